@@ -12,3 +12,11 @@ for _ in range(3):
     led.value(0)
     time.sleep(0.1)
 led.value(1) # Keep on during main boot
+
+# Differential OTA (lib/ota.py): count trial boots of a new update and roll
+# back one that never came up
+try:
+    import lib.ota
+    lib.ota.boot_check()
+except Exception as e:
+    print("OTA boot check failed:", e)
@@ -1,5 +1,6 @@
 import machine
 import time
+import struct
 
 class BMI323:
     # Registers (Word addresses)
@@ -9,16 +10,30 @@ class BMI323:
     REG_ACC_DATA_Y = 0x04
     REG_ACC_DATA_Z = 0x05
     REG_GYR_DATA_X = 0x0C
+    REG_FIFO_FILL_LEVEL = 0x15
+    REG_FIFO_DATA = 0x16
     REG_ACC_CONF = 0x20
     REG_GYR_CONF = 0x21
     REG_PWR_CTRL = 0x22
+    REG_FIFO_CONF = 0x36
+    REG_FIFO_CTRL = 0x37
     REG_CMD = 0x7E
     
     CHIP_ID = 0x43
+
+    # ODR field (bits 3:0) of ACC_CONF / GYR_CONF
+    ODR_CODES = {50: 0x06, 100: 0x07, 200: 0x08, 400: 0x09}
+
+    # FIFO: acc xyz + gyr xyz per frame (6 words, int16 LE), 2 KB deep
+    FIFO_FRAME_BYTES = 12
+    FIFO_BYTES = 2048
+    FIFO_DUMMY_ACC = 0x7F01 # Frame slot without new data
     
-    def __init__(self, i2c, address=0x69):
+    def __init__(self, i2c, address=0x69, odr_hz=100):
         self.i2c = i2c
         self.address = address
+        self.odr_hz = odr_hz if odr_hz in self.ODR_CODES else 100
+        self.fifo_enabled = False
         self._init_sensor()
 
     def _read_words(self, reg, count):
@@ -48,15 +63,60 @@ class BMI323:
         if (cid & 0xFF) != self.CHIP_ID:
             print("Warning: Unexpected Chip ID " + hex(cid))
             
-        # 3. Configure Accel (100Hz, +/- 4g, Normal Mode)
+        # 3. Configure Accel (odr_hz, default 100Hz, +/- 4g, Normal Mode)
         # 0x01 = 4g range, 0x07 = 100Hz, 0x2000 = Normal Mode
-        self._write_word(self.REG_ACC_CONF, 0x2107) 
+        odr = self.ODR_CODES[self.odr_hz]
+        self._write_word(self.REG_ACC_CONF, 0x2100 | odr)
         
-        # 4. Configure Gyro (100Hz, 500dps, Normal Mode)
+        # 4. Configure Gyro (odr_hz, default 100Hz, 500dps, Normal Mode)
         # 0x01 = 500dps, 0x07 = 100Hz, 0x2000 = Normal Mode
-        self._write_word(self.REG_GYR_CONF, 0x2107)
+        self._write_word(self.REG_GYR_CONF, 0x2100 | odr)
         time.sleep(0.05)
 
+    def enable_fifo(self):
+        """
+        Buffer acc + gyr frames in the sensor FIFO so every sample is kept
+        while the main loop runs at the GPS rate. Drain with read_fifo().
+        """
+        # 0x0200 = acc, 0x0400 = gyr, bit 0 clear = overwrite oldest when full
+        self._write_word(self.REG_FIFO_CONF, 0x0600)
+        # Flush anything captured before this point
+        self._write_word(self.REG_FIFO_CTRL, 0x0001)
+        # I2C reads start with 2 dummy bytes
+        self._fifo_buf = bytearray(2 + self.FIFO_BYTES)
+        self._fifo_mv = memoryview(self._fifo_buf)
+        self._level_buf = bytearray(4)
+        self.fifo_enabled = True
+
+    def read_fifo(self):
+        """
+        Burst-reads every complete frame in one I2C transaction into a
+        preallocated buffer. Returns (frames, count); frames is a memoryview
+        of count * FIFO_FRAME_BYTES bytes, valid until the next call.
+        """
+        self.i2c.readfrom_mem_into(self.address, self.REG_FIFO_FILL_LEVEL, self._level_buf)
+        words = (self._level_buf[2] | (self._level_buf[3] << 8)) & 0x07FF
+        count = words // (self.FIFO_FRAME_BYTES // 2)
+        if not count:
+            return self._fifo_mv[2:2], 0
+        nbytes = count * self.FIFO_FRAME_BYTES
+        self.i2c.readfrom_mem_into(self.address, self.REG_FIFO_DATA, self._fifo_mv[:2 + nbytes])
+        return self._fifo_mv[2:2 + nbytes], count
+
+    def latest_frame(self, frames, count, acc, gyr):
+        """
+        Copies the newest valid frame into the acc/gyr dicts (in place, no
+        allocation of new dicts). Returns False if no valid frame was found.
+        """
+        for i in range(count - 1, -1, -1):
+            ax, ay, az, gx, gy, gz = struct.unpack_from("<hhhhhh", frames, i * self.FIFO_FRAME_BYTES)
+            if (ax & 0xFFFF) == self.FIFO_DUMMY_ACC:
+                continue
+            acc["x"], acc["y"], acc["z"] = ax, ay, az
+            gyr["x"], gyr["y"], gyr["z"] = gx, gy, gz
+            return True
+        return False
+
     def get_accel(self):
         # Read X, Y, Z (Registers 0x03, 0x04, 0x05)
         return self._read_words(self.REG_ACC_DATA_X, 3)
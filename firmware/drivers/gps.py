@@ -1,47 +1,120 @@
-# Minimal NMEA Parser for ESP32
-# Handles GNRMC (Position/Speed) and GNGGA (Altitude/Satellites)
+# GPS driver for ESP32 (u-blox Neo-M8N)
+# UBX mode: binary NAV-PVT at 115200 baud, 10-25 Hz (drivers/ubx.py)
+# NMEA fallback: GNRMC (Position/Speed) and GNGGA (Satellites) (drivers/nmea.py)
+import time
+from drivers.ubx import UBXParser, frame
+from drivers.nmea import NMEAParser
+
+MODE_UBX = "UBX"
+MODE_NMEA = "NMEA"
+
+# CFG-PRT outProtoMask
+PROTO_UBX = 0x0001
+PROTO_UBX_NMEA = 0x0003
 
 class GPS:
+    # Bauds probed when looking for the module (see tests/gps_autodetect.py)
+    PROBE_BAUDS = (115200, 9600, 38400)
+
     def __init__(self, uart):
         self.uart = uart
+        self.mode = MODE_NMEA
+        self.baud = None
         self.last_fix = {
             'lat': None,
             'lon': None,
             'speed_kmh': 0.0,
             'satellites': 0,
             'timestamp': None,
-            'valid': False
+            'valid': False,
+            'utc': None,    # (y, mo, d, h, mi, s, ms) of the latest solution
+            'rx_us': 0,     # ticks_us when it was read (lib/gps_clock.py)
+            'seq': 0        # Incremented per solution
         }
+        self.ubx = UBXParser(self.last_fix)
+        self.nmea = NMEAParser(self.last_fix)
         
     def send_ubx(self, msg_class, msg_id, payload):
         """Send a UBX binary command with automatic checksum calculation"""
-        header = b'\xb5\x62'
-        length = len(payload).to_bytes(2, 'little')
-        msg = bytes([msg_class, msg_id]) + length + payload
-        
-        # Calculate Checksum
-        ck_a, ck_b = 0, 0
-        for b in msg:
-            ck_a = (ck_a + b) & 0xFF
-            ck_b = (ck_b + ck_a) & 0xFF
-            
-        full_msg = header + msg + bytes([ck_a, ck_b])
-        self.uart.write(full_msg)
-
-    def set_baudrate(self, baud):
-        """Configure GPS module UART baud rate (CFG-PRT)"""
-        # Pre-calculated for common rates
-        if baud == 115200:
-            payload = b'\x01\x00\x00\x00\xd0\x08\x00\x00\x00\xc2\x01\x00\x07\x00\x03\x00\x00\x00\x00\x00'
-        elif baud == 38400:
-            payload = b'\x01\x00\x00\x00\xd0\x08\x00\x00\x00\x96\x00\x00\x07\x00\x03\x00\x00\x00\x00\x00'
-        else:
-            payload = b'\x01\x00\x00\x00\xd0\x08\x00\x00'
-            payload += baud.to_bytes(4, 'little')
-            payload += b'\x07\x00\x03\x00\x00\x00\x00\x00'
+        self.uart.write(frame(msg_class, msg_id, payload))
+
+    def set_baudrate(self, baud, out_proto=PROTO_UBX_NMEA):
+        """Configure GPS module UART baud rate and output protocols (CFG-PRT, UART1)"""
+        # portID=1, txReady=0, mode=8N1 (0x08D0), baud, inProto=UBX+NMEA+RTCM, outProto
+        payload = b'\x01\x00\x00\x00\xd0\x08\x00\x00'
+        payload += baud.to_bytes(4, 'little')
+        payload += b'\x07\x00' + out_proto.to_bytes(2, 'little') + b'\x00\x00\x00\x00'
         
         self.send_ubx(0x06, 0x00, payload)
 
+    def start(self, rate_hz=10, baud=115200):
+        """
+        Bring the module up in UBX NAV-PVT mode at `baud` / `rate_hz`, falling
+        back to NMEA at whatever baud the module answers on. Returns the mode.
+        """
+        # Already in UBX mode (e.g. ESP reset while the GPS kept power)?
+        if self._listen(baud, MODE_UBX):
+            self._enable_pvt(rate_hz)
+            return self._set_mode(MODE_UBX, baud)
+
+        for probe in self.PROBE_BAUDS:
+            if not self._listen(probe, None):
+                continue
+            # Module found: switch it to UBX-only output at the target baud
+            self.set_baudrate(baud, PROTO_UBX)
+            time.sleep_ms(100) # Let CFG-PRT go out before our side switches
+            self._uart_baud(baud)
+            self._enable_pvt(rate_hz)
+            if self._listen(baud, MODE_UBX, reinit=False):
+                return self._set_mode(MODE_UBX, baud)
+
+            # No NAV-PVT: undo and stay on NMEA
+            print("[GPS] UBX switch failed, falling back to NMEA")
+            self.set_baudrate(probe, PROTO_UBX_NMEA)
+            time.sleep_ms(100)
+            self._uart_baud(probe)
+            return self._set_mode(MODE_NMEA, probe)
+
+        print("[GPS] No data on any baud, assuming NMEA @ 9600")
+        self._uart_baud(9600)
+        return self._set_mode(MODE_NMEA, 9600)
+
+    def _set_mode(self, mode, baud):
+        self.mode = mode
+        self.baud = baud
+        print(f"[GPS] Mode {mode} @ {baud}")
+        return mode
+
+    def _uart_baud(self, baud):
+        self.uart.init(baudrate=baud)
+
+    def _enable_pvt(self, rate_hz):
+        interval = int(1000 / rate_hz)
+        self.send_ubx(0x06, 0x08, interval.to_bytes(2, 'little') + b'\x01\x00\x01\x00') # CFG-RATE
+        self.send_ubx(0x06, 0x01, b'\x01\x07\x01') # CFG-MSG: NAV-PVT every epoch
+
+    def _listen(self, baud, want, timeout_ms=1500, reinit=True):
+        """True if valid data arrives: NAV-PVT for want=MODE_UBX, else any UBX/NMEA."""
+        if reinit:
+            self._uart_baud(baud)
+        while self.uart.any():
+            self.uart.read()
+        start = time.ticks_ms()
+        pvt_before = self.ubx.pvt_count
+        seen = b""
+        while time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
+            if self.uart.any():
+                if want == MODE_UBX:
+                    self.ubx.feed_from(self.uart)
+                    if self.ubx.pvt_count > pvt_before:
+                        return True
+                else:
+                    seen = (seen + (self.uart.read() or b""))[-256:]
+                    if b'$G' in seen or b'\xb5\x62' in seen:
+                        return True
+            time.sleep_ms(10)
+        return False
+
     def set_rate(self, hz):
         """Configure GPS measurement rate (CFG-RATE) and disable unused messages"""
         interval = int(1000 / hz)
@@ -58,95 +131,9 @@ class GPS:
 
     def update(self):
         """Read all available data from UART and parse. Don't block."""
-        while self.uart.any():
-            try:
-                line = self.uart.readline()
-                if not line: break
-                
-                # Convert bytes to string (ignoring errors)
-                try:
-                    line_str = line.decode('utf-8').strip()
-                except:
-                    continue
-                    
-                if line_str.startswith('$'):
-                    self._parse_nmea(line_str)
-            except Exception:
-                pass 
-                
-        return self.last_fix
+        if self.mode == MODE_UBX:
+            self.ubx.feed_from(self.uart)
+            return self.last_fix
 
-    def _chk(self, line):
-        """Verify NMEA Checksum"""
-        try:
-            pt = line.split('*')
-            if len(pt) != 2: return False
-            content = pt[0][1:] # Skip $
-            checksum_received = int(pt[1], 16)
-            
-            calc = 0
-            for char in content:
-                calc ^= ord(char)
-                
-            return calc == checksum_received
-        except:
-            return False
-
-    def _parse_nmea(self, line):
-        if not self._chk(line):
-            return 
-            
-        parts = line.split(',')
-        msg_id = parts[0][3:] # Remove $GN or $GP
-        
-        # RMC: Recommended Minimum Data (Time, Lat, Lon, Speed, Date)
-        if msg_id == 'RMC':
-            # $GNRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A
-            # Index: 1=Time, 2=Status(A=OK), 3=Lat, 4=N, 5=Lon, 6=E, 7=Speed(Knots)
-            if len(parts) < 10: return
-            
-            # Update timestamp regardless of fix validy (shows UART is working)
-            if parts[1]:
-                self.last_fix['timestamp'] = parts[1]
-            
-            valid = parts[2] == 'A'
-            self.last_fix['valid'] = valid
-            
-            if valid:
-                self.last_fix['lat'] = self._dm_to_dd(parts[3], parts[4])
-                self.last_fix['lon'] = self._dm_to_dd(parts[5], parts[6])
-                
-                try:
-                    knots = float(parts[7] or 0)
-                    self.last_fix['speed_kmh'] = knots * 1.852
-                except:
-                    pass
-
-        # GGA: Fix Data (Satellites, Altitude)
-        elif msg_id == 'GGA':
-            # $GNGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47
-            # Index: 6=FixType, 7=Sats
-            if len(parts) < 8: return
-            
-            try:
-                self.last_fix['satellites'] = int(parts[7] or 0)
-            except:
-                pass
-
-    def _dm_to_dd(self, val, hemi):
-        """Convert DegMin (ddmm.mmmm) to Decimal Degrees"""
-        if not val or not hemi: return None
-        try:
-            dot = val.find('.')
-            if dot == -1: return None
-            
-            degrees = float(val[:dot-2])
-            minutes = float(val[dot-2:])
-            calc = degrees + (minutes / 60.0)
-            
-            if hemi == 'S' or hemi == 'W':
-                calc = -calc
-                
-            return calc
-        except:
-            return None
+        self.nmea.feed_from(self.uart)
+        return self.last_fix
@@ -0,0 +1,258 @@
+# drivers/nmea.py - NMEA 0183 parser (RMC, GGA) for the NMEA fallback
+#
+# Pure Python (no machine imports) so it runs on CPython against recorded
+# sentences: see tests/nmea_replay.py.
+#
+# Like drivers/ubx.py, bytes are read into one reusable buffer
+# (UART.readinto) and parsed in place: the XOR checksum is computed over the
+# bytes, field offsets are recorded while scanning (no split) and numbers are
+# read digit by digit into scaled integers (ddmm.mmmm -> degrees and minutes
+# * 10^7, both small ints), so a sentence costs no line, decoded str, field
+# list or substrings. Only the values stored in the fix dict are allocated.
+import time
+
+try:
+    ticks_us = time.ticks_us
+except AttributeError:
+    ticks_us = lambda: int(time.perf_counter() * 1000000) # CPython
+
+DOLLAR = 0x24
+STAR = 0x2A
+COMMA = 0x2C
+DOT = 0x2E
+CR = 0x0D
+LF = 0x0A
+
+MAX_SENTENCE = 96    # NMEA allows 82 chars; u-blox stays below. Longer = garbage
+MAX_FIELDS = 24      # Commas recorded per sentence
+MIN_DECIMALS = 7     # Minutes scaled by 10^7: 59.9999999 still fits a small int
+KMH_PER_MILLIKNOT = 0.001852
+
+
+def _hex(c):
+    if 0x30 <= c <= 0x39:
+        return c - 0x30
+    c |= 0x20 # Lower case
+    if 0x61 <= c <= 0x66:
+        return c - 0x57
+    return -1
+
+
+class NMEAParser:
+    def __init__(self, fix=None, size=256):
+        # Fix dict is updated in place (same keys as drivers/ubx.py)
+        self.fix = fix if fix is not None else {}
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self.fill = 0
+        self.rx_us = 0 # ticks_us of the read that delivered the current bytes
+        # Comma offsets of the current sentence, relative to its '$'
+        self._commas = bytearray(MAX_FIELDS)
+        self._start = 0
+        self._star = 0
+        self._nf = 0
+
+        # Stats
+        self.sentences = 0
+        self.bad_checksum = 0
+        self.rmc_count = 0
+
+    def feed_from(self, uart):
+        """Read whatever the UART has straight into the buffer and parse it."""
+        new = 0
+        while uart.any():
+            self.rx_us = ticks_us()
+            if self.fill == len(self._buf):
+                self.fill = 0 # Garbage filled the buffer: drop it
+            n = uart.readinto(self._mv[self.fill:])
+            if not n:
+                break
+            self.fill += n
+            new += self._consume()
+        return new
+
+    def feed(self, data, rx_us=None):
+        """Parse bytes (CPython / recorded streams). Returns number of new RMC solutions."""
+        self.rx_us = ticks_us() if rx_us is None else rx_us
+        new = 0
+        pos = 0
+        while pos < len(data):
+            if self.fill == len(self._buf):
+                self.fill = 0
+            take = min(len(self._buf) - self.fill, len(data) - pos)
+            self._mv[self.fill:self.fill + take] = data[pos:pos + take]
+            self.fill += take
+            pos += take
+            new += self._consume()
+        return new
+
+    def _consume(self):
+        buf = self._buf
+        commas = self._commas
+        fill = self.fill
+        i = 0
+        new = 0
+        while i < fill:
+            if buf[i] != DOLLAR:
+                i += 1
+                continue
+            # One pass up to '*': checksum and comma offsets
+            j = i + 1
+            cs = 0
+            nf = 0
+            while j < fill and j - i < MAX_SENTENCE:
+                c = buf[j]
+                if c == STAR or c == DOLLAR or c == CR or c == LF:
+                    break
+                cs ^= c
+                if c == COMMA and nf < MAX_FIELDS:
+                    commas[nf] = j - i
+                    nf += 1
+                j += 1
+            if j - i >= MAX_SENTENCE:
+                i = j # No terminator: not a sentence
+                continue
+            if j + 2 >= fill:
+                break # Wait for the rest of the sentence
+            if buf[j] != STAR:
+                i = j # Cut short (no checksum)
+                continue
+            hi = _hex(buf[j + 1])
+            lo = _hex(buf[j + 2])
+            if hi < 0 or lo < 0 or (hi << 4 | lo) != cs:
+                self.bad_checksum += 1
+                i = j
+                continue
+            self.sentences += 1
+            self._start = i
+            self._star = j
+            self._nf = nf
+            new += self._dispatch()
+            i = j + 3
+
+        if i:
+            rest = fill - i
+            if rest:
+                buf[:rest] = self._mv[i:fill]
+            self.fill = rest
+        return new
+
+    # --- Fields (k = 0 is the address, e.g. GNRMC) ---
+
+    def _fs(self, k):
+        return self._start + (self._commas[k - 1] + 1 if k else 1)
+
+    def _fe(self, k):
+        return self._start + self._commas[k] if k < self._nf else self._star
+
+    def _int(self, s, e, decimals=0):
+        """Digits in buf[s:e] as an integer scaled by 10^decimals (extra decimals dropped). None if empty."""
+        buf = self._buf
+        v = 0
+        digits = 0
+        frac = -1
+        while s < e:
+            c = buf[s]
+            if c == DOT and frac < 0:
+                frac = 0
+            elif 0x30 <= c <= 0x39:
+                if frac < 0:
+                    v = v * 10 + c - 0x30
+                elif frac < decimals:
+                    v = v * 10 + c - 0x30
+                    frac += 1
+                digits += 1
+            else:
+                return None
+            s += 1
+        if not digits:
+            return None
+        if frac < 0:
+            frac = 0
+        while frac < decimals:
+            v *= 10
+            frac += 1
+        return v
+
+    def _degrees(self, k):
+        """ddmm.mmmm / dddmm.mmmm field k with hemisphere field k+1 -> decimal degrees (None if empty)."""
+        buf = self._buf
+        s = self._fs(k)
+        e = self._fe(k)
+        dot = s
+        while dot < e and buf[dot] != DOT:
+            dot += 1
+        if dot == e or dot - s < 3 or self._fe(k + 1) <= self._fs(k + 1):
+            return None
+        deg = self._int(s, dot - 2)
+        minutes = self._int(dot - 2, e, MIN_DECIMALS)
+        if deg is None or minutes is None:
+            return None
+        dd = deg + minutes / 600000000.0 # 60 * 10^MIN_DECIMALS
+        hemi = buf[self._fs(k + 1)]
+        if hemi == 0x53 or hemi == 0x57: # S, W
+            dd = -dd
+        return dd
+
+    def _dispatch(self):
+        buf = self._buf
+        i = self._start
+        # $ttRMC / $ttGGA (talker GN, GP, GL...): a 5 character address
+        if self._nf < 1 or self._commas[0] != 6:
+            return 0
+        a, b, c = buf[i + 3], buf[i + 4], buf[i + 5]
+        if a == 0x52 and b == 0x4D and c == 0x43:   # RMC
+            return self._rmc()
+        if a == 0x47 and b == 0x47 and c == 0x41:   # GGA
+            self._gga()
+        return 0
+
+    def _rmc(self):
+        # $GNRMC,123519.00,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A
+        # Fields: 1=Time, 2=Status(A=OK), 3=Lat, 4=N, 5=Lon, 6=E, 7=Speed(Knots), 9=Date
+        if self._nf < 9:
+            return 0
+        buf = self._buf
+        fix = self.fix
+        new = 0
+
+        # Update timestamp regardless of fix validity (shows UART is working)
+        s = self._fs(1)
+        e = self._fe(1)
+        if e > s:
+            self.rmc_count += 1
+            new = 1
+            fix['rx_us'] = self.rx_us
+            fix['seq'] = fix.get('seq', 0) + 1
+            # UTC for the clock needs both time (hhmmss.ss) and date (ddmmyy)
+            fix['utc'] = None
+            hms = self._int(s, s + 6) if e - s >= 6 else None
+            ms = self._int(s + 6, e, 3) if e - s > 6 else 0
+            ds = self._fs(9)
+            dmy = self._int(ds, ds + 6) if self._fe(9) - ds == 6 else None
+            if hms is not None and ms is not None:
+                fix['timestamp'] = "%02d%02d%02d.%02d" % (hms // 10000, hms // 100 % 100, hms % 100, ms // 10)
+                if dmy is not None:
+                    fix['utc'] = (2000 + dmy % 100, dmy // 100 % 100, dmy // 10000,
+                                  hms // 10000, hms // 100 % 100, hms % 100, ms)
+
+        s = self._fs(2)
+        valid = self._fe(2) - s == 1 and buf[s] == 0x41 # 'A'
+        fix['valid'] = valid
+
+        if valid:
+            fix['lat'] = self._degrees(3)
+            fix['lon'] = self._degrees(5)
+            knots = self._int(self._fs(7), self._fe(7), 3)
+            if knots is not None or self._fe(7) == self._fs(7):
+                fix['speed_kmh'] = (knots or 0) * KMH_PER_MILLIKNOT
+        return new
+
+    def _gga(self):
+        # $GNGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47
+        # Fields: 6=FixType, 7=Sats
+        if self._nf < 7:
+            return
+        sats = self._int(self._fs(7), self._fe(7))
+        if sats is not None or self._fe(7) == self._fs(7):
+            self.fix['satellites'] = sats or 0
@@ -17,6 +17,13 @@ Example usage:
     
     # Mount filesystem
     os.mount(sd, '/sd')
+
+Sequential write fast path: a multi-block write is left open (no stop token)
+and a following write that starts at the next block continues it with data
+tokens only, without CMD25 and the card's stop/busy cycle in between. A log
+file preallocated on contiguous clusters (lib/sd_buffer.py) is written this
+way as one long CMD25 stream. Any read, a write elsewhere or a sync
+(ioctl 3, issued by the filesystem on flush/close) ends the stream.
 """
 
 from micropython import const
@@ -43,10 +50,19 @@ class SDCard:
         self.cmdbuf = bytearray(6)
         self.dummybuf = bytearray(512)
         self.tokenbuf = bytearray(1)
+        self.token_cmd25 = bytes([_TOKEN_CMD25])
+        self.token_stop = bytes([_TOKEN_STOP_TRAN])
+        self.token_data = bytes([_TOKEN_DATA])
         for i in range(512):
             self.dummybuf[i] = 0xFF
         self.dummybuf_memoryview = memoryview(self.dummybuf)
 
+        # Open CMD25 stream: next block number, or -1
+        self._stream_next = -1
+        # Stats: CMD25 commands issued / blocks written as a continued stream
+        self.write_cmds = 0
+        self.stream_blocks = 0
+
         # Init CS pin
         self.cs.init(self.cs.OUT, value=1)
 
@@ -136,6 +152,8 @@ class SDCard:
         raise OSError("timeout waiting for v2 card")
 
     def ioctl(self, op, arg):
+        if op == 2 or op == 3:  # deinit / sync
+            return self.stop_stream()
         if op == 4:  # get number of blocks
             return self.sectors
         if op == 5:  # get block size
@@ -148,10 +166,10 @@ class SDCard:
         # create and send the command
         buf = self.cmdbuf
         buf[0] = 0x40 | cmd
-        buf[1] = arg >> 24
-        buf[2] = arg >> 16
-        buf[3] = arg >> 8
-        buf[4] = arg
+        buf[1] = (arg >> 24) & 0xFF
+        buf[2] = (arg >> 16) & 0xFF
+        buf[3] = (arg >> 8) & 0xFF
+        buf[4] = arg & 0xFF
         buf[5] = crc
         self.spi.write(buf)
 
@@ -191,6 +209,7 @@ class SDCard:
         return -1
 
     def readblocks(self, block_num, buf):
+        self.stop_stream()
         nblocks = len(buf) // 512
         assert nblocks and not len(buf) % 512, 'Buffer length is invalid'
         if nblocks == 1:
@@ -220,6 +239,7 @@ class SDCard:
             # CMD18: READ_MULTIPLE_BLOCK
             if self.cmd(18, block_num * self.cdv, 0, release=False) != 0:
                 return 1
+            mv = memoryview(buf) # A bytearray slice would be a copy
             offset = 0
             while nblocks:
                 # wait for the start block token
@@ -231,7 +251,7 @@ class SDCard:
                     self.cs(1)
                     raise OSError("timeout waiting for response")
                 # read the data
-                self.spi.readinto(buf[offset : offset + 512])
+                self.spi.readinto(mv[offset : offset + 512])
                 offset += 512
                 nblocks -= 1
                 # read CRC checksum (2 bytes)
@@ -244,56 +264,95 @@ class SDCard:
             self.spi.write(b'\xff')
             return 0
 
+    def _read_byte(self):
+        self.spi.readinto(self.tokenbuf, 0xFF)
+        return self.tokenbuf[0]
+
+    def _wait_not_busy(self):
+        # Card holds MISO low while programming
+        while not self._read_byte():
+            pass
+
+    def _write_data(self, mv, nblocks):
+        # Data tokens of an open CMD25; returns 0 or 1 (stream ended on error)
+        self.cs(0)
+        offset = 0
+        while nblocks:
+            self.spi.write(self.token_cmd25)
+            self.spi.write(mv[offset : offset + 512])
+            offset += 512
+            nblocks -= 1
+            self.spi.write(b'\xff')
+            self.spi.write(b'\xff')
+            if (self._read_byte() & 0x1F) != 0x05:
+                self.cs(1)
+                self.spi.write(b'\xff')
+                self._stream_next = -1
+                return 1
+            self._wait_not_busy()
+        # CS may go high between the blocks of a multi-block write
+        self.cs(1)
+        self.spi.write(b'\xff')
+        return 0
+
+    def stop_stream(self):
+        """End an open multi-block write (stop token, wait while the card programs)."""
+        if self._stream_next < 0:
+            return 0
+        self._stream_next = -1
+        self.cs(0)
+        self.spi.write(self.token_stop)
+        # wait for write to finish (skip the byte after the stop token)
+        self._read_byte()
+        self._wait_not_busy()
+        self.cs(1)
+        self.spi.write(b'\xff')
+        return 0
+
     def writeblocks(self, block_num, buf):
         nblocks = len(buf) // 512
         assert nblocks and not len(buf) % 512, 'Buffer length is invalid'
+        if block_num == self._stream_next:
+            # Continues the open CMD25: data tokens only
+            if self._write_data(memoryview(buf), nblocks):
+                return 1
+            self._stream_next = block_num + nblocks
+            self.stream_blocks += nblocks
+            return 0
+        self.stop_stream()
         if nblocks == 1:
             # CMD24: WRITE_BLOCK
             if self.cmd(24, block_num * self.cdv, 0, release=False) != 0:
                 return 1
             # send the token
-            self.spi.write(bytearray([_TOKEN_DATA]))
+            self.spi.write(self.token_data)
             # send the data
             self.spi.write(buf)
             # send CRC checksum (2 bytes)
             self.spi.write(b'\xff')
             self.spi.write(b'\xff')
             # check the response
-            if (self.spi.read(1)[0] & 0x1F) != 0x05:
+            if (self._read_byte() & 0x1F) != 0x05:
                 self.cs(1)
                 self.spi.write(b'\xff')
                 return 1
             # wait for write to finish
-            while not self.spi.read(1)[0]:
-                pass
+            self._wait_not_busy()
             self.cs(1)
             self.spi.write(b'\xff')
             return 0
         else:
+            # ACMD23: SET_WR_BLK_ERASE_COUNT (pre-erase hint, optional)
+            self.cmd(55, 0, 0)
+            self.cmd(23, nblocks, 0)
             # CMD25: WRITE_MULTIPLE_BLOCK
             if self.cmd(25, block_num * self.cdv, 0, release=False) != 0:
                 return 1
-            # send the data
-            offset = 0
-            while nblocks:
-                self.spi.write(bytearray([_TOKEN_CMD25]))
-                self.spi.write(buf[offset : offset + 512])
-                offset += 512
-                nblocks -= 1
-                self.spi.write(b'\xff')
-                self.spi.write(b'\xff')
-                if (self.spi.read(1)[0] & 0x1F) != 0x05:
-                    self.cs(1)
-                    self.spi.write(b'\xff')
-                    return 1
-                while not self.spi.read(1)[0]:
-                    pass
-            # stop transmission token
-            self.spi.write(bytearray([_TOKEN_STOP_TRAN]))
-            # wait for write to finish
-            while not self.spi.read(1)[0]:
-                pass
-            self.cs(1)
-            self.spi.write(b'\xff')
+            self.write_cmds += 1
+            # send the data (memoryview: no 512 B copy per block); the
+            # stream stays open for a write continuing at the next block
+            if self._write_data(memoryview(buf), nblocks):
+                return 1
+            self._stream_next = block_num + nblocks
             return 0
 
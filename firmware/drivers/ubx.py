@@ -0,0 +1,162 @@
+# drivers/ubx.py - UBX binary protocol parser (NAV-PVT)
+#
+# Pure Python (struct only, no machine imports) so it runs on CPython against
+# recorded byte streams: see tests/ubx_replay.py.
+#
+# Frame: 0xB5 0x62 | class | id | length u16 LE | payload | CK_A CK_B
+# Bytes are read into one reusable buffer (UART.readinto) and payloads are
+# decoded in place with struct.unpack_from, no per-sentence strings.
+import struct
+import time
+
+try:
+    ticks_us = time.ticks_us
+except AttributeError:
+    ticks_us = lambda: int(time.perf_counter() * 1000000) # CPython
+
+SYNC1 = 0xB5
+SYNC2 = 0x62
+CLS_NAV = 0x01
+ID_NAV_PVT = 0x07
+CLS_ACK = 0x05
+NAV_PVT_LEN = 92
+
+# First 76 bytes of NAV-PVT: iTOW, year, month, day, hour, min, sec, valid,
+# tAcc, nano, fixType, flags, flags2, numSV, lon, lat, height, hMSL,
+# hAcc, vAcc, velN, velE, velD, gSpeed, headMot, sAcc, headAcc
+NAV_PVT_FMT = "<IHBBBBBBIiBBBBiiiiIIiiiiiII"
+
+
+def checksum(data):
+    """8-bit Fletcher checksum over class, id, length and payload."""
+    ck_a = 0
+    ck_b = 0
+    for b in data:
+        ck_a = (ck_a + b) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return ck_a, ck_b
+
+
+def frame(msg_class, msg_id, payload):
+    """Build a complete UBX frame (used for config commands and tests)."""
+    body = bytes([msg_class, msg_id]) + len(payload).to_bytes(2, 'little') + payload
+    ck_a, ck_b = checksum(body)
+    return b'\xb5\x62' + body + bytes([ck_a, ck_b])
+
+
+class UBXParser:
+    def __init__(self, fix=None, size=512):
+        # Fix dict is updated in place (same keys as the NMEA parser + extras)
+        self.fix = fix if fix is not None else {}
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self.fill = 0
+        self.rx_us = 0 # ticks_us of the read that delivered the current bytes
+
+        # Stats
+        self.pvt_count = 0
+        self.bad_checksum = 0
+        self.acks = 0
+        self.naks = 0
+
+    def feed_from(self, uart):
+        """Read whatever the UART has straight into the buffer and parse it."""
+        new = 0
+        while uart.any():
+            self.rx_us = ticks_us()
+            if self.fill == len(self._buf):
+                self.fill = 0 # Garbage filled the buffer: drop it
+            n = uart.readinto(self._mv[self.fill:])
+            if not n:
+                break
+            self.fill += n
+            new += self._consume()
+        return new
+
+    def feed(self, data, rx_us=None):
+        """Parse bytes (CPython / recorded streams). Returns number of new PVT fixes."""
+        self.rx_us = ticks_us() if rx_us is None else rx_us
+        new = 0
+        pos = 0
+        while pos < len(data):
+            if self.fill == len(self._buf):
+                self.fill = 0
+            take = min(len(self._buf) - self.fill, len(data) - pos)
+            self._mv[self.fill:self.fill + take] = data[pos:pos + take]
+            self.fill += take
+            pos += take
+            new += self._consume()
+        return new
+
+    def _consume(self):
+        buf = self._buf
+        fill = self.fill
+        i = 0
+        new = 0
+        while fill - i >= 8:
+            if buf[i] != SYNC1 or buf[i + 1] != SYNC2:
+                i += 1
+                continue
+            length = buf[i + 4] | (buf[i + 5] << 8)
+            if length > len(buf) - 8:
+                i += 1 # Corrupt length, resync
+                continue
+            end = i + 6 + length
+            if end + 2 > fill:
+                break # Wait for the rest of the frame
+            ck_a, ck_b = checksum(self._mv[i + 2:end])
+            if ck_a != buf[end] or ck_b != buf[end + 1]:
+                self.bad_checksum += 1
+                i += 1
+                continue
+            new += self._dispatch(buf[i + 2], buf[i + 3], i + 6, length)
+            i = end + 2
+
+        if i:
+            rest = fill - i
+            if rest:
+                buf[:rest] = self._mv[i:fill]
+            self.fill = rest
+        return new
+
+    def _dispatch(self, cls, msg_id, off, length):
+        if cls == CLS_NAV and msg_id == ID_NAV_PVT and length == NAV_PVT_LEN:
+            self._decode_pvt(off)
+            return 1
+        if cls == CLS_ACK:
+            if msg_id == 0x01:
+                self.acks += 1
+            else:
+                self.naks += 1
+        return 0
+
+    def _decode_pvt(self, off):
+        (itow, year, month, day, hour, minute, sec, valid, t_acc, nano,
+         fix_type, flags, flags2, num_sv, lon, lat, height, h_msl,
+         h_acc, v_acc, vel_n, vel_e, vel_d, g_speed, head_mot, s_acc, head_acc
+         ) = struct.unpack_from(NAV_PVT_FMT, self._buf, off)
+
+        fix = self.fix
+        fix['itow'] = itow
+        fix['satellites'] = num_sv
+        fix['rx_us'] = self.rx_us
+        fix['seq'] = fix.get('seq', 0) + 1
+        # validDate + validTime: UTC usable for clock sync (ms may be negative: nano is signed)
+        if (valid & 0x03) == 0x03:
+            fix['timestamp'] = "%02d%02d%02d.%02d" % (hour, minute, sec, max(0, nano) // 10000000)
+            fix['date'] = (year, month, day)
+            fix['utc'] = (year, month, day, hour, minute, sec, nano // 1000000)
+        else:
+            fix['utc'] = None
+
+        ok = (flags & 0x01) and 2 <= fix_type <= 4
+        fix['valid'] = bool(ok)
+        if ok:
+            fix['lat'] = lat * 1e-7
+            fix['lon'] = lon * 1e-7
+            fix['alt'] = h_msl / 1000.0
+            fix['speed_kmh'] = g_speed * 0.0036
+            fix['heading'] = head_mot * 1e-5
+            fix['h_acc_m'] = h_acc / 1000.0
+            fix['s_acc_kmh'] = s_acc * 0.0036
+        self.pvt_count += 1
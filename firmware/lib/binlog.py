@@ -0,0 +1,175 @@
+# lib/binlog.py - Compact binary session log (RSL) writer
+#
+# File layout (little endian):
+#   File header  (16 B): magic "RSL1", version u8, record size u8,
+#                        records/block u16, start epoch u32 (s), flags u32
+#   Blocks:      header (8 B): magic 0xB10C u16, record count u16, CRC32 u32 of records
+#                followed by <count> fixed-size records
+#   Record       (30 B): t_ms u32 (since start epoch), lat/lon i32 (deg * 1e7),
+#                        speed u16 (km/h * 100), acc x/y/z i16, gyro x/y/z i16 (raw LSB),
+#                        vbat u16 (mV), sats u8, flags u8
+#   IMU blocks (v2): header magic 0xB1A1, frame count, CRC32 of payload
+#                payload: t_ms u32 of first frame, frame period u16 (us),
+#                then <count> raw BMI323 FIFO frames (acc x/y/z, gyro x/y/z i16)
+#
+# Timestamps come from a GPSClock (lib/gps_clock.py): ms resolution anchored to
+# GPS UTC, so t_ms + start epoch is the record's UTC time.
+#
+# Records are packed into a preallocated block buffer; sealed blocks go through
+# an SD-block-aligned AlignedWriter (lib/sd_buffer.py) instead of one formatted
+# line + flush per sample. On SD the file can be preallocated (`reserve`);
+# the data length of a log that was not closed is found with recover_length().
+# The server decoder lives in server/core/ingestion/binary_loader.py.
+import struct
+from lib.sd_buffer import AlignedWriter
+
+try:
+    from binascii import crc32
+except ImportError:
+    from ubinascii import crc32
+
+FILE_EXT = "rsl"
+FILE_MAGIC = b"RSL1"
+FORMAT_VERSION = 2
+FILE_HDR_FMT = "<4sBBHII"
+FILE_HDR_SIZE = struct.calcsize(FILE_HDR_FMT)
+BLOCK_MAGIC = 0xB10C
+BLOCK_HDR_FMT = "<HHI"
+BLOCK_HDR_SIZE = struct.calcsize(BLOCK_HDR_FMT)
+REC_FMT = "<IiiHhhhhhhHBB"
+REC_SIZE = struct.calcsize(REC_FMT)
+IMU_BLOCK_MAGIC = 0xB1A1
+IMU_HDR_FMT = "<IH"
+IMU_HDR_SIZE = struct.calcsize(IMU_HDR_FMT)
+IMU_FRAME_SIZE = 12
+
+
+class BinLogWriter:
+    def __init__(self, f, clock, records_per_block=32, buffer_size=8192, flush_interval_ms=10000, reserve=0):
+        self.out = AlignedWriter(f, buffer_size, flush_interval_ms, reserve=reserve)
+        self.records_per_block = records_per_block
+        self.clock = clock
+        self.start_epoch = clock.epoch_s()
+        # Header epoch in the clock's ms time base (t_ms = clock ms - base_ms)
+        self.base_ms = (self.start_epoch - clock.origin_s) * 1000
+
+        # One block: header + records, reused for the whole session
+        self._buf = bytearray(BLOCK_HDR_SIZE + records_per_block * REC_SIZE)
+        self._mv = memoryview(self._buf)
+        self.count = 0
+        self.records_total = 0
+        self.blocks_written = 0
+        self.imu_frames_total = 0
+        self._imu_hdr = bytearray(BLOCK_HDR_SIZE + IMU_HDR_SIZE)
+
+        self.out.write(struct.pack(FILE_HDR_FMT, FILE_MAGIC, FORMAT_VERSION, REC_SIZE,
+                            records_per_block, self.start_epoch, 0))
+
+    def append(self, lat, lon, speed_kmh, acc, gyr, vbat, sats=0, flags=0, t_ms=None):
+        """
+        Pack one sample into the block buffer; writes the block when full.
+        t_ms is the sample time on the clock (e.g. clock.last_fix_ms for a GPS
+        record); default is now.
+        """
+        if t_ms is None:
+            t_ms = self.clock.now_ms()
+        off = BLOCK_HDR_SIZE + self.count * REC_SIZE
+        struct.pack_into(REC_FMT, self._buf, off,
+                         max(0, t_ms - self.base_ms),
+                         int(lat * 10000000), int(lon * 10000000),
+                         min(int(speed_kmh * 100), 65535),
+                         int(acc['x']), int(acc['y']), int(acc['z']),
+                         int(gyr['x']), int(gyr['y']), int(gyr['z']),
+                         min(int(vbat * 1000), 65535), min(sats, 255), flags)
+        self.count += 1
+        self.records_total += 1
+        if self.count >= self.records_per_block:
+            self.write_block()
+
+    def append_imu(self, frames, count, period_us):
+        """
+        Log a burst of raw IMU FIFO frames as one IMU block (high-rate stream).
+        The newest frame is stamped with the current time and earlier frames
+        are spaced back from it by the sensor's frame period.
+        """
+        if not count:
+            return
+        now = self.clock.now_ms() - self.base_ms
+        t_first = max(0, now - ((count - 1) * period_us) // 1000)
+        struct.pack_into(IMU_HDR_FMT, self._imu_hdr, BLOCK_HDR_SIZE, t_first, period_us)
+        crc = crc32(frames, crc32(memoryview(self._imu_hdr)[BLOCK_HDR_SIZE:])) & 0xFFFFFFFF
+        struct.pack_into(BLOCK_HDR_FMT, self._imu_hdr, 0, IMU_BLOCK_MAGIC, count, crc)
+        self.out.write(self._imu_hdr)
+        self.out.write(frames)
+        self.imu_frames_total += count
+
+    def write_block(self):
+        """Seal the current (possibly partial) block with its CRC and write it."""
+        if not self.count:
+            return
+        end = BLOCK_HDR_SIZE + self.count * REC_SIZE
+        crc = crc32(self._mv[BLOCK_HDR_SIZE:end]) & 0xFFFFFFFF
+        struct.pack_into(BLOCK_HDR_FMT, self._buf, 0, BLOCK_MAGIC, self.count, crc)
+        self.out.write(self._mv[:end])
+        self.count = 0
+        self.blocks_written += 1
+
+    def flush(self):
+        """Seal any partial block and sync it to the card (PAUSED, low battery)."""
+        self.write_block()
+        self.out.sync()
+
+    def poll(self):
+        """Time-based flush policy; call once per main loop iteration."""
+        if self.out.due():
+            self.flush()
+
+    def close(self):
+        self.flush()
+        self.out.truncate() # Preallocated tail (kept where the port cannot truncate)
+        self.out.f.close()
+
+    def reopen(self, f):
+        """Continue on a reopened ('ab') handle, e.g. after renaming the file."""
+        self.out.f = f
+
+
+def recover_length(path, offset=0, crc=0, buf_size=4096):
+    """
+    Data length of a log that was not closed (reset, power loss): a
+    preallocated file is longer than its data and the tail holds stale card
+    contents. Walks the blocks from `offset` (a block boundary with `crc` the
+    CRC32 of the file up to it, e.g. as last recorded in the session index)
+    and stops at the first block whose magic or CRC does not check.
+    Returns (length, crc32 of the file up to length).
+    """
+    buf = bytearray(buf_size)
+    mv = memoryview(buf)
+    with open(path, 'rb') as f:
+        if offset < FILE_HDR_SIZE:
+            n = f.readinto(mv[:FILE_HDR_SIZE])
+            if n < FILE_HDR_SIZE or buf[:4] != FILE_MAGIC:
+                return 0, 0
+            offset = FILE_HDR_SIZE
+            crc = crc32(mv[:FILE_HDR_SIZE])
+        else:
+            f.seek(offset)
+        while True:
+            if f.readinto(mv[:BLOCK_HDR_SIZE]) < BLOCK_HDR_SIZE:
+                break
+            magic, count, bcrc = struct.unpack_from(BLOCK_HDR_FMT, buf, 0)
+            if magic == BLOCK_MAGIC:
+                n = count * REC_SIZE
+            elif magic == IMU_BLOCK_MAGIC:
+                n = IMU_HDR_SIZE + count * IMU_FRAME_SIZE
+            else:
+                break
+            if not count or BLOCK_HDR_SIZE + n > buf_size:
+                break
+            if f.readinto(mv[BLOCK_HDR_SIZE:BLOCK_HDR_SIZE + n]) < n:
+                break
+            if crc32(mv[BLOCK_HDR_SIZE:BLOCK_HDR_SIZE + n]) & 0xFFFFFFFF != bcrc:
+                break
+            crc = crc32(mv[:BLOCK_HDR_SIZE + n], crc)
+            offset += BLOCK_HDR_SIZE + n
+    return offset, crc & 0xFFFFFFFF
@@ -0,0 +1,237 @@
+# lib/ble_bulk.py - Bulk session transfer over BLE notifications
+#
+# Lets a phone pull a small session without switching the WiFi radio to AP
+# mode. BLEProvisioning registers the bulk service (files / control / data
+# characteristics) and hands the traffic to BulkTransfer, which holds the
+# protocol state and is independent of the radio (tests/ble_bulk.py drives it
+# over a simulated link).
+#
+# Files characteristic (read): JSON list of sessions
+#   [{"name": "sess_123.rsl", "size": 81920, "encoding": "deflate"}, ...]
+#   ("encoding" only for sessions stored compressed: the stored bytes are sent)
+#
+# Control characteristic (write, little-endian):
+#   'G' <u32 offset> <name>   Send a file from offset (0, or the bytes already held)
+#   'A' <u32 offset>          Cumulative ack: all bytes below offset received
+#   'N' <u32 offset>          Gap seen: resend from offset
+#   'X'                       Cancel
+#
+# Data characteristic (notify):
+#   'D' <u32 offset> <data>   Up to MTU - 3 - 5 bytes of file data
+#   'E' <u32 size> <u32 crc>  End of file: CRC32 of the bytes from the 'G' offset to the end
+#   'F' <message>             Failure (unknown file, read error)
+#
+# The device keeps at most WINDOW_BYTES unacknowledged; the client acks every
+# half window. When nothing could be sent and no ack came for ACK_TIMEOUT_MS,
+# the unacked bytes are sent again (go-back-N). A dropped connection resumes with 'G' at the client's
+# offset.
+import struct
+import time
+
+try:
+    from binascii import crc32
+except ImportError:
+    from ubinascii import crc32
+
+try:
+    ticks_ms = time.ticks_ms
+    ticks_diff = time.ticks_diff
+except AttributeError:
+    # CPython (tests/ble_bulk.py)
+    ticks_ms = lambda: int(time.perf_counter() * 1000)
+    ticks_diff = lambda a, b: a - b
+
+DEFAULT_MTU = 23         # Until the central negotiates a larger one
+MAX_MTU = 247            # Requested from the central (one LL packet with DLE)
+HEADER = 5               # 'D' + u32 offset
+WINDOW_BYTES = 8192      # Unacknowledged data in flight
+ACK_TIMEOUT_MS = 1500
+FRAMES_PER_PUMP = 12     # Notifications queued per main loop call
+
+
+class BulkTransfer:
+    def __init__(self, session_mgr):
+        self.sm = session_mgr
+        self.mtu = DEFAULT_MTU
+        self._frame = bytearray(MAX_MTU - 3)
+        self._mv = memoryview(self._frame)
+        self._f = None
+        self.name = None
+        self._pending = None     # (name, offset) from the control IRQ, opened in pump()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.counters = {
+            "files": 0,
+            "bytes": 0,            # File data delivered (acked)
+            "sent": 0,             # Data bytes notified incl. resends
+            "frames": 0,
+            "resends": 0,          # Go-back-N rewinds
+            "busy": 0,             # Notify refused (stack queue full)
+            "last_kbps": 0.0
+        }
+
+    # --- Control (called from the BLE IRQ: no file access here) ---
+
+    def set_mtu(self, mtu):
+        self.mtu = max(DEFAULT_MTU, min(mtu, MAX_MTU))
+
+    def on_control(self, data):
+        if not data:
+            return
+        cmd = data[0]
+        if cmd == 0x47 and len(data) > 5: # 'G'
+            self._pending = (bytes(data[5:]).decode(), struct.unpack_from("<I", data, 1)[0])
+        elif cmd == 0x41 and len(data) >= 5 and self._f: # 'A'
+            off = struct.unpack_from("<I", data, 1)[0]
+            if self.acked < off <= self._crc_pos:
+                self.acked = off
+                if self.pos < off:
+                    self.pos = off # Acked while a rewind was pending
+                self._ack_ms = ticks_ms()
+        elif cmd == 0x4E and len(data) >= 5 and self._f: # 'N'
+            off = struct.unpack_from("<I", data, 1)[0]
+            if self.acked <= off < self.pos:
+                self.acked = off
+                self._rewind()
+        elif cmd == 0x58: # 'X'
+            self._pending = None
+            self.cancel()
+
+    def cancel(self):
+        """Stop the current file (cancel command or central disconnected)."""
+        if self._f:
+            try:
+                self._f.close()
+            except OSError:
+                pass
+            self._f = None
+            self.sm.transfer_end(self.name)
+            print(f"[BLE] Bulk {self.name} stopped at {self.acked} B")
+        self.name = None
+
+    def files_json(self):
+        import json
+        out = []
+        for name in self.sm.list_sessions():
+            # Sizes from the session index (no stat per file in a GATT read)
+            _, encoding = self.sm.session_path(name)
+            entry = {"name": name, "size": self.sm.session_size(name)}
+            if encoding:
+                entry["encoding"] = encoding
+            out.append(entry)
+        return json.dumps(out)
+
+    # --- Sending (main loop) ---
+
+    def _open(self, name, offset):
+        self.cancel()
+        if '/' in name:
+            raise OSError("bad name")
+        path, _ = self.sm.session_path(name)
+        self.size = self.sm.session_size(name) # Data length (a preallocated log is longer)
+        if offset > self.size:
+            offset = self.size
+        self._f = open(path, 'rb')
+        self._f.seek(offset)
+        self.name = name
+        self.sm.transfer_start(name)
+        self.start = self.pos = self.acked = self._crc_pos = offset
+        self._fpos = offset
+        self.crc = 0
+        self._t0 = self._ack_ms = ticks_ms()
+        self._ended = False
+
+    def _rewind(self):
+        self.counters["resends"] += 1
+        self.pos = self.acked
+        self._ended = False
+
+    def pump(self, notify):
+        """
+        Queue up to FRAMES_PER_PUMP notifications through notify(frame) -> bool
+        (False: the stack's queue is full, try again next call). Returns the
+        number of frames queued.
+        """
+        if self._pending:
+            name, offset = self._pending
+            self._pending = None
+            try:
+                self._open(name, offset)
+            except OSError as e:
+                self.cancel()
+                msg = f"F{name}: {e}".encode()
+                notify(memoryview(msg))
+                return 1
+        if not self._f:
+            return 0
+
+        sent = 0
+        st = self.counters
+        mv = self._mv
+        payload = self.mtu - 3 - HEADER
+        while sent < FRAMES_PER_PUMP:
+            if self._ended and self.acked >= self.size:
+                self._finish()
+                return sent
+            if self.pos >= self.size or self.pos - self.acked >= WINDOW_BYTES:
+                # Waiting for acks (the 'E' frame goes out once, resent on timeout)
+                if self.pos >= self.size and not self._ended:
+                    self._frame[0] = 0x45 # 'E'
+                    struct.pack_into("<II", self._frame, 1, self.size, self.crc & 0xFFFFFFFF)
+                    if not notify(mv[:9]):
+                        st["busy"] += 1
+                        return sent
+                    self._ended = True
+                    self._ack_ms = ticks_ms()
+                    sent += 1
+                elif ticks_diff(ticks_ms(), self._ack_ms) > ACK_TIMEOUT_MS:
+                    self._rewind()
+                    self._ack_ms = ticks_ms()
+                    continue
+                return sent
+
+            if self._fpos != self.pos:
+                self._f.seek(self.pos)
+            n = self._f.readinto(mv[HEADER:HEADER + min(payload, self.size - self.pos)])
+            if not n:
+                self.size = self.pos # Truncated under us: end here
+                continue
+            self._frame[0] = 0x44 # 'D'
+            struct.pack_into("<I", self._frame, 1, self.pos)
+            if not notify(mv[:HEADER + n]):
+                st["busy"] += 1
+                self._fpos = -1
+                return sent
+            if self.pos == self._crc_pos:
+                self.crc = crc32(mv[HEADER:HEADER + n], self.crc)
+                self._crc_pos += n
+            self.pos += n
+            self._fpos = self.pos
+            self._ack_ms = ticks_ms() # Stall timer runs from the last frame out
+            st["sent"] += n
+            st["frames"] += 1
+            sent += 1
+        return sent
+
+    def _finish(self):
+        st = self.counters
+        ms = max(1, ticks_diff(ticks_ms(), self._t0))
+        n = self.size - self.start
+        st["files"] += 1
+        st["bytes"] += n
+        st["last_kbps"] = round(n * 8 / ms, 1)
+        self._f.close()
+        self._f = None
+        self.sm.transfer_end(self.name)
+        print(f"[BLE] Bulk {self.name}: {n} B in {ms} ms ({st['last_kbps']} kbit/s, "
+              f"MTU {self.mtu}, {st['resends']} resends)")
+        self.name = None
+
+    def stats(self):
+        out = dict(self.counters)
+        out["mtu"] = self.mtu
+        out["active"] = self.name
+        if self._f:
+            out["progress"] = [self.acked, self.size]
+        return out
@@ -5,12 +5,14 @@ import ubinascii
 import struct
 import time
 from micropython import const
+from lib.ble_bulk import BulkTransfer, DEFAULT_MTU, MAX_MTU
 
 # BLE IRQ constants
 _IRQ_CENTRAL_CONNECT = const(1)
 _IRQ_CENTRAL_DISCONNECT = const(2)
 _IRQ_GATTS_WRITE = const(3)
 _IRQ_GATTS_READ_REQUEST = const(4)
+_IRQ_MTU_EXCHANGED = const(21)
 
 # Custom UUIDs
 SERVICE_UUID = bluetooth.UUID("12345678-1234-5678-1234-567812345678")
@@ -22,6 +24,12 @@ CHAR_STATUS_UUID = bluetooth.UUID("12345678-1234-5678-1234-567812345002")
 CHAR_CONFIGURE_UUID = bluetooth.UUID("12345678-1234-5678-1234-567812345003")
 CHAR_DEVICE_INFO_UUID = bluetooth.UUID("12345678-1234-5678-1234-567812345004")
 
+# Bulk transfer service (lib/ble_bulk.py)
+BULK_SERVICE_UUID = bluetooth.UUID("12345678-1234-5678-1234-567812346000")
+CHAR_BULK_FILES_UUID = bluetooth.UUID("12345678-1234-5678-1234-567812346001")
+CHAR_BULK_CONTROL_UUID = bluetooth.UUID("12345678-1234-5678-1234-567812346002")
+CHAR_BULK_DATA_UUID = bluetooth.UUID("12345678-1234-5678-1234-567812346003")
+
 class BLEProvisioning:
     def __init__(self, wifi_manager=None, session_manager=None):
         self.wifi_mgr = wifi_manager
@@ -32,6 +40,12 @@ class BLEProvisioning:
         
         self._connections = set()
         self._wlan = network.WLAN(network.STA_IF)
+        self.bulk = BulkTransfer(session_manager) if session_manager else None
+        self._bulk_conn = None # Central that sent the last bulk command
+        try:
+            self.ble.config(mtu=MAX_MTU) # Offered when the central exchanges MTU
+        except Exception:
+            pass
         
         # Register services
         self._register_services()
@@ -58,7 +72,17 @@ class BLEProvisioning:
                 (CHAR_DEVICE_INFO_UUID, bluetooth.FLAG_READ),
             ),
         )
-        ((self._h_networks, self._h_status, self._h_configure, self._h_device_info),) = self.ble.gatts_register_services((service,))
+        bulk = (
+            BULK_SERVICE_UUID,
+            (
+                (CHAR_BULK_FILES_UUID, bluetooth.FLAG_READ),
+                (CHAR_BULK_CONTROL_UUID, bluetooth.FLAG_WRITE | bluetooth.FLAG_WRITE_NO_RESPONSE),
+                (CHAR_BULK_DATA_UUID, bluetooth.FLAG_NOTIFY),
+            ),
+        )
+        ((self._h_networks, self._h_status, self._h_configure, self._h_device_info),
+         (self._h_bulk_files, self._h_bulk_control, self._h_bulk_data)) = self.ble.gatts_register_services((service, bulk))
+        self.ble.gatts_set_buffer(self._h_bulk_control, 96) # 'G' + offset + session name
 
     def _update_all_chars(self):
         self.ble.gatts_write(self._h_networks, self._networks_json)
@@ -112,17 +136,30 @@ class BLEProvisioning:
             conn_handle, addr_type, addr = data
             self._connections.discard(conn_handle)
             print(f"[BLE] Cental disconnected: {conn_handle}")
+            if self.bulk and conn_handle == self._bulk_conn:
+                self.bulk.cancel() # The central resumes with 'G' at its offset
+                self.bulk.set_mtu(DEFAULT_MTU)
+                self._bulk_conn = None
             self.start() # Resume advertising
         elif event == _IRQ_GATTS_WRITE:
             conn_handle, attr_handle = data
             if attr_handle == self._h_configure:
                 value = self.ble.gatts_read(self._h_configure)
                 self._handle_write(value.decode())
+            elif self.bulk and attr_handle == self._h_bulk_control:
+                self._bulk_conn = conn_handle
+                self.bulk.on_control(self.ble.gatts_read(self._h_bulk_control))
         elif event == _IRQ_GATTS_READ_REQUEST:
             conn_handle, attr_handle = data
             if attr_handle == self._h_networks:
                 # Refresh networks on read request
                 self._scan_networks()
+            elif self.bulk and attr_handle == self._h_bulk_files:
+                self.ble.gatts_write(self._h_bulk_files, self.bulk.files_json())
+        elif event == _IRQ_MTU_EXCHANGED:
+            conn_handle, mtu = data
+            if self.bulk:
+                self.bulk.set_mtu(mtu)
 
     def _scan_networks(self):
         print("[BLE] Scanning for WiFi networks...")
@@ -163,7 +200,7 @@ class BLEProvisioning:
                 if self._wlan.isconnected():
                     import _thread
                     import lib.uploader as uploader
-                    _thread.start_new_thread(uploader.upload_all, (self.sm,))
+                    _thread.start_new_thread(uploader.upload_all, (self.sm, None, self))
             else:
                 # Try parsing as JSON: {ssid, password, api_url}
                 try:
@@ -227,6 +264,18 @@ class BLEProvisioning:
         except:
             pass
 
+    def pump_bulk(self):
+        """Main loop task: queue the next bulk transfer notifications."""
+        if self.bulk and self._bulk_conn is not None:
+            self.bulk.pump(self._notify_bulk)
+
+    def _notify_bulk(self, frame):
+        try:
+            self.ble.gatts_notify(self._bulk_conn, self._h_bulk_data, frame)
+            return True
+        except OSError:
+            return False # Notification queue full: retried next call
+
     def notify_sync_progress(self, progress: int, filename: str):
         # Update the status JSON with progress
         status = json.loads(self._status_json.decode())
@@ -0,0 +1,154 @@
+# lib/gps_clock.py - GPS-anchored millisecond clock
+#
+# time.time() only has whole seconds. GPSClock maps time.ticks_us() onto GPS
+# UTC: every new fix re-anchors the tick counter to the fix time, and the tick
+# rate error is tracked in ppm so stamps between fixes (IMU frames, log
+# records) stay at ms resolution.
+#
+# Fix arrival is only seen when the UART is polled, so the measured latency
+# jitters upwards. Anchoring is therefore asymmetric: a fix that arrives
+# "early" against the prediction is trusted (the clock was late), a late one
+# only nudges the clock. The corrections applied over a 10 s window give the
+# tick rate error (skew).
+#
+# Times are ms since `origin_s`, an epoch second fixed at the first anchor, so
+# the hot path works on small ints; epoch ms = origin_s * 1000 + ms.
+import time
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError:
+    # CPython (host tests)
+    ticks_us = lambda: int(time.perf_counter() * 1000000)
+    ticks_diff = lambda a, b: a - b
+
+
+def days_from_civil(y, m, d):
+    """Days since 1970-01-01 for a proleptic Gregorian date."""
+    if m <= 2:
+        y -= 1
+    era = (y if y >= 0 else y - 399) // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def utc_to_epoch_s(y, mo, d, h, mi, s):
+    return days_from_civil(y, mo, d) * 86400 + h * 3600 + mi * 60 + s
+
+
+def weekday(y, mo, d):
+    """0 = Monday, as machine.RTC().datetime() expects."""
+    return (days_from_civil(y, mo, d) + 3) % 7
+
+
+class GPSClock:
+    MAX_SKEW_PPM = 500
+    STEP_MS = 1000          # Larger errors re-anchor instead of slewing
+    SKEW_WINDOW_MS = 10000
+    REBASE_US = 1 << 28     # Keep ticks_diff well inside the ticks_us period
+
+    def __init__(self, latency_ms=0):
+        # Until the first fix the clock runs from the RTC (whole seconds)
+        self.origin_s = int(time.time())
+        self.latency_ms = latency_ms # Fix epoch -> first byte read (transport delay)
+        self._base_ms = 0
+        self._base_frac = 0  # Sub-ms part of the anchor (us), avoids truncation bias
+        self._base_us = ticks_us()
+        self.skew_ppm = 0
+        self.synced = False
+
+        self.last_fix_ms = 0 # Measurement time of the latest fix (ms since origin)
+        self._last_utc = None
+        self._win_start_ms = 0
+        self._win_corr = 0   # us
+
+        # Stats
+        self.fixes = 0
+        self.steps = 0
+        self.last_err_ms = 0
+
+    def _elapsed_us(self, t_us):
+        """Corrected us since the anchor (incl. its sub-ms part) at ticks_us t_us."""
+        dt = ticks_diff(t_us, self._base_us)
+        if dt > self.REBASE_US:
+            # Long gap without fixes: move the base forward before ticks wrap
+            self._anchor(self._base_frac + dt + dt * self.skew_ppm // 1000000, t_us)
+            dt = 0
+        return self._base_frac + dt + dt * self.skew_ppm // 1000000
+
+    def now_ms(self, t_us=None):
+        """ms since origin_s at ticks_us value t_us (default: now)."""
+        if t_us is None:
+            t_us = ticks_us()
+        return self._base_ms + self._elapsed_us(t_us) // 1000
+
+    def epoch_ms(self, ms=None):
+        return self.origin_s * 1000 + (self.now_ms() if ms is None else ms)
+
+    def epoch_s(self):
+        return self.origin_s + self.now_ms() // 1000
+
+    def _anchor(self, rel_us, t_us):
+        """Move the anchor by rel_us (relative to the current one) to ticks t_us."""
+        self._base_ms += rel_us // 1000
+        self._base_frac = rel_us % 1000
+        self._base_us = t_us
+
+    def on_fix(self, utc, rx_us):
+        """
+        Anchor to a GPS solution. utc = (y, mo, d, h, mi, s, ms), rx_us = ticks_us
+        when it was read. Returns True on the first sync (origin changed).
+        """
+        if utc == self._last_utc:
+            return False # Same time as the last fix (stale UTC, fresh rx_us): would set the clock back
+        self._last_utc = utc
+        y, mo, d, h, mi, s, ms = utc
+        epoch_s = utc_to_epoch_s(y, mo, d, h, mi, s)
+        self.fixes += 1
+
+        if not self.synced:
+            self.origin_s = epoch_s
+            self.last_fix_ms = ms
+            self._base_ms = 0
+            self._anchor((ms + self.latency_ms) * 1000, rx_us)
+            self._win_start_ms = ms
+            self._win_corr = 0
+            self.synced = True
+            return True
+
+        fix_ms = (epoch_s - self.origin_s) * 1000 + ms
+        self.last_fix_ms = fix_ms
+        pred = self._elapsed_us(rx_us) # us past _base_ms
+        err = (fix_ms + self.latency_ms - self._base_ms) * 1000 - pred
+        self.last_err_ms = err // 1000
+
+        if err > self.STEP_MS * 1000 or err < -self.STEP_MS * 1000:
+            self._anchor(pred + err, rx_us)
+            self._win_start_ms = fix_ms
+            self._win_corr = 0
+            self.steps += 1
+            return False
+
+        corr = err // 2 if err > 0 else -((-err) // 16)
+        self._anchor(pred + corr, rx_us)
+        self._win_corr += corr
+
+        span = fix_ms - self._win_start_ms
+        if span >= self.SKEW_WINDOW_MS:
+            skew = self.skew_ppm + self._win_corr * 1000 // span // 2
+            self.skew_ppm = max(-self.MAX_SKEW_PPM, min(self.MAX_SKEW_PPM, skew))
+            self._win_start_ms = fix_ms
+            self._win_corr = 0
+        return False
+
+    def stats(self):
+        return {
+            "synced": self.synced,
+            "skew_ppm": self.skew_ppm,
+            "last_err_ms": self.last_err_ms,
+            "fixes": self.fixes,
+            "steps": self.steps
+        }
@@ -0,0 +1,194 @@
+# lib/lap_delta.py - Live predictive lap delta against a reference lap
+import math
+from array import array
+
+# Reference lap (track record "ref", pushed by the server with /track/set):
+#   {"v": 1, "lat0": .., "lon0": .., "step_m": 5, "lap_ms": 83456,
+#    "x": [..], "y": [..], "t": [..]}
+# The best lap resampled every step_m metres from the start line (lat0, lon0).
+# x/y are decimetres east/north of the start line, t is ms since the lap
+# started. All three are delta-encoded (each value is the change from the
+# previous point). The last point closes the lap, so segment i runs from
+# point i to point i+1. On load the points are moved into the caller's local
+# projection (TrackEngine: meters around the track's start line).
+REF_VERSION = 1
+
+LOCK_M = 20                # Acquire: fix within this distance of the reference
+LOST_M = 40                # Drop lock beyond this distance (pit lane, off track)
+ACQUIRE_STRIDE = 4         # Coarse acquisition search: every Nth point
+WINDOW_BACK = 2            # Segments searched behind the last match
+WINDOW_AHEAD = 3           # ...and ahead, plus the distance covered since then
+MAX_SPEED_MPS = 100
+MAX_GAP_MS = 5000          # Longer gaps (or time going back) restart the lap
+WRAP_SEGMENTS = 8          # End-of-lap -> start-of-lap jump = start line crossed
+
+
+def _decode(deltas):
+    out = array('i', deltas)
+    for i in range(1, len(out)):
+        out[i] += out[i - 1]
+    return out
+
+
+class LapDelta:
+    """
+    Projects each fix onto the reference lap and reports how far ahead (-)
+    or behind (+) of it the current lap is, in ms.
+    Only a small window around the last match is searched on each fix, so
+    the cost per fix does not depend on the length of the track.
+    """
+
+    def __init__(self, ref, lat0, lon0, kx, ky):
+        """
+        ref: track record "ref". lat0/lon0: origin of the caller's projection,
+        kx/ky: its meters per degree of longitude/latitude.
+        """
+        if ref.get('v', REF_VERSION) != REF_VERSION:
+            raise ValueError("Unsupported reference version")
+        self.x = _decode(ref['x'])
+        self.y = _decode(ref['y'])
+        self.t = _decode(ref['t'])
+        n = len(self.t)
+        if n < 3 or len(self.x) != n or len(self.y) != n:
+            raise ValueError("Bad reference arrays")
+        self.nseg = n - 1
+        self.lap_ms = self.t[-1]
+        self.step_dm = int(ref.get('step_m', 5) * 10)
+
+        # Shift from the reference's origin to the caller's
+        ox = int((ref['lon0'] - lon0) * kx * 10)
+        oy = int((ref['lat0'] - lat0) * ky * 10)
+        x, y = self.x, self.y
+        for i in range(n):
+            x[i] += ox
+            y[i] += oy
+        self.reset()
+
+    def reset(self):
+        self.locked = False
+        self.seg = 0
+        self.ref_ms = 0.0          # Reference time at the last match
+        self.last_t_ms = None
+        self.lap_start_ms = None   # Set when the start line is crossed
+        self.delta_ms = None
+        self.dist_m = 0.0          # Distance from the matched point
+
+    def _match(self, px, py, k):
+        """Squared distance (dm^2) to segment k and the position along it."""
+        x, y = self.x, self.y
+        ax = x[k]
+        ay = y[k]
+        dx = x[k + 1] - ax
+        dy = y[k + 1] - ay
+        rx = px - ax
+        ry = py - ay
+        l2 = dx * dx + dy * dy
+        f = (rx * dx + ry * dy) / l2 if l2 else 0.0
+        if f < 0.0:
+            f = 0.0
+        elif f > 1.0:
+            f = 1.0
+        ex = rx - f * dx
+        ey = ry - f * dy
+        return ex * ex + ey * ey, f
+
+    def _acquire(self, px, py):
+        """Nearest reference point on a coarse grid, or -1 if none is close."""
+        x, y = self.x, self.y
+        best = -1
+        best_d2 = (LOCK_M * 10 + ACQUIRE_STRIDE * self.step_dm) ** 2
+        for i in range(0, self.nseg, ACQUIRE_STRIDE):
+            dx = px - x[i]
+            dy = py - y[i]
+            d2 = dx * dx + dy * dy
+            if d2 < best_d2:
+                best_d2 = d2
+                best = i
+        return best
+
+    def update(self, x, y, t_ms):
+        """
+        Feed one fix (x/y: meters in the caller's projection, t_ms: fix time
+        in ms). Returns the lap delta in ms, or None until the first start
+        line crossing on the reference.
+        """
+        px = x * 10
+        py = y * 10
+        nseg = self.nseg
+
+        last_t = self.last_t_ms
+        gap = t_ms - last_t if last_t is not None else -1
+        if gap < 0 or gap > MAX_GAP_MS:
+            self.locked = False
+            self.lap_start_ms = None
+
+        if self.locked:
+            ahead = WINDOW_AHEAD + gap * MAX_SPEED_MPS * 10 // (1000 * self.step_dm)
+            start = self.seg - WINDOW_BACK
+            count = WINDOW_BACK + 1 + min(ahead, nseg // 2)
+        else:
+            i = self._acquire(px, py)
+            if i < 0:
+                self.last_t_ms = t_ms
+                self.delta_ms = None
+                return None
+            start = i - ACQUIRE_STRIDE
+            count = 2 * ACQUIRE_STRIDE + 1
+
+        best_k = -1
+        best_d2 = 0.0
+        best_f = 0.0
+        for j in range(count):
+            k = (start + j) % nseg
+            d2, f = self._match(px, py, k)
+            if best_k < 0 or d2 < best_d2:
+                best_k = k
+                best_d2 = d2
+                best_f = f
+
+        lost_dm = (LOST_M if self.locked else LOCK_M) * 10
+        if best_d2 > lost_dm * lost_dm:
+            self.reset()
+            self.last_t_ms = t_ms
+            return None
+
+        t = self.t
+        ref_ms = t[best_k] + best_f * (t[best_k + 1] - t[best_k])
+
+        # Start line: the match jumped from the end of the reference to its start
+        # (not just jitter around the line). Split the gap between the fixes by
+        # reference time on either side.
+        lap_ms = self.lap_ms
+        if (self.locked and self.seg >= nseg - WRAP_SEGMENTS and best_k < WRAP_SEGMENTS
+                and (self.lap_start_ms is None or t_ms - self.lap_start_ms > lap_ms // 2)):
+            before = lap_ms - self.ref_ms
+            span = before + ref_ms
+            frac = before / span if span > 0 else 0.0
+            self.lap_start_ms = last_t + int(gap * frac + 0.5)
+
+        self.locked = True
+        self.seg = best_k
+        self.ref_ms = ref_ms
+        self.last_t_ms = t_ms
+        self.dist_m = math.sqrt(best_d2) / 10
+
+        if self.lap_start_ms is None:
+            self.delta_ms = None
+        else:
+            self.delta_ms = int(t_ms - self.lap_start_ms - ref_ms)
+        return self.delta_ms
+
+    def progress(self):
+        """Fraction of the reference lap covered at the last match."""
+        return self.ref_ms / self.lap_ms if self.lap_ms else 0.0
+
+    def get_status(self):
+        return {
+            "ref_points": self.nseg + 1,
+            "ref_lap_ms": self.lap_ms,
+            "locked": self.locked,
+            "lap_started": self.lap_start_ms is not None,
+            "delta_ms": self.delta_ms,
+            "progress": round(self.progress(), 3),
+            "offset_m": round(self.dist_m, 1)
+        }
@@ -3,6 +3,9 @@ import neopixel
 import time
 import math
 
+DELTA_MS_PER_LED = 100      # Lap delta bar: one LED per 0.1s
+DELTA_STALE_MS = 2000       # Bar is hidden when no delta arrived for this long
+
 class LEDManager:
     """
     Manages NeoPixel animations on the ESP32.
@@ -12,7 +15,7 @@ class LEDManager:
     1. Storage Critical (>= 90%) - Solid Red
     2. Sector Events (Flash) - Green/Orange/Red
     3. Track Found (3s White Flash)
-    4. Normal Logging/Search animations
+    4. Normal Logging/Search animations (live lap delta bar when timing a lap)
     """
     def __init__(self, pin=4, count=8):
         self.pin = Pin(pin, Pin.OUT)
@@ -24,6 +27,10 @@ class LEDManager:
         self._event_active = False
         self._event_end_time = 0
         self._event_type = None
+        
+        # Live lap delta (ms, - ahead / + behind), shown while LOGGING
+        self._delta_ms = None
+        self._delta_time = 0
 
     def clear(self):
         for i in range(self.count):
@@ -68,6 +75,9 @@ class LEDManager:
             intensity = int((math.sin(t * 3.0) + 1) / 2 * 150)
             self.set_color(intensity, 0, 0)
             
+        elif state == "LOGGING" and self._delta_fresh(now):
+            self._show_delta()
+
         elif state == "LOGGING":
             # Blue Scanner (KITT style)
             self.clear_buffer()
@@ -98,6 +108,32 @@ class LEDManager:
             intensity = int((math.sin(t * 1.0) + 1) / 2 * 10)
             self.set_color(0, intensity, 0)
 
+    def set_delta(self, delta_ms):
+        """Latest live lap delta (None: no reference / not on a timed lap)."""
+        self._delta_ms = delta_ms
+        self._delta_time = time.ticks_ms()
+
+    def _delta_fresh(self, now):
+        return self._delta_ms is not None and time.ticks_diff(now, self._delta_time) < DELTA_STALE_MS
+
+    def _show_delta(self):
+        """Bar from the centre: green to the right when ahead, red to the left when behind."""
+        self.clear_buffer()
+        d = self._delta_ms
+        half = self.count // 2
+        n = min(half, abs(d) // DELTA_MS_PER_LED)
+        if n == 0:
+            # Within 0.1s: dim white centre pair
+            self.np[half - 1] = (40, 40, 40)
+            self.np[half] = (40, 40, 40)
+        elif d < 0:
+            for i in range(half, half + n):
+                self.np[i] = (0, 255, 0)
+        else:
+            for i in range(half - n, half):
+                self.np[i] = (255, 0, 0)
+        self.np.write()
+
     def clear_buffer(self):
         for i in range(self.count):
             self.np[i] = (0, 0, 0)
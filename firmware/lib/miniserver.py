@@ -1,194 +1,425 @@
 # lib/miniserver.py - Minimal HTTP Server for ESP32
-import socket
-import os
+#
+# Event-driven on asyncio streams (uasyncio on older MicroPython): start()
+# runs the event loop on the second core and sleeps in select() until a
+# socket is ready, so an idle server costs no CPU and does not wake the
+# logging core. Each connection is its own task: a stalled client only holds
+# its own task (until CLIENT_TIMEOUT_S), others are served meanwhile, up to
+# MAX_CLIENTS at once.
+#
+# Requests are read incrementally: the head in reads of at most HEAD_CHUNK
+# bytes, split into lines here (Stream.readline() would buffer a line without
+# limit; a line longer than MAX_LINE gets 400), bodies in RECV_BUF chunks. Uploads (/ota/file, /update?filename=) go
+# straight to the file; JSON bodies are read in one piece (MAX_BODY).
+# The shared send buffer is filled and handed to stream.write() with no
+# await in between (write copies what the socket does not take at once), so
+# tasks never see each other's data in it.
 import json
 import gc
+from lib.session_index import SIZE, CRC, START, END, LAPS, CLOSED
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+try:
+    from binascii import crc32
+except ImportError:
+    from ubinascii import crc32
+
+SEND_BUF = 4096        # File send buffer (8 SD sectors), allocated once
+RECV_BUF = 2048        # Upload receive buffer, one per upload
+KEEPALIVE_S = 2        # A keep-alive client may stay idle this long between requests
+KEEPALIVE_MAX = 100    # Requests served per connection
+CLIENT_TIMEOUT_S = 5   # Request head, or one body chunk, must arrive within this
+MAX_CLIENTS = 4        # Concurrent connections (lwIP sockets are few); more get 503
+MAX_HEADERS = 32
+MAX_LINE = 1024        # Request line / header line
+HEAD_CHUNK = 256       # Request head read size (bytes past the head are kept for the body)
+MAX_BODY = 65536       # JSON bodies (read whole); file uploads are streamed
+
+# GET /bundle[?files=a.rsl,b.rsl] streams several session files in one
+# response (all sessions when no list is given). Per file:
+#   {"name": "sess_123.rsl", "size": 81920}\n   JSON header line ("encoding": "deflate"
+#                                              when stored compressed)
+#   <size bytes of file data>
+#   1a2b3c4d\n                                 CRC32 of the data, 8 hex digits
+
+STATUS = {200: 'OK', 206: 'Partial Content', 304: 'Not Modified', 400: 'Bad Request',
+          404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+          416: 'Range Not Satisfiable', 500: 'Error', 503: 'Service Unavailable'}
+
+
+class Client:
+    """One connection: its stream and the state of the request being served."""
+
+    def __init__(self, stream):
+        self.s = stream
+        self.keep_alive = False
+        self.headers = {}  # Lower-case name -> value
+        self.rx = b''      # Read past the line / head: start of the body or next request
+
 
 class MiniServer:
     VERSION = "1.1.0"
 
-    def __init__(self, session_mgr, led=None, gps_state=None, track_engine=None):
+    def __init__(self, session_mgr, led=None, gps_state=None, track_engine=None, scheduler=None,
+                 compressor=None, boot_stats=None):
         self.sm = session_mgr
         self.led = led
         self.gps_state = gps_state
         self.track_engine = track_engine  # TrackEngine instance
-        self.sock = None
+        self.scheduler = scheduler        # Main loop Scheduler (task timing stats)
+        self.compressor = compressor      # SessionCompressor (background deflate stats)
+        self.boot_stats = boot_stats      # Import time / free heap at boot (main.py)
+        self.server = None
         self.running = False
-        
+        self.clients = 0                  # Connections being served
+        self.served = 0
+        self.rejected = 0
+        self._buf = bytearray(SEND_BUF)
+        self._mv = memoryview(self._buf)
+
     def start(self, port=80):
-        import time
-        addr = socket.getaddrinfo('0.0.0.0', port)[0][-1]
-        self.sock = socket.socket()
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
+        """Second core: run the event loop (does not return while the server runs)."""
+        asyncio.run(self.serve(port))
+
+    async def serve(self, port=80):
         # Retry bind
         for i in range(3):
             try:
-                self.sock.bind(addr)
+                self.server = await asyncio.start_server(self.handle_client, '0.0.0.0', port, backlog=5)
                 break
             except OSError as e:
                 print(f"Bind Error {e}, retrying...")
-                time.sleep(1)
-        
-        self.sock.listen(5)
-        self.sock.settimeout(0.01) # Reduced from 0.1 for faster loop
+                await asyncio.sleep(1)
+        if self.server is None:
+            return
         self.running = True
         print("Server listening on port " + str(port))
-        
-        while self.running:
-            self.poll()
-            time.sleep(0.01)
+        await self.server.wait_closed()
+        self.running = False
 
-    def poll(self):
-        if not self.running:
-            return
-        
-        try:
-            cl, addr = self.sock.accept()
-        except OSError:
+    def stop(self):
+        if self.server:
+            self.server.close()
+
+    async def handle_client(self, reader, writer):
+        """Serve one connection (keep-alive: several requests in turn)."""
+        cl = Client(writer)
+        if self.clients >= MAX_CLIENTS:
+            self.rejected += 1
+            try:
+                await self.send_response(cl, 503, '{"error": "Busy"}')
+            except Exception:
+                pass
+            await self.close_client(cl)
             return
-        
+
+        self.clients += 1
         try:
-            cl.settimeout(5.0)
-            if self.led:
+            # Activity blink when given a Pin (main passes the LEDManager)
+            if self.led and hasattr(self.led, 'value'):
                 self.led.value(not self.led.value())
-            
-            request = cl.recv(1024)
-            if not request:
-                cl.close()
-                return
-            
-            req_str = request.decode('utf-8', 'ignore')
-            first_line = req_str.split('\r\n')[0]
-            parts = first_line.split(' ')
-            
-            if len(parts) < 2:
-                self.send_response(cl, 400, '{"error": "Bad Request"}')
-                cl.close()
-                return
-            
-            method = parts[0]
-            path = parts[1]
-            
-            if method == 'OPTIONS':
-                self.send_cors_preflight(cl)
-            elif method == 'GET':
-                self.handle_get(cl, path)
-            elif method == 'POST':
-                # Read full body for POST (OTA files can be large)
-                body = ""
-                if '\r\n\r\n' in req_str:
-                    body = req_str.split('\r\n\r\n', 1)[1]
-                
-                # Check for Content-Length to ensure we got everything
-                cl_header = "Content-Length: "
-                idx = req_str.find(cl_header)
-                if idx == -1:
-                    idx = req_str.lower().find(cl_header.lower())
-                
-                if idx != -1:
-                    try:
-                        end_idx = req_str.find('\r\n', idx)
-                        length = int(req_str[idx + len(cl_header):end_idx].strip())
-                        while len(body.encode()) < length:
-                            chunk = cl.recv(1024)
-                            if not chunk: break
-                            body += chunk.decode('utf-8', 'ignore')
-                    except Exception as e:
-                        print("Body read error:", e)
-
-                self.handle_post(cl, path, body)
-            else:
-                self.send_response(cl, 405, '{"error": "Method Not Allowed"}')
-            
-            cl.close()
-            gc.collect()
-            
+
+            # Keep-alive: a sync client reuses the connection for the next request
+            served = 0
+            while await self.handle_request(cl, reader, served):
+                served += 1
+                if served >= KEEPALIVE_MAX:
+                    break
+
         except Exception as e:
             print("Server Error: " + str(e))
+        finally:
+            self.clients -= 1
+            await self.close_client(cl)
+            gc.collect()
+
+    async def close_client(self, cl):
+        try:
+            cl.s.close()
+            await cl.s.wait_closed()
+        except Exception:
+            pass
+
+    async def read_line(self, cl, reader):
+        """
+        Next line (with its newline) from bounded reads, None at EOF. Raises
+        ValueError once MAX_LINE bytes came without a newline.
+        """
+        buf = cl.rx
+        while True:
+            i = buf.find(b'\n')
+            if i >= 0:
+                cl.rx = buf[i + 1:]
+                return buf[:i + 1]
+            if len(buf) > MAX_LINE:
+                cl.rx = b''
+                raise ValueError("Line too long")
+            data = await reader.read(min(HEAD_CHUNK, MAX_LINE + 1 - len(buf)))
+            if not data:
+                cl.rx = b''
+                return None
+            buf += data
+            cl.rx = buf
+
+    async def read_head(self, cl, reader):
+        """Request line and headers (into cl.headers). Returns the request line, None at EOF."""
+        line = await self.read_line(cl, reader)
+        if not line:
+            return None
+        first = line.decode('utf-8', 'ignore').strip()
+        cl.headers = {}
+        while True:
+            line = await self.read_line(cl, reader)
+            if not line or line == b'\r\n' or line == b'\n':
+                break
+            if len(cl.headers) >= MAX_HEADERS:
+                raise ValueError("Request headers too large")
+            line = line.decode('utf-8', 'ignore')
+            idx = line.find(':')
+            if idx > 0:
+                cl.headers[line[:idx].strip().lower()] = line[idx + 1:].strip()
+        return first
+
+    async def handle_request(self, cl, reader, served=0):
+        """Serve one request. Returns True if the connection stays open for another."""
+        try:
+            # A keep-alive client may go quiet: the first request gets the full timeout
+            first_line = await asyncio.wait_for(self.read_head(cl, reader),
+                                                KEEPALIVE_S if served else CLIENT_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            return False # Client went idle (or never finished its request)
+        except ValueError as e:
+            cl.keep_alive = False
+            await self.send_response(cl, 400, json.dumps({"error": str(e)}))
+            return False
+        if first_line is None:
+            return False
+
+        parts = first_line.split(' ')
+
+        if len(parts) < 2:
+            cl.keep_alive = False
+            await self.send_response(cl, 400, '{"error": "Bad Request"}')
+            return False
+
+        method = parts[0]
+        path = parts[1]
+        conn = cl.headers.get('connection')
+        cl.keep_alive = first_line.endswith('HTTP/1.1') and not (conn and conn.lower() == 'close')
+        self.served += 1
+
+        if method == 'OPTIONS':
+            await self.send_cors_preflight(cl)
+        elif method == 'POST' and path.startswith('/ota/file'):
+            # Binary body (.mpy): streamed to the staging area, not decoded
+            await self.handle_ota_file(cl, reader, path)
+        elif method == 'POST' and path.startswith('/update?'):
+            await self.handle_update_file(cl, reader, path)
+        elif method == 'GET':
+            await self.handle_get(cl, path)
+        elif method == 'POST':
+            body = await self.read_body(cl, reader)
+            if body is not None:
+                await self.handle_post(cl, path, body)
+        else:
+            await self.send_response(cl, 405, '{"error": "Method Not Allowed"}')
+
+        return cl.keep_alive
+
+    def content_length(self, cl):
+        try:
+            return int(cl.headers.get('content-length', 0))
+        except ValueError:
+            return -1
+
+    async def read_body(self, cl, reader):
+        """Whole (JSON) body as str, or None after answering 400/413."""
+        length = self.content_length(cl)
+        if length < 0:
+            cl.keep_alive = False
+            await self.send_response(cl, 400, '{"error": "Bad Content-Length"}')
+            return None
+        if length > MAX_BODY:
+            cl.keep_alive = False # Body left unread
+            await self.send_response(cl, 413, '{"error": "Body too large"}')
+            return None
+        if not length:
+            return ""
+        body = cl.rx[:length]
+        cl.rx = cl.rx[length:]
+        try:
+            if len(body) < length:
+                body += await asyncio.wait_for(reader.readexactly(length - len(body)), CLIENT_TIMEOUT_S)
+        except (asyncio.TimeoutError, EOFError) as e:
+            print("Body read error:", e)
+            cl.keep_alive = False
+            return None
+        return body.decode('utf-8', 'ignore')
+
+    async def recv_into(self, cl, reader, out, length):
+        """
+        Copy a `length` byte body to out.write() through one receive buffer
+        (no per-chunk allocation). Raises OSError if the client stops sending.
+        """
+        if cl.rx:
+            # Body bytes that came with the head
+            n = min(len(cl.rx), length)
+            out.write(cl.rx[:n])
+            cl.rx = cl.rx[n:]
+            length -= n
+        # Own buffer: other tasks run while this one waits for the client
+        mv = memoryview(bytearray(RECV_BUF))
+        while length > 0:
             try:
-                cl.close()
-            except:
-                pass
+                n = await asyncio.wait_for(reader.readinto(mv if length >= RECV_BUF else mv[:length]),
+                                           CLIENT_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                n = 0
+            if not n:
+                cl.keep_alive = False
+                raise OSError("Connection closed")
+            out.write(mv[:n] if n < RECV_BUF else mv)
+            length -= n
 
-    def handle_get(self, cl, path):
+    def get_header(self, cl, name):
+        """Value of a request header (case-insensitive), or None."""
+        return cl.headers.get(name.lower())
+
+    async def handle_get(self, cl, path):
+        query = ""
+        if '?' in path:
+            path, query = path.split('?', 1)
+        
         if path == '/status':
-            self.handle_status(cl)
+            await self.handle_status(cl)
         elif path == '/wifi/list':
-            self.handle_wifi_list(cl)
+            await self.handle_wifi_list(cl)
         elif path == '/list':
-            self.handle_session_list(cl)
+            await self.handle_session_list(cl)
         elif path.startswith('/download/'):
             fname = path.split('/download/', 1)[1]
-            self.handle_download(cl, fname)
+            await self.handle_download(cl, fname, self.get_header(cl, "Range"))
+        elif path == '/bundle':
+            await self.handle_bundle(cl, query)
         elif path.startswith('/delete/'):
             fname = path.split('/delete/', 1)[1]
-            self.handle_delete(cl, fname)
+            await self.handle_delete(cl, fname)
         elif path == '/track/status':
-            self.handle_track_status(cl)
+            await self.handle_track_status(cl)
+        elif path == '/track/library':
+            await self.handle_track_library(cl, self.get_header(cl, "If-None-Match"))
+        elif path == '/ota/manifest':
+            await self.handle_ota_manifest(cl)
         elif path == '/':
-            self.send_response(cl, 200, '{"message": "Datalogger ESP32 API"}')
+            await self.send_response(cl, 200, '{"message": "Datalogger ESP32 API"}')
         else:
-            self.send_response(cl, 404, '{"error": "Not Found"}')
+            await self.send_response(cl, 404, '{"error": "Not Found"}')
 
-    def handle_post(self, cl, path, body):
+    async def handle_post(self, cl, path, body):
         if path == '/wifi/add':
-            self.handle_wifi_add(cl, body)
+            await self.handle_wifi_add(cl, body)
         elif path == '/wifi/remove':
-            self.handle_wifi_remove(cl, body)
+            await self.handle_wifi_remove(cl, body)
         elif path == '/track/set':
-            self.handle_track_set(cl, body)
+            await self.handle_track_set(cl, body)
+        elif path == '/sync/ack':
+            await self.handle_sync_ack(cl, body)
+        elif path == '/ota/commit':
+            await self.handle_ota_commit(cl, body)
         elif path == '/update':
-            self.handle_update(cl, body)
+            await self.handle_update(cl, body)
         elif path == '/reboot':
-            self.handle_reboot(cl)
+            await self.handle_reboot(cl)
         else:
-            self.send_response(cl, 404, '{"error": "Not Found"}')
+            await self.send_response(cl, 404, '{"error": "Not Found"}')
 
-    def send_cors_preflight(self, cl):
+    async def send_cors_preflight(self, cl):
         h = "HTTP/1.1 200 OK\r\n"
         h += "Access-Control-Allow-Origin: *\r\n"
         h += "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
-        h += "Access-Control-Allow-Headers: Content-Type\r\n"
+        h += "Access-Control-Allow-Headers: Content-Type, Range\r\n"
         h += "Access-Control-Max-Age: 86400\r\n"
         h += "Content-Length: 0\r\n"
         h += "\r\n"
-        cl.send(h.encode())
+        await self.send_all(cl, h.encode())
 
-    def send_response(self, cl, code, content, ctype="application/json"):
-        status_map = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Error'}
-        status = status_map.get(code, 'OK')
-        
-        h = "HTTP/1.1 " + str(code) + " " + status + "\r\n"
+    async def send_head(self, cl, code, ctype, length, extra=""):
+        """Status line and headers; `extra` holds further header lines."""
+        h = "HTTP/1.1 " + str(code) + " " + STATUS.get(code, 'OK') + "\r\n"
         h += "Content-Type: " + ctype + "\r\n"
-        h += "Content-Length: " + str(len(content)) + "\r\n"
+        h += "Content-Length: " + str(length) + "\r\n"
         h += "Access-Control-Allow-Origin: *\r\n"
-        h += "Connection: close\r\n"
+        h += extra
+        h += "Connection: " + ("keep-alive" if cl.keep_alive else "close") + "\r\n"
         h += "\r\n"
-        
-        cl.send(h.encode())
-        cl.send(content.encode())
+        await self.send_all(cl, h.encode())
+
+    async def send_response(self, cl, code, content, ctype="application/json", etag=None):
+        data = content.encode()
+        extra = ""
+        if etag:
+            extra = "ETag: " + etag + "\r\nAccess-Control-Expose-Headers: ETag\r\n"
+        await self.send_head(cl, code, ctype, len(data), extra)
+        await self.send_all(cl, data)
+
+    async def send_all(self, cl, data):
+        """Queue `data` and wait until the socket has taken it (other clients are served meanwhile)."""
+        cl.s.write(data)
+        await cl.s.drain()
+
+    async def send_file(self, cl, filepath, offset, length, crc=None):
+        """
+        Stream `length` bytes from `offset` through the preallocated buffer
+        (readinto + memoryview: no allocation per chunk), waiting for the
+        client between chunks. Returns the CRC32
+        of the bytes sent when given a start value in `crc`.
+        """
+        mv = self._mv
+        with open(filepath, 'rb') as f:
+            if offset:
+                f.seek(offset)
+            while length > 0:
+                n = f.readinto(mv if length >= SEND_BUF else mv[:length])
+                if not n:
+                    # Headers promised more bytes: the connection cannot be reused
+                    cl.keep_alive = False
+                    raise OSError("Short read: " + filepath)
+                chunk = mv[:n] if n < SEND_BUF else mv
+                if crc is not None:
+                    crc = crc32(chunk, crc)
+                await self.send_all(cl, chunk)
+                length -= n
+        return crc
 
-    def handle_status(self, cl):
+    async def file_crc(self, filepath, length=-1):
+        """CRC32 of a file (of its first `length` bytes when given), yielding between chunks."""
+        crc = 0
+        mv = self._mv
+        with open(filepath, 'rb') as f:
+            while length:
+                n = f.readinto(mv if length < 0 or length >= SEND_BUF else mv[:length])
+                if not n:
+                    break
+                crc = crc32(mv[:n] if n < SEND_BUF else mv, crc)
+                if length > 0:
+                    length -= n
+                await asyncio.sleep(0)
+        return crc
+
+    async def handle_status(self, cl):
         from lib import wifi_manager
         creds = wifi_manager.load_credentials()
         
-        # Get storage info
-        try:
-            stat = os.statvfs('/')
-            block_size = stat[0]
-            total_blocks = stat[2]
-            free_blocks = stat[3]
-            
-            total_kb = (total_blocks * block_size) // 1024
-            free_kb = (free_blocks * block_size) // 1024
-            used_kb = total_kb - free_kb
-            used_pct = int((used_kb * 100) / total_kb) if total_kb > 0 else 0
-        except:
-            total_kb = 0
-            used_kb = 0
-            free_kb = 0
-            used_pct = 0
+        # Get storage info (cached statvfs + session index: no directory walk)
+        info = self.sm.get_storage_info() or {}
+        total_kb = info.get('total_kb', 0)
+        used_kb = info.get('used_kb', 0)
+        free_kb = info.get('free_kb', 0)
+        used_pct = int((used_kb * 100) / total_kb) if total_kb > 0 else 0
         
         status = {
             "version": self.VERSION,
@@ -200,9 +431,13 @@ class MiniServer:
             "storage_used_kb": used_kb,
             "storage_free_kb": free_kb,
             "storage_used_pct": used_pct,
+            "sessions": info.get('sessions', 0),
+            "sessions_kb": info.get('sessions_kb', 0),
             "active_track": self.track_engine.track.get('id') if self.track_engine and self.track_engine.track else None,
             "track_identified": self.track_engine.track_identified if self.track_engine else False
         }
+        if self.boot_stats:
+            status["boot"] = self.boot_stats
 
         # Add GPS info if available
         if self.gps_state:
@@ -216,18 +451,24 @@ class MiniServer:
                 status["gps_lat"] = self.gps_state.last_fix.get('lat')
                 status["gps_lon"] = self.gps_state.last_fix.get('lon')
 
-        self.send_response(cl, 200, json.dumps(status))
+        # Main loop task rates, overruns and jitter (lib/scheduler.py)
+        if self.scheduler:
+            status["scheduler"] = self.scheduler.stats()
+        if self.compressor:
+            status["compression"] = self.compressor.stats()
 
-    def handle_wifi_list(self, cl):
+        await self.send_response(cl, 200, json.dumps(status))
+
+    async def handle_wifi_list(self, cl):
         from lib import wifi_manager
         creds = wifi_manager.load_credentials()
         ssids = [c.get('ssid', '') for c in creds]
-        self.send_response(cl, 200, json.dumps({"networks": ssids}))
+        await self.send_response(cl, 200, json.dumps({"networks": ssids}))
 
-    def handle_wifi_add(self, cl, body):
+    async def handle_wifi_add(self, cl, body):
         try:
             if not body:
-                self.send_response(cl, 400, '{"error": "No body"}')
+                await self.send_response(cl, 400, '{"error": "No body"}')
                 return
             
             data = json.loads(body)
@@ -235,47 +476,46 @@ class MiniServer:
             password = data.get('password', '')
             
             if not ssid:
-                self.send_response(cl, 400, '{"error": "SSID required"}')
+                await self.send_response(cl, 400, '{"error": "SSID required"}')
                 return
             
             from lib import wifi_manager
             if wifi_manager.add_credential(ssid, password):
                 resp = {"success": True, "message": "Added " + ssid}
-                self.send_response(cl, 200, json.dumps(resp))
+                await self.send_response(cl, 200, json.dumps(resp))
                 
                 import machine
-                import time
-                time.sleep(1)
+                await asyncio.sleep(1)
                 machine.reset()
             else:
-                self.send_response(cl, 500, '{"error": "Failed to save"}')
+                await self.send_response(cl, 500, '{"error": "Failed to save"}')
                 
         except Exception as e:
-            self.send_response(cl, 500, '{"error": "' + str(e) + '"}')
+            await self.send_response(cl, 500, '{"error": "' + str(e) + '"}')
 
-    def handle_wifi_remove(self, cl, body):
+    async def handle_wifi_remove(self, cl, body):
         try:
             if not body:
-                self.send_response(cl, 400, '{"error": "No body"}')
+                await self.send_response(cl, 400, '{"error": "No body"}')
                 return
             
             data = json.loads(body)
             ssid = data.get('ssid', '')
             
             if not ssid:
-                self.send_response(cl, 400, '{"error": "SSID required"}')
+                await self.send_response(cl, 400, '{"error": "SSID required"}')
                 return
             
             from lib import wifi_manager
             if wifi_manager.remove_credential(ssid):
-                self.send_response(cl, 200, '{"success": true}')
+                await self.send_response(cl, 200, '{"success": true}')
             else:
-                self.send_response(cl, 500, '{"error": "Failed"}')
+                await self.send_response(cl, 500, '{"error": "Failed"}')
                 
         except Exception as e:
-            self.send_response(cl, 500, '{"error": "' + str(e) + '"}')
+            await self.send_response(cl, 500, '{"error": "' + str(e) + '"}')
 
-    def handle_session_list(self, cl):
+    async def handle_session_list(self, cl):
         try:
             # Stop logging when sync process starts (requested by user)
             if self.gps_state and isinstance(self.gps_state, dict):
@@ -283,103 +523,389 @@ class MiniServer:
                 print("[Server] Sync requested: Stopping Logging Thread")
             
             files = self.sm.list_sessions()
-            self.send_response(cl, 200, json.dumps({"files": files}))
+            await self.send_response(cl, 200, json.dumps({"files": files, "sessions": await self.session_manifest(files)}))
         except Exception as e:
-            self.send_response(cl, 500, '{"error": "' + str(e) + '"}')
+            await self.send_response(cl, 500, '{"error": "' + str(e) + '"}')
+
+    async def session_manifest(self, files):
+        """
+        Size, times, laps and CRC32 per session from the session index, so
+        the sync client can skip, resume or verify files without a request
+        each. For the log being written, size/crc32 describe what was last
+        synced to the card. A CRC the index does not hold yet (sessions found
+        by a rebuild, just compressed) is computed once and stored there.
+        Raw sessions listed here are not compressed until acked (sm.listed).
+        """
+        manifest = []
+        for name in files:
+            e = self.sm.session_info(name)
+            if e is None:
+                continue
+            filepath, encoding = self.sm.session_path(name)
+            crc = e[CRC]
+            if crc is None:
+                try:
+                    crc = await self.file_crc(filepath, e[SIZE])
+                except OSError as err:
+                    print(f"[Server] Manifest Error ({name}): {err}")
+                    continue
+                self.sm.index.set_crc(name, e[SIZE], crc)
+            info = {"name": name, "size": e[SIZE], "mtime": e[END], "crc32": crc,
+                    "start": e[START], "end": e[END], "laps": e[LAPS],
+                    "closed": e[CLOSED] and self.sm.is_closed(name)}
+            if name in self.sm.synced:
+                info["synced"] = self.sm.synced[name][0] # Acked prefix (bytes)
+            if encoding:
+                info["encoding"] = encoding # size/crc32 are of the stored (compressed) bytes
+            else:
+                self.sm.listed.add(name) # Kept raw until acked: the client checks these bytes
+            manifest.append(info)
+        return manifest
 
-    def handle_download(self, cl, filename):
-        filepath = self.sm.active_dir + "/" + filename
+    async def handle_sync_ack(self, cl, body):
+        """
+        POST /sync/ack - {"file", "size", "crc32"}: the server confirms it
+        holds the first `size` stored bytes of a session. The device checks
+        the CRC itself; a closed session confirmed in full is deleted, for an
+        open one the synced length is recorded.
+        """
+        try:
+            data = json.loads(body)
+            name = data['file']
+            size = int(data['size'])
+            crc = int(data['crc32'])
+        except Exception:
+            await self.send_response(cl, 400, '{"error": "file, size and crc32 required"}')
+            return
         
+        filepath, encoding = self.sm.session_path(name)
         try:
-            size = os.stat(filepath)[6]
-            h = "HTTP/1.1 200 OK\r\n"
-            h += "Content-Type: text/csv\r\n"
-            h += "Content-Length: " + str(size) + "\r\n"
-            h += "Access-Control-Allow-Origin: *\r\n"
-            h += "Connection: close\r\n"
-            h += "\r\n"
-            cl.send(h.encode())
-            
-            with open(filepath, 'rb') as f:
-                while True:
-                    chunk = f.read(512)
-                    if not chunk:
-                        break
-                    cl.send(chunk)
+            stored = self.sm.session_size(name) # Data length (a preallocated log is longer)
         except OSError:
-            self.send_response(cl, 404, '{"error": "File not found"}')
+            await self.send_response(cl, 404, '{"error": "File not found"}')
+            return
+        
+        entry = self.sm.session_info(name)
+        if entry and entry[CRC] is not None and entry[SIZE] == size:
+            dev_crc = entry[CRC]
+        elif size <= stored:
+            dev_crc = await self.file_crc(filepath, size)
+        else:
+            dev_crc = None
+        if dev_crc != crc:
+            await self.send_response(cl, 409, json.dumps({"error": "Checksum mismatch", "size": stored, "crc32": dev_crc}))
+            return
+        
+        self.sm.listed.discard(name)
+        if size == stored and self.sm.is_closed(name):
+            deleted = self.sm.delete_session(name)
+            await self.send_response(cl, 200, json.dumps({"deleted": deleted}))
+        else:
+            self.sm.record_synced(name, size, crc)
+            await self.send_response(cl, 200, json.dumps({"deleted": False, "synced": size}))
+
+    def parse_range(self, value, size):
+        """
+        Single "bytes=a-b" / "bytes=a-" / "bytes=-n" range -> (start, end)
+        inclusive; -1 when unsatisfiable; None to send the whole file
+        (no header, multiple ranges or a malformed value).
+        """
+        if not value or not value.startswith('bytes=') or ',' in value:
+            return None
+        try:
+            first, last = value[6:].strip().split('-', 1)
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+            else:
+                start = size - int(last)
+                end = size - 1
+        except ValueError:
+            return None
+        if start < 0:
+            start = 0
+        if end > size - 1:
+            end = size - 1
+        if start > end:
+            return -1
+        return (start, end)
+
+    async def handle_download(self, cl, filename, range_hdr=None):
+        """GET /download/<file> - whole file, or one byte range (resume) with Range."""
+        # Open for reading: the compressor must not replace the file meanwhile
+        self.sm.transfer_start(filename)
+        try:
+            await self._download(cl, filename, range_hdr)
+        finally:
+            self.sm.transfer_end(filename)
+
+    async def _download(self, cl, filename, range_hdr):
+        filepath, encoding = self.sm.session_path(filename)
+        
+        try:
+            size = self.sm.session_size(filename) # Data length (a preallocated log is longer)
+        except OSError:
+            await self.send_response(cl, 404, '{"error": "File not found"}')
+            return
+        
+        ctype = "application/octet-stream" if filename.endswith(".rsl") else "text/csv"
+        extra = "Accept-Ranges: bytes\r\n"
+        if encoding:
+            # Compressed on the device: ranges count stored (compressed) bytes
+            extra += "Content-Encoding: " + encoding + "\r\n"
+        rng = self.parse_range(range_hdr, size)
+        if rng == -1:
+            await self.send_head(cl, 416, "application/json", 0, extra + "Content-Range: bytes */" + str(size) + "\r\n")
+            return
+        if rng:
+            start, end = rng
+            extra += "Content-Range: bytes " + str(start) + "-" + str(end) + "/" + str(size) + "\r\n"
+            extra += "Access-Control-Expose-Headers: Content-Range\r\n"
+            await self.send_head(cl, 206, ctype, end - start + 1, extra)
+            await self.send_file(cl, filepath, start, end - start + 1)
+        else:
+            await self.send_head(cl, 200, ctype, size, extra)
+            await self.send_file(cl, filepath, 0, size)
 
-    def handle_delete(self, cl, filename):
+    async def handle_bundle(self, cl, query=""):
+        """GET /bundle[?files=a,b] - several sessions in one response (format at the top)."""
+        names = None
+        for param in query.split('&'):
+            if param.startswith('files='):
+                names = [n for n in param[6:].split(',') if n]
+        if names is None:
+            names = self.sm.list_sessions()
+        
+        # Sizes are fixed here so Content-Length is known up front (a file
+        # still growing is cut at this size). All files stay open for reading
+        # (left as stored by the compressor) until the response is sent.
+        parts = []
+        total = 0
+        try:
+            for name in names:
+                if '/' in name:
+                    continue
+                self.sm.transfer_start(name)
+                filepath, encoding = self.sm.session_path(name)
+                try:
+                    size = self.sm.session_size(name) # Index: the open log as last synced to the card
+                except OSError:
+                    self.sm.transfer_end(name)
+                    continue # Missing files are left out: the client checks the names it gets
+                info = {"name": name, "size": size}
+                if encoding:
+                    info["encoding"] = encoding
+                head = (json.dumps(info) + "\n").encode()
+                parts.append((name, filepath, size, head))
+                total += len(head) + size + 9
+
+            await self.send_head(cl, 200, "application/octet-stream", total)
+            for _, filepath, size, head in parts:
+                await self.send_all(cl, head)
+                crc = await self.send_file(cl, filepath, 0, size, 0)
+                await self.send_all(cl, ("%08x\n" % crc).encode())
+        finally:
+            for part in parts:
+                self.sm.transfer_end(part[0])
+
+    async def handle_delete(self, cl, filename):
         if self.sm.delete_session(filename):
-            self.send_response(cl, 200, '{"success": true}')
+            await self.send_response(cl, 200, '{"success": true}')
         else:
-            self.send_response(cl, 500, '{"error": "Delete failed"}')
+            await self.send_response(cl, 500, '{"error": "Delete failed"}')
+
+    def update_path_ok(self, filename):
+        """Simple path safety for /update: relative paths, or under /lib/ and /drivers/."""
+        if not filename or '..' in filename:
+            return False
+        return not filename.startswith('/') or filename.startswith('/lib/') or filename.startswith('/drivers/')
 
-    def handle_update(self, cl, body):
+    async def handle_update(self, cl, body):
+        """POST /update {"filename", "content"} - write one source file (legacy OTA)."""
         try:
             data = json.loads(body)
+            body = None
             filename = data.get('filename')
             content = data.get('content')
             
             if not filename or content is None:
-                self.send_response(cl, 400, '{"error": "Missing filename or content"}')
+                await self.send_response(cl, 400, '{"error": "Missing filename or content"}')
                 return
             
-            # Simple path safety
-            if '..' in filename or filename.startswith('/'):
-                if not filename.startswith('/lib/') and not filename.startswith('/drivers/') and filename not in ['boot.py', 'main.py']:
-                     self.send_response(cl, 400, '{"error": "Invalid filename path"}')
-                     return
+            if not self.update_path_ok(filename):
+                await self.send_response(cl, 400, '{"error": "Invalid filename path"}')
+                return
             
             # Write file (use 'w' for text contents)
             with open(filename, 'w') as f:
                 f.write(content)
                 
             print(f"OTA Updated: {filename}")
-            self.send_response(cl, 200, '{"success": true, "filename": filename}')
+            await self.send_response(cl, 200, json.dumps({"success": True, "filename": filename}))
         except Exception as e:
-            self.send_response(cl, 500, json.dumps({"error": str(e)}))
+            await self.send_response(cl, 500, json.dumps({"error": str(e)}))
+
+    async def handle_update_file(self, cl, reader, path):
+        """
+        POST /update?filename=lib/x.py - raw file body, streamed to <file>.new
+        and renamed over the file once complete (no JSON, no copy in RAM).
+        """
+        import os
+        filename = self.parse_query(path).get('filename')
+        length = self.content_length(cl)
+        if not self.update_path_ok(filename) or length < 0:
+            cl.keep_alive = False
+            await self.send_response(cl, 400, '{"error": "Invalid filename path or Content-Length"}')
+            return
+        tmp = filename + ".new"
+        try:
+            with open(tmp, 'wb') as f:
+                await self.recv_into(cl, reader, f, length)
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            os.rename(tmp, filename)
+        except OSError as e:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            await self.send_response(cl, 500, json.dumps({"error": str(e)}))
+            return
+        print(f"OTA Updated: {filename} ({length} B)")
+        await self.send_response(cl, 200, json.dumps({"success": True, "filename": filename, "size": length}))
+
+    async def handle_ota_manifest(self, cl):
+        """GET /ota/manifest - SHA-256 of every installed firmware module (lib/ota.py)"""
+        import lib.ota as ota
+        try:
+            await self.send_response(cl, 200, json.dumps(ota.manifest(self.VERSION)))
+        except OSError as e:
+            await self.send_response(cl, 500, json.dumps({"error": str(e)}))
+
+    def parse_query(self, path):
+        """?k=v&k2=v2 of a path as a dict (values not URL-decoded)."""
+        query = path.split('?', 1)[1] if '?' in path else ""
+        params = {}
+        for kv in query.split('&'):
+            if '=' in kv:
+                k, v = kv.split('=', 1)
+                params[k] = v
+        return params
+
+    async def handle_ota_file(self, cl, reader, path):
+        """POST /ota/file?path=lib/x.mpy&sha256=<hex> - stage one file for /ota/commit"""
+        import lib.ota as ota
+        params = self.parse_query(path)
+        try:
+            length = self.content_length(cl)
+            if length < 0:
+                raise ValueError("Bad Content-Length")
+            staged = ota.StagedFile(params.get('path'))
+        except (TypeError, ValueError) as e:
+            cl.keep_alive = False
+            await self.send_response(cl, 400, json.dumps({"error": str(e)}))
+            return
+
+        try:
+            await self.recv_into(cl, reader, staged, length)
+        except OSError as e:
+            staged.close(None)
+            cl.keep_alive = False
+            await self.send_response(cl, 500, json.dumps({"error": str(e)}))
+            return
+
+        if staged.close(params.get('sha256')):
+            await self.send_response(cl, 200, json.dumps({"staged": staged.path, "size": staged.size}))
+        else:
+            await self.send_response(cl, 409, json.dumps({"error": "sha256 mismatch", "path": staged.path}))
+
+    async def handle_ota_commit(self, cl, body):
+        """POST /ota/commit {version, files, delete} - swap staged files in (reboot to run them)"""
+        import lib.ota as ota
+        try:
+            data = json.loads(body)
+            n = ota.commit(data.get('files', []), data.get('delete', []), data.get('version'))
+            await self.send_response(cl, 200, json.dumps({"success": True, "changed": n}))
+        except ValueError as e:
+            await self.send_response(cl, 400, json.dumps({"error": str(e)}))
+        except OSError as e:
+            # Partial swap: put the previous files back
+            ota.rollback()
+            await self.send_response(cl, 500, json.dumps({"error": str(e)}))
 
-    def handle_reboot(self, cl):
-        self.send_response(cl, 200, '{"message": "Rebooting..."}')
-        import time
+    async def handle_reboot(self, cl):
+        await self.send_response(cl, 200, '{"message": "Rebooting..."}')
         import machine
-        time.sleep(1)
+        await asyncio.sleep(1)
         machine.reset()
 
-    def handle_track_set(self, cl, body):
+    async def handle_track_set(self, cl, body):
         """
-        POST /track/set - Save track metadata from app.
-        Expected body: {id, name, start_line, sectors, tbl}
+        POST /track/set - Save track metadata from app into the track library.
+        Expected body: {id, name, start_line, sectors, tbl, etag?, ref?}
+        (becomes the current track), or a library sync {"tracks": [...]}
+        (stored only). Tracks whose etag is already stored are not rewritten;
+        GET /track/library lets the app skip sending them at all.
         """
         try:
             if not body:
-                self.send_response(cl, 400, '{"error": "No body"}')
+                await self.send_response(cl, 400, '{"error": "No body"}')
                 return
             
             data = json.loads(body)
+            body = None
+            sync = 'tracks' in data
+            tracks = data['tracks'] if sync else [data]
             
             # Validate required fields
-            if 'id' not in data or 'start_line' not in data:
-                self.send_response(cl, 400, '{"error": "Missing id or start_line"}')
+            for t in tracks:
+                if 'id' not in t or 'start_line' not in t:
+                    await self.send_response(cl, 400, '{"error": "Missing id or start_line"}')
+                    return
+            
+            if not self.track_engine:
+                await self.send_response(cl, 500, '{"error": "Track engine not initialized"}')
                 return
             
-            if self.track_engine:
-                if self.track_engine.save_track(data):
-                    resp = {"success": True, "track_name": data.get('name', 'Unknown')}
-                    self.send_response(cl, 200, json.dumps(resp))
-                else:
-                    self.send_response(cl, 500, '{"error": "Failed to save track"}')
-            else:
-                self.send_response(cl, 500, '{"error": "Track engine not initialized"}')
+            stored = []
+            unchanged = []
+            for t in tracks:
+                result = self.track_engine.save_track(t, activate=not sync)
+                if result is None:
+                    await self.send_response(cl, 500, '{"error": "Failed to save track"}')
+                    return
+                (stored if result == "stored" else unchanged).append(str(t['id']))
+            
+            library = self.track_engine.library
+            resp = {"success": True, "stored": stored, "unchanged": unchanged, "rev": library.rev}
+            if not sync:
+                resp["track_name"] = data.get('name', 'Unknown')
+            await self.send_response(cl, 200, json.dumps(resp), etag='"' + str(library.rev) + '"')
                 
         except Exception as e:
-            self.send_response(cl, 500, json.dumps({"error": str(e)}))
+            await self.send_response(cl, 500, json.dumps({"error": str(e)}))
+
+    async def handle_track_library(self, cl, if_none_match=None):
+        """
+        GET /track/library - Stored tracks with their ETags. The response ETag is
+        the library revision: If-None-Match with it answers 304 when nothing changed.
+        """
+        if not self.track_engine:
+            await self.send_response(cl, 200, '{"rev": 0, "tracks": {}}')
+            return
+        library = self.track_engine.library
+        etag = '"' + str(library.rev) + '"'
+        if if_none_match == etag:
+            await self.send_response(cl, 304, "", etag=etag)
+            return
+        await self.send_response(cl, 200, json.dumps(library.summary()), etag=etag)
 
-    def handle_track_status(self, cl):
+    async def handle_track_status(self, cl):
         """GET /track/status - Return current track state."""
         if self.track_engine:
             status = self.track_engine.get_status()
-            self.send_response(cl, 200, json.dumps(status))
+            await self.send_response(cl, 200, json.dumps(status))
         else:
-            self.send_response(cl, 200, '{"track_loaded": false}')
+            await self.send_response(cl, 200, '{"track_loaded": false}')
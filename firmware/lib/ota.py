@@ -0,0 +1,238 @@
+# lib/ota.py - Differential OTA: file manifest, staging, atomic swap, rollback
+#
+# The server (server/api/update_manager.py) builds the firmware as .mpy
+# bytecode (main.py and boot.py stay source: they are run by name), compares
+# the SHA-256 of every file with GET /ota/manifest and sends only those that
+# differ:
+#   POST /ota/file?path=lib/x.mpy&sha256=<hex>   raw file bytes, staged in STAGE_DIR
+#   POST /ota/commit {"version": .., "files": [..], "delete": [..]}
+# The commit journals its moves in STATE_FILE, then moves every replaced or
+# deleted file into BACKUP_DIR and the staged files into place. The following
+# boots are a trial: main.py confirms the update once setup() has completed,
+# boot.py restores the backups if that did not happen within TRIAL_BOOTS
+# boots or if the swap itself was interrupted (reset, power loss).
+#
+# Paths are relative to the filesystem root ("lib/x.mpy").
+import os
+import json
+import hashlib
+
+try:
+    from binascii import hexlify
+except ImportError:
+    from ubinascii import hexlify
+
+STAGE_DIR = "ota_stage"
+BACKUP_DIR = "ota_backup"
+STATE_FILE = "ota_state.json"
+TRIAL_BOOTS = 2              # Boots without confirm() before rolling back
+MANAGED_DIRS = ("", "lib", "drivers")
+KEEP = ("secrets.py",)       # Device-local: never listed, replaced or deleted
+HASH_BUF = 1024
+
+
+def _flat(path):
+    # Stage/backup copies live in one directory each
+    return path.replace("/", "__")
+
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _mkdir(path):
+    try:
+        os.mkdir(path)
+    except OSError:
+        pass
+
+
+def valid_path(path):
+    """A firmware module the OTA may write: <managed dir>/<name>.py|.mpy"""
+    if not path or ".." in path or path.startswith("/") or path in KEEP:
+        return False
+    if not (path.endswith(".py") or path.endswith(".mpy")):
+        return False
+    d = path.rsplit("/", 1)[0] if "/" in path else ""
+    return d in MANAGED_DIRS
+
+
+def file_hash(path, buf=None):
+    """SHA-256 of a file as hex, read through a small buffer."""
+    h = hashlib.sha256()
+    mv = memoryview(buf or bytearray(HASH_BUF))
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(mv)
+            if not n:
+                break
+            h.update(mv[:n])
+    return hexlify(h.digest()).decode()
+
+
+def manifest(version):
+    """{"version", "files": {path: sha256}} of the installed firmware modules."""
+    files = {}
+    buf = bytearray(HASH_BUF)
+    for d in MANAGED_DIRS:
+        try:
+            names = os.listdir(d or ".")
+        except OSError:
+            continue
+        for name in names:
+            path = d + "/" + name if d else name
+            if valid_path(path):
+                files[path] = file_hash(path, buf)
+    return {"version": version, "files": files, "state": status()}
+
+
+class StagedFile:
+    """One file received for the next commit, hashed while it is written."""
+
+    def __init__(self, path):
+        if not valid_path(path):
+            raise ValueError("Invalid path: " + str(path))
+        _mkdir(STAGE_DIR)
+        self.path = path
+        self.stage = STAGE_DIR + "/" + _flat(path)
+        self._h = hashlib.sha256()
+        self._f = open(self.stage, "wb")
+        self.size = 0
+
+    def write(self, data):
+        self._f.write(data)
+        self._h.update(data)
+        self.size += len(data)
+
+    def close(self, expected):
+        """Finish the file. Returns True if its SHA-256 matches `expected` (else it is dropped)."""
+        self._f.close()
+        if hexlify(self._h.digest()).decode() == expected:
+            return True
+        _remove(self.stage)
+        return False
+
+
+def _load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(state):
+    with open(STATE_FILE, "w") as f:
+        json.dump(state, f)
+
+
+def status():
+    """Pending update state for /status, or None."""
+    state = _load_state()
+    if not state:
+        return None
+    return {"state": state["state"], "version": state.get("version"), "boots": state.get("boots", 0)}
+
+
+def commit(files, delete=(), version=None):
+    """
+    Swap staged `files` into place and remove `delete`, keeping backups for
+    rollback. Returns the number of paths changed; raises ValueError when a
+    path is not allowed or was not staged.
+    """
+    for p in list(files) + list(delete):
+        if not valid_path(p):
+            raise ValueError("Invalid path: " + str(p))
+    for p in files:
+        if not _exists(STAGE_DIR + "/" + _flat(p)):
+            raise ValueError("Not staged: " + p)
+
+    # The running firmware serves this request: a pending trial is good
+    confirm()
+    _mkdir(BACKUP_DIR)
+
+    moves = []
+    for p in list(files) + [p for p in delete if p not in files]:
+        moves.append([p, BACKUP_DIR + "/" + _flat(p) if _exists(p) else None])
+    state = {"state": "swap", "version": version, "boots": 0, "moves": moves}
+    _save_state(state)
+
+    for target, backup in moves:
+        if backup:
+            _remove(backup)
+            os.rename(target, backup)
+    for p in files:
+        os.rename(STAGE_DIR + "/" + _flat(p), p)
+
+    state["state"] = "trial"
+    _save_state(state)
+    print(f"[OTA] Installed {len(files)} files, removed {len(moves) - len(files)} (trial until confirmed)")
+    return len(moves)
+
+
+def rollback(state=None):
+    """Restore the backups of the last update (safe to repeat after a reset)."""
+    state = state or _load_state()
+    if not state:
+        return False
+    for target, backup in reversed(state.get("moves", [])):
+        if backup:
+            if _exists(backup):
+                _remove(target)
+                os.rename(backup, target)
+        else:
+            _remove(target) # Added by the update
+    _remove(STATE_FILE)
+    clear_stage()
+    print(f"[OTA] Rolled back update {state.get('version')}")
+    return True
+
+
+def confirm():
+    """The updated firmware came up: drop the backups. Returns True if a trial ended."""
+    state = _load_state()
+    if not state or state["state"] != "trial":
+        return False
+    for _, backup in state.get("moves", []):
+        if backup:
+            _remove(backup)
+    _remove(STATE_FILE)
+    print(f"[OTA] Update {state.get('version')} confirmed")
+    return True
+
+
+def clear_stage():
+    try:
+        for name in os.listdir(STAGE_DIR):
+            _remove(STAGE_DIR + "/" + name)
+    except OSError:
+        pass
+
+
+def boot_check():
+    """
+    Called from boot.py before main.py runs. Counts trial boots and rolls back
+    an interrupted swap or an update that was never confirmed.
+    """
+    state = _load_state()
+    if not state:
+        return
+    if state["state"] == "swap":
+        rollback(state)
+    elif state["state"] == "trial":
+        state["boots"] = state.get("boots", 0) + 1
+        if state["boots"] > TRIAL_BOOTS:
+            rollback(state)
+        else:
+            _save_state(state)
@@ -0,0 +1,145 @@
+# lib/scheduler.py - Cooperative multi-rate task scheduler (tick wheel)
+#
+# Each task has its own period and deadline. Deadlines advance by whole
+# periods (not "now + period"), so a task's cadence does not drift with how
+# long the rest of the loop took. Event tasks have no period and run whenever
+# their ready() check is true (e.g. UART bytes waiting).
+#
+# A task that starts a full period or more after its deadline has missed ticks:
+# they are counted as overruns and skipped rather than run back-to-back.
+# Start lateness (jitter) and run time are tracked per task for /status, as
+# maxima and 1/16 integer moving averages (no ever-growing sums).
+import time
+
+try:
+    ticks_ms = time.ticks_ms
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+    ticks_add = time.ticks_add
+    sleep_ms = time.sleep_ms
+except AttributeError:
+    # CPython (host simulation)
+    ticks_ms = lambda: int(time.perf_counter() * 1000)
+    ticks_us = lambda: int(time.perf_counter() * 1000000)
+    ticks_diff = lambda a, b: a - b
+    ticks_add = lambda a, b: a + b
+    sleep_ms = lambda ms: time.sleep(ms / 1000)
+
+
+class Task:
+    def __init__(self, name, fn, period_ms=0, ready=None):
+        self.name = name
+        self.fn = fn
+        self.period_ms = period_ms
+        self.ready = ready
+        self.deadline = ticks_ms()
+
+        # Stats
+        self.runs = 0
+        self.overruns = 0
+        self.errors = 0
+        self.late_max_ms = 0
+        self.run_max_us = 0
+        self._late_acc = 0 # Moving averages, scaled by 16
+        self._run_acc = 0
+
+    def stats(self):
+        return {
+            "hz": 1000 / self.period_ms if self.period_ms else None,
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "errors": self.errors,
+            "late_avg_ms": self._late_acc >> 4,
+            "late_max_ms": self.late_max_ms,
+            "run_avg_us": self._run_acc >> 4,
+            "run_max_us": self.run_max_us
+        }
+
+
+class Scheduler:
+    LOAD_WINDOW_MS = 10000
+
+    def __init__(self, idle_ms=5):
+        self.tasks = []
+        self.idle_ms = idle_ms # Longest sleep, bounds event task latency
+        self.running = False
+
+        # Loop stats
+        self.loops = 0
+        self.busy_pct = 0 # CPU time in tasks over the last load window
+        self._busy_us = 0
+        self._win_start = ticks_ms()
+
+    def add(self, name, fn, hz=None, ready=None):
+        """Add a periodic task (hz) or an event task (ready() -> bool)."""
+        task = Task(name, fn, int(1000 / hz) if hz else 0, ready)
+        self.tasks.append(task)
+        return task
+
+    def _run(self, task, late_ms):
+        t0 = ticks_us()
+        try:
+            task.fn()
+        except Exception as e:
+            task.errors += 1
+            print(f"[Scheduler] Task {task.name} error: {e}")
+        dt = ticks_diff(ticks_us(), t0)
+        task.runs += 1
+        task._run_acc += dt - (task._run_acc >> 4)
+        if dt > task.run_max_us:
+            task.run_max_us = dt
+        task._late_acc += late_ms - (task._late_acc >> 4)
+        if late_ms > task.late_max_ms:
+            task.late_max_ms = late_ms
+        self._busy_us += dt
+
+    def run_once(self):
+        """Run every due task once. Returns ms until the next deadline."""
+        self.loops += 1
+        win = ticks_diff(ticks_ms(), self._win_start)
+        if win >= self.LOAD_WINDOW_MS:
+            self.busy_pct = min(100, self._busy_us // (win * 10))
+            self._busy_us = 0
+            self._win_start = ticks_ms()
+
+        wait = self.idle_ms
+        for task in self.tasks:
+            if not task.period_ms:
+                if task.ready():
+                    self._run(task, 0)
+                continue
+
+            now = ticks_ms()
+            late = ticks_diff(now, task.deadline)
+            if late >= 0:
+                if late >= task.period_ms:
+                    missed = late // task.period_ms
+                    task.overruns += missed
+                    task.deadline = ticks_add(task.deadline, missed * task.period_ms)
+                    late -= missed * task.period_ms
+                self._run(task, late)
+                task.deadline = ticks_add(task.deadline, task.period_ms)
+                now = ticks_ms()
+            left = ticks_diff(task.deadline, now)
+            if left < wait:
+                wait = left
+        return wait
+
+    def run(self):
+        self.running = True
+        while self.running:
+            wait = self.run_once()
+            if wait > 0:
+                sleep_ms(wait)
+
+    def stats(self):
+        tasks = {}
+        for task in self.tasks:
+            tasks[task.name] = task.stats()
+        return {
+            "loops": self.loops,
+            "busy_pct": self.busy_pct,
+            "late_max_ms": max([t.late_max_ms for t in self.tasks] or [0]),
+            "overruns": sum(t.overruns for t in self.tasks),
+            "tasks": tasks
+        }
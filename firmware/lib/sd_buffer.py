@@ -0,0 +1,136 @@
+# lib/sd_buffer.py - SD-block-aligned write buffer with flush policy
+#
+# Small writes + f.flush() per sample make the FAT driver issue one single-block
+# SPI transaction per 512 B sector and rewrite the FAT/directory sectors each
+# time. AlignedWriter collects data in a preallocated RAM buffer and hands the
+# filesystem chunks that end on a 512 B sector boundary, so whole sectors go
+# straight to SDCard.writeblocks() as one CMD25 multi-block write.
+#
+# Flush policy:
+#   - size: buffer full -> aligned chunk written (no FAT metadata update)
+#   - time: poll() syncs data + metadata every flush_interval_ms
+#   - event: sync() on demand (PAUSED transition, low battery, close)
+#
+# Preallocation (SD logs): a growing file makes FatFs extend the cluster
+# chain (FAT sector writes) and rewrite the directory entry size on every
+# sync. With `reserve` the file is extended to that size up front (one chain
+# allocation, contiguous on an unfragmented card; data then overwrites it in
+# place and SDCard.writeblocks() keeps one CMD25 stream open across chunks),
+# and again by `reserve` whenever the data reaches the end. truncate() cuts
+# the file to the data length on close where the port supports it; otherwise
+# the tail is stale card data and readers use the length kept in the session
+# index (recovered with lib/binlog.recover_length after a power loss).
+#
+# `offset` and `crc` (CRC32 of everything written, from offset 0) describe
+# the file as committed after a sync: the session index records them instead
+# of re-reading the log.
+import time
+
+try:
+    from binascii import crc32
+except ImportError:
+    from ubinascii import crc32
+
+SD_BLOCK = 512
+
+
+class AlignedWriter:
+    def __init__(self, f, size=8192, flush_interval_ms=10000, offset=0, reserve=0):
+        self.f = f
+        self.size = size
+        self.flush_interval_ms = flush_interval_ms
+        self.offset = offset # File position of _buf[0]
+        self.crc = 0         # CRC32 of the bytes written so far
+
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self.fill = 0
+        self.last_sync = time.ticks_ms()
+
+        # Stats
+        self.chunks_written = 0
+        self.syncs = 0
+        self.reserves = 0
+
+        self.reserved = 0    # Preallocated file size
+        self.reserve_step = reserve
+        if reserve:
+            self.reserve(offset + reserve)
+
+    def reserve(self, size):
+        """Extend the file to `size` bytes (allocated, not written). Returns True if reserved."""
+        ok = False
+        try:
+            self.f.seek(size - 1)
+            self.f.write(b"\0")
+            self.f.flush() # Directory entry holds the size: in-place data survives a power loss
+            self.reserved = size
+            self.reserves += 1
+            ok = True
+        except OSError as e:
+            print(f"[SD] Preallocation failed ({e}): growing the file instead")
+            self.reserve_step = 0
+        self.f.seek(self.offset)
+        return ok
+
+    def _write(self, mv):
+        n = len(mv)
+        if self.reserve_step and self.offset + n > self.reserved:
+            self.reserve(self.reserved + self.reserve_step)
+        self.f.write(mv)
+        self.crc = crc32(mv, self.crc)
+        self.offset += n
+
+    def truncate(self):
+        """Cut a preallocated file to the data length. False where the port cannot truncate."""
+        if self.reserved <= self.offset:
+            return True
+        trunc = getattr(self.f, "truncate", None)
+        if trunc is None:
+            return False
+        trunc(self.offset)
+        self.reserved = self.offset
+        return True
+
+    def write(self, data):
+        """Buffer bytes; writes an aligned chunk whenever the buffer fills."""
+        n = len(data)
+        pos = 0
+        while pos < n:
+            take = min(self.size - self.fill, n - pos)
+            self._mv[self.fill:self.fill + take] = data[pos:pos + take]
+            self.fill += take
+            pos += take
+            if self.fill == self.size:
+                self._drain()
+
+    def _drain(self):
+        """Write the longest buffered prefix that ends on a sector boundary."""
+        end = self.fill - (self.offset + self.fill) % SD_BLOCK
+        if end <= 0:
+            return
+        self._write(self._mv[:end])
+        rest = self.fill - end
+        if rest:
+            self._buf[:rest] = self._mv[end:self.fill]
+        self.fill = rest
+        self.chunks_written += 1
+
+    def sync(self):
+        """Write everything buffered and commit FAT metadata (file size)."""
+        if self.fill:
+            self._write(self._mv[:self.fill])
+            self.fill = 0
+        self.f.flush()
+        self.last_sync = time.ticks_ms()
+        self.syncs += 1
+
+    def due(self):
+        return time.ticks_diff(time.ticks_ms(), self.last_sync) >= self.flush_interval_ms
+
+    def poll(self):
+        """Time-based flush; call once per loop. Returns True if it synced."""
+        if self.due():
+            self.sync()
+            return True
+        return False
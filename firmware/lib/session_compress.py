@@ -0,0 +1,190 @@
+# lib/session_compress.py - Background deflate of closed session logs
+#
+# Session logs are very repetitive (nearly constant vbat/sats, slowly changing
+# lat/lon, block headers) and compress well. While the logger is idle (PAUSED,
+# calibrating or without a fix), main.py runs SessionCompressor.step() as a
+# low-rate task: each step feeds one buffer of a closed session through
+# MicroPython's deflate module into <name>.z.part. When the file is done the
+# part file is renamed to <name>.z and the original removed, so a reset at
+# any point leaves either the original or the finished copy (stale .part
+# files are discarded at boot).
+#
+# MiniServer serves the .z bytes with "Content-Encoding: deflate" (zlib
+# stream, as HTTP defines it) and the uploader flags them the same way; the
+# server decompresses on ingest.
+import os
+from lib.session_manager import COMPRESSED_EXT
+
+try:
+    import deflate
+except ImportError:
+    deflate = None # MicroPython before 1.21: sessions stay raw
+
+PART_EXT = ".part"
+WBITS = 10           # 1 KB history window (RAM on the device vs ratio)
+STEP_BYTES = 4096    # Input per step (8 SD sectors)
+
+
+def _can_compress():
+    """Default ESP32 builds only decompress (no MICROPY_PY_DEFLATE_COMPRESS): try one write."""
+    try:
+        import io
+        z = deflate.DeflateIO(io.BytesIO(), deflate.ZLIB, WBITS)
+        z.write(b"x")
+        z.close()
+        return True
+    except Exception:
+        return False
+
+
+class SessionCompressor:
+    def __init__(self, session_mgr, step_bytes=STEP_BYTES):
+        self.sm = session_mgr
+        self.available = deflate is not None and _can_compress()
+        self._buf = bytearray(step_bytes)
+        self._mv = memoryview(self._buf)
+        self._name = None    # Session being compressed
+        self._src = None
+        self._dst = None
+        self._z = None
+        self._in = 0
+        self._size = 0
+        self._done_for = ""  # current_log when nothing was left (new closed sessions
+                             # only appear when the log rotates)
+        self._stale = []     # Raw copies replaced by a .z while open for reading: removed later
+
+        # Stats
+        self.files = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        self._remove_parts()
+
+    def _remove_parts(self):
+        try:
+            for f in os.listdir(self.sm.active_dir):
+                if f.endswith(PART_EXT):
+                    os.remove(self.sm.active_dir + "/" + f)
+        except OSError:
+            pass
+
+    def _next(self):
+        """
+        A closed session that is not compressed yet, or None. Sessions the
+        server already holds part of are left raw: only their tail is sent.
+        So are sessions a sync client was shown since their last ack: it may
+        be fetching them, and its /sync/ack checks the raw bytes.
+        """
+        current = self.sm.current_log
+        for name in self.sm.list_sessions():
+            path, encoding = self.sm.session_path(name)
+            if (encoding is None and path != current and name not in self.sm.synced
+                    and name not in self.sm.transferring and name not in self.sm.listed):
+                return name
+        return None
+
+    def step(self):
+        """Compress up to one buffer of input. Returns True while there is work left."""
+        if not self.available:
+            return False
+        if self._stale:
+            self._remove_stale()
+        try:
+            if self._src is None:
+                if self._done_for == self.sm.current_log:
+                    return False
+                name = self._next()
+                if name is None:
+                    self._done_for = self.sm.current_log
+                    return False
+                self._open(name)
+
+            left = self._size - self._in
+            n = self._src.readinto(self._mv if left >= len(self._buf) else self._mv[:left]) if left > 0 else 0
+            if n:
+                self._z.write(self._mv[:n] if n < len(self._buf) else self._mv)
+                self._in += n
+            else:
+                self._finish()
+            return True
+        except Exception as e:
+            # Card full / file removed under us / out of memory: retried after the next log rotation
+            print(f"[Compress] Error ({self._name}): {e}")
+            self._discard()
+            self._done_for = self.sm.current_log
+            return False
+
+    def _open(self, name):
+        path = self.sm.active_dir + "/" + name
+        self._name = name
+        self._in = 0
+        self._size = self.sm.session_size(name) # Data length (a preallocated log is longer)
+        self._src = open(path, 'rb')
+        self._dst = open(path + COMPRESSED_EXT + PART_EXT, 'wb')
+        self._z = deflate.DeflateIO(self._dst, deflate.ZLIB, WBITS)
+
+    def _discard(self):
+        for f in (self._z, self._dst, self._src):
+            try:
+                if f:
+                    f.close()
+            except Exception:
+                pass
+        self._z = self._dst = self._src = None
+        if self._name:
+            try:
+                os.remove(self.sm.active_dir + "/" + self._name + COMPRESSED_EXT + PART_EXT)
+            except OSError:
+                pass
+        self._name = None
+
+    def _finish(self):
+        path = self.sm.active_dir + "/" + self._name
+        part = path + COMPRESSED_EXT + PART_EXT
+        self._z.close() # Final deflate block
+        self._dst.close()
+        self._src.close()
+        self._z = self._dst = self._src = None
+        try:
+            os.stat(path)
+            gone = self._name in self.sm.transferring # Open for reading (download, uploader, BLE)
+        except OSError:
+            gone = True # Synced and deleted meanwhile (MiniServer thread)
+        if gone:
+            os.remove(part)
+            self._name = None
+            return
+
+        out = os.stat(part)[6]
+        os.rename(part, path + COMPRESSED_EXT)
+        self.sm.index.compressed(self._name, out) # Before the raw copy goes (reset in between: .z served)
+        # A reader (MiniServer thread) may have opened the raw file since the
+        # check above: new readers get the .z now, this one keeps its file
+        if self._name in self.sm.transferring:
+            self._stale.append(self._name)
+        else:
+            os.remove(path)
+        self.files += 1
+        self.bytes_in += self._in
+        self.bytes_out += out
+        print(f"[Compress] {self._name}: {self._in} -> {out} B")
+        self._name = None
+
+    def _remove_stale(self):
+        for name in self._stale[:]:
+            if name in self.sm.transferring:
+                continue
+            self._stale.remove(name)
+            try:
+                os.remove(self.sm.active_dir + "/" + name)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "files": self.files,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "active": self._name
+        }
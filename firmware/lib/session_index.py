@@ -0,0 +1,228 @@
+# lib/session_index.py - Persisted summary of the stored sessions
+#
+# /list, /status and the BLE file list used to stat every session (and
+# statvfs) on each request; with hundreds of logs on a FAT card that is a
+# directory walk per poll. SessionIndex keeps one small entry per session in
+# /data/metadata/session_index.json instead:
+#   {name: [size, crc32, start, end, laps, closed, encoding]}
+#   size/crc32  stored bytes (of the .z file when encoding is "deflate");
+#               crc32 null until known (computed once by MiniServer)
+#   start/end   epoch seconds of the first / last record
+#   laps        laps completed while logging (null if unknown)
+# The logger maintains it incrementally (SessionManager.get_log_file /
+# log_progress / close_log): state changes are saved at once, progress of
+# the open log at most every SAVE_INTERVAL_MS. The directory is scanned only
+# when the index file is missing or unreadable.
+#
+# The MiniServer thread reads entries while the main loop writes them:
+# readers take a snapshot (items()) and entries are replaced, not edited.
+# Both cores update and save the index (delete, set_crc on the server side),
+# so changes and save() hold a lock. save() writes a .tmp file and renames it
+# over the index: a reset mid-write leaves the previous index, not a
+# truncated one that forces a rebuild (which loses laps, times and CRCs).
+import os
+import json
+import time
+import _thread
+
+INDEX_FILE = "session_index.json"
+SAVE_INTERVAL_MS = 30000
+
+# Entry fields
+SIZE = 0
+CRC = 1
+START = 2
+END = 3
+LAPS = 4
+CLOSED = 5
+ENCODING = 6
+
+
+def _start_from_name(name):
+    # sess_<epoch>.<ext> (SessionManager.get_log_file)
+    try:
+        return int(name[5:name.index('.')])
+    except ValueError:
+        return None
+
+
+class SessionIndex:
+    def __init__(self, metadata_dir):
+        self.path = metadata_dir + '/' + INDEX_FILE
+        self.entries = {}
+        self._dirty = False
+        self._saved_ms = time.ticks_ms()
+        self._lock = _thread.allocate_lock()
+
+    def load(self, active_dir, compressed_ext, recover=None):
+        """
+        Read the index, or rebuild it from the session directory. recover(path,
+        size, crc) -> (size, crc) finds the data length of a log left open.
+        """
+        self.entries = None
+        # A reset between removing the old index and the rename leaves only the .tmp
+        for path in (self.path, self.path + '.tmp'):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+                break
+            except (OSError, ValueError):
+                pass
+        if self.entries is None:
+            self.rebuild(active_dir, compressed_ext, recover)
+            return
+        # A log still open in the index was cut by a reset: find its length on the card
+        changed = path != self.path
+        for name, e in list(self.entries.items()):
+            if e[CLOSED]:
+                continue
+            path = active_dir + '/' + name
+            e = list(e)
+            try:
+                if recover:
+                    e[SIZE], e[CRC] = recover(path, e[SIZE], e[CRC])
+                else:
+                    size = os.stat(path)[6]
+                    if size != e[SIZE]:
+                        e[SIZE] = size
+                        e[CRC] = None
+            except OSError:
+                del self.entries[name]
+                changed = True
+                continue
+            e[CLOSED] = True
+            self.entries[name] = e
+            changed = True
+        if changed:
+            self.save()
+
+    def rebuild(self, active_dir, compressed_ext, recover=None):
+        """
+        One scan of the session directory (first boot with the index). Raw
+        logs go through recover() as well: a preallocated one is longer than its data.
+        """
+        entries = {}
+        try:
+            files = os.listdir(active_dir)
+        except OSError:
+            files = []
+        for f in files:
+            encoding = None
+            name = f
+            if f.endswith(compressed_ext):
+                name = f[:-len(compressed_ext)]
+                encoding = "deflate"
+            if not (name.endswith('.csv') or name.endswith('.rsl')):
+                continue
+            if name in entries and not encoding:
+                continue # The .z copy is the one served
+            path = active_dir + '/' + f
+            try:
+                st = os.stat(path)
+                size, crc = st[6], None
+                if recover and not encoding:
+                    size, crc = recover(path, 0, None)
+            except OSError:
+                continue
+            entries[name] = [size, crc, _start_from_name(name), st[8], None, True, encoding]
+        self.entries = entries
+        self.save()
+        print(f"[Index] Rebuilt: {len(entries)} sessions")
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with self._lock:
+            try:
+                with open(tmp, 'w') as f:
+                    f.write(json.dumps(self.entries))
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+                os.rename(tmp, self.path)
+                self._dirty = False
+                self._saved_ms = time.ticks_ms()
+            except OSError as e:
+                print(f"[Index] Save error: {e}")
+
+    def poll(self):
+        """Save pending progress of the open log (rate-limited); call from a slow task."""
+        if self._dirty and time.ticks_diff(time.ticks_ms(), self._saved_ms) >= SAVE_INTERVAL_MS:
+            self.save()
+
+    # --- Updates ---
+
+    def add(self, name, start):
+        with self._lock:
+            self.entries[name] = [0, 0, start, start, 0, False, None]
+        self.save()
+
+    def progress(self, name, size, crc, end, laps):
+        with self._lock:
+            e = self.entries.get(name)
+            if e is None:
+                return
+            self.entries[name] = [size, crc, e[START], end, laps, False, None]
+            self._dirty = True
+
+    def close(self, name, size=None, crc=None, end=None, laps=None):
+        with self._lock:
+            e = self.entries.get(name)
+            if e is None:
+                return
+            e = list(e)
+            if size is not None:
+                e[SIZE] = size
+                e[CRC] = crc
+            if end is not None:
+                e[END] = end
+            if laps is not None:
+                e[LAPS] = laps
+            e[CLOSED] = True
+            self.entries[name] = e
+        self.save()
+
+    def compressed(self, name, size):
+        """The session is now stored as <name>.z (CRC of the new bytes computed on demand)."""
+        with self._lock:
+            e = self.entries.get(name)
+            if e is None:
+                return
+            e = list(e)
+            e[SIZE] = size
+            e[CRC] = None
+            e[ENCODING] = "deflate"
+            self.entries[name] = e
+        self.save()
+
+    def set_crc(self, name, size, crc):
+        """CRC computed by a reader; kept if the entry still has that size."""
+        with self._lock:
+            e = self.entries.get(name)
+            if e is not None and e[SIZE] == size:
+                e = list(e)
+                e[CRC] = crc
+                self.entries[name] = e
+                self._dirty = True
+
+    def remove(self, name):
+        with self._lock:
+            removed = self.entries.pop(name, None) is not None
+        if removed:
+            self.save()
+
+    # --- Queries ---
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def names(self):
+        """Session names, oldest first."""
+        items = list(self.entries.items())
+        items.sort(key=lambda kv: kv[1][START] or 0)
+        return [name for name, _ in items]
+
+    def totals(self):
+        """(sessions, stored bytes)"""
+        entries = list(self.entries.values())
+        return len(entries), sum(e[SIZE] for e in entries)
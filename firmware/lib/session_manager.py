@@ -1,6 +1,12 @@
 # session_manager.py - Manages onboard flash storage only
 import os
 import time
+import json
+from lib.session_index import SessionIndex, SIZE, ENCODING
+from lib.binlog import FILE_EXT, recover_length
+
+COMPRESSED_EXT = ".z"   # Closed session compressed on the device (lib/session_compress.py)
+STORAGE_REFRESH_MS = 60000 # statvfs scans the FAT on SD cards: cached in between
 
 class SessionManager:
     def __init__(self, sd_mounted=False):
@@ -25,13 +31,29 @@ class SessionManager:
             self.active_dir = self.flash_sessions
             self.metadata_dir = self.flash_meta
         
+        self.current_log = None # Session being written (never compressed or listed as closed)
+        self._log_name = None
+        self.transferring = {} # Sessions open for reading (downloads, uploader, BLE bulk) -> readers: left as stored
+        self.listed = set()    # Sessions in a /list manifest since their last /sync/ack: left as stored
+        
         # Ensure directories exist
         self._ensure_dir_exists()
         
+        # Sync acks: bytes of each session the server confirmed holding
+        # ({name: [size, crc32]}, lib/miniserver.py /sync/ack)
+        self.sync_file = self.metadata_dir + '/sync_acks.json'
+        self.synced = self._load_synced()
+        
         # If using Flash, migrate old data
         if not self.sd_mounted:
             self._migrate_legacy_data()
         
+        # Size/CRC/times per session, so listings never walk the directory (lib/session_index.py)
+        self.index = SessionIndex(self.metadata_dir)
+        self.index.load(self.active_dir, COMPRESSED_EXT, self._recover_log)
+        self._storage = None
+        self._storage_ms = 0
+        
         print(f"SessionManager initialized: {self.active_dir}")
             
     def _ensure_dir_exists(self):
@@ -77,59 +99,174 @@ class SessionManager:
         except OSError:
             pass
 
-    def get_log_file(self):
-        """Returns file path for new session on internal flash"""
-        # Generate filename based on timestamp
-        # ESP32 time() starts from boot, but GPS will update it
-        fname = f"sess_{time.time()}.csv"
-        return f"{self.active_dir}/{fname}"
+    def get_log_file(self, ext="csv", start=None):
+        """Returns file path for new session; `start` (epoch s) names it, default the RTC"""
+        # main.py passes GPSClock.epoch_s(): the same time base as the end
+        # times it records (log_progress), so the indexed duration holds
+        if start is None:
+            start = time.time()
+        fname = f"sess_{start}.{ext}"
+        self.current_log = f"{self.active_dir}/{fname}"
+        self._log_name = fname
+        self.index.add(fname, start)
+        return self.current_log
+
+    def log_progress(self, size, crc, end, laps):
+        """The open log was synced to the card: `size` bytes with CRC32 `crc`."""
+        if self._log_name:
+            self.index.progress(self._log_name, size, crc, end, laps)
+
+    def close_log(self, size=None, crc=None, end=None, laps=None, keep=True):
+        """The log being written was closed (or removed, keep=False)."""
+        name = self._log_name
+        self.current_log = None
+        self._log_name = None
+        if not name:
+            return
+        if keep:
+            self.index.close(name, size, crc, end, laps)
+        else:
+            self.index.remove(name)
+
+    def _recover_log(self, path, size, crc):
+        """
+        Data length of a log a reset left open. Preallocated logs are longer
+        than their data: binary logs are walked block by block from the last
+        length the index recorded, then cut to it where the port can truncate.
+        """
+        if not path.endswith('.' + FILE_EXT):
+            st = os.stat(path)[6]
+            return st, crc if st == size else None
+        if crc is None:
+            size, crc = 0, 0
+        length, crc = recover_length(path, size, crc)
+        with open(path, 'r+b') as f:
+            trunc = getattr(f, 'truncate', None)
+            if trunc and os.stat(path)[6] > length:
+                trunc(length)
+        print(f"[Index] Recovered {path}: {length} B")
+        return length, crc
 
     def list_sessions(self):
-        """List all session files stored on active storage"""
+        """
+        List all session files (CSV and binary .rsl) stored on active storage,
+        oldest first. Compressed sessions are listed under their original name.
+        """
+        return self.index.names()
+    
+    def session_info(self, filename):
+        """Index entry of a session (lib/session_index.py fields), or None"""
+        return self.index.get(filename)
+    
+    def session_size(self, filename):
+        """
+        Stored size: the length the index recorded (a preallocated log is
+        longer on the card), stat for sessions not indexed. OSError if missing.
+        """
+        e = self.index.get(filename)
+        if e is not None:
+            return e[SIZE]
+        return os.stat(self.session_path(filename)[0])[6]
+    
+    def transfer_start(self, filename):
+        """A reader opens the session: the compressor leaves it as stored until transfer_end()."""
+        self.transferring[filename] = self.transferring.get(filename, 0) + 1
+
+    def transfer_end(self, filename):
+        n = self.transferring.get(filename, 0) - 1
+        if n > 0:
+            self.transferring[filename] = n
+        else:
+            self.transferring.pop(filename, None)
+
+    def session_path(self, filename):
+        """Stored path of a session and its encoding: ("<path>.z", "deflate") or ("<path>", None)"""
+        fpath = f"{self.active_dir}/{filename}"
+        e = self.index.get(filename)
+        if e is not None:
+            return (fpath + COMPRESSED_EXT, e[ENCODING]) if e[ENCODING] else (fpath, None)
         try:
-            files = os.listdir(self.active_dir)
-            return [f for f in files if f.endswith('.csv')]
+            os.stat(fpath + COMPRESSED_EXT)
+            return fpath + COMPRESSED_EXT, "deflate"
         except OSError:
-            return []
+            return fpath, None
     
     def get_session_data(self, filename):
-        """Read session file content for cloud upload"""
-        fpath = f"{self.active_dir}/{filename}"
+        """Read session file content for cloud upload (bytes for binary or compressed logs)"""
+        fpath, encoding = self.session_path(filename)
         try:
-            with open(fpath, 'r') as f:
+            with open(fpath, 'rb' if encoding or filename.endswith('.rsl') else 'r') as f:
                 return f.read()
         except Exception as e:
             print(f"Error reading {filename}: {e}")
             return None
     
     def delete_session(self, filename):
-        """Delete session after successful cloud sync"""
+        """Delete session after successful cloud sync (raw and compressed copies)"""
         fpath = f"{self.active_dir}/{filename}"
-        try:
-            os.remove(fpath)
+        deleted = False
+        for path in (fpath, fpath + COMPRESSED_EXT):
+            try:
+                os.remove(path)
+                deleted = True
+            except OSError:
+                pass
+        if self.synced.pop(filename, None):
+            self._save_synced()
+        self.listed.discard(filename)
+        self.index.remove(filename)
+        if deleted:
             print(f"Deleted synced session: {filename}")
-            return True
-        except Exception as e:
-            print(f"Error deleting {filename}: {e}")
-            return False
+        else:
+            print(f"Error deleting {filename}: not found")
+        return deleted
+    
+    def is_closed(self, filename):
+        """True unless the session is the log being written"""
+        return f"{self.active_dir}/{filename}" != self.current_log
+    
+    def _load_synced(self):
+        try:
+            with open(self.sync_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_synced(self):
+        try:
+            with open(self.sync_file, 'w') as f:
+                json.dump(self.synced, f)
+        except OSError as e:
+            print(f"Sync ack save error: {e}")
+    
+    def record_synced(self, filename, size, crc):
+        """The server holds the first `size` bytes of an open session (its tail follows later)"""
+        self.synced[filename] = [size, crc]
+        self._save_synced()
     
     def get_storage_info(self):
-        """Get flash storage statistics"""
+        """Get flash storage statistics (statvfs at most every STORAGE_REFRESH_MS, sessions from the index)"""
         try:
-            stat = os.statvfs('/')
-            block_size = stat[0]
-            total_blocks = stat[2]
-            free_blocks = stat[3]
-            
-            total_kb = (total_blocks * block_size) // 1024
-            free_kb = (free_blocks * block_size) // 1024
-            used_kb = total_kb - free_kb
+            now = time.ticks_ms()
+            if self._storage is None or time.ticks_diff(now, self._storage_ms) >= STORAGE_REFRESH_MS:
+                stat = os.statvfs('/')
+                block_size = stat[0]
+                total_blocks = stat[2]
+                free_blocks = stat[3]
+                
+                total_kb = (total_blocks * block_size) // 1024
+                free_kb = (free_blocks * block_size) // 1024
+                self._storage = (total_kb, free_kb)
+                self._storage_ms = now
+            total_kb, free_kb = self._storage
+            sessions, session_bytes = self.index.totals()
             
             return {
                 'total_kb': total_kb,
-                'used_kb': used_kb,
+                'used_kb': total_kb - free_kb,
                 'free_kb': free_kb,
-                'sessions': len(self.list_sessions())
+                'sessions': sessions,
+                'sessions_kb': session_bytes // 1024
             }
         except Exception as e:
             print(f"Storage info error: {e}")
@@ -3,53 +3,157 @@ import json
 import os
 import math
 import time
+from lib.lap_delta import LapDelta
+from lib.track_library import TrackLibrary, NEARBY_M
 
-TRACK_FILE = "/data/metadata/track.json"
-GATE_RADIUS_M = 15  # Meters to trigger sector crossing
+TRACK_FILE = "/data/metadata/track.json" # Single-track file from older firmware (migrated)
+GATE_RADIUS_M = 15  # Half-width of a sector gate line (meters either side of the gate point)
+M_PER_DEG = 111195.0  # Equirectangular projection (6371 km sphere)
+MAX_MOVE_M = 200  # Longer fix-to-fix jumps (GPS dropouts) never count as a crossing
 
 class TrackEngine:
     """
     Lightweight track identification and sector timing engine.
     Designed for ESP32 resource constraints.
+    Tracks live in the on-device library (lib/track_library.py); the one
+    near the rider is loaded when a fix first comes within NEARBY_M of its
+    start line.
+    When a track loads, its start line, gates and pit centre are projected to
+    metres on a plane touching the earth at the start line. Each fix is then
+    projected with two multiplies, and all tests are squared distances or
+    line crossings (no trig, no sqrt).
     """
     
     def __init__(self):
         self.track = None
+        self.library = TrackLibrary()
         self.track_identified = False
         self.current_sector = 0
         self.sector_start_ts = 0.0
         self.lap_start_ts = 0.0
+        self.laps = 0  # Laps completed since boot (session index)
         self.current_lap_sectors = {}  # {0: 12.34, 1: 15.67}
         self._pending_event = None  # Event to be consumed by LED manager
+        self.lap_delta = None  # LapDelta when the track has a reference lap ("ref")
         
+        # Local projection of the current track (set in _activate)
+        self._lat0 = 0.0
+        self._lon0 = 0.0
+        self._kx = M_PER_DEG
+        self._start_r2 = 0.0      # Start line half-width squared
+        self._gates = []          # [(x, y)] sector end points, meters
+        self._pit = None          # (x, y, radius^2)
+        self._proj_key = None     # Last projected (lat, lon) -> self._pos
+        self._pos = (0.0, 0.0)
+        self._prev = None         # Previous fix (x, y, timestamp) for crossing tests
+    
     def load_track(self):
-        """Load track definition from flash storage."""
-        if not self._file_exists(TRACK_FILE):
-            self.track = None
-            return False
-            
-        try:
-            with open(TRACK_FILE, 'r') as f:
-                self.track = json.load(f)
-            print(f"[TrackEngine] Loaded: {self.track.get('name', 'Unknown')}")
-            return True
-        except Exception as e:
-            print(f"[TrackEngine] Load Error: {e}")
-            self.track = None
-            return False
+        """Load the library index (tracks themselves are loaded on approach)."""
+        if self._file_exists(TRACK_FILE):
+            try:
+                with open(TRACK_FILE, 'r') as f:
+                    legacy = json.load(f)
+                self.library.load()
+                self.library.put(legacy)
+                os.remove(TRACK_FILE)
+                print(f"[TrackEngine] Migrated {TRACK_FILE} to library")
+            except Exception as e:
+                print(f"[TrackEngine] Migration Error: {e}")
+        
+        count = self.library.load()
+        print(f"[TrackEngine] Library: {count} tracks")
+        return count > 0
     
-    def save_track(self, track_data):
-        """Save track definition to flash storage."""
+    def save_track(self, track_data, activate=True):
+        """
+        Store a track in the library. With activate, it becomes the current
+        track right away (until a fix shows the rider is at another one).
+        Returns "stored", "unchanged" (same ETag) or None on error.
+        """
         try:
-            with open(TRACK_FILE, 'w') as f:
-                json.dump(track_data, f)
-            self.track = track_data
-            self.reset()
-            print(f"[TrackEngine] Saved: {track_data.get('name', 'Unknown')}")
-            return True
+            stored = self.library.put(track_data)
+            if activate:
+                self._activate(track_data if stored else self.library.get(track_data['id']))
+            elif self.track and str(self.track.get('id')) == str(track_data['id']) and stored:
+                self._activate(track_data) # Current track updated
+            print(f"[TrackEngine] {'Saved' if stored else 'Unchanged'}: {track_data.get('name', 'Unknown')}")
+            return "stored" if stored else "unchanged"
         except Exception as e:
             print(f"[TrackEngine] Save Error: {e}")
+            return None
+    
+    def _activate(self, track):
+        """Make a library record the current track (sectors, pit, TBL, reference)."""
+        self.track = track
+        self._proj_key = None
+        if track:
+            self._build_projection()
+            self._load_reference()
+            print(f"[TrackEngine] Loaded: {track.get('name', 'Unknown')}")
+        else:
+            self.lap_delta = None
+        self.reset()
+    
+    def _build_projection(self):
+        """Project the track's features to meters around its start line (once per load)."""
+        track = self.track
+        sl = track['start_line']
+        self._lat0 = sl['lat']
+        self._lon0 = sl['lon']
+        self._kx = M_PER_DEG * math.cos(math.radians(self._lat0))
+        r = sl.get('radius_m', 20)
+        self._start_r2 = r * r
+        
+        self._gates = []
+        for gate in track.get('sectors', []):
+            if gate.get('end_lat') and gate.get('end_lon'):
+                self._gates.append(self._to_xy(gate['end_lat'], gate['end_lon']))
+            else:
+                self._gates.append(None)
+        
+        self._pit = None
+        pit_lat = track.get('pit_center_lat')
+        pit_lon = track.get('pit_center_lon')
+        if pit_lat is not None and pit_lon is not None:
+            r = track.get('pit_radius_m', 50) # Default 50m
+            x, y = self._to_xy(pit_lat, pit_lon)
+            self._pit = (x, y, r * r)
+    
+    def _to_xy(self, lat, lon):
+        return ((lon - self._lon0) * self._kx, (lat - self._lat0) * M_PER_DEG)
+    
+    def _project(self, lat, lon):
+        """Fix position in meters (cached: is_in_pit, update and update_delta share it)."""
+        key = (lat, lon)
+        if key != self._proj_key:
+            self._pos = ((lon - self._lon0) * self._kx, (lat - self._lat0) * M_PER_DEG)
+            self._proj_key = key
+        return self._pos
+    
+    def _select_track(self, lat, lon):
+        """Keep the current track while near its start line, else look one up in the grid."""
+        track = self.track
+        if track:
+            x, y = self._project(lat, lon)
+            if x * x + y * y < NEARBY_M * NEARBY_M:
+                return True
+        tid = self.library.nearest(lat, lon)
+        if tid is None:
             return False
+        if track is None or str(track.get('id')) != tid:
+            self._activate(self.library.get(tid))
+        return self.track is not None
+    
+    def _load_reference(self):
+        """Unpack the reference lap into int arrays (the JSON lists are dropped)."""
+        ref = self.track.pop('ref', None)
+        self.lap_delta = None
+        if ref:
+            try:
+                self.lap_delta = LapDelta(ref, self._lat0, self._lon0, self._kx, M_PER_DEG)
+                print(f"[TrackEngine] Reference lap: {self.lap_delta.lap_ms / 1000:.2f}s, {self.lap_delta.nseg + 1} points")
+            except Exception as e:
+                print(f"[TrackEngine] Reference Error: {e}")
     
     def reset(self):
         """Reset state for new session."""
@@ -59,6 +163,9 @@ class TrackEngine:
         self.lap_start_ts = 0.0
         self.current_lap_sectors = {}
         self._pending_event = None
+        self._prev = None
+        if self.lap_delta:
+            self.lap_delta.reset()
     
     def get_pending_event(self):
         """Get and clear pending LED event."""
@@ -68,21 +175,42 @@ class TrackEngine:
     
     def is_in_pit(self, lat, lon):
         """Check if current position is within the pit geofence."""
-        if not self.track:
+        pit = self._pit
+        if not self.track or not pit:
             return False
-        
-        pit_lat = self.track.get('pit_center_lat')
-        pit_lon = self.track.get('pit_center_lon')
-        pit_radius = self.track.get('pit_radius_m', 50) # Default 50m
-        
-        if pit_lat is not None and pit_lon is not None:
-            dist = self._haversine_m(lat, lon, pit_lat, pit_lon)
-            return dist < pit_radius
-        return False
-
+        x, y = self._project(lat, lon)
+        dx = x - pit[0]
+        dy = y - pit[1]
+        return dx * dx + dy * dy < pit[2]
+    
+    def _crossing(self, prev, x, y, gx, gy, half_width2):
+        """
+        Fraction (0-1) of the move prev -> (x, y) at which it crosses the line
+        through the gate point (gx, gy) square to the direction of travel, or -1.
+        The line reaches sqrt(half_width2) meters either side of the gate point.
+        """
+        x0 = prev[0]
+        y0 = prev[1]
+        mx = x - x0
+        my = y - y0
+        m2 = mx * mx + my * my
+        if m2 == 0 or m2 > MAX_MOVE_M * MAX_MOVE_M:
+            return -1
+        # Along-track position of the gate: ahead of prev, not ahead of this fix
+        # (with 1% slack: a fix sitting on the line must not fall through both moves)
+        s0 = (gx - x0) * mx + (gy - y0) * my
+        if s0 <= 0 or s0 > m2 * 1.01:
+            return -1
+        # Cross-track offset of the gate from the path (scaled by |m|)
+        c = (gx - x0) * my - (gy - y0) * mx
+        if c * c > half_width2 * m2:
+            return -1
+        return min(s0 / m2, 1.0)
+    
     def update(self, lat, lon, timestamp):
         """
-        Main update loop. Call with each GPS sample.
+        Main update loop. Call with each GPS sample (timestamp: fix time in
+        seconds; line crossings are interpolated between fixes).
         
         Returns:
             None - No event
@@ -91,38 +219,42 @@ class TrackEngine:
             "SECTOR_NEUTRAL" - Sector within threshold
             "SECTOR_SLOW" - Sector slower than TBL
         """
-        if not self.track:
+        # Phase 1: Track Identification (library grid lookup, then the start line)
+        if not self.track_identified and not self._select_track(lat, lon):
+            self._prev = None
             return None
-            
-        # Phase 1: Track Identification
-        if not self.track_identified:
-            sl = self.track.get('start_line')
-            if sl:
-                dist = self._haversine_m(lat, lon, sl['lat'], sl['lon'])
-                radius = sl.get('radius_m', 20)
-                if dist < radius:
-                    self.track_identified = True
-                    self.sector_start_ts = timestamp
-                    self.lap_start_ts = timestamp
-                    self.current_sector = 0
-                    self._pending_event = "TRACK_FOUND"
-                    print(f"[TrackEngine] Track Identified: {self.track.get('name')}")
-                    return "TRACK_FOUND"
+        
+        x, y = self._project(lat, lon)
+        prev = self._prev
+        self._prev = (x, y, timestamp)
+        if prev is None:
             return None
         
+        if not self.track_identified:
+            f = self._crossing(prev, x, y, 0.0, 0.0, self._start_r2)
+            if f < 0:
+                return None
+            ts = prev[2] + f * (timestamp - prev[2])
+            self.track_identified = True
+            self.sector_start_ts = ts
+            self.lap_start_ts = ts
+            self.current_sector = 0
+            self._pending_event = "TRACK_FOUND"
+            print(f"[TrackEngine] Track Identified: {self.track.get('name')}")
+            return "TRACK_FOUND"
+        
         # Phase 2: Sector Crossing Detection
-        sectors = self.track.get('sectors', [])
-        if self.current_sector < len(sectors):
-            gate = sectors[self.current_sector]
-            gate_lat = gate.get('end_lat')
-            gate_lon = gate.get('end_lon')
+        gates = self._gates
+        if self.current_sector < len(gates):
+            gate = gates[self.current_sector]
             
-            if gate_lat and gate_lon:
-                dist = self._haversine_m(lat, lon, gate_lat, gate_lon)
+            if gate:
+                f = self._crossing(prev, x, y, gate[0], gate[1], GATE_RADIUS_M * GATE_RADIUS_M)
                 
-                if dist < GATE_RADIUS_M:
+                if f >= 0:
                     # Sector Complete
-                    sector_time = timestamp - self.sector_start_ts
+                    ts = prev[2] + f * (timestamp - prev[2])
+                    sector_time = ts - self.sector_start_ts
                     self.current_lap_sectors[self.current_sector] = sector_time
                     
                     # Compare with TBL
@@ -135,24 +267,35 @@ class TrackEngine:
                     
                     # Advance
                     self.current_sector += 1
-                    self.sector_start_ts = timestamp
+                    self.sector_start_ts = ts
                     
                     # Check lap complete (back to sector 0)
-                    if self.current_sector >= len(sectors):
+                    if self.current_sector >= len(gates):
                         self.current_sector = 0
-                        self.lap_start_ts = timestamp
+                        self.lap_start_ts = ts
                         self.current_lap_sectors = {}
+                        self.laps += 1
                     
                     self._pending_event = event
                     return event
         
         return None
     
+    def update_delta(self, lat, lon, t_ms):
+        """
+        Live lap delta for each GPS sample (t_ms: fix time in ms).
+        Returns ms ahead (-) / behind (+) the reference lap, or None.
+        """
+        if not self.lap_delta:
+            return None
+        x, y = self._project(lat, lon)
+        return self.lap_delta.update(x, y, t_ms)
+    
     def _calc_delta_event(self, sector_time, tbl_time):
         """Determine feedback color based on delta."""
         if tbl_time is None:
             return "SECTOR_NEUTRAL"  # No TBL data
-            
+        
         delta = sector_time - tbl_time
         
         # Thresholds (in seconds)
@@ -163,20 +306,6 @@ class TrackEngine:
         else:
             return "SECTOR_SLOW"  # Red
     
-    def _haversine_m(self, lat1, lon1, lat2, lon2):
-        """Calculate distance in meters between two GPS points."""
-        R = 6371000  # Earth radius in meters
-        
-        lat1_r = math.radians(lat1)
-        lat2_r = math.radians(lat2)
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        
-        a = math.sin(dlat/2)**2 + math.cos(lat1_r) * math.cos(lat2_r) * math.sin(dlon/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        
-        return R * c
-    
     def _file_exists(self, path):
         try:
             os.stat(path)
@@ -188,8 +317,11 @@ class TrackEngine:
         """Return current state for API."""
         return {
             "track_loaded": self.track is not None,
+            "track_id": self.track.get('id') if self.track else None,
             "track_name": self.track.get('name') if self.track else None,
+            "library_tracks": len(self.library.tracks),
             "track_identified": self.track_identified,
             "current_sector": self.current_sector,
-            "sector_count": len(self.track.get('sectors', [])) if self.track else 0
+            "sector_count": len(self.track.get('sectors', [])) if self.track else 0,
+            "lap_delta": self.lap_delta.get_status() if self.lap_delta else None
         }
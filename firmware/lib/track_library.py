@@ -0,0 +1,151 @@
+# lib/track_library.py - On-device track library with a coarse grid lookup
+import json
+import os
+import math
+
+LIBRARY_DIR = "/data/tracks"
+
+CELL_DEG = 0.05            # Grid cell size (~5.5 km north-south)
+NEARBY_M = 3000            # A track is a candidate within this distance of its start line
+M_PER_DEG = 111195.0
+
+# Index file: {"v": 1, "rev": 7, "tracks": {"<id>": [start_lat, start_lon, "<etag>", "<name>"]}}
+# Each track's full record (sectors, pit geofence, TBL, reference lap) is in
+# /data/tracks/<id>.json and is only read when a fix comes near its start line.
+INDEX_VERSION = 1
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Equirectangular distance, accurate to well under 1% at track scale."""
+    dy = (lat2 - lat1) * M_PER_DEG
+    dx = (lon2 - lon1) * M_PER_DEG * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.sqrt(dx * dx + dy * dy)
+
+
+def _cell(lat, lon):
+    return (int(math.floor(lat / CELL_DEG)), int(math.floor(lon / CELL_DEG)))
+
+
+def _safe_id(track_id):
+    return "".join(c for c in str(track_id) if c.isalpha() or c.isdigit() or c in "-_")[:32]
+
+
+class TrackLibrary:
+    """
+    Track records on flash plus a RAM index: start line, ETag and name per
+    track, and a grid of CELL_DEG cells -> track ids. A fix only checks the
+    tracks registered in its own cell.
+    """
+
+    def __init__(self, directory=LIBRARY_DIR):
+        self.dir = directory
+        self.index_file = directory + "/index.json"
+        self.tracks = {}   # id -> [lat, lon, etag, name]
+        self.rev = 0       # Bumped on every change (library ETag)
+        self.grid = {}     # (cell_lat, cell_lon) -> [id, ...]
+
+    def load(self):
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+            self.tracks = index.get('tracks', {})
+            self.rev = index.get('rev', 0)
+        except OSError:
+            self.tracks = {}
+        except Exception as e:
+            print(f"[TrackLibrary] Index Error: {e}")
+            self.tracks = {}
+        self._build_grid()
+        return len(self.tracks)
+
+    def _save_index(self):
+        self.rev += 1
+        tmp = self.index_file + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"v": INDEX_VERSION, "rev": self.rev, "tracks": self.tracks}, f)
+        try:
+            os.remove(self.index_file)
+        except OSError:
+            pass
+        os.rename(tmp, self.index_file)
+
+    def _build_grid(self):
+        """Register every track in each cell its NEARBY_M circle touches."""
+        grid = {}
+        for tid, entry in self.tracks.items():
+            lat, lon = entry[0], entry[1]
+            dlat = NEARBY_M / M_PER_DEG
+            dlon = dlat / max(0.01, math.cos(math.radians(lat)))
+            c0 = _cell(lat - dlat, lon - dlon)
+            c1 = _cell(lat + dlat, lon + dlon)
+            for ci in range(c0[0], c1[0] + 1):
+                for cj in range(c0[1], c1[1] + 1):
+                    grid.setdefault((ci, cj), []).append(tid)
+        self.grid = grid
+
+    def _record_path(self, track_id):
+        return self.dir + "/" + _safe_id(track_id) + ".json"
+
+    def nearest(self, lat, lon, max_m=NEARBY_M):
+        """Id of the closest track whose start line is within max_m, or None."""
+        ids = self.grid.get(_cell(lat, lon))
+        if not ids:
+            return None
+        best = None
+        best_d = max_m
+        for tid in ids:
+            entry = self.tracks.get(tid) # May be removed from the server thread
+            if not entry:
+                continue
+            d = distance_m(lat, lon, entry[0], entry[1])
+            if d < best_d:
+                best_d = d
+                best = tid
+        return best
+
+    def etag(self, track_id):
+        entry = self.tracks.get(str(track_id))
+        return entry[2] if entry else None
+
+    def get(self, track_id):
+        """Full track record, or None."""
+        try:
+            with open(self._record_path(track_id), 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[TrackLibrary] Load Error ({track_id}): {e}")
+            return None
+
+    def put(self, track):
+        """Store a track record. Returns False when its ETag is already stored."""
+        tid = str(track['id'])
+        etag = track.get('etag')
+        if etag and self.etag(tid) == etag:
+            return False
+        with open(self._record_path(tid), 'w') as f:
+            json.dump(track, f)
+        sl = track['start_line']
+        self.tracks[tid] = [sl['lat'], sl['lon'], etag or "", track.get('name', '')]
+        self._save_index()
+        self._build_grid()
+        return True
+
+    def remove(self, track_id):
+        tid = str(track_id)
+        if tid not in self.tracks:
+            return False
+        del self.tracks[tid]
+        try:
+            os.remove(self._record_path(tid))
+        except OSError:
+            pass
+        self._save_index()
+        self._build_grid()
+        return True
+
+    def summary(self):
+        """Per-track ETags for /track/library (the sync client skips unchanged tracks)."""
+        return {
+            "rev": self.rev,
+            "tracks": {tid: {"name": e[3], "etag": e[2]} for tid, e in self.tracks.items()}
+        }
@@ -1,10 +1,230 @@
 # lib/uploader.py - HTTP Uploader for Cloud Sync
-import urequests
-import secrets
+#
+# Sessions are streamed to the server's chunk endpoint straight from the file:
+#   PUT <API_URL>/stream/<name>
+#   X-Upload-Offset: <offset>     first byte of this chunk in the stored file
+#   X-Upload-Total: <size>        stored size of the whole file
+#   X-Content-Encoding: deflate   (sessions compressed on the device)
+#   <up to CHUNK_BYTES of file data>
+# The server appends the chunk and answers {"offset": n}, or {"complete": true}
+# once it holds the whole file. A 409 carries the offset it actually holds,
+# which the uploader resumes from. RAM use is one BUF_BYTES buffer whatever
+# the file size; the acknowledged offset of each file is kept in
+# /data/metadata/upload_offsets.json so an interrupted upload resumes there.
+import socket
+import os
+import json
+import time
+import gc
+
+CHUNK_BYTES = 32768    # Data per request (resume granularity)
+BUF_BYTES = 2048       # File read / socket buffer, allocated once
+RETRIES = 3            # Attempts per chunk (reconnecting between them)
+RETRY_DELAY_S = 2
+TIMEOUT_S = 10
+
+
+def _parse_url(url):
+    """http[s]://host[:port]/path -> (host, port, path, tls)"""
+    tls = url.startswith("https://")
+    rest = url.split("://", 1)[1] if "://" in url else url
+    host, _, path = rest.partition("/")
+    port = 443 if tls else 80
+    if ":" in host:
+        host, port = host.split(":", 1)
+        port = int(port)
+    return host, port, "/" + path.rstrip("/"), tls
+
+
+class ChunkUploader:
+    """Streams session files to the server in fixed-size chunks over one socket."""
+
+    def __init__(self, session_mgr, api_url, ble=None):
+        self.sm = session_mgr
+        self.host, self.port, self.path, self.tls = _parse_url(api_url)
+        self.ble = ble
+        self.sock = None
+        self._buf = bytearray(BUF_BYTES)
+        self._mv = memoryview(self._buf)
+        self.offsets_file = session_mgr.metadata_dir + '/upload_offsets.json'
+        self.offsets = self._load_offsets()  # {name: [offset, stored size, encoding]}
+
+        # Progress over all files (bytes)
+        self.total = 0
+        self.done = 0
+
+    def _load_offsets(self):
+        try:
+            with open(self.offsets_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_offsets(self):
+        try:
+            with open(self.offsets_file, 'w') as f:
+                json.dump(self.offsets, f)
+        except OSError as e:
+            print(f"Upload offsets save error: {e}")
+
+    # --- Connection ---
+
+    def _connect(self):
+        self._close()
+        addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+        s = socket.socket()
+        s.settimeout(TIMEOUT_S)
+        s.connect(addr)
+        if self.tls:
+            import ssl
+            s = ssl.wrap_socket(s, server_hostname=self.host)
+        self.sock = s
+
+    def _close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _send_all(self, data):
+        sent = self.sock.send(data)
+        n = len(data)
+        while sent < n:
+            sent += self.sock.send(data[sent:])
+
+    def _read_response(self):
+        """Status code and JSON body of the server's answer (small: fits the buffer)."""
+        mv = self._mv
+        n = 0
+        head_end = -1
+        while head_end < 0:
+            if n == BUF_BYTES:
+                raise OSError("Response header too large")
+            got = self.sock.recv_into(mv[n:]) if hasattr(self.sock, 'recv_into') else self._recv_copy(n)
+            if not got:
+                raise OSError("Connection closed by server")
+            n += got
+            head_end = self._buf.find(b"\r\n\r\n", 0, n)
+
+        head = bytes(mv[:head_end]).decode()
+        lines = head.split("\r\n")
+        code = int(lines[0].split(" ")[1])
+        length = 0
+        keep = lines[0].startswith("HTTP/1.1")
+        for line in lines[1:]:
+            key, _, value = line.partition(":")
+            key = key.strip().lower()
+            if key == "content-length":
+                length = int(value)
+            elif key == "connection":
+                keep = value.strip().lower() != "close"
+
+        start = head_end + 4
+        if start + length > BUF_BYTES:
+            raise OSError("Response body too large")
+        while n < start + length:
+            got = self.sock.recv_into(mv[n:]) if hasattr(self.sock, 'recv_into') else self._recv_copy(n)
+            if not got:
+                break
+            n += got
+        if not keep:
+            self._close()
+        try:
+            body = json.loads(bytes(mv[start:start + length])) if length else {}
+        except ValueError:
+            body = {}
+        return code, body
+
+    def _recv_copy(self, n):
+        # Sockets without recv_into (some MicroPython ports / TLS wrappers)
+        data = self.sock.recv(BUF_BYTES - n)
+        self._buf[n:n + len(data)] = data
+        return len(data)
+
+    # --- Upload ---
+
+    def _put_chunk(self, f, name, offset, size, encoding):
+        """Send one chunk starting at `offset`. Returns (code, response body)."""
+        length = min(CHUNK_BYTES, size - offset)
+        head = (f"PUT {self.path}/stream/{name} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                "Content-Type: application/octet-stream\r\n"
+                f"Content-Length: {length}\r\n"
+                f"X-Upload-Offset: {offset}\r\n"
+                f"X-Upload-Total: {size}\r\n")
+        if encoding:
+            head += f"X-Content-Encoding: {encoding}\r\n"
+        if self.sock is None:
+            self._connect()
+        self._send_all((head + "\r\n").encode())
+
+        f.seek(offset)
+        mv = self._mv
+        left = length
+        while left > 0:
+            n = f.readinto(mv if left >= BUF_BYTES else mv[:left])
+            if not n:
+                raise OSError("Short read")
+            self._send_all(mv[:n])
+            left -= n
+        return self._read_response()
+
+    def upload_file(self, name):
+        """Stream one session. Returns True once the server holds all of it."""
+        path, encoding = self.sm.session_path(name)
+        size = self.sm.session_size(name) # Preallocated logs: the data length, not the file's
+
+        # Resume where the server last acknowledged, unless the stored file changed
+        # (compressed meanwhile)
+        state = self.offsets.get(name)
+        offset = state[0] if state and state[1] == size and state[2] == encoding else 0
+        self.done += offset
+
+        with open(path, 'rb') as f:
+            while True:
+                for attempt in range(RETRIES):
+                    try:
+                        code, body = self._put_chunk(f, name, offset, size, encoding)
+                        break
+                    except OSError as e:
+                        print(f"  Chunk @{offset} failed ({e}), retry {attempt + 1}/{RETRIES}")
+                        self._close()
+                        time.sleep(RETRY_DELAY_S)
+                else:
+                    return False
+
+                if code in (200, 201) and body.get("complete"):
+                    self.done += size - offset
+                    return True
+                if code == 409:
+                    # Server holds a different prefix: continue from its offset
+                    acked = int(body.get("offset", 0))
+                    print(f"  Server holds {acked} B, resuming there")
+                elif code in (200, 201):
+                    acked = int(body.get("offset", -1))
+                else:
+                    print(f"  ✗ Failed: HTTP {code} {body.get('error', '')}")
+                    return False
+
+                if acked == offset or not 0 <= acked < size:
+                    print(f"  ✗ Failed: no progress at {offset} B")
+                    return False
+                self.done += acked - offset
+                offset = acked
+                self.offsets[name] = [offset, size, encoding]
+                self._save_offsets()
+                self._progress(name)
+
+    def _progress(self, name):
+        if self.ble and self.total:
+            self.ble.notify_sync_progress(min(99, self.done * 100 // self.total), name)
+
 
 def upload_all(session_mgr, api_url=None, ble=None):
     """
-    Uploads all CSV sessions from internal flash to Cloud Backend.
+    Uploads all closed sessions from storage to the Cloud Backend in chunks.
     Deletes successfully uploaded files to free space.
     """
     if not api_url:
@@ -12,63 +232,51 @@ def upload_all(session_mgr, api_url=None, ble=None):
         api_url = secrets.API_URL
 
     print(f"Starting cloud sync to {api_url}...")
-    
-    # Get all sessions from flash
-    sessions = session_mgr.list_sessions()
-    
+
+    # The log being written keeps growing: it is uploaded after it closes
+    sessions = [s for s in session_mgr.list_sessions() if session_mgr.is_closed(s)]
+
     if not sessions:
         print("No sessions to upload")
         if ble:
             ble.notify_wifi_status(True, "No Data", "STA", progress=100)
         return 0
-    
-    total = len(sessions)
-    print(f"Found {total} sessions to upload")
-    
+
+    print(f"Found {len(sessions)} sessions to upload")
+    up = ChunkUploader(session_mgr, api_url, ble)
+    for name in list(up.offsets):
+        if name not in sessions:
+            del up.offsets[name] # Synced or deleted another way
+    for name in sessions:
+        try:
+            up.total += session_mgr.session_size(name)
+        except OSError:
+            pass
+
     count_success = 0
     count_failed = 0
-    
-    for i, filename in enumerate(sessions):
-        print(f"Uploading {filename}...")
-        
-        # Notify progress via BLE
-        if ble:
-            progress = int((i / total) * 100)
-            ble.notify_sync_progress(progress, filename)
 
+    for filename in sessions:
+        print(f"Uploading {filename}...")
+        up._progress(filename)
+        session_mgr.transfer_start(filename)
         try:
-            # Read session content
-            content = session_mgr.get_session_data(filename)
-            if not content:
-                print(f"  Error: Could not read file")
-                count_failed += 1
-                continue
-            
-            # Prepare JSON payload
-            payload = {
-                "filename": filename,
-                "content": content
-            }
-            
-            # POST to cloud backend
-            headers = {'Content-Type': 'application/json'}
-            import urequests
-            res = urequests.post(api_url, json=payload, headers=headers)
-            
-            if res.status_code == 200 or res.status_code == 201:
+            if up.upload_file(filename):
                 print(f"  ✓ Success! Deleting local copy...")
                 session_mgr.delete_session(filename)
+                if up.offsets.pop(filename, None):
+                    up._save_offsets()
                 count_success += 1
             else:
-                print(f"  ✗ Failed: HTTP {res.status_code}")
                 count_failed += 1
-            
-            res.close()
-            
         except Exception as e:
             print(f"  ✗ Error: {e}")
+            up._close()
             count_failed += 1
-    
+        session_mgr.transfer_end(filename)
+        gc.collect()
+
+    up._close()
     if ble:
         ble.notify_sync_progress(100, "Complete")
 
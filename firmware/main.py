@@ -5,15 +5,37 @@ import os
 import gc
 import _thread
 
-# Drivers
-from drivers.gps import GPS
-from drivers.bmi323 import BMI323
-from lib.session_manager import SessionManager
-from lib.led_manager import LEDManager
-from lib.track_engine import TrackEngine
-from lib.wifi_manager import connect_or_ap
-from lib.miniserver import MiniServer
-from lib.ble_provisioning import BLEProvisioning
+_T_IMPORT = time.ticks_ms()
+
+# Firmware modules. A module that fails to import (e.g. a bad update) must
+# still reset the device: boot.py then counts the failed boot and rolls the
+# update back (lib/ota.py)
+try:
+    # Drivers
+    from drivers.gps import GPS
+    from drivers.bmi323 import BMI323
+    from lib.session_manager import SessionManager
+    from lib.led_manager import LEDManager
+    from lib.track_engine import TrackEngine
+    from lib.wifi_manager import connect_or_ap
+    from lib.miniserver import MiniServer
+    from lib.ble_provisioning import BLEProvisioning
+    from lib.binlog import BinLogWriter, FILE_EXT
+    from lib.gps_clock import GPSClock, weekday
+    from lib.scheduler import Scheduler
+    from lib.session_compress import SessionCompressor
+    import lib.ota as ota
+except Exception as e:
+    print(f"CRITICAL IMPORT ERROR: {e}")
+    time.sleep(5)
+    machine.reset()
+
+# Boot cost of the firmware (compiling .py vs loading .mpy), reported in /status
+gc.collect()
+BOOT_STATS = {
+    "import_ms": time.ticks_diff(time.ticks_ms(), _T_IMPORT),
+    "heap_free_after_import": gc.mem_free()
+}
 
 # --- MASTER PINOUT CONFIG (ESP32-S3 RS-CORE V2) ---
 PIN_LED_STATUS = 4   # Neopixel LED_DATA
@@ -29,6 +51,29 @@ PIN_SD_CD = 3        # Card Detect
 PIN_BATTERY_ADC = 35 # VBAT-SENSE
 PIN_DEBUG_LED = 2    # Blue Debug LED
 
+# Log Flush Policy (lib/sd_buffer.py)
+LOG_BUFFER_SIZE = 8192          # 16 SD blocks per aligned write
+LOG_FLUSH_MS = 10000            # Max data at risk on power loss
+LOG_FLUSH_LOW_VBAT_MS = 1000
+LOG_RESERVE = 4 * 1024 * 1024   # SD: log preallocated (and grown) in steps of this size
+VBAT_LOW = 3.45                 # Volts (after divider correction)
+
+# High-rate IMU stream (BMI323 FIFO, drained every loop tick)
+IMU_ODR_HZ = 200
+
+# Task Rates (lib/scheduler.py). GPS runs whenever UART data arrives
+IMU_DRAIN_HZ = 25               # 8 FIFO frames per drain at 200Hz ODR
+LED_HZ = 30
+POWER_HZ = 0.2                  # Battery ADC + storage stats + session index save
+BLE_HZ = 0.5
+BLE_BULK_HZ = 50                # Bulk transfer notifications (idle unless a phone pulls a file)
+FLUSH_HZ = 2                    # Checks the log flush deadline
+COMPRESS_HZ = 10                # Closed-session deflate steps (only while not logging)
+
+# GPS: UBX NAV-PVT at 115200 (NMEA fallback). M8N: up to 10Hz multi-GNSS, 18Hz GPS-only
+GPS_BAUD = 115200
+GPS_RATE_HZ = 10
+
 def setup():
     print("\n--- ESP32-S3 RACESENSE V2 DATALOGGER ---")
     
@@ -60,24 +105,27 @@ def setup():
     except Exception as e:
         print(f"Storage: SD Mount Failed ({e}). Using Onboard Flash.")
 
-    # 5. Session Manager
+    # 5. Session Manager (+ background compression of closed sessions)
     sm = SessionManager(sd_mounted=sd_mounted)
+    compressor = SessionCompressor(sm)
     
     # 6. I2C Sensors (IMU)
     imu = None
     try:
         # Use I2C 0 for S3 (SDA:21, SCL:39)
         i2c = machine.I2C(0, sda=machine.Pin(PIN_I2C_SDA), scl=machine.Pin(PIN_I2C_SCL), freq=400000)
-        imu = BMI323(i2c, address=0x69)
-        print("IMU: BMI323 Initialized Success")
+        imu = BMI323(i2c, address=0x69, odr_hz=IMU_ODR_HZ)
+        imu.enable_fifo()
+        print(f"IMU: BMI323 Initialized Success (FIFO @ {imu.odr_hz}Hz)")
     except Exception as e:
         print(f"IMU: Failed to initialize ({e})")
 
     # 7. GPS
     # S3 UART2 is flexible
-    gps_uart = machine.UART(1, baudrate=9600, tx=machine.Pin(PIN_GPS_TX), rx=machine.Pin(PIN_GPS_RX), timeout=0)
+    gps_uart = machine.UART(1, baudrate=9600, tx=machine.Pin(PIN_GPS_TX), rx=machine.Pin(PIN_GPS_RX), timeout=0, rxbuf=1024)
     gps = GPS(gps_uart)
-    print("GPS: Neo-M8N Initialized")
+    gps_mode = gps.start(rate_hz=GPS_RATE_HZ, baud=GPS_BAUD)
+    print(f"GPS: Neo-M8N Initialized ({gps_mode})")
 
     # 8. Track Engine
     track_eng = TrackEngine()
@@ -95,97 +143,101 @@ def setup():
     
     ble.notify_wifi_status(mode=="STA", "", ip, mode)
 
-    # 11. Start MiniServer (Second Core)
-    server = MiniServer(sm, led=led, gps_state=gps, track_engine=track_eng)
+    # 11. Start MiniServer (Second Core: asyncio event loop, idle until a client connects)
+    sched = Scheduler()
+    server = MiniServer(sm, led=led, gps_state=gps, track_engine=track_eng, scheduler=sched,
+                        compressor=compressor, boot_stats=BOOT_STATS)
     _thread.start_new_thread(server.start, ())
     print("Server: Listening in background (Core 1)")
 
-    return led, gps, imu, sm, track_eng, mode, ble, vbat_adc
+    return led, gps, imu, sm, track_eng, mode, ble, vbat_adc, sched, compressor
 
 def main_loop():
-    led, gps, imu, sm, track_eng, wifi_mode, ble, vbat_adc = setup()
+    led, gps, imu, sm, track_eng, wifi_mode, ble, vbat_adc, sched, compressor = setup()
+    BOOT_STATS["ready_ms"] = time.ticks_ms() # Since reset
+    ota.confirm() # A new OTA update came up: keep it (lib/ota.py)
     
     # Debug LED for AP Mode / Status
     onboard_led = machine.Pin(PIN_DEBUG_LED, machine.Pin.OUT)
     
     print("\n[System] Logging Active (Core 0)")
-    log_file = sm.get_log_file()
+    clock = GPSClock() # ms timestamps anchored to GPS UTC (lib/gps_clock.py)
+    # Name/start on the clock's time base, like the log records and the index end times
+    log_file = sm.get_log_file(FILE_EXT, clock.epoch_s())
     
-    time_synced = False
-    ble_update_tick = 0
+    fix = gps.last_fix
+    fix_seq = 0
     
     # State Machine Variables
     current_state = "LOGGING"
     calib_wait_start = 0
     calib_samples = []
     session_offset = {"x": 0.0, "y": 0.0, "z": 0.0}
+    low_batt = False
+    flush_ms = LOG_FLUSH_MS
+    log_syncs = 0                   # Writer syncs already recorded in the session index
+    log_laps0 = track_eng.laps      # Lap count when the log was opened
+
+    # Slow-rate readings, cached between their task runs
+    vbat = 0.0
+    storage_pct = 0
+    storage_critical = False
+
+    # Latest IMU sample (updated in place from the FIFO)
+    acc = {"x":0.0, "y":0.0, "z":0.0}
+    gyr = {"x":0.0, "y":0.0, "z":0.0}
+    imu_period_us = 1000000 // imu.odr_hz if imu else 0
+    log_reserve = LOG_RESERVE if sm.sd_mounted else 0 # Flash: no FAT chain to spare, no room to waste
     
-    with open(log_file, 'w') as f:
-        f.write("time,lat,lon,alt,speed,acc_x,acc_y,acc_z,gyro_x,gyro_y,gyro_z,vbat\n")
-        
-        while True:
-            ble_update_tick += 1
-            if ble_update_tick >= 20: # Every 2s
-                ble_update_tick = 0
-            
-            # 1. Update GPS
-            fix = gps.update()
-            
-            # 2. Battery Monitoring
-            try:
-                # 12-bit ADC (0-4095) -> 0-3.3V
-                # Voltage divider 1:2 (100k/100k) -> Multiply by 2
-                raw_v = vbat_adc.read()
-                vbat = (raw_v / 4095.0) * 3.3 * 2.0
-            except:
-                vbat = 0.0
+    with open(log_file, 'wb') as f:
+        # Binary log (lib/binlog.py) behind an SD-block-aligned buffer (lib/sd_buffer.py)
+        writer = BinLogWriter(f, clock, buffer_size=LOG_BUFFER_SIZE, flush_interval_ms=flush_ms,
+                              reserve=log_reserve)
 
-            # 3. BLE Status Update
-            if ble_update_tick == 0:
-                try:
-                    s_info = sm.get_storage_info()
-                    usage = (s_info['used_kb'] / s_info['total_kb']) * 100 if s_info else 0
-                except:
-                    usage = 0
-                ble.update_device_info(gps_valid=fix['valid'], storage_pct=usage)
-            
-            # 4. Time Sync
-            if not time_synced and fix['timestamp']:
-                try:
-                    t_str = fix['timestamp']
-                    h, m, s = int(t_str[0:2]), int(t_str[2:4]), int(t_str[4:6])
-                    machine.RTC().datetime((2026, 2, 7, 0, h, m, s, 0)) # Updated for current year
-                    time_synced = True
-                    print(f"[System] Time synced: {h}:{m}:{s}")
-                    
-                    # Rename log file
-                    f.close()
-                    new_log_file = sm.get_log_file()
-                    os.rename(log_file, new_log_file)
-                    log_file = new_log_file
-                    f = open(log_file, 'a')
-                except:
-                    pass
-
-            # 5. Read IMU
-            acc = {"x":0.0, "y":0.0, "z":0.0}
-            gyr = {"x":0.0, "y":0.0, "z":0.0}
-            if imu:
+        # --- Tasks (lib/scheduler.py) ---
+
+        def task_gps():
+            # Drain the UART; the rest runs once per new GPS solution
+            nonlocal fix_seq, log_file, f, writer, current_state, calib_wait_start, calib_samples, session_offset
+            nonlocal log_syncs, log_laps0
+            gps.update()
+            if fix['seq'] == fix_seq:
+                return
+            fix_seq = fix['seq']
+
+            # Time Sync: anchor the clock to every solution with a UTC time
+            if fix['utc']:
                 try:
-                    data = imu.get_values()
-                    acc, gyr = data["acc"], data["gyro"]
-                except:
-                    pass
-            
-            # 6. State Machine & Logging
+                    if clock.on_fix(fix['utc'], fix['rx_us']):
+                        y, mo, d, h, m, s, _ = fix['utc']
+                        machine.RTC().datetime((y, mo, d, weekday(y, mo, d), h, m, s, 0))
+                        print(f"[System] Time synced: {y}-{mo:02d}-{d:02d} {h}:{m:02d}:{s:02d}")
+                        
+                        # Start a new log on the GPS time base (the RTC-based
+                        # pre-sync log is kept only if it has records)
+                        writer.close()
+                        keep = writer.records_total > 0
+                        if not keep:
+                            os.remove(log_file)
+                        sm.close_log(writer.out.offset, writer.out.crc, laps=track_eng.laps - log_laps0, keep=keep)
+                        log_file = sm.get_log_file(FILE_EXT, clock.epoch_s())
+                        f = open(log_file, 'wb')
+                        writer = BinLogWriter(f, clock, buffer_size=LOG_BUFFER_SIZE, flush_interval_ms=flush_ms,
+                                              reserve=log_reserve)
+                        log_syncs = 0
+                        log_laps0 = track_eng.laps
+                except Exception as e:
+                    print(f"[System] Time sync error: {e}")
+
+            # State Machine
             in_pit = False
             if fix['valid']:
                 in_pit = track_eng.is_in_pit(fix['lat'], fix['lon'])
             
-            # State Transitions
             if current_state == "LOGGING":
                 if in_pit:
                     current_state = "PAUSED"
+                    writer.flush()
                     print("[System] Entering Pit - PAUSED")
             
             elif current_state == "PAUSED":
@@ -217,41 +269,100 @@ def main_loop():
                     led.show_calibrated()
                     print(f"[System] Calibrated! Offset: {session_offset}")
 
-            # 7. Write to Log
+            # Write to Log (one record per GPS solution, stamped with its fix time)
             if fix['valid'] and current_state == "LOGGING":
-                log_line = f"{time.time()},{fix['lat']},{fix['lon']},0.0,{fix['speed_kmh']:.2f},{acc['x']},{acc['y']},{acc['z']},{gyr['x']},{gyr['y']},{gyr['z']},{vbat:.2f}\n"
-                f.write(log_line)
-                f.flush()
+                fix_ms = clock.last_fix_ms if fix['utc'] and clock.synced else None
+                writer.append(fix['lat'], fix['lon'], fix['speed_kmh'], acc, gyr, vbat, fix['satellites'],
+                              t_ms=fix_ms)
                 
                 # Track Engine
                 try:
-                    event = track_eng.update(fix['lat'], fix['lon'], time.time())
+                    t_ms = fix_ms if fix_ms is not None else clock.now_ms()
+                    event = track_eng.update(fix['lat'], fix['lon'], t_ms / 1000)
                     if event:
                         led.trigger_event(event)
+                    
+                    # Live lap delta against the reference lap (LED bar)
+                    delta = track_eng.update_delta(fix['lat'], fix['lon'], t_ms)
+                    led.set_delta(delta)
                 except Exception as e:
                     print(f"TrackEng Error: {e}")
 
-            # 8. LED Update
+        def task_imu():
+            # Drain IMU FIFO: every frame since the last run goes to the
+            # high-rate stream, the newest one drives the state machine
+            frames, n = imu.read_fifo()
+            if n:
+                imu.latest_frame(frames, n, acc, gyr)
+                if fix['valid'] and current_state == "LOGGING":
+                    writer.append_imu(frames, n, imu_period_us)
+
+        def task_led():
             base_state = current_state if fix['valid'] else "SEARCHING"
+            if storage_critical:
+                base_state = "STORAGE_CRITICAL" # Priority
+            led.update_with_events(base_state)
             
-            # Storage Check (Priority)
+            # Status LED: 5Hz blink in AP mode
+            onboard_led.value((time.ticks_ms() // 100) & 1 if wifi_mode == "AP" else 0)
+
+        def task_power():
+            # Battery + storage (statvfs) change slowly
+            nonlocal vbat, storage_pct, storage_critical, low_batt, flush_ms
+            try:
+                # 12-bit ADC (0-4095) -> 0-3.3V
+                # Voltage divider 1:2 (100k/100k) -> Multiply by 2
+                raw_v = vbat_adc.read()
+                vbat = (raw_v / 4095.0) * 3.3 * 2.0
+            except:
+                vbat = 0.0
+
+            # Low battery: get buffered data onto the card and flush more often
+            if not low_batt and 0.0 < vbat < VBAT_LOW:
+                low_batt = True
+                flush_ms = LOG_FLUSH_LOW_VBAT_MS
+                writer.flush()
+                writer.out.flush_interval_ms = flush_ms
+                print(f"[System] Low battery ({vbat:.2f}V) - log flushed")
+
             try:
                 s_info = sm.get_storage_info()
-                if s_info and (s_info['used_kb'] / s_info['total_kb']) > 0.95:
-                    base_state = "STORAGE_CRITICAL"
+                storage_pct = (s_info['used_kb'] / s_info['total_kb']) * 100 if s_info else 0
             except:
-                pass
+                storage_pct = 0
+            storage_critical = storage_pct > 95
+            sm.index.poll() # Open log progress (lib/session_index.py)
 
-            led.update_with_events(base_state)
-            
-            # 9. Status LED Blink
-            if wifi_mode == "AP":
-                onboard_led.value(not onboard_led.value()) 
-            else:
-                onboard_led.value(0)
-
-            # 10Hz target
-            time.sleep(0.1)
+        def task_ble():
+            ble.update_device_info(gps_valid=fix['valid'], storage_pct=storage_pct)
+
+        def task_ble_bulk():
+            ble.pump_bulk() # BLE session download (lib/ble_bulk.py)
+
+        def task_flush():
+            nonlocal log_syncs
+            writer.poll() # Time-based flush policy (lib/sd_buffer.py)
+            if writer.out.syncs != log_syncs:
+                # Data on the card: record size/CRC/end in the session index
+                log_syncs = writer.out.syncs
+                sm.log_progress(writer.out.offset, writer.out.crc, clock.epoch_s(), track_eng.laps - log_laps0)
+
+        def task_compress():
+            # Deflate closed sessions while nothing is being logged (lib/session_compress.py)
+            if not (fix['valid'] and current_state == "LOGGING"):
+                compressor.step()
+
+        sched.add("gps", task_gps, ready=gps.uart.any)
+        if imu:
+            sched.add("imu", task_imu, hz=IMU_DRAIN_HZ)
+        sched.add("led", task_led, hz=LED_HZ)
+        sched.add("power", task_power, hz=POWER_HZ)
+        sched.add("ble", task_ble, hz=BLE_HZ)
+        sched.add("ble_bulk", task_ble_bulk, hz=BLE_BULK_HZ)
+        sched.add("flush", task_flush, hz=FLUSH_HZ)
+        sched.add("compress", task_compress, hz=COMPRESS_HZ)
+        task_power() # First battery/storage reading before logging starts
+        sched.run()
             
 if __name__ == "__main__":
     try:
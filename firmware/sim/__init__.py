@@ -0,0 +1,4 @@
+# sim - CPython host simulation of the firmware (not deployed to the device)
+#
+#   python tests/host_sim.py                 # synthetic session self-check
+#   python tests/host_sim.py session.csv     # replay a recorded session
@@ -0,0 +1,81 @@
+# sim/clock.py - Virtual time for the host simulation
+#
+# The firmware only sees time through this clock: sleeps advance it instantly,
+# so a 20 minute session replays in seconds and every run is deterministic.
+# ticks_ms/ticks_us wrap like MicroPython's (30-bit period) so wrap handling is
+# exercised too.
+import time as _time
+import types
+
+TICKS_PERIOD = 1 << 30
+TICKS_MASK = TICKS_PERIOD - 1
+
+
+class VirtualClock:
+    def __init__(self, epoch_s=1767225600, ticks_start_us=0):
+        self.us = ticks_start_us   # Monotonic virtual time
+        self.epoch_us = epoch_s * 1000000 - ticks_start_us # RTC: epoch at us = 0
+        self.slept_us = 0
+
+    def advance(self, us):
+        if us > 0:
+            self.us += int(us)
+
+    def sleep_us(self, us):
+        self.slept_us += max(0, int(us))
+        self.advance(us)
+
+    # --- time module API ---
+
+    def ticks_ms(self):
+        return (self.us // 1000) & TICKS_MASK
+
+    def ticks_us(self):
+        return self.us & TICKS_MASK
+
+    def ticks_cpu(self):
+        return self.us & TICKS_MASK
+
+    @staticmethod
+    def ticks_diff(a, b):
+        return ((a - b + TICKS_PERIOD // 2) & TICKS_MASK) - TICKS_PERIOD // 2
+
+    @staticmethod
+    def ticks_add(a, b):
+        return (a + b) & TICKS_MASK
+
+    def time(self):
+        return (self.epoch_us + self.us) // 1000000
+
+    def time_ns(self):
+        return (self.epoch_us + self.us) * 1000
+
+    def set_epoch(self, epoch_s):
+        """RTC.datetime(): re-base wall time, ticks keep running."""
+        self.epoch_us = epoch_s * 1000000 - self.us
+
+    def gmtime(self, secs=None):
+        t = _time.gmtime(self.time() if secs is None else secs)
+        return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+    def mktime(self, t):
+        import calendar
+        return calendar.timegm(tuple(t[:6]) + (0, 0, 0))
+
+    def module(self):
+        """A stand-in for MicroPython's `time` module bound to this clock."""
+        m = types.ModuleType("time")
+        m.ticks_ms = self.ticks_ms
+        m.ticks_us = self.ticks_us
+        m.ticks_cpu = self.ticks_cpu
+        m.ticks_diff = self.ticks_diff
+        m.ticks_add = self.ticks_add
+        m.time = self.time
+        m.time_ns = self.time_ns
+        m.gmtime = self.gmtime
+        m.localtime = self.gmtime
+        m.mktime = self.mktime
+        m.sleep = lambda s: self.sleep_us(s * 1000000)
+        m.sleep_ms = lambda ms: self.sleep_us(ms * 1000)
+        m.sleep_us = self.sleep_us
+        return m
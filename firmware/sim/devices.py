@@ -0,0 +1,531 @@
+# sim/devices.py - Recorded-session replay through emulated GPS and IMU hardware
+#
+# ReplaySession holds a session (from a device/server CSV or generated) and
+# interpolates it at any virtual time. The devices render it the way the real
+# parts would present it to the firmware:
+#   GPSDevice     u-blox M8N on a UART: NMEA or UBX NAV-PVT epochs at the
+#                 configured rate, bytes arriving at the configured baud, and
+#                 CFG-PRT / CFG-MSG / CFG-RATE handled like the module does
+#   BMI323Device  I2C register file incl. the FIFO (fill level + frame data)
+import bisect
+import csv
+import math
+import struct
+import time
+
+GPS_EPOCH = 315964800   # 1980-01-06 in unix time
+GPS_LEAP_S = 18
+
+
+class ReplaySession:
+    """
+    Rows of (t, lat, lon, speed_kmh, heading, ax, ay, az, gx, gy, gz).
+    IMU values are raw BMI323 LSB (4 g / 500 dps ranges).
+    """
+
+    ACC_LSB_PER_G = 8192
+    GYR_LSB_PER_DPS = 65.536
+
+    def __init__(self, rows):
+        if len(rows) < 2:
+            raise ValueError("Session needs at least 2 rows")
+        self.rows = sorted(rows)
+        self.times = [r[0] for r in self.rows]
+        self.t0 = self.times[0]
+        self.duration = self.times[-1] - self.t0
+
+    @classmethod
+    def from_csv(cls, path):
+        """Device CSV (time,lat,lon,...,acc_x..gyro_z) or server export column names."""
+        rows = []
+        with open(path, newline="") as f:
+            for r in csv.DictReader(f):
+                def col(*names, default=0.0):
+                    for n in names:
+                        v = r.get(n)
+                        if v not in (None, ""):
+                            return float(v)
+                    return default
+                t = col("timestamp", "time", default=None)
+                lat = col("latitude", "lat", default=None)
+                lon = col("longitude", "lon", default=None)
+                if t is None or lat is None or lon is None or (lat == 0.0 and lon == 0.0):
+                    continue
+                rows.append([t, lat, lon, col("speed"), col("heading", default=-1.0),
+                             col("acc_x", "accel_x", "imu_x"), col("acc_y", "accel_y", "imu_y"),
+                             col("acc_z", "accel_z", "imu_z"),
+                             col("gyro_x"), col("gyro_y"), col("gyro_z")])
+        if not rows:
+            raise ValueError(f"No GPS rows in {path}")
+
+        # Older logs store g / dps; the FIFO carries raw LSB
+        if max(abs(r[5]) + abs(r[6]) + abs(r[7]) for r in rows) < 50:
+            for r in rows:
+                r[5:8] = [v * cls.ACC_LSB_PER_G for v in r[5:8]]
+                r[8:11] = [v * cls.GYR_LSB_PER_DPS for v in r[8:11]]
+
+        # Fill in heading from consecutive positions where the log has none
+        for i, r in enumerate(rows):
+            if r[4] < 0:
+                a = rows[max(0, i - 1)]
+                b = rows[min(len(rows) - 1, i + 1)]
+                r[4] = bearing(a[1], a[2], b[1], b[2])
+        return cls([tuple(r) for r in rows])
+
+    def at(self, t):
+        """Linearly interpolated row at session time t (clamped to the ends)."""
+        i = bisect.bisect_right(self.times, t)
+        if i <= 0:
+            return self.rows[0]
+        if i >= len(self.rows):
+            return self.rows[-1]
+        a = self.rows[i - 1]
+        b = self.rows[i]
+        span = b[0] - a[0]
+        k = (t - a[0]) / span if span > 0 else 0.0
+        out = [a[j] + (b[j] - a[j]) * k for j in range(len(a))]
+        # Heading wraps at 360
+        dh = (b[4] - a[4] + 540.0) % 360.0 - 180.0
+        out[4] = (a[4] + dh * k) % 360.0
+        return out
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dl = math.radians(lon2 - lon1)
+    y = math.sin(dl) * math.cos(p2)
+    x = math.cos(p1) * math.sin(p2) - math.sin(p1) * math.cos(p2) * math.cos(dl)
+    return math.degrees(math.atan2(y, x)) % 360.0
+
+
+def reference_lap(points, step_m=5.0):
+    """
+    track.json "ref" (lib/lap_delta.py) from one lap of (t, lat, lon) points,
+    resampled every step_m metres and closed at the last point.
+    """
+    t0, lat0, lon0 = points[0]
+    kx = 1111949.3 * math.cos(math.radians(lat0))
+    xy = [(t - t0, (lon - lon0) * kx, (lat - lat0) * 1111949.3) for t, lat, lon in points]
+    out = [xy[0]]
+    step = step_m * 10
+    dist = 0.0
+    target = step
+    for (ta, xa, ya), (tb, xb, yb) in zip(xy, xy[1:]):
+        seg = math.hypot(xb - xa, yb - ya)
+        while seg > 0 and target <= dist + seg:
+            r = (target - dist) / seg
+            out.append((ta + (tb - ta) * r, xa + (xb - xa) * r, ya + (yb - ya) * r))
+            target += step
+        dist += seg
+    if target - step < dist:
+        out.append(xy[-1])
+
+    def deltas(values):
+        values = [int(round(v)) for v in values]
+        return values[:1] + [b - a for a, b in zip(values, values[1:])]
+
+    return {"v": 1, "lat0": lat0, "lon0": lon0, "step_m": step_m,
+            "lap_ms": int(round(out[-1][0] * 1000)),
+            "x": deltas(p[1] for p in out), "y": deltas(p[2] for p in out),
+            "t": deltas(p[0] * 1000 for p in out)}
+
+
+def synthetic_session(laps=3, lap_s=60.0, start_epoch=1767258000, rate_hz=25,
+                      center=(10.9265, 77.0650), radii_m=(320.0, 150.0), ref_gain_s=0.5):
+    """
+    Generated oval laps (varying speed) plus the matching track.json, for
+    self-checks without a recorded log. The start line is at the oval's
+    west end and the three sector gates split each lap. The reference lap
+    is the same line driven `ref_gain_s` faster.
+    """
+    lat0, lon0 = center
+    m_per_deg_lat = 111320.0
+    m_per_deg_lon = 111320.0 * math.cos(math.radians(lat0))
+    rx, ry = radii_m
+
+    def pos(phase):
+        # phase 0 = start line (west end), counter-clockwise
+        a = math.pi + 2 * math.pi * phase
+        return (lat0 + ry * math.sin(a) / m_per_deg_lat, lon0 + rx * math.cos(a) / m_per_deg_lon)
+
+    rows = []
+    n = int(laps * lap_s * rate_hz) + 1
+    for i in range(n):
+        t = i / rate_hz
+        # Uneven speed along the lap (slow corners), phase stays lap-periodic
+        u = t / lap_s
+        phase = u + 0.03 * math.sin(4 * math.pi * u)
+        lat, lon = pos(phase % 1.0)
+        nxt_lat, nxt_lon = pos((phase + 0.001) % 1.0)
+        circumference = math.pi * (3 * (rx + ry) - math.sqrt((3 * rx + ry) * (rx + 3 * ry)))
+        v = circumference / lap_s * (1 + 0.03 * 4 * math.pi * math.cos(4 * math.pi * u)) # m/s
+        curvature = 1.0 / ((rx + ry) / 2)
+        lat_g = v * v * curvature / 9.81
+        rows.append((start_epoch + t, lat, lon, v * 3.6, bearing(lat, lon, nxt_lat, nxt_lon),
+                     0.0, lat_g * ReplaySession.ACC_LSB_PER_G, ReplaySession.ACC_LSB_PER_G,
+                     0.0, 0.0, math.degrees(v * curvature) * ReplaySession.GYR_LSB_PER_DPS))
+
+    gates = [pos(k / 3.0) for k in (1, 2, 3)]
+    start = pos(0.0)
+    track = {
+        "id": "sim_oval",
+        "name": "Simulated Oval",
+        "start_line": {"lat": start[0], "lon": start[1], "radius_m": 20.0, "heading": 0.0},
+        "sectors": [{"end_lat": g[0], "end_lon": g[1]} for g in gates],
+        "pit_center_lat": lat0, "pit_center_lon": lon0, "pit_radius_m": 40, # Infield, off the racing line
+        "tbl": {"0": lap_s / 3, "1": lap_s / 3, "2": lap_s / 3}
+    }
+    ref_s = lap_s - ref_gain_s
+    ref_points = []
+    n_ref = int(ref_s * rate_hz)
+    for i in range(n_ref + 1):
+        u = i / n_ref
+        lat, lon = pos((u + 0.03 * math.sin(4 * math.pi * u)) % 1.0)
+        ref_points.append((u * ref_s, lat, lon))
+    track["ref"] = reference_lap(ref_points)
+    return ReplaySession(rows), track
+
+
+def nmea(body):
+    cs = 0
+    for c in body:
+        cs ^= ord(c)
+    return ("$%s*%02X\r\n" % (body, cs)).encode()
+
+
+def _dm(value, width):
+    a = abs(value)
+    deg = int(a)
+    return "%0*d%08.5f" % (width, deg, (a - deg) * 60.0)
+
+
+class GPSDevice:
+    """
+    u-blox M8N behind a UART, replaying a session.
+    profile: "factory" - NMEA @ 9600, 1 Hz, accepts UBX configuration
+             "ubx"     - already configured: UBX NAV-PVT @ 115200, 10 Hz
+             "nmea"    - NMEA-only module @ 9600 (ignores UBX configuration)
+    Session time t0 is reached `lead_in_s` after power-on; epochs before that
+    carry UTC time but no position fix.
+    """
+
+    def __init__(self, session, clock, profile="factory", lead_in_s=10.0, latency_ms=40, sats=12):
+        self.session = session
+        self.clock = clock
+        self.profile = profile
+        self.lead_in_us = int(lead_in_s * 1000000)
+        self.latency_us = latency_ms * 1000
+        self.sats = sats
+        self.accept_config = profile != "nmea"
+        if profile == "ubx":
+            self.baud, self.out_proto, self.period_ms, self.pvt = 115200, 0x01, 100, True
+        else:
+            self.baud, self.out_proto, self.period_ms, self.pvt = 9600, 0x02, 1000, False
+        self._next_epoch_us = 0
+        self._queue = [] # (first byte arrival us, bytes)
+
+        # Stats
+        self.epochs = 0
+        self.config_msgs = 0
+
+    def session_time(self, t_us):
+        return self.session.t0 + (t_us - self.lead_in_us) / 1e6
+
+    def done(self, t_us):
+        return self.session_time(t_us) > self.session.t0 + self.session.duration
+
+    # --- UART side ---
+
+    def pending(self, t_us):
+        """Chunks whose first byte has arrived by t_us; removed from the device."""
+        while self._next_epoch_us <= t_us:
+            self._render_epoch(self._next_epoch_us)
+            self._next_epoch_us += self.period_ms * 1000
+        out = []
+        while self._queue and self._queue[0][0] <= t_us:
+            out.append(self._queue.pop(0))
+        return out
+
+    def us_per_byte(self):
+        return 10000000 // self.baud # 8N1
+
+    def on_write(self, data):
+        """Host -> module bytes: apply UBX CFG frames."""
+        i = 0
+        while i + 8 <= len(data):
+            if data[i] != 0xB5 or data[i + 1] != 0x62:
+                i += 1
+                continue
+            cls, msg_id = data[i + 2], data[i + 3]
+            length = data[i + 4] | (data[i + 5] << 8)
+            payload = bytes(data[i + 6:i + 6 + length])
+            i += 8 + length
+            if not self.accept_config or cls != 0x06:
+                continue
+            self.config_msgs += 1
+            if msg_id == 0x00 and length >= 16:    # CFG-PRT
+                baud, out_proto = struct.unpack_from("<IxxH", payload, 8)
+                self._ack(cls, msg_id)             # Sent at the old baud
+                self.baud, self.out_proto = baud, out_proto
+                continue
+            if msg_id == 0x08 and length >= 2:     # CFG-RATE
+                self.period_ms = max(40, payload[0] | (payload[1] << 8))
+            elif msg_id == 0x01 and length >= 3 and payload[:2] == b"\x01\x07":
+                self.pvt = payload[2] > 0          # CFG-MSG NAV-PVT
+            self._ack(cls, msg_id)
+
+    def _ack(self, cls, msg_id):
+        if self.out_proto & 0x01:
+            from drivers.ubx import frame
+            self._queue.append((self.clock.us, frame(0x05, 0x01, bytes([cls, msg_id]))))
+
+    # --- Rendering ---
+
+    def _render_epoch(self, t_us):
+        self.epochs += 1
+        st = self.session_time(t_us)
+        has_fix = st >= self.session.t0
+        row = self.session.at(st)
+        data = b""
+        if self.out_proto & 0x01 and self.pvt:
+            data += self._pvt(st, row, has_fix)
+        if self.out_proto & 0x02:
+            data += self._nmea(st, row, has_fix)
+        if data:
+            self._queue.append((t_us + self.latency_us, data))
+
+    def _pvt(self, st, row, has_fix):
+        from drivers.ubx import frame, NAV_PVT_FMT, NAV_PVT_LEN
+        ms_total = int(round(st * 1000))
+        secs, ms = divmod(ms_total, 1000)
+        y, mo, d, h, mi, s = _utc(secs)
+        itow = ((secs + GPS_LEAP_S - GPS_EPOCH) % 604800) * 1000 + ms
+        speed_mms = int(row[3] / 3.6 * 1000)
+        head = math.radians(row[4])
+        fields = (itow, y, mo, d, h, mi, s, 0x07, 30, ms * 1000000,
+                  3 if has_fix else 0, 0x01 if has_fix else 0, 0, self.sats if has_fix else 0,
+                  int(row[2] * 1e7), int(row[1] * 1e7), 420000, 400000,
+                  900 if has_fix else 99999, 1500, int(speed_mms * math.cos(head)),
+                  int(speed_mms * math.sin(head)), 0, speed_mms, int(row[4] * 1e5), 250, 80000)
+        payload = struct.pack(NAV_PVT_FMT, *fields)
+        return frame(0x01, 0x07, payload + bytes(NAV_PVT_LEN - len(payload)))
+
+    def _nmea(self, st, row, has_fix):
+        secs, ms = divmod(int(round(st * 1000)), 1000)
+        y, mo, d, h, mi, s = _utc(secs)
+        hms = "%02d%02d%02d.%02d" % (h, mi, s, ms // 10)
+        lat = "%s,%s" % (_dm(row[1], 2), "N" if row[1] >= 0 else "S")
+        lon = "%s,%s" % (_dm(row[2], 3), "E" if row[2] >= 0 else "W")
+        if has_fix:
+            rmc = "GNRMC,%s,A,%s,%s,%.3f,%.2f,%02d%02d%02d,,,A" % (hms, lat, lon, row[3] / 1.852, row[4], d, mo, y % 100)
+            gga = "GNGGA,%s,%s,%s,1,%02d,0.9,42.0,M,-88.0,M,," % (hms, lat, lon, self.sats)
+        else:
+            rmc = "GNRMC,%s,V,,,,,,,%02d%02d%02d,,,N" % (hms, d, mo, y % 100)
+            gga = "GNGGA,%s,,,,,0,00,99.99,,,,,," % hms
+        return nmea(rmc) + nmea(gga)
+
+
+def _utc(secs):
+    g = time.gmtime(secs)
+    return g.tm_year, g.tm_mon, g.tm_mday, g.tm_hour, g.tm_min, g.tm_sec
+
+
+class BMI323Device:
+    """BMI323 register file + FIFO, fed from the session's IMU columns."""
+
+    CHIP_ID = 0x0043
+    ODR_HZ = {0x06: 50, 0x07: 100, 0x08: 200, 0x09: 400}
+    FRAME_BYTES = 12
+    FIFO_FRAMES = 2048 // 12
+
+    def __init__(self, session_time, session, clock):
+        self.session_time = session_time # t_us -> session time (shared with the GPS)
+        self.session = session
+        self.clock = clock
+        self.odr_hz = 100
+        self.fifo_on = False
+        self._fifo_t0 = 0
+        self._consumed = 0
+
+        # Stats
+        self.frames_read = 0
+        self.fifo_overflow = 0
+
+    def _sample(self, t_us):
+        r = self.session.at(self.session_time(t_us))
+        return tuple(max(-32768, min(32767, int(v))) for v in r[5:11])
+
+    def _produced(self):
+        return (self.clock.us - self._fifo_t0) * self.odr_hz // 1000000
+
+    def write(self, reg, data):
+        word = data[0] | (data[1] << 8) if len(data) >= 2 else 0
+        if reg in (0x20, 0x21):
+            self.odr_hz = self.ODR_HZ.get(word & 0x0F, self.odr_hz)
+        elif reg == 0x36:
+            self.fifo_on = bool(word & 0x0600)
+        elif reg == 0x37 and word & 0x0001:
+            self._fifo_t0 = self.clock.us
+            self._consumed = 0
+
+    def read(self, reg, n):
+        out = bytearray(n) # 2 dummy bytes first, then LE words
+        if reg == 0x00:
+            struct.pack_into("<H", out, 2, self.CHIP_ID)
+        elif reg == 0x03 and n >= 8:
+            struct.pack_into("<hhh", out, 2, *self._sample(self.clock.us)[:3])
+        elif reg == 0x0C and n >= 8:
+            struct.pack_into("<hhh", out, 2, *self._sample(self.clock.us)[3:])
+        elif reg == 0x15 and self.fifo_on:
+            struct.pack_into("<H", out, 2, min(0x07FF, self.unread() * self.FRAME_BYTES // 2))
+        elif reg == 0x16 and self.fifo_on:
+            count = min(self.unread(), (n - 2) // self.FRAME_BYTES)
+            period_us = 1000000 // self.odr_hz
+            for k in range(count):
+                t_us = self._fifo_t0 + (self._consumed + k) * period_us
+                struct.pack_into("<hhhhhh", out, 2 + k * self.FRAME_BYTES, *self._sample(t_us))
+            self._consumed += count
+            self.frames_read += count
+        return bytes(out)
+
+    def unread(self):
+        unread = self._produced() - self._consumed
+        if unread > self.FIFO_FRAMES:
+            # FIFO full: oldest frames overwritten
+            self.fifo_overflow += unread - self.FIFO_FRAMES
+            self._consumed += unread - self.FIFO_FRAMES
+            unread = self.FIFO_FRAMES
+        return unread
+
+
+class SDCardDevice:
+    """
+    SD card in SPI mode: the commands drivers/sdcard.py uses (init, CSD,
+    single/multi-block read and write incl. open-ended CMD25 and the stop
+    token) on an in-memory block store. Busy time while the card programs is
+    modelled as busy bytes on MISO (one byte = 8 SPI clocks), counted in
+    `clocked` together with every other byte, so driver paths can be compared
+    by bus time.
+    """
+
+    BLOCK = 512
+    BUSY_BLOCK = 16      # Busy bytes after each data block of a multi-block write
+    BUSY_SINGLE = 250    # After CMD24 (program the block, update the card's mapping)
+    BUSY_STOP = 300      # After the stop token of a CMD25 (close the open unit)
+
+    def __init__(self, blocks=65536):
+        self.blocks = blocks
+        self.data = {}         # block number -> bytes
+        self._cmd = bytearray()
+        self._out = bytearray()
+        self._idle = True
+        self._app = False      # Next command is an ACMD (after CMD55)
+        self._rx = None        # Data block being received: [block, bytearray, need]
+        self._write_at = None  # Next block of an open write (CMD24 / CMD25)
+        self._multi = False
+
+        # Stats
+        self.clocked = 0
+        self.commands = {}     # Command number -> count ("A23" for ACMD23)
+        self.blocks_written = 0
+
+    # --- SPI side ---
+
+    def write(self, buf):
+        for b in bytes(buf):
+            self._clock(b)
+
+    def readinto(self, buf, fill=0xFF):
+        for i in range(len(buf)):
+            buf[i] = self._clock(fill)
+
+    def read(self, n, fill=0xFF):
+        out = bytearray(n)
+        self.readinto(out, fill)
+        return bytes(out)
+
+    def _clock(self, b):
+        self.clocked += 1
+        out = self._out.pop(0) if self._out else 0xFF
+        if self._rx is not None:
+            self._rx[1].append(b)
+            if len(self._rx[1]) == self._rx[2]:
+                self._store()
+        elif self._write_at is not None:
+            self._data_token(b)
+        elif self._cmd or (b & 0xC0) == 0x40:
+            self._cmd.append(b)
+            if len(self._cmd) == 6:
+                self._command()
+        return out
+
+    # --- Card ---
+
+    def _respond(self, *data):
+        self._out += bytes((0xFF,) + data) # NCR, then the response
+
+    def _block(self, n):
+        return self.data.get(n, bytes(self.BLOCK))
+
+    def _command(self):
+        cmd = self._cmd[0] & 0x3F
+        arg = int.from_bytes(self._cmd[1:5], "big")
+        self._cmd = bytearray()
+        key = "A%d" % cmd if self._app else cmd
+        self.commands[key] = self.commands.get(key, 0) + 1
+        app, self._app = self._app, False
+        if cmd == 0:
+            self._idle = True
+            self._respond(0x01)
+        elif cmd == 8:
+            self._respond(0x01, 0x00, 0x00, 0x01, 0xAA)
+        elif cmd == 58:
+            self._respond(0x01 if self._idle else 0x00, 0xC0, 0xFF, 0x80, 0x00)
+        elif cmd == 55:
+            self._app = True
+            self._respond(0x01 if self._idle else 0x00)
+        elif cmd == 41 and app:
+            self._idle = False
+            self._respond(0x00)
+        elif cmd == 9:
+            csd = bytearray(16)
+            csd[0] = 0x40 # CSD v2: C_SIZE in 512 KB units
+            c_size = self.blocks // 1024 - 1
+            csd[7], csd[8], csd[9] = (c_size >> 16) & 0x3F, (c_size >> 8) & 0xFF, c_size & 0xFF
+            self._respond(0x00)
+            self._out += b"\xff\xfe" + csd + b"\xff\xff"
+        elif cmd == 16 or (cmd == 23 and app):
+            self._respond(0x00)
+        elif cmd == 17 or cmd == 18:
+            self._respond(0x00)
+            for n in range(arg, arg + (1 if cmd == 17 else 64)):
+                # CMD18: enough blocks are queued for a FatFs read; CMD12 drops the rest
+                self._out += b"\xff\xfe" + self._block(n) + b"\xff\xff"
+        elif cmd == 12:
+            self._out = bytearray(b"\xff")
+            self._respond(0x00)
+        elif cmd == 24 or cmd == 25:
+            self._respond(0x00)
+            self._write_at = arg
+            self._multi = cmd == 25
+        else:
+            self._respond(0x04) # Illegal command
+
+    def _data_token(self, b):
+        if b == 0xFE or (b == 0xFC and self._multi):
+            self._rx = [self._write_at, bytearray(), self.BLOCK + 2]
+        elif b == 0xFD and self._multi:
+            self._write_at = None
+            self._out += b"\xff" + bytes(self.BUSY_STOP)
+
+    def _store(self):
+        n, data, _ = self._rx
+        self._rx = None
+        self.data[n] = bytes(data[:self.BLOCK])
+        self.blocks_written += 1
+        self._out += b"\x05" + bytes(self.BUSY_BLOCK if self._multi else self.BUSY_SINGLE)
+        if self._multi:
+            self._write_at = n + 1
+        else:
+            self._write_at = None
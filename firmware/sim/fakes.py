@@ -0,0 +1,410 @@
+# sim/fakes.py - Stand-ins for the remaining MicroPython modules
+#
+# Each build_*() returns a module object the import hook in sim/host.py hands
+# to firmware code. They only keep state the simulation reports on (LED
+# writes, BLE characteristic writes, started threads, HTTP exchanges).
+import asyncio
+import binascii
+import errno
+import tracemalloc
+import types
+import zlib
+
+
+def _module(name, **attrs):
+    m = types.ModuleType(name)
+    for k, v in attrs.items():
+        setattr(m, k, v)
+    return m
+
+
+def build_neopixel(hw):
+    class NeoPixel:
+        def __init__(self, pin, n, bpp=3, timing=1):
+            self.n = n
+            self.buf = [(0,) * bpp] * n
+            self.writes = 0
+            hw.neopixels = getattr(hw, "neopixels", []) + [self]
+
+        def __setitem__(self, i, v):
+            self.buf[i] = tuple(v)
+
+        def __getitem__(self, i):
+            return self.buf[i]
+
+        def __len__(self):
+            return self.n
+
+        def fill(self, v):
+            self.buf = [tuple(v)] * self.n
+
+        def write(self):
+            self.writes += 1
+
+    return _module("neopixel", NeoPixel=NeoPixel)
+
+
+def build_network(hw):
+    class WLAN:
+        def __init__(self, iface=0):
+            self.iface = iface
+            self._active = False
+            self._config = {"mac": b"\x52\x53\x00\x00\x00\x01", "essid": ""}
+
+        def active(self, v=None):
+            if v is None:
+                return self._active
+            self._active = bool(v)
+
+        def config(self, *args, **kwargs):
+            if args:
+                return self._config.get(args[0])
+            self._config.update(kwargs)
+
+        def scan(self):
+            return [] # No networks in range: AP mode
+
+        def connect(self, ssid=None, password=None, **kwargs):
+            pass
+
+        def disconnect(self):
+            pass
+
+        def isconnected(self):
+            return False
+
+        def status(self, *args):
+            return 0
+
+        def ifconfig(self, *args):
+            if self.iface == AP_IF:
+                return ("192.168.4.1", "255.255.255.0", "192.168.4.1", "192.168.4.1")
+            return ("0.0.0.0", "0.0.0.0", "0.0.0.0", "0.0.0.0")
+
+    STA_IF = 0
+    AP_IF = 1
+    return _module("network", WLAN=WLAN, STA_IF=STA_IF, AP_IF=AP_IF,
+                   STAT_IDLE=0, STAT_CONNECTING=1, STAT_GOT_IP=1010,
+                   hostname=lambda *a: "datalogger")
+
+
+def build_bluetooth(hw):
+    class UUID:
+        def __init__(self, value):
+            self.value = value
+
+    class BLE:
+        def __init__(self):
+            self._handle = 0
+            self.values = {}
+            self.notifies = 0
+
+        def active(self, v=None):
+            return True
+
+        def irq(self, handler):
+            self.handler = handler
+
+        def config(self, *args, **kwargs):
+            if args:
+                return b"\x52\x53\x00\x00\x00\x01" if args[0] == "mac" else None
+
+        def gatts_register_services(self, services):
+            out = []
+            for _, chars in services:
+                handles = []
+                for _ in chars:
+                    self._handle += 1
+                    handles.append(self._handle)
+                out.append(tuple(handles))
+            return tuple(out)
+
+        def gatts_write(self, handle, data, send_update=False):
+            self.values[handle] = bytes(data)
+
+        def gatts_set_buffer(self, handle, length, append=False):
+            pass
+
+        def gatts_read(self, handle):
+            return self.values.get(handle, b"")
+
+        def gatts_notify(self, conn_handle, handle, data=None):
+            self.notifies += 1
+
+        def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+            pass
+
+        def gap_disconnect(self, conn_handle):
+            pass
+
+    return _module("bluetooth", BLE=BLE, UUID=UUID, FLAG_READ=0x0002, FLAG_WRITE=0x0008,
+                   FLAG_NOTIFY=0x0010, FLAG_WRITE_NO_RESPONSE=0x0004)
+
+
+def build_thread(hw):
+    class Lock:
+        def __init__(self):
+            self.locked_ = False
+
+        def acquire(self, waitflag=1, timeout=-1):
+            self.locked_ = True
+            return True
+
+        def release(self):
+            self.locked_ = False
+
+        def locked(self):
+            return self.locked_
+
+        __enter__ = acquire
+
+        def __exit__(self, *exc):
+            self.release()
+
+    def start_new_thread(fn, args, kwargs=None):
+        # Not run: the simulation drives the second core's work itself
+        hw.threads.append((fn, args))
+        return len(hw.threads)
+
+    return _module("_thread", start_new_thread=start_new_thread, allocate_lock=Lock,
+                   get_ident=lambda: 1, stack_size=lambda *a: 4096)
+
+
+class SimConnection:
+    """
+    One client: `request` is what it sends, `response` what it got. With
+    eof=False the client keeps the connection open after its bytes (a
+    stalled phone); feed() sends more, finish() closes its side. While
+    `paused` the client reads nothing: the server's drain() waits.
+    """
+
+    def __init__(self, request, eof=True):
+        self.request = bytes(request)
+        self.response = bytearray()
+        self.closed = False
+        self.eof = eof
+        self.paused = False
+
+    def feed(self, data):
+        self.request += data
+
+    def finish(self):
+        self.eof = True
+
+    def settimeout(self, t):
+        pass
+
+    def setblocking(self, flag):
+        pass
+
+    def recv(self, n):
+        data, self.request = self.request[:n], self.request[n:]
+        return data
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.response += data
+        return len(data)
+
+    def sendall(self, data):
+        self.send(data)
+
+    write = send
+
+    def close(self):
+        self.closed = True
+
+
+class SimStream:
+    """
+    asyncio Stream (MicroPython: reader and writer are one object) over a
+    SimConnection. Reads wait while a stalled client has not sent enough;
+    writes go through at once, drain() waits while the client is paused.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def _until(self, ready):
+        while not ready() and not self.conn.eof:
+            await asyncio.sleep(0)
+
+    async def readline(self):
+        await self._until(lambda: b"\n" in self.conn.request)
+        end = self.conn.request.find(b"\n")
+        return self.conn.recv(len(self.conn.request) if end < 0 else end + 1)
+
+    async def read(self, n=-1):
+        await self._until(lambda: self.conn.request)
+        return self.conn.recv(len(self.conn.request) if n < 0 else n)
+
+    async def readinto(self, buf):
+        await self._until(lambda: self.conn.request)
+        data = self.conn.recv(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    async def readexactly(self, n):
+        await self._until(lambda: len(self.conn.request) >= n)
+        if len(self.conn.request) < n:
+            raise EOFError("Connection closed")
+        return self.conn.recv(n)
+
+    def write(self, data):
+        self.conn.send(bytes(data))
+
+    async def drain(self):
+        while self.conn.paused and not self.conn.closed:
+            await asyncio.sleep(0)
+
+    def close(self):
+        self.conn.close()
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name):
+        return ("192.168.4.2", 50000) if name == "peername" else None
+
+
+class SimServerLoop:
+    """
+    The second core's asyncio loop for a MiniServer, stepped by the caller:
+    connect() hands it a client like start_server() would, step() runs the
+    loop while client tasks are not done (stalled clients stay pending).
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        self.tasks = []
+
+    def connect(self, conn):
+        stream = SimStream(conn)
+        self.tasks.append(self.loop.create_task(self.server.handle_client(stream, stream)))
+
+    def busy(self):
+        return bool(self.tasks)
+
+    def step(self, max_iter=64):
+        for _ in range(max_iter):
+            if not self.tasks:
+                break
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.tasks = [t for t in self.tasks if not t.done()]
+
+    def close(self):
+        for t in self.tasks:
+            t.cancel()
+        if self.tasks:
+            self.loop.run_until_complete(asyncio.gather(*self.tasks, return_exceptions=True))
+        self.loop.close()
+
+
+def build_socket(hw):
+    class socket:
+        def __init__(self, af=2, kind=1, proto=0):
+            self.timeout = None
+
+        def setsockopt(self, *args):
+            pass
+
+        def bind(self, addr):
+            pass
+
+        def listen(self, backlog=1):
+            pass
+
+        def settimeout(self, t):
+            self.timeout = t
+
+        def setblocking(self, flag):
+            pass
+
+        def accept(self):
+            if not hw.connections:
+                raise OSError(errno.ETIMEDOUT, "ETIMEDOUT")
+            conn = hw.connections.pop(0)
+            return conn, ("192.168.4.2", 50000)
+
+        def close(self):
+            pass
+
+    def getaddrinfo(host, port, *args):
+        return [(2, 1, 0, "", (host, port))]
+
+    return _module("socket", socket=socket, getaddrinfo=getaddrinfo, AF_INET=2, SOCK_STREAM=1,
+                   SOL_SOCKET=1, SO_REUSEADDR=4)
+
+
+def build_gc(hw):
+    state = {"collects": 0}
+
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    def collect():
+        state["collects"] += 1 # No real collection: it would dominate the CPU profile
+
+    return _module("gc", collect=collect, mem_alloc=mem_alloc,
+                   mem_free=lambda: hw.heap_size - mem_alloc(),
+                   enable=lambda: None, disable=lambda: None, isenabled=lambda: True,
+                   threshold=lambda *a: -1, state=state)
+
+
+def build_micropython(hw):
+    return _module("micropython", const=lambda x: x, opt_level=lambda *a: 0,
+                   mem_info=lambda *a: None, qstr_info=lambda *a: None,
+                   alloc_emergency_exception_buf=lambda n: None,
+                   schedule=lambda fn, arg: fn(arg), heap_lock=lambda: 0, heap_unlock=lambda: 0,
+                   native=lambda f: f, viper=lambda f: f)
+
+
+def build_urequests(hw):
+    def request(*args, **kwargs):
+        raise OSError(errno.EHOSTUNREACH, "No network in simulation")
+
+    return _module("urequests", request=request, get=request, post=request, put=request)
+
+
+def build_secrets(hw):
+    return _module("secrets", SSID="", PASSWORD="", API_URL="")
+
+
+def build_ubinascii(hw):
+    return _module("ubinascii", hexlify=binascii.hexlify, unhexlify=binascii.unhexlify,
+                   a2b_base64=binascii.a2b_base64, b2a_base64=binascii.b2a_base64,
+                   crc32=binascii.crc32)
+
+
+def build_deflate(hw):
+    # Compression side only. MicroPython's compressor emits static-Huffman
+    # blocks: Z_FIXED keeps the simulated ratio close to the device's
+    RAW, ZLIB, GZIP, AUTO = 1, 2, 3, 0
+
+    class DeflateIO:
+        def __init__(self, stream, format=AUTO, wbits=0, close=False):
+            self.stream = stream
+            self.format = format or ZLIB
+            self.wbits = wbits or 8
+            self.close_stream = close
+            self._c = None
+
+        def _window(self):
+            return {RAW: -self.wbits, ZLIB: self.wbits, GZIP: 16 + self.wbits}[self.format]
+
+        def write(self, data):
+            if self._c is None:
+                self._c = zlib.compressobj(9, zlib.DEFLATED, self._window(), 8, zlib.Z_FIXED)
+            self.stream.write(self._c.compress(bytes(data)))
+            return len(data)
+
+        def close(self):
+            if self._c is not None:
+                self.stream.write(self._c.flush())
+                self._c = None
+            if self.close_stream:
+                self.stream.close()
+
+    return _module("deflate", DeflateIO=DeflateIO, RAW=RAW, ZLIB=ZLIB, GZIP=GZIP, AUTO=AUTO)
@@ -0,0 +1,423 @@
+# sim/host.py - Run the real firmware on CPython against replayed sensor data
+#
+# The firmware is imported unchanged. While a Simulation runs, an import hook
+# hands firmware modules (and only them) the stand-ins from this package for
+# machine, time, os, _thread, socket, gc, network, neopixel, bluetooth, ... and
+# injects `open` (device paths mapped under `root`) and optionally a quiet
+# `print`. main.main_loop() then runs as on the device; the scheduler's run()
+# is replaced by a driver that advances virtual time, steps the MiniServer's
+# asyncio loop while it has clients (sim.fakes.SimServerLoop: the second
+# core, which sleeps otherwise), and measures every task run:
+#   - CPU time (host wall clock, perf_counter_ns)
+#   - allocations (tracemalloc: transient peak bytes per run)
+#   - lap / sector events and per-fix cost of TrackEngine.update / is_in_pit
+#   - live lap delta (TrackEngine.update_delta): cost per fix, RAM, end-of-lap delta
+import builtins
+import collections
+import contextlib
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from sim import fakes
+from sim import machine as sim_machine
+from sim.clock import VirtualClock
+from sim.devices import BMI323Device, GPSDevice
+from sim.vfs import SimOS
+
+FIRMWARE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIM_DIR = os.path.join(FIRMWARE_DIR, "sim")
+RTC_UNSET_EPOCH = 946684800 # ESP32 RTC after power-on: 2000-01-01
+
+UART_GPS = 1
+I2C_ADDR_IMU = 0x69
+
+
+def percentiles(values):
+    if not values:
+        return {"n": 0}
+    v = sorted(values)
+    n = len(v)
+    return {
+        "n": n,
+        "mean": round(sum(v) / n, 1),
+        "p50": v[n // 2],
+        "p99": v[min(n - 1, n * 99 // 100)],
+        "max": v[-1]
+    }
+
+
+class Simulation:
+    def __init__(self, session, track=None, gps_profile="factory", root=None, lead_in_s=10.0,
+                 tail_s=2.0, max_s=None, trace_alloc=True, quiet=True, cpu_scale=0.0,
+                 http_every_s=5.0, server_poll_ms=10):
+        self.session = session
+        self.track = track
+        self.root = root or tempfile.mkdtemp(prefix="rs_sim_")
+        self.tail_s = tail_s
+        self.max_s = max_s
+        self.trace_alloc = trace_alloc
+        self.quiet = quiet
+        self.cpu_scale = cpu_scale # Virtual us per host us of firmware CPU (0: free)
+        self.http_every_s = http_every_s
+        self.server_poll_ms = server_poll_ms
+
+        self.clock = VirtualClock(epoch_s=RTC_UNSET_EPOCH)
+        self.hw = sim_machine.SimHardware(self.clock)
+        self.gps = GPSDevice(session, self.clock, profile=gps_profile, lead_in_s=lead_in_s)
+        self.imu = BMI323Device(self.gps.session_time, session, self.clock)
+        self.hw.uarts[UART_GPS] = self.gps
+        self.hw.i2c[I2C_ADDR_IMU] = self.imu
+        self.vfs = SimOS(self.root)
+
+        # Results
+        self.log = collections.deque(maxlen=500)
+        self.log_lines = 0
+        self.iter_us = []
+        self.task_us = collections.defaultdict(list)
+        self.task_alloc = collections.defaultdict(list)
+        self.poll_us = []      # MiniServer loop steps (only while clients are connected)
+        self.poll_alloc = []
+        self.responses = []
+        self.events = []
+        self.track_us = []     # TrackEngine.update per fix (CPU only, nested in the gps task)
+        self.pit_us = []       # TrackEngine.is_in_pit per fix
+        self.delta_us = []
+        self.delta_values = []
+        self.delta_lap_end = [] # Delta at the last fix before each start line crossing
+        self.reset = None
+        self.sched = None
+        self.server = None
+        self.server_loop = None
+        self.track_engine = None
+        self.gps_driver = None
+        self._imu_overflow0 = 0
+        self._uart_overflow0 = 0
+
+    # --- Module plumbing ---
+
+    def _overrides(self):
+        hw = self.hw
+        sim_machine.HW = hw
+        mods = {
+            "machine": sim_machine,
+            "time": self.clock.module(),
+            "os": self.vfs.module(),
+            "_thread": fakes.build_thread(hw),
+            "socket": fakes.build_socket(hw),
+            "gc": fakes.build_gc(hw),
+            "network": fakes.build_network(hw),
+            "neopixel": fakes.build_neopixel(hw),
+            "bluetooth": fakes.build_bluetooth(hw),
+            "micropython": fakes.build_micropython(hw),
+            "urequests": fakes.build_urequests(hw),
+            "secrets": fakes.build_secrets(hw),
+            "ubinascii": fakes.build_ubinascii(hw),
+            "deflate": fakes.build_deflate(hw),
+        }
+        for alias in ("time", "os", "socket"):
+            mods["u" + alias] = mods[alias]
+        mods["ujson"] = json
+        return mods
+
+    def _print(self, *args, sep=" ", end="\n", **kwargs):
+        self.log.append(sep.join(str(a) for a in args))
+        self.log_lines += 1
+
+    def _is_firmware(self, g):
+        f = (g.get("__file__") or "") if g else ""
+        return f.startswith(FIRMWARE_DIR) and not f.startswith(SIM_DIR)
+
+    def _install(self):
+        mods = self._overrides()
+        real_import = builtins.__import__
+        sim = self
+
+        def sim_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if globals is not None and sim._is_firmware(globals):
+                globals.setdefault("open", sim.vfs.open)
+                if sim.quiet:
+                    globals.setdefault("print", sim._print)
+                if level == 0 and name in mods:
+                    return mods[name]
+            return real_import(name, globals, locals, fromlist, level)
+
+        # Fresh firmware modules bound to this simulation's stand-ins
+        for name, mod in list(sys.modules.items()):
+            if self._is_firmware(getattr(mod, "__dict__", None)):
+                del sys.modules[name]
+        if FIRMWARE_DIR not in sys.path:
+            sys.path.insert(0, FIRMWARE_DIR)
+        self._real_import = real_import
+        builtins.__import__ = sim_import
+
+    def _uninstall(self):
+        builtins.__import__ = self._real_import
+        sim_machine.HW = None
+
+    def _prepare_fs(self):
+        for d in ("/data", "/data/metadata", "/data/learning", "/data/tracks"):
+            os.makedirs(self.vfs.host_path(d), exist_ok=True)
+        if self.track:
+            # Track library (lib/track_library.py) with a decoy track ~50 km away
+            sl = self.track["start_line"]
+            decoy = dict(self.track, id="sim_decoy", name="Decoy",
+                         start_line=dict(sl, lat=sl["lat"] + 0.45))
+            index = {}
+            for t in (self.track, decoy):
+                with self.vfs.open("/data/tracks/%s.json" % t["id"], "w") as f:
+                    json.dump(t, f)
+                index[t["id"]] = [t["start_line"]["lat"], t["start_line"]["lon"], "", t["name"]]
+            with self.vfs.open("/data/tracks/index.json", "w") as f:
+                json.dump({"v": 1, "rev": 1, "tracks": index}, f)
+
+    # --- Run ---
+
+    @contextlib.contextmanager
+    def installed(self):
+        """Firmware imports bound to this simulation's stand-ins, for tests driving single modules."""
+        self._prepare_fs()
+        self._install()
+        try:
+            yield self
+        finally:
+            self._uninstall()
+
+    def run(self):
+        self._prepare_fs()
+        self._install()
+        t_wall = time.perf_counter()
+        try:
+            main = importlib.import_module("main")
+            scheduler = importlib.import_module("lib.scheduler")
+            sim = self
+            scheduler.Scheduler.run = lambda sched: sim._drive(sched)
+            try:
+                main.main_loop()
+            except sim_machine.SimReset as e:
+                self.reset = str(e)
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self._uninstall()
+        self.wall_s = time.perf_counter() - t_wall
+        return self.report()
+
+    def _measure(self, fn, us_list, alloc_list):
+        if self.trace_alloc:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter_ns()
+        try:
+            return fn()
+        finally:
+            dt = (time.perf_counter_ns() - t0) // 1000
+            us_list.append(dt)
+            if self.trace_alloc:
+                alloc_list.append(tracemalloc.get_traced_memory()[1] - base)
+            self._cpu_us += dt
+
+    def _wrap_task(self, task):
+        fn = task.fn
+        us = self.task_us[task.name]
+        alloc = self.task_alloc[task.name]
+        task.fn = lambda: self._measure(fn, us, alloc)
+
+    def _wrap_track_engine(self, te):
+        update = te.update
+        sim = self
+
+        def timed_update(lat, lon, timestamp):
+            t0 = time.perf_counter_ns()
+            event = update(lat, lon, timestamp)
+            sim.track_us.append((time.perf_counter_ns() - t0) // 1000)
+            if event:
+                sim.events.append({
+                    "t": round(sim.clock.us / 1e6, 3),
+                    "session_t": round(sim.gps.session_time(sim.clock.us) - sim.session.t0, 3),
+                    "event": event
+                })
+            return event
+
+        te.update = timed_update
+
+        is_in_pit = te.is_in_pit
+
+        def timed_is_in_pit(lat, lon):
+            t0 = time.perf_counter_ns()
+            result = is_in_pit(lat, lon)
+            sim.pit_us.append((time.perf_counter_ns() - t0) // 1000)
+            return result
+
+        te.is_in_pit = timed_is_in_pit
+
+        update_delta = te.update_delta
+        state = {"lap_start": None, "delta": None}
+
+        def timed_update_delta(lat, lon, t_ms):
+            # Nested in the gps task: CPU only (its allocations count there)
+            t0 = time.perf_counter_ns()
+            delta = update_delta(lat, lon, t_ms)
+            sim.delta_us.append((time.perf_counter_ns() - t0) // 1000)
+            ld = te.lap_delta
+            if ld:
+                if ld.lap_start_ms != state["lap_start"] and state["delta"] is not None:
+                    sim.delta_lap_end.append(state["delta"])
+                state["lap_start"] = ld.lap_start_ms
+            state["delta"] = delta
+            if delta is not None:
+                sim.delta_values.append(delta)
+            return delta
+
+        te.update_delta = timed_update_delta
+
+    def _start_server(self):
+        """Second core: MiniServer.start(), its event loop stepped by _drive() (no sockets)."""
+        for fn, _ in self.hw.threads:
+            server = getattr(fn, "__self__", None)
+            if server is not None and hasattr(server, "handle_client"):
+                server.running = True
+                self.server_loop = fakes.SimServerLoop(server)
+                return server
+        return None
+
+    def _drive(self, sched):
+        """Replacement for Scheduler.run(): the simulation's main loop."""
+        self.sched = sched
+        self.server = self._start_server()
+        self.track_engine = self.server.track_engine if self.server else None
+        self.gps_driver = self.server.gps_state if self.server else None
+        if self.track_engine:
+            self._wrap_track_engine(self.track_engine)
+        for task in sched.tasks:
+            self._wrap_task(task)
+        if self.trace_alloc:
+            tracemalloc.start()
+        # Overflow while booting (FIFO/UART not drained yet) is not the loop's
+        self.imu.unread()
+        for u in self.hw.uart_objs:
+            u.any()
+        self._imu_overflow0 = self.imu.fifo_overflow
+        self._uart_overflow0 = sum(u.overflow for u in self.hw.uart_objs)
+
+        clock = self.clock
+        end_us = self.gps.lead_in_us + int((self.session.duration + self.tail_s) * 1000000)
+        if self.max_s:
+            end_us = min(end_us, int(self.max_s * 1000000))
+        next_poll = clock.us
+        next_http = clock.us + int(self.http_every_s * 1000000) if self.http_every_s else None
+        sched.running = True
+
+        while sched.running and clock.us < end_us:
+            self._cpu_us = 0
+            runs = sum(t.runs for t in sched.tasks)
+            wait = sched.run_once()
+            if sum(t.runs for t in sched.tasks) != runs:
+                self.iter_us.append(self._cpu_us)
+
+            if self.server and clock.us >= next_poll:
+                if next_http is not None and clock.us >= next_http:
+                    self.responses.append(fakes.SimConnection(b"GET /status HTTP/1.1\r\nHost: sim\r\n\r\n"))
+                    self.hw.connections.append(self.responses[-1])
+                    next_http += int(self.http_every_s * 1000000)
+                while self.hw.connections:
+                    self.server_loop.connect(self.hw.connections.pop(0))
+                # Idle: the loop sleeps in select(), nothing to run or measure
+                if self.server_loop.busy():
+                    self._measure(self.server_loop.step, self.poll_us, self.poll_alloc)
+                next_poll = clock.us + self.server_poll_ms * 1000
+
+            clock.advance(self._cpu_us * self.cpu_scale)
+            clock.sleep_us(wait * 1000 if wait > 0 else 100)
+        sched.running = False
+        if self.server_loop:
+            self.server_loop.close()
+
+    # --- Results ---
+
+    def _lap_delta_report(self):
+        ld = self.track_engine.lap_delta if self.track_engine else None
+        if ld is None:
+            return None
+        return {
+            "ref_points": ld.nseg + 1,
+            "ram_bytes": sum(len(a) * a.itemsize for a in (ld.x, ld.y, ld.t)),
+            "us": percentiles(self.delta_us),
+            "updates": len(self.delta_us),
+            "with_delta": len(self.delta_values),
+            "lap_end_ms": self.delta_lap_end
+        }
+
+    def _session_index_report(self):
+        """Index entries checked against the stored files (size/CRC of the synced prefix)."""
+        sm = self.server.sm if self.server else None
+        if sm is None:
+            return None
+        out = {}
+        for name, e in sm.index.entries.items():
+            path = self.vfs.host_path(sm.session_path(name)[0])
+            size, crc, closed = e[0], e[1], e[5]
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                out[name] = {"entry": e, "ok": False}
+                continue
+            ok = len(data) >= size and (crc is None or zlib.crc32(data[:size]) == crc)
+            if closed:
+                ok = ok and len(data) == size
+            out[name] = {"entry": e, "file_size": len(data), "ok": ok}
+        return out
+
+    def report(self):
+        uarts = self.hw.uart_objs
+        files = {}
+        for dirpath, _, names in os.walk(self.vfs.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                files["/" + os.path.relpath(path, self.vfs.root)] = os.path.getsize(path)
+        counts = collections.Counter(e["event"] for e in self.events)
+        status = [r.response.split(b"\r\n", 1)[0].decode(errors="replace") for r in self.responses]
+        return {
+            "virtual_s": round(self.clock.us / 1e6, 3),
+            "wall_s": round(self.wall_s, 3),
+            "trace_alloc": self.trace_alloc,
+            "reset": self.reset,
+            "iteration_us": percentiles(self.iter_us),
+            "tasks": {
+                name: {"us": percentiles(us), "alloc_bytes": percentiles(self.task_alloc[name])}
+                for name, us in self.task_us.items()
+            },
+            "server": {
+                "poll_us": percentiles(self.poll_us),
+                "poll_alloc_bytes": percentiles(self.poll_alloc),
+                "requests": len(self.responses),
+                "ok": sum(1 for s in status if " 200 " in s + " ")
+            },
+            "gps": {
+                "profile": self.gps.profile,
+                "mode": getattr(self.gps_driver, "mode", None),
+                "baud": getattr(self.gps_driver, "baud", None),
+                "epochs": self.gps.epochs,
+                "solutions": self.gps_driver.last_fix.get("seq") if self.gps_driver else 0,
+                "uart_rx_bytes": sum(u.rx_bytes for u in uarts),
+                "uart_overflow_bytes": sum(u.overflow for u in uarts) - self._uart_overflow0,
+                "wrong_baud_bytes": sum(u.dropped_baud for u in uarts)
+            },
+            "imu": {"odr_hz": self.imu.odr_hz, "frames_read": self.imu.frames_read,
+                    "fifo_overflow": self.imu.fifo_overflow - self._imu_overflow0},
+            "track_engine": {"update_us": percentiles(self.track_us), "is_in_pit_us": percentiles(self.pit_us)},
+            "lap_delta": self._lap_delta_report(),
+            "events": self.events,
+            "event_counts": dict(counts),
+            "scheduler": self.sched.stats() if self.sched else None,
+            "files": files,
+            "session_index": self._session_index_report(),
+            "log_lines": self.log_lines,
+            "log_tail": list(self.log)[-20:]
+        }
@@ -0,0 +1,342 @@
+# sim/machine.py - Stand-in for MicroPython's `machine` module
+#
+# Peripherals talk to the emulated hardware in HW (sim/host.py binds it):
+#   UART   -> GPSDevice (bytes arrive at the configured baud, rxbuf overflows)
+#   I2C    -> register devices by address (BMI323Device)
+#   SPI    -> HW.spi device by bus id (SDCardDevice); none by default: reads
+#             return 0xFF, so the SD mount fails and the firmware falls back
+#             to flash like a device without a card
+#   ADC    -> HW.adc values (battery divider)
+#   RTC    -> re-bases the virtual wall clock
+import calendar
+
+HW = None # SimHardware, set by the simulation
+
+
+class SimHardware:
+    def __init__(self, clock):
+        self.clock = clock
+        self.uarts = {}     # UART id -> device
+        self.i2c = {}       # address -> device
+        self.spi = {}       # SPI id -> device
+        self.adc = {}       # pin -> raw 12-bit reading
+        self.pins = {}
+        self.threads = []   # (fn, args) passed to _thread.start_new_thread
+        self.connections = [] # Pending sim socket connections
+        self.heap_size = 8 * 1024 * 1024 # ESP32-S3 with PSRAM
+        self.uart_objs = []
+
+
+class SimReset(Exception):
+    """machine.reset() / soft reset requested by the firmware."""
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = value or 0
+        if HW is not None:
+            HW.pins[id] = self
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=0):
+        pass
+
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+    WIDTH_12BIT = 3
+
+    def __init__(self, pin, atten=None):
+        self.pin_id = pin.id if isinstance(pin, Pin) else pin
+
+    def atten(self, value):
+        pass
+
+    def width(self, value):
+        pass
+
+    def read(self):
+        return HW.adc.get(self.pin_id, 2482) # ~4.0 V through the 1:2 divider
+
+    def read_u16(self):
+        return self.read() << 4
+
+    def read_uv(self):
+        return self.read() * 3300000 // 4095
+
+
+class UART:
+    def __init__(self, id, baudrate=9600, tx=None, rx=None, timeout=0, rxbuf=256, **kwargs):
+        self.id = id
+        self.device = HW.uarts.get(id)
+        self.baudrate = baudrate
+        self.rxbuf = rxbuf
+        self._buf = bytearray()
+        self._arriving = [] # [start_us, data, sent, us_per_byte, baud]
+        self._wire_free_us = 0
+
+        # Stats
+        self.rx_bytes = 0
+        self.overflow = 0
+        self.dropped_baud = 0
+        HW.uart_objs.append(self)
+
+    def init(self, baudrate=None, **kwargs):
+        if baudrate:
+            self.baudrate = baudrate
+        if "rxbuf" in kwargs:
+            self.rxbuf = kwargs["rxbuf"]
+        self._buf = bytearray()
+
+    def deinit(self):
+        pass
+
+    def _pump(self):
+        dev = self.device
+        if dev is None:
+            return
+        now = HW.clock.us
+        for start, data in dev.pending(now):
+            # Bytes are serial on the wire: a chunk starts after the previous one
+            start = max(start, self._wire_free_us)
+            upb = dev.us_per_byte()
+            self._wire_free_us = start + len(data) * upb
+            self._arriving.append([start, data, 0, upb, dev.baud])
+        while self._arriving:
+            chunk = self._arriving[0]
+            start, data, sent, upb, baud = chunk
+            if now < start:
+                break
+            avail = min(len(data), (now - start) // upb + 1)
+            if avail > sent:
+                part = data[sent:avail]
+                chunk[2] = avail
+                if baud != self.baudrate:
+                    self.dropped_baud += len(part) # Framing errors at the wrong baud
+                else:
+                    room = self.rxbuf - len(self._buf)
+                    if len(part) > room:
+                        self.overflow += len(part) - room
+                        part = part[:max(0, room)]
+                    self._buf += part
+                    self.rx_bytes += len(part)
+            if chunk[2] < len(data):
+                break
+            self._arriving.pop(0)
+
+    def any(self):
+        self._pump()
+        return len(self._buf)
+
+    def _take(self, n):
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def read(self, n=None):
+        self._pump()
+        if not self._buf:
+            return None
+        return self._take(len(self._buf) if n is None else n)
+
+    def readinto(self, buf, n=None):
+        self._pump()
+        if not self._buf:
+            return None
+        n = min(len(buf) if n is None else n, len(self._buf))
+        buf[:n] = self._buf[:n]
+        del self._buf[:n]
+        return n
+
+    def readline(self):
+        # timeout=0: returns what has arrived, which may be a partial line
+        self._pump()
+        if not self._buf:
+            return None
+        end = self._buf.find(b"\n")
+        return self._take(len(self._buf) if end < 0 else end + 1)
+
+    def write(self, data):
+        if self.device is not None and self.device.baud == self.baudrate:
+            self.device.on_write(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def txdone(self):
+        return True
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000, **kwargs):
+        self.id = id
+
+    def _dev(self, addr):
+        dev = HW.i2c.get(addr)
+        if dev is None:
+            raise OSError(19, "ENODEV")
+        return dev
+
+    def scan(self):
+        return sorted(HW.i2c)
+
+    def readfrom_mem(self, addr, reg, n, addrsize=8):
+        return self._dev(addr).read(reg, n)
+
+    def readfrom_mem_into(self, addr, reg, buf, addrsize=8):
+        data = self._dev(addr).read(reg, len(buf))
+        buf[:len(data)] = data
+
+    def writeto_mem(self, addr, reg, buf, addrsize=8):
+        self._dev(addr).write(reg, bytes(buf))
+
+    def writeto(self, addr, buf, stop=True):
+        buf = bytes(buf)
+        if buf:
+            self._dev(addr).write(buf[0], buf[1:])
+        return 1
+
+    def readfrom(self, addr, n, stop=True):
+        return self._dev(addr).read(None, n)
+
+
+SoftI2C = I2C
+
+
+class SPI:
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        self.id = id
+        self.device = HW.spi.get(id) if HW else None
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+    def read(self, n, write=0xFF):
+        if self.device:
+            return self.device.read(n, write)
+        return bytes([0xFF]) * n
+
+    def readinto(self, buf, write=0xFF):
+        if self.device:
+            self.device.readinto(buf, write)
+            return
+        for i in range(len(buf)):
+            buf[i] = 0xFF
+
+    def write(self, buf):
+        if self.device:
+            self.device.write(buf)
+
+    def write_readinto(self, wbuf, rbuf):
+        self.readinto(rbuf)
+
+
+SoftSPI = SPI
+
+
+class RTC:
+    def __init__(self, id=0):
+        pass
+
+    def datetime(self, t=None):
+        clock = HW.clock
+        if t is None:
+            y, mo, d, h, mi, s, wd, _ = clock.gmtime()
+            return (y, mo, d, wd, h, mi, s, 0)
+        y, mo, d, _, h, mi, s = t[:7]
+        clock.set_epoch(calendar.timegm((y, mo, d, h, mi, s, 0, 0, 0)))
+
+    def init(self, t):
+        self.datetime(t)
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        pass
+
+    def feed(self):
+        pass
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        pass
+
+    def init(self, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+
+def reset():
+    raise SimReset("machine.reset()")
+
+
+def soft_reset():
+    raise SimReset("machine.soft_reset()")
+
+
+def freq(hz=None):
+    return 240000000
+
+
+def unique_id():
+    return b"\x52\x53\x53\x49\x4d\x31" # "RSSIM1"
+
+
+def idle():
+    pass
+
+
+def lightsleep(ms=0):
+    HW.clock.sleep_us(ms * 1000)
+
+
+deepsleep = lightsleep
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
@@ -0,0 +1,106 @@
+# sim/vfs.py - Device filesystem mapped onto a host directory
+#
+# Firmware paths are absolute device paths ('/data/learning/...', '/sd/...').
+# SimOS maps them below `root` and returns MicroPython-shaped results (stat
+# and statvfs tuples, ilistdir entries).
+import builtins
+import os as _os
+import types
+
+
+class SimOS:
+    def __init__(self, root, capacity_kb=4096):
+        self.root = _os.path.abspath(root)
+        self.capacity_kb = capacity_kb # Reported by statvfs (flash size)
+        self.cwd = "/"
+        self.mounts = {}
+        _os.makedirs(self.root, exist_ok=True)
+
+    def host_path(self, path):
+        path = str(path)
+        if not path.startswith("/"):
+            path = self.cwd.rstrip("/") + "/" + path
+        parts = []
+        for p in path.split("/"):
+            if p in ("", "."):
+                continue
+            if p == "..":
+                if parts:
+                    parts.pop()
+                continue
+            parts.append(p)
+        return _os.path.join(self.root, *parts)
+
+    # --- os module API ---
+
+    def open(self, path, mode="r", *args, **kwargs):
+        return builtins.open(self.host_path(path), mode, *args, **kwargs)
+
+    def listdir(self, path=""):
+        return sorted(_os.listdir(self.host_path(path or self.cwd)))
+
+    def ilistdir(self, path=""):
+        base = self.host_path(path or self.cwd)
+        for name in sorted(_os.listdir(base)):
+            st = _os.stat(_os.path.join(base, name))
+            kind = 0x4000 if _os.path.isdir(_os.path.join(base, name)) else 0x8000
+            yield (name, kind, 0, st.st_size)
+
+    def mkdir(self, path):
+        _os.mkdir(self.host_path(path))
+
+    def rmdir(self, path):
+        _os.rmdir(self.host_path(path))
+
+    def remove(self, path):
+        _os.remove(self.host_path(path))
+
+    def rename(self, old, new):
+        _os.rename(self.host_path(old), self.host_path(new))
+
+    def stat(self, path):
+        st = _os.stat(self.host_path(path))
+        mode = 0x4000 if _os.path.isdir(self.host_path(path)) else 0x8000
+        return (mode, 0, 0, 0, 0, 0, st.st_size, int(st.st_atime), int(st.st_mtime), int(st.st_ctime))
+
+    def statvfs(self, path="/"):
+        used = 0
+        for dirpath, _, files in _os.walk(self.root):
+            for name in files:
+                used += _os.path.getsize(_os.path.join(dirpath, name))
+        bsize = 4096
+        blocks = self.capacity_kb * 1024 // bsize
+        free = max(0, blocks - (used + bsize - 1) // bsize)
+        return (bsize, bsize, blocks, free, free, 0, 0, 0, 0, 255)
+
+    def getcwd(self):
+        return self.cwd
+
+    def chdir(self, path):
+        if not _os.path.isdir(self.host_path(path)):
+            raise OSError(2, "ENOENT")
+        self.cwd = path if path.startswith("/") else self.cwd.rstrip("/") + "/" + path
+
+    def mount(self, dev, path, *args, **kwargs):
+        self.mounts[path] = dev
+        _os.makedirs(self.host_path(path), exist_ok=True)
+
+    def umount(self, path):
+        self.mounts.pop(path, None)
+
+    def sync(self):
+        pass
+
+    def uname(self):
+        return ("esp32", "sim", "1.22.1", "host simulation", "ESP32S3 (sim)")
+
+    def urandom(self, n):
+        return _os.urandom(n)
+
+    def module(self):
+        m = types.ModuleType("os")
+        for name in ("listdir", "ilistdir", "mkdir", "rmdir", "remove", "rename", "stat",
+                     "statvfs", "getcwd", "chdir", "mount", "umount", "sync", "uname", "urandom"):
+            setattr(m, name, getattr(self, name))
+        m.sep = "/"
+        return m
@@ -0,0 +1,248 @@
+"""
+BLE Bulk Transfer Throughput Test
+=================================
+Host-side client for the bulk transfer service (lib/ble_bulk.py) driving the
+real BulkTransfer over a simulated BLE link, in virtual time. CPython only.
+
+Link model, per connection event (every --ci-ms):
+  * the device's main loop calls pump() at BLE_BULK_HZ, queueing notifications
+    into the stack (QUEUE_FRAMES deep: notify is refused when it is full)
+  * up to --ppe queued notifications reach the phone per event
+  * the phone's acks (control writes) reach the device at the next event
+Throughput is reported for common phone settings (ATT MTU, connection
+interval, packets per event), plus a resume after a dropped connection and a
+lossy run (notifications lost in the phone's stack) to check go-back-N.
+
+    python tests/ble_bulk.py
+    python tests/ble_bulk.py --size 200000 --loss 0.02
+"""
+
+import argparse
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lib.ble_bulk as ble_bulk
+from lib.ble_bulk import BulkTransfer, WINDOW_BYTES
+
+BLE_BULK_HZ = 50     # main.py
+QUEUE_FRAMES = 16    # Notifications the stack buffers (NimBLE msys blocks)
+
+
+class Sessions:
+    """The parts of SessionManager BulkTransfer uses, on a host directory."""
+
+    def __init__(self, root):
+        self.active_dir = root
+        self.transferring = {}
+
+    def transfer_start(self, name):
+        self.transferring[name] = self.transferring.get(name, 0) + 1
+
+    def transfer_end(self, name):
+        if self.transferring.get(name, 0) > 1:
+            self.transferring[name] -= 1
+        else:
+            self.transferring.pop(name, None)
+
+    def list_sessions(self):
+        return sorted(os.listdir(self.active_dir))
+
+    def session_path(self, name):
+        return self.active_dir + "/" + name, None
+
+    def session_size(self, name):
+        return os.stat(self.active_dir + "/" + name).st_size
+
+
+class BulkClient:
+    """Central side of the protocol: what the phone app implements."""
+
+    def __init__(self, write):
+        self.write = write       # Control characteristic write
+        self.data = bytearray()
+        self.done = False
+        self.error = None
+
+    def start(self, name):
+        # Resume from what is already held
+        self.start_off = len(self.data)
+        self.last_ack = self.start_off
+        self.nacked = False
+        self.done = False
+        self.write(b"G" + struct.pack("<I", self.start_off) + name.encode())
+
+    def on_notify(self, frame):
+        kind = frame[0:1]
+        if kind == b"D":
+            off = struct.unpack_from("<I", frame, 1)[0]
+            expected = len(self.data)
+            if off == expected:
+                self.data += frame[5:]
+                self.nacked = False
+                if len(self.data) - self.last_ack >= WINDOW_BYTES // 2:
+                    self.last_ack = len(self.data)
+                    self.write(b"A" + struct.pack("<I", self.last_ack))
+            elif off > expected and not self.nacked:
+                self.nacked = True # Ask once per gap
+                self.write(b"N" + struct.pack("<I", expected))
+        elif kind == b"E":
+            size, crc = struct.unpack_from("<II", frame, 1)
+            if size != len(self.data):
+                if not self.nacked:
+                    self.nacked = True
+                    self.write(b"N" + struct.pack("<I", len(self.data)))
+                return
+            if zlib.crc32(bytes(self.data[self.start_off:])) != crc:
+                self.error = "CRC mismatch"
+            self.write(b"A" + struct.pack("<I", size))
+            self.done = True
+        elif kind == b"F":
+            self.error = bytes(frame[1:]).decode()
+
+
+class Link:
+    """Virtual-time BLE connection between BulkTransfer and a BulkClient."""
+
+    def __init__(self, bulk, mtu, ci_ms, ppe, loss=0.0, seed=1):
+        self.bulk = bulk
+        self.ci_ms = ci_ms
+        self.ppe = ppe
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.now = 0
+        self.queue = []          # Notifications waiting for a connection event
+        self.writes = []         # Control writes waiting for the next event
+        self.lost = 0
+        self.pump_us = []
+        ble_bulk.ticks_ms = lambda: self.now
+        bulk.set_mtu(mtu)
+
+    def notify(self, frame):
+        if len(self.queue) >= QUEUE_FRAMES:
+            return False
+        self.queue.append(bytes(frame))
+        return True
+
+    def run(self, client, name, max_ms=600000, stop_at=None):
+        """Transfer until the client has the file (or holds stop_at bytes). Returns virtual ms."""
+        client.write = lambda w: self.writes.append(w)
+        client.start(name)
+        t0 = self.now
+        next_pump = next_event = self.now
+        while not client.done and client.error is None:
+            if stop_at is not None and len(client.data) >= stop_at:
+                break
+            if self.now - t0 > max_ms:
+                raise RuntimeError("Transfer stalled at %d B" % len(client.data))
+            if self.now >= next_event:
+                next_event += self.ci_ms
+                for w in self.writes:
+                    self.bulk.on_control(w)
+                self.writes = []
+                for frame in self.queue[:self.ppe]:
+                    if self.rng.random() < self.loss:
+                        self.lost += 1
+                    else:
+                        client.on_notify(frame)
+                del self.queue[:self.ppe]
+            if self.now >= next_pump:
+                next_pump += 1000 // BLE_BULK_HZ
+                t = time.perf_counter()
+                self.bulk.pump(self.notify)
+                self.pump_us.append((time.perf_counter() - t) * 1e6)
+            self.now += 1
+        # Deliver the final ack so the device closes the file
+        for _ in range(3):
+            for w in self.writes:
+                self.bulk.on_control(w)
+            self.writes = []
+            self.bulk.pump(self.notify)
+        return self.now - t0
+
+
+def session_bytes(size, seed=7):
+    """CSV-like session content (what a short session looks like on flash)."""
+    rng = random.Random(seed)
+    out = bytearray(b"time,lat,lon,speed,sats,vbat\n")
+    t, lat, lon = 0, 10.912345, 77.012345
+    while len(out) < size:
+        t += 100
+        lat += rng.uniform(-2e-5, 2e-5)
+        lon += rng.uniform(-2e-5, 2e-5)
+        out += b"%d,%.6f,%.6f,%.1f,12,4.05\n" % (t, lat, lon, rng.uniform(40, 160))
+    return bytes(out[:size])
+
+
+def transfer(root, name, mtu, ci_ms, ppe, loss=0.0):
+    bulk = BulkTransfer(Sessions(root))
+    link = Link(bulk, mtu, ci_ms, ppe, loss)
+    client = BulkClient(None)
+    ms = link.run(client, name)
+    with open(root + "/" + name, "rb") as f:
+        assert client.error is None and bytes(client.data) == f.read(), client.error
+    assert bulk.name is None and not bulk.sm.transferring, "Device did not close the file"
+    return ms, bulk.counters, link
+
+
+def main():
+    ap = argparse.ArgumentParser(description="BLE bulk transfer throughput (simulated link)")
+    ap.add_argument("--size", type=int, default=64 * 1024, help="Short session size (bytes)")
+    ap.add_argument("--loss", type=float, default=0.01, help="Notification loss for the lossy run")
+    args = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="rs_blebulk_")
+    try:
+        files = {"summary.json": 2048, "session.csv": args.size}
+        for name, size in files.items():
+            with open(root + "/" + name, "wb") as f:
+                f.write(session_bytes(size))
+
+        print("%-13s %7s %4s %6s %4s %8s %8s %8s %6s" % (
+            "file", "bytes", "mtu", "ci_ms", "ppe", "time_s", "KB/s", "resends", "busy"))
+        results = {}
+        for mtu, ci_ms, ppe, label in ((23, 30, 4, "default MTU"), (185, 30, 4, "iOS"),
+                                       (247, 15, 6, "Android DLE"), (247, 45, 4, "slow CI")):
+            for name, size in files.items():
+                ms, st, link = transfer(root, name, mtu, ci_ms, ppe)
+                results[(name, label)] = ms
+                print("%-13s %7d %4d %6d %4d %8.2f %8.1f %8d %6d  %s" % (
+                    name, size, mtu, ci_ms, ppe, ms / 1000.0, size / ms, st["resends"], st["busy"], label))
+        pump = sorted(link.pump_us)
+        print("Device pump() CPU: mean %.0f us, max %.0f us (host)" % (sum(pump) / len(pump), pump[-1]))
+
+        # Dropped connection halfway: the phone resumes from what it holds
+        bulk = BulkTransfer(Sessions(root))
+        link = Link(bulk, 185, 30, 4)
+        client = BulkClient(None)
+        link.run(client, "session.csv", stop_at=args.size // 2)
+        held = len(client.data)
+        bulk.cancel()
+        link.queue = []
+        link.writes = []
+        ms = link.run(client, "session.csv")
+        with open(root + "/session.csv", "rb") as f:
+            assert client.error is None and bytes(client.data) == f.read(), client.error
+        print("Resume: reconnected at %d B, remaining %d B in %.2f s" % (held, args.size - held, ms / 1000.0))
+
+        # Lost notifications: go-back-N recovers
+        ms, st, link = transfer(root, "session.csv", 247, 15, 6, loss=args.loss)
+        print("Loss %.0f%%: %d frames lost, %d resends, %.2f s (%.1f KB/s)" % (
+            args.loss * 100, link.lost, st["resends"], ms / 1000.0, args.size / ms))
+
+        assert results[("summary.json", "iOS")] < 1000, results
+        assert results[("session.csv", "Android DLE")] < 5000, results
+        print("BLE BULK TEST PASSED")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
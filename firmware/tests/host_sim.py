@@ -0,0 +1,120 @@
+"""
+Host Simulation Run
+===================
+Runs the real firmware (main.main_loop) on CPython with emulated hardware
+(sim/) and replays a session through the GPS UART and BMI323 FIFO. Reports
+per-iteration / per-task CPU time, allocations, GPS/IMU stats and lap/sector
+events. CPython only.
+
+    python tests/host_sim.py                          # synthetic laps, self-check
+    python tests/host_sim.py session.csv --track track.json
+    python tests/host_sim.py --gps nmea --json report.json
+    python tests/host_sim.py --no-alloc               # CPU timing without tracemalloc
+
+Compare two reports (e.g. before/after a change) with --json on both runs.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim.devices import ReplaySession, synthetic_session
+from sim.host import Simulation
+
+
+def print_report(r):
+    print("Virtual %.1fs in %.1fs wall (alloc tracing %s)" % (r["virtual_s"], r["wall_s"], "on" if r["trace_alloc"] else "off"))
+    it = r["iteration_us"]
+    print("Loop iterations: %d  CPU us mean %s p99 %s max %s" % (it["n"], it.get("mean"), it.get("p99"), it.get("max")))
+    print("  %-8s %7s %9s %9s %9s %11s" % ("task", "runs", "mean_us", "p99_us", "max_us", "alloc_max_B"))
+    for name, t in sorted(r["tasks"].items()):
+        us, al = t["us"], t["alloc_bytes"]
+        print("  %-8s %7d %9s %9s %9s %11s" % (name, us["n"], us.get("mean"), us.get("p99"), us.get("max"), al.get("max", "-")))
+    s = r["server"]
+    print("MiniServer: %d loop steps, mean %s us, %d/%d requests OK" % (s["poll_us"]["n"], s["poll_us"].get("mean"), s["ok"], s["requests"]))
+    g = r["gps"]
+    print("GPS: %s @ %s (%s profile), %d epochs, %d solutions, %d B rx, %d B overflow" % (
+        g["mode"], g["baud"], g["profile"], g["epochs"], g["solutions"], g["uart_rx_bytes"], g["uart_overflow_bytes"]))
+    i = r["imu"]
+    print("IMU: %d frames read @ %d Hz, %d FIFO overflow" % (i["frames_read"], i["odr_hz"], i["fifo_overflow"]))
+    print("Scheduler overruns: %d, max lateness %d ms" % (r["scheduler"]["overruns"], r["scheduler"]["late_max_ms"]))
+    print("Events:", r["event_counts"])
+    te = r["track_engine"]
+    print("TrackEngine per fix: update mean %s us p99 %s us, is_in_pit mean %s us p99 %s us" % (
+        te["update_us"].get("mean"), te["update_us"].get("p99"), te["is_in_pit_us"].get("mean"), te["is_in_pit_us"].get("p99")))
+    d = r["lap_delta"]
+    if d:
+        print("Lap delta: %d ref points (%d B), %d fixes, mean %s us p99 %s us, end-of-lap %s ms" % (
+            d["ref_points"], d["ram_bytes"], d["updates"], d["us"].get("mean"), d["us"].get("p99"), d["lap_end_ms"]))
+    for path, size in sorted(r["files"].items()):
+        if path.startswith("/data/learning") or path.startswith("/sd/"):
+            print("  %s (%d B)" % (path, size))
+    for name, e in sorted((r.get("session_index") or {}).items()):
+        size, crc, start, end, laps, closed = e["entry"][:6]
+        print("  index %s: %d B crc %s, %s-%s, %s laps, %s%s" % (
+            name, size, crc, start, end, laps, "closed" if closed else "open", "" if e["ok"] else " MISMATCH"))
+    if r["reset"]:
+        print("Firmware requested reset:", r["reset"])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Firmware host simulation")
+    ap.add_argument("csv", nargs="?", help="Session CSV to replay (default: synthetic laps)")
+    ap.add_argument("--track", help="Track JSON (as sent to /track/set) for the library")
+    ap.add_argument("--gps", default="factory", choices=("factory", "ubx", "nmea"))
+    ap.add_argument("--laps", type=int, default=3, help="Synthetic laps")
+    ap.add_argument("--max-s", type=float, help="Stop after this much virtual time")
+    ap.add_argument("--no-alloc", action="store_true", help="Disable tracemalloc")
+    ap.add_argument("--verbose", action="store_true", help="Show firmware prints")
+    ap.add_argument("--root", help="Host directory for the device filesystem")
+    ap.add_argument("--json", help="Write the full report here")
+    args = ap.parse_args()
+
+    if args.csv:
+        session = ReplaySession.from_csv(args.csv)
+        track = None
+        if args.track:
+            with open(args.track) as f:
+                track = json.load(f)
+    else:
+        session, track = synthetic_session(laps=args.laps)
+
+    sim = Simulation(session, track=track, gps_profile=args.gps, root=args.root, max_s=args.max_s,
+                     trace_alloc=not args.no_alloc, quiet=not args.verbose)
+    report = sim.run()
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Report written to", args.json)
+
+    if not args.csv and not args.max_s:
+        # Synthetic self-check: every lap's gates seen, live delta tracks the
+        # reference, GPS/IMU fully consumed
+        counts = report["event_counts"]
+        sectors = sum(v for k, v in counts.items() if k.startswith("SECTOR_"))
+        assert counts.get("TRACK_FOUND") == 1, counts
+        assert sectors >= 3 * (args.laps - 1), counts
+        assert report["gps"]["uart_overflow_bytes"] == 0, report["gps"]
+        assert report["imu"]["fifo_overflow"] == 0, report["imu"]
+        assert report["server"]["ok"] == report["server"]["requests"] > 0, report["server"]
+        # Reference lap is 0.5s faster: each timed lap ends ~500ms behind
+        ends = report["lap_delta"]["lap_end_ms"]
+        assert len(ends) >= args.laps - 2 and all(350 < d < 650 for d in ends), report["lap_delta"]
+        assert any(p.endswith(".rsl") and s > 1024 for p, s in report["files"].items()), report["files"]
+        # Session index: every log listed, its size/CRC match the synced bytes
+        index = report["session_index"]
+        logs = [p.rsplit("/", 1)[1] for p in report["files"] if p.startswith("/data/learning/")]
+        assert index and sorted(index) == sorted(logs), (index, logs)
+        assert all(e["ok"] and e["entry"][0] > 0 for e in index.values()), index
+        # Start (file name) and end times on the same clock: a sane duration
+        assert all(0 <= e["entry"][3] - e["entry"][2] < args.laps * 600 for e in index.values()), index
+        print("HOST SIM SELF-CHECK PASSED")
+
+
+if __name__ == "__main__":
+    main()
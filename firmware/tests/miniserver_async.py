@@ -0,0 +1,233 @@
+"""
+MiniServer Concurrency Test
+===========================
+Host-side checks for the asyncio MiniServer (lib/miniserver.py) on the
+simulation's stand-in streams (sim.fakes.SimServerLoop, no sockets).
+CPython only.
+
+  1. A stalled client (half a request, then silence) does not hold up
+     /status for others; it is served once it finishes, or dropped after
+     CLIENT_TIMEOUT_S.
+  2. Requests arriving a byte at a time, and keep-alive requests in turn
+     (also pipelined: several requests in one read).
+  3. A line that never ends gets 400 after MAX_LINE bytes; the server holds
+     at most about MAX_LINE of it.
+  4. MAX_CLIENTS: the next connection gets 503 instead of waiting.
+  5. Uploads (/update?filename=, /ota/file) are written to the file as they
+     arrive: peak allocation per step stays far below the body size (the
+     JSON /update form holds the whole body, up to MAX_BODY).
+
+    python tests/miniserver_async.py
+    python tests/miniserver_async.py --upload-kb 128
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim.devices import synthetic_session
+from sim.fakes import SimConnection, SimServerLoop
+from sim.host import Simulation
+
+STATUS = b"GET /status HTTP/1.1\r\nHost: sim\r\nConnection: close\r\n\r\n"
+
+
+def status_line(conn):
+    return bytes(conn.response).split(b"\r\n", 1)[0].decode()
+
+
+def bodies(conn):
+    """JSON bodies of the responses on one connection, in order."""
+    out = []
+    rest = bytes(conn.response)
+    while rest:
+        head, rest = rest.split(b"\r\n\r\n", 1)
+        length = [int(h.split(b":")[1]) for h in head.split(b"\r\n") if h.lower().startswith(b"content-length:")][0]
+        out.append((head.split(b"\r\n", 1)[0].decode(), rest[:length]))
+        rest = rest[length:]
+    return out
+
+
+def stalled_client_test(ms, loop):
+    stalled = SimConnection(b"GET /status HTTP/1.1\r\nHo", eof=False)
+    loop.connect(stalled)
+    loop.step()
+    others = [SimConnection(STATUS) for _ in range(3)]
+    for conn in others:
+        loop.connect(conn)
+    loop.step()
+    assert all(status_line(c) == "HTTP/1.1 200 OK" for c in others), [status_line(c) for c in others]
+    assert not stalled.response and not stalled.closed
+    print("Stalled client: %d other /status requests served while it waits" % len(others))
+
+    stalled.feed(b"st: sim\r\nConnection: close\r\n\r\n")
+    loop.step()
+    assert status_line(stalled) == "HTTP/1.1 200 OK" and stalled.closed
+    assert not loop.busy()
+
+    # Never finishes: dropped after the (shortened) client timeout
+    ms.CLIENT_TIMEOUT_S = 0.2
+    stalled = SimConnection(b"GET /sta", eof=False)
+    loop.connect(stalled)
+    t0 = time.monotonic()
+    while loop.busy() and time.monotonic() - t0 < 2:
+        loop.step()
+        time.sleep(0.01)
+    assert stalled.closed and not stalled.response, (stalled.closed, stalled.response)
+    print("Silent client dropped after %.1f s without a response" % (time.monotonic() - t0))
+    ms.CLIENT_TIMEOUT_S = 5
+
+
+def incremental_test(loop):
+    req = (b"GET / HTTP/1.1\r\nHost: sim\r\n\r\n"
+           b"GET /track/status HTTP/1.1\r\nHost: sim\r\n\r\n"
+           b"GET /status HTTP/1.1\r\nHost: sim\r\nConnection: close\r\n\r\n")
+    conn = SimConnection(b"", eof=False)
+    loop.connect(conn)
+    for i in range(len(req)):
+        conn.feed(req[i:i + 1])
+        loop.step(4)
+    loop.step()
+    got = bodies(conn)
+    assert [s for s, _ in got] == ["HTTP/1.1 200 OK"] * 3 and conn.closed, got
+    assert json.loads(got[2][1])["status"] == "running"
+    print("Byte-at-a-time keep-alive: %d requests in %d B, 3 responses" % (3, len(req)))
+
+    conn = SimConnection(req)
+    loop.connect(conn)
+    loop.step()
+    got = bodies(conn)
+    assert [s for s, _ in got] == ["HTTP/1.1 200 OK"] * 3 and conn.closed, got
+    print("Pipelined: 3 requests in one read, 3 responses")
+
+
+def preflight_test(loop):
+    conn = SimConnection(b"OPTIONS /download/a.rsl HTTP/1.1\r\nConnection: close\r\n\r\n")
+    loop.connect(conn)
+    loop.step()
+    allow = [h for h in bytes(conn.response).split(b"\r\n") if h.lower().startswith(b"access-control-allow-headers:")]
+    assert status_line(conn) == "HTTP/1.1 200 OK" and allow == [b"Access-Control-Allow-Headers: Content-Type, Range"], allow
+
+
+def long_line_test(ms, loop):
+    conn = SimConnection(b"GET /", eof=False)
+    loop.connect(conn)
+    loop.step()
+    tracemalloc.start()
+    try:
+        sent = 0
+        while loop.busy() and sent < 64 * ms.MAX_LINE:
+            conn.feed(b"a" * 100) # No newline, ever
+            sent += 100
+            loop.step(4)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert status_line(conn).startswith("HTTP/1.1 400") and conn.closed, conn.response
+    assert sent <= 2 * ms.MAX_LINE and peak < 8 * ms.MAX_LINE, (sent, peak)
+    print("Endless line: 400 after %d B, peak allocation %d B" % (sent, peak))
+
+
+def limit_test(ms, loop):
+    stalled = [SimConnection(b"GET /", eof=False) for _ in range(ms.MAX_CLIENTS)]
+    for conn in stalled:
+        loop.connect(conn)
+    extra = SimConnection(STATUS)
+    loop.connect(extra)
+    loop.step()
+    assert status_line(extra).startswith("HTTP/1.1 503") and extra.closed, extra.response
+    for conn in stalled:
+        conn.feed(b"status HTTP/1.1\r\nConnection: close\r\n\r\n")
+    loop.step()
+    assert all(status_line(c) == "HTTP/1.1 200 OK" for c in stalled)
+    print("Client limit: %d served, connection %d answered 503" % (ms.MAX_CLIENTS, ms.MAX_CLIENTS + 1))
+
+
+def upload(loop, head, body, rng):
+    """Send head + body in random TCP-sized pieces; returns (conn, peak transient bytes of a step)."""
+    conn = SimConnection(head, eof=False)
+    loop.connect(conn)
+    peak = 0
+    pos = 0
+    while pos < len(body) or loop.busy():
+        if pos < len(body):
+            n = rng.randint(1, 1460)
+            conn.feed(body[pos:pos + n])
+            pos += n
+        else:
+            conn.finish()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        loop.step(4)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    return conn, peak
+
+
+def upload_test(sim, loop, args):
+    rng = random.Random(7)
+    body = bytes(rng.getrandbits(8) for _ in range(args.upload_kb * 1024))
+    importlib.import_module("lib.ota") # Imported by the first /ota/file request: not per-upload memory
+    tracemalloc.start()
+    try:
+        head = b"POST /update?filename=upload_test.py HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body)
+        conn, raw_peak = upload(loop, head, body, rng)
+        assert status_line(conn) == "HTTP/1.1 200 OK", conn.response
+        with open(sim.vfs.host_path("/upload_test.py"), "rb") as f:
+            assert f.read() == body
+
+        sha = hashlib.sha256(body).hexdigest()
+        head = b"POST /ota/file?path=lib/upload_test.mpy&sha256=%s HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (
+            sha.encode(), len(body))
+        conn, ota_peak = upload(loop, head, body, rng)
+        assert status_line(conn) == "HTTP/1.1 200 OK", conn.response
+
+        text = body.hex()[:len(body) // 2] # JSON bodies are limited to MAX_BODY
+        doc = json.dumps({"filename": "upload_json.py", "content": text}).encode()
+        head = b"POST /update HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(doc)
+        conn, json_peak = upload(loop, head, doc, rng)
+        assert status_line(conn) == "HTTP/1.1 200 OK", conn.response
+        with open(sim.vfs.host_path("/upload_json.py")) as f:
+            assert f.read() == text
+    finally:
+        tracemalloc.stop()
+    print("Upload %d KB, peak allocation per step: /update?filename= %d B, /ota/file %d B, JSON /update %d B" % (
+        args.upload_kb, raw_peak, ota_peak, json_peak))
+    assert raw_peak < len(body) // 4 and ota_peak < len(body) // 4, (raw_peak, ota_peak)
+    assert json_peak > len(body) // 2, json_peak
+
+
+def main():
+    ap = argparse.ArgumentParser(description="asyncio MiniServer: concurrent clients and streamed uploads")
+    ap.add_argument("--upload-kb", type=int, default=64, help="Upload body size")
+    args = ap.parse_args()
+
+    sim = Simulation(synthetic_session(laps=1), trace_alloc=False)
+    with sim.installed():
+        ms = importlib.import_module("lib.miniserver")
+        sm_mod = importlib.import_module("lib.session_manager")
+        server = ms.MiniServer(sm_mod.SessionManager())
+        loop = SimServerLoop(server)
+        try:
+            stalled_client_test(ms, loop)
+            incremental_test(loop)
+            preflight_test(loop)
+            long_line_test(ms, loop)
+            limit_test(ms, loop)
+            upload_test(sim, loop, args)
+        finally:
+            loop.close()
+        assert server.clients == 0, server.clients
+        print("Served %d requests, rejected %d connections" % (server.served, server.rejected))
+    print("MINISERVER ASYNC TEST PASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+OTA Rollback Test
+=================
+Host-side checks for the differential OTA (lib/ota.py on the device,
+UpdateManager.plan on the server) on the simulation's filesystem (sim/).
+CPython only.
+
+  1. plan() against the device's manifest: only changed modules are sent, the
+     other form (.py / .mpy) of a module being installed is deleted, other
+     device files are left alone. commit() swaps them in; confirm() drops the
+     backups.
+  2. An update whose module fails to import: main.py resets the device on
+     every boot, boot_check() counts the trial boots and restores the previous
+     files after TRIAL_BOOTS.
+  3. A swap cut by a reset half-way is rolled back on the next boot; a second
+     rollback() is harmless.
+
+    python tests/ota_rollback.py
+"""
+
+import hashlib
+import importlib
+import os
+import sys
+
+FIRMWARE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FIRMWARE)
+sys.path.append(os.path.join(os.path.dirname(FIRMWARE), "server", "api")) # update_manager (not its main.py)
+
+from sim import machine as sim_machine
+from sim.devices import synthetic_session
+from sim.host import Simulation
+from update_manager import UpdateManager
+
+INSTALLED = {
+    "lib/alpha.py": b"VALUE = 1\n",
+    "lib/beta.py": b"VALUE = 2\n",
+    "lib/gamma.py": b"VALUE = 3\n",
+    "lib/mip_extra.py": b"# Installed on the device with mip\n",
+}
+
+
+def write(sim, path, data):
+    with sim.vfs.open("/" + path, "wb") as f:
+        f.write(data)
+
+
+def read(sim, path):
+    try:
+        with sim.vfs.open("/" + path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def install(sim, ota):
+    for d in ("lib", ota.BACKUP_DIR, ota.STAGE_DIR):
+        os.makedirs(sim.vfs.host_path("/" + d), exist_ok=True)
+    for d in (ota.BACKUP_DIR, ota.STAGE_DIR):
+        for name in os.listdir(sim.vfs.host_path("/" + d)):
+            os.remove(sim.vfs.host_path("/%s/%s" % (d, name)))
+    for name in os.listdir(sim.vfs.host_path("/lib")):
+        os.remove(sim.vfs.host_path("/lib/" + name))
+    for path, data in INSTALLED.items():
+        write(sim, path, data)
+
+
+def build(files):
+    return {p: {"sha256": hashlib.sha256(d).hexdigest(), "size": len(d), "data": d} for p, d in files.items()}
+
+
+def push(ota, new):
+    """What UpdateManager.push_update does over HTTP: plan, stage, commit."""
+    changed, delete = UpdateManager.plan(new, ota.manifest("1.0")["files"])
+    for p in changed:
+        staged = ota.StagedFile(p)
+        staged.write(new[p]["data"])
+        assert staged.close(new[p]["sha256"]), p
+    return changed, delete, ota.commit(changed, delete, version="1.1")
+
+
+def update_test(sim, ota):
+    install(sim, ota)
+    new = build({
+        "lib/alpha.py": INSTALLED["lib/alpha.py"],  # Unchanged
+        "lib/beta.mpy": b"M\x06beta",              # Now bytecode: lib/beta.py must go
+        "lib/gamma.py": b"VALUE = 30\n",
+        "lib/delta.py": b"VALUE = 4\n",            # New module
+    })
+    changed, delete, n = push(ota, new)
+    assert changed == ["lib/beta.mpy", "lib/delta.py", "lib/gamma.py"], changed
+    assert delete == ["lib/beta.py"], delete
+    assert n == 4, n
+    for p, info in new.items():
+        assert read(sim, p) == info["data"], p
+    assert read(sim, "lib/beta.py") is None
+    assert read(sim, "lib/mip_extra.py") == INSTALLED["lib/mip_extra.py"]
+    assert ota.status()["state"] == "trial"
+    assert len(os.listdir(sim.vfs.host_path("/" + ota.BACKUP_DIR))) == 2 # beta.py, gamma.py
+
+    assert UpdateManager.plan(new, ota.manifest("1.1")["files"]) == ([], [])
+    assert ota.confirm() and ota.status() is None
+    assert not os.listdir(sim.vfs.host_path("/" + ota.BACKUP_DIR))
+    print("Update: %d of %d modules sent, %s deleted, mip library kept; confirmed" % (
+        len(changed), len(new), ", ".join(delete)))
+
+
+def failed_boot_test(sim, ota):
+    install(sim, ota)
+    new = build({"lib/gamma.py": b"VALUE = 30\n", "lib/delta.py": b"VALUE = 4\n"})
+    push(ota, new)
+
+    # The new firmware never gets as far as confirm(): one of its modules
+    # fails to import (lib.session_compress stands in for the new lib/gamma.py)
+    sys.modules["lib.session_compress"] = None
+    resets = 0
+    try:
+        while ota.status():
+            ota.boot_check()                       # boot.py
+            if not ota.status():
+                break                              # Rolled back: the old firmware runs
+            try:
+                sys.modules.pop("main", None)
+                importlib.import_module("main")    # main.py
+            except sim_machine.SimReset:
+                resets += 1
+            assert resets <= ota.TRIAL_BOOTS + 1, resets
+    finally:
+        del sys.modules["lib.session_compress"]
+    assert resets == ota.TRIAL_BOOTS, resets
+    for p, data in INSTALLED.items():
+        assert read(sim, p) == data, p
+    assert read(sim, "lib/delta.py") is None
+    print("Broken update: main.py reset the device %d times, rolled back on boot %d" % (resets, resets + 1))
+
+
+def interrupted_swap_test(sim, ota):
+    install(sim, ota)
+    rename = ota.os.rename
+    calls = []
+
+    def power_loss(old, new):
+        if len(calls) == 3:
+            raise sim_machine.SimReset("power loss")
+        calls.append(old)
+        rename(old, new)
+
+    new = build({"lib/alpha.py": b"VALUE = 10\n", "lib/beta.py": b"VALUE = 20\n", "lib/delta.py": b"VALUE = 4\n"})
+    ota.os.rename = power_loss
+    try:
+        push(ota, new)
+        raise AssertionError("swap was not interrupted")
+    except sim_machine.SimReset:
+        pass
+    finally:
+        ota.os.rename = rename
+    assert ota.status()["state"] == "swap"
+
+    ota.boot_check()
+    assert ota.status() is None
+    for p, data in INSTALLED.items():
+        assert read(sim, p) == data, p
+    assert read(sim, "lib/delta.py") is None
+    assert not os.listdir(sim.vfs.host_path("/" + ota.STAGE_DIR))
+    assert not ota.rollback()
+    print("Swap cut after %d renames: restored on the next boot" % len(calls))
+
+
+def main():
+    sim = Simulation(synthetic_session(laps=1), trace_alloc=False)
+    with sim.installed():
+        ota = importlib.import_module("lib.ota")
+        update_test(sim, ota)
+        failed_boot_test(sim, ota)
+        interrupted_swap_test(sim, ota)
+    print("OTA ROLLBACK TEST PASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,12 @@
 SD Card 5MB Stress Write Test
 ==============================
 Writes ~5MB of realistic CSV data to test SD card performance.
+Then benchmarks the logger write path, before/after:
+  - legacy: one CSV line + f.flush() per sample
+  - buffered: binary records via BinLogWriter + AlignedWriter (lib/sd_buffer.py)
+  - prealloc: the same with the file reserved ahead (main.py LOG_RESERVE)
+reporting throughput and per-iteration cost (loop jitter at 10Hz); the
+worst case (max) is what preallocation is meant to cut.
 Power cycle ESP32 before running.
 """
 
@@ -22,6 +28,10 @@ CSV_HEADER = "timestamp,latitude,longitude,speed,satellites,imu_x,imu_y,imu_z,gy
 # Target size: ~5MB
 TARGET_SIZE = 5 * 1024 * 1024  # 5MB
 
+# Logger benchmark: samples per mode (3000 = 5 min at 10Hz)
+BENCH_SAMPLES = 3000
+LOOP_PERIOD_US = 100000  # 10Hz main loop budget
+
 
 def generate_csv_row(base_time, row_num):
     """Generate a realistic CSV row"""
@@ -42,6 +52,58 @@ def generate_csv_row(base_time, row_num):
     )
 
 
+def summarize(name, times_us, total_bytes):
+    """Print throughput and per-iteration cost stats for one benchmark run."""
+    times_us.sort()
+    n = len(times_us)
+    total_us = sum(times_us)
+    p99 = times_us[min(n - 1, (n * 99) // 100)]
+    over = sum(1 for t in times_us if t > LOOP_PERIOD_US // 10)
+    print("    %-9s %7.1f KB/s  mean %6d us  p99 %6d us  max %7d us  >10ms: %d" % (
+        name, total_bytes * 1000000 / total_us / 1024 if total_us else 0,
+        total_us // n, p99, times_us[-1], over))
+
+
+def bench_legacy(path):
+    """Old main loop path: formatted CSV line, write + flush every sample."""
+    times = []
+    total = 0
+    with open(path, 'w') as f:
+        f.write(CSV_HEADER)
+        for i in range(BENCH_SAMPLES):
+            t0 = time.ticks_us()
+            row = generate_csv_row(1768637949.0, i)
+            f.write(row)
+            f.flush()
+            times.append(time.ticks_diff(time.ticks_us(), t0))
+            total += len(row)
+    return times, total
+
+
+def bench_buffered(path, sd, reserve=0):
+    """New path: packed records, SD-block-aligned buffer, 10s time flush (optionally preallocated)."""
+    from lib.binlog import BinLogWriter, REC_SIZE
+    from lib.gps_clock import GPSClock
+    acc = {"x": -3600, "y": -8280, "z": 13640}
+    gyr = {"x": 290, "y": -275, "z": 70}
+    times = []
+    cmds0, blocks0 = sd.write_cmds, sd.stream_blocks
+    with open(path, 'wb') as f:
+        writer = BinLogWriter(f, GPSClock(), reserve=reserve)
+        for i in range(BENCH_SAMPLES):
+            t0 = time.ticks_us()
+            writer.append(11.127990 + i * 0.000001, 77.186050, 42.5, acc, gyr, 4.1, 12)
+            writer.poll()
+            times.append(time.ticks_diff(time.ticks_us(), t0))
+        t0 = time.ticks_us()
+        writer.close()
+        times.append(time.ticks_diff(time.ticks_us(), t0))
+        print("    %s: %d aligned chunks, %d syncs, %d reserve steps, CMD25 %d, streamed blocks %d" % (
+            "prealloc" if reserve else "buffered", writer.out.chunks_written, writer.out.syncs,
+            writer.out.reserves, sd.write_cmds - cmds0, sd.stream_blocks - blocks0))
+    return times, BENCH_SAMPLES * REC_SIZE
+
+
 def main():
     print("=" * 50)
     print(" SD CARD 5MB STRESS WRITE TEST")
@@ -150,6 +212,21 @@ def main():
     free_after = stats[0] * stats[3]
     print("    Space used: %.2f MB" % ((free_before - free_after) / (1024*1024)))
     
+    # Logger write path before/after
+    print("\n[8] Logger benchmark (%d samples each)..." % BENCH_SAMPLES)
+    gc.collect()
+    legacy = bench_legacy('/sd/bench_legacy.csv')
+    gc.collect()
+    buffered = bench_buffered('/sd/bench_buffered.rsl', sd)
+    gc.collect()
+    prealloc = bench_buffered('/sd/bench_prealloc.rsl', sd, reserve=4 * 1024 * 1024)
+    summarize("legacy", *legacy)
+    summarize("buffered", *buffered)
+    summarize("prealloc", *prealloc)
+    for name in ('/sd/bench_legacy.csv', '/sd/bench_buffered.rsl', '/sd/bench_prealloc.rsl'):
+        print("    %s: %d bytes" % (name, os.stat(name)[6]))
+        os.remove(name)
+
     print("\n" + "=" * 50)
     print(" 5MB WRITE TEST COMPLETE!")
     print("=" * 50)
@@ -0,0 +1,212 @@
+"""
+Preallocated SD Log Test
+========================
+Host-side checks for preallocated session logs (lib/sd_buffer.py reserve,
+lib/binlog.py recover_length) and the sequential CMD25 fast path in
+drivers/sdcard.py, on the host simulation's stand-ins (sim/). CPython only.
+
+  1. SD driver on an emulated card (sim.devices.SDCardDevice): a log written
+     as 8 KB chunks the way FatFs issues them, growing file vs preallocated
+     file. Reports worst-case and mean bus time per chunk (SPI bytes incl.
+     the card's busy time) and verifies the blocks read back.
+  2. Logger: a preallocated log is cut to its data length on close and holds
+     the same bytes as an unreserved one; after a simulated power loss (stale
+     card data in the reserved tail) the next boot recovers the length and
+     CRC from the session index and the block CRCs. A reset while the index
+     is saved keeps its entries.
+
+Bus time on a real card depends on its controller: tests/sd_5mb_test.py
+measures worst-case write latency with and without preallocation on the
+device.
+
+    python tests/sd_prealloc.py
+    python tests/sd_prealloc.py --log-kb 2048 --spi-mhz 20
+"""
+
+import argparse
+import importlib
+import os
+import random
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim import machine as sim_machine
+from sim.devices import SDCardDevice, synthetic_session
+from sim.host import Simulation, percentiles
+
+CHUNK = 8192             # LOG_BUFFER_SIZE: one aligned chunk per writeblocks()
+CLUSTER = 32768          # FAT32 cluster on a typical 8-32 GB card
+SYNC_EVERY = 8           # Chunks between syncs (LOG_FLUSH_MS at ~2.7 KB/s is less; worst case)
+FAT_LBA = 2048           # Where the FAT and directory sectors of the model live
+DIR_LBA = 6144
+DATA_LBA = 16384
+
+
+def fatfs_writes(sd, chunks, prealloc):
+    """
+    Issue the block device calls FatFs makes for a log written in CHUNK
+    pieces. Growing file: entering a new cluster reads the FAT sector (to
+    allocate it) and every sync writes the FAT and directory sectors.
+    Preallocated: the chain exists, a sync writes only the directory entry.
+    Returns bus bytes per chunk.
+    """
+    card = sd.spi.device
+    fat = bytearray(512)
+    buf = bytearray(CHUNK)
+    per_chunk = []
+    for i in range(chunks):
+        c0 = card.clocked
+        for k in range(0, CHUNK, 4):
+            buf[k] = (i + k // 4) & 0xFF
+        lba = DATA_LBA + i * CHUNK // 512
+        if not prealloc and (i * CHUNK) % CLUSTER == 0:
+            sd.readblocks(FAT_LBA, fat)
+        assert sd.writeblocks(lba, buf) == 0
+        if (i + 1) % SYNC_EVERY == 0:
+            if not prealloc:
+                assert sd.writeblocks(FAT_LBA, fat) == 0
+            assert sd.writeblocks(DIR_LBA, bytearray(512)) == 0
+            sd.ioctl(3, 0)
+        per_chunk.append(card.clocked - c0)
+    sd.ioctl(3, 0)
+    return per_chunk
+
+
+def check_readback(sd, chunks):
+    buf = bytearray(CHUNK)
+    for i in range(chunks):
+        sd.readblocks(DATA_LBA + i * CHUNK // 512, buf)
+        for k in range(0, CHUNK, 4):
+            assert buf[k] == (i + k // 4) & 0xFF, "Block data differs at chunk %d" % i
+
+
+def driver_test(args):
+    chunks = args.log_kb * 1024 // CHUNK
+    us_per_byte = 8.0 / args.spi_mhz
+    print("%-12s %8s %10s %10s %10s %8s %8s" % ("layout", "chunks", "mean_us", "p99_us", "max_us",
+                                                 "CMD25", "streamed"))
+    results = {}
+    for prealloc in (False, True):
+        sim = Simulation(synthetic_session(laps=1), trace_alloc=False)
+        card = SDCardDevice()
+        sim.hw.spi[1] = card
+        with sim.installed():
+            sdcard = importlib.import_module("drivers.sdcard")
+            sd = sdcard.SDCard(sim_machine.SPI(1), sim_machine.Pin(10))
+            per_chunk = fatfs_writes(sd, chunks, prealloc)
+            check_readback(sd, chunks)
+        us = percentiles([round(b * us_per_byte) for b in per_chunk])
+        label = "prealloc" if prealloc else "growing"
+        results[label] = us
+        print("%-12s %8d %10s %10s %10s %8d %8d" % (label, chunks, us["mean"], us["p99"], us["max"],
+                                                   sd.write_cmds, sd.stream_blocks))
+    assert results["prealloc"]["max"] < results["growing"]["max"], results
+    assert results["prealloc"]["mean"] < results["growing"]["mean"], results
+    print("Worst-case chunk write: %d us growing, %d us preallocated (%.0f%% less)" % (
+        results["growing"]["max"], results["prealloc"]["max"],
+        100.0 * (1 - results["prealloc"]["max"] / results["growing"]["max"])))
+
+
+def log_records(writer, n, rng):
+    acc = {"x": -3600, "y": -8280, "z": 13640}
+    gyr = {"x": 290, "y": -275, "z": 70}
+    frames = bytes(rng.getrandbits(8) for _ in range(8 * 12))
+    for i in range(n):
+        writer.append(11.127990 + i * 1e-6, 77.186050, 42.5, acc, gyr, 4.1, 12, t_ms=i * 100)
+        if i % 4 == 0:
+            writer.append_imu(frames, 8, 5000)
+
+
+def logger_test(args):
+    rng = random.Random(3)
+    reserve = 64 * 1024
+    sim = Simulation(synthetic_session(laps=1), trace_alloc=False)
+    with sim.installed():
+        binlog = importlib.import_module("lib.binlog")
+        gps_clock = importlib.import_module("lib.gps_clock")
+        sm_mod = importlib.import_module("lib.session_manager")
+        clock = gps_clock.GPSClock()
+
+        # Closed log: truncated to the data, same bytes as without preallocation
+        sm = sm_mod.SessionManager()
+        plain = "/data/learning/plain.bin"
+        with sim.vfs.open(plain, "wb") as f:
+            w = binlog.BinLogWriter(f, clock)
+            log_records(w, 3000, random.Random(5))
+            w.close()
+        path = sm.get_log_file(binlog.FILE_EXT)
+        f = sim.vfs.open(path, "wb")
+        w = binlog.BinLogWriter(f, clock, reserve=reserve)
+        log_records(w, 3000, random.Random(5))
+        reserved = os.path.getsize(sim.vfs.host_path(path))
+        w.close()
+        sm.close_log(w.out.offset, w.out.crc)
+        with open(sim.vfs.host_path(path), "rb") as a, open(sim.vfs.host_path(plain), "rb") as b:
+            data = a.read()
+            assert data == b.read(), "Preallocated log differs from the plain one"
+        assert reserved > len(data) and w.out.reserves > 1, (reserved, len(data), w.out.reserves)
+        assert sm.session_size(os.path.basename(path)) == len(data)
+        print("Closed log: %d B data, file reserved to %d B in %d steps, truncated on close" % (
+            len(data), reserved, w.out.reserves))
+
+        # Power loss: synced data + drained chunks, then stale card data in the reserved tail
+        path = sm.get_log_file(binlog.FILE_EXT)
+        name = os.path.basename(path)
+        f = sim.vfs.open(path, "wb")
+        w = binlog.BinLogWriter(f, clock, buffer_size=2048, reserve=reserve)
+        log_records(w, 400, rng)
+        w.flush()
+        sm.log_progress(w.out.offset, w.out.crc, clock.epoch_s(), 0)
+        sm.index.save()
+        indexed = w.out.offset
+        log_records(w, 300, rng) # Drained in 2 KB chunks, never synced
+        f.flush()
+        written = w.out.offset
+        stale = bytearray(rng.getrandbits(8) for _ in range(reserve))
+        stale[100:100 + 2048] = data[4096:4096 + 2048] # An old log's blocks at another offset
+        with open(sim.vfs.host_path(path), "r+b") as raw:
+            raw.seek(written)
+            raw.write(stale[:reserve - written % reserve])
+        size_on_card = os.path.getsize(sim.vfs.host_path(path))
+        f.close()
+
+        with open(sim.vfs.host_path(path), "rb") as raw:
+            on_card = raw.read(written)
+        expect, _ = binlog.recover_length(path) # Whole file walk, no index
+        sm = sm_mod.SessionManager() # Next boot
+        e = sm.session_info(name)
+        assert e[5] and e[0] == expect and e[1] == zlib.crc32(on_card[:expect]), (e, expect)
+        assert indexed < expect <= written and written - expect < 2048, (indexed, expect, written)
+        assert os.path.getsize(sim.vfs.host_path(path)) == expect
+        print("Power loss: index had %d B, %d B on the card (%d B file), recovered %d B (CRC ok)" % (
+            indexed, written, size_on_card, expect))
+
+        # Reset while saving the index: a cut .tmp is ignored; after the old
+        # index was removed but before the rename, the .tmp is the index
+        index = sim.vfs.host_path(sm.index.path)
+        with open(index) as f:
+            saved = f.read()
+        with open(index + ".tmp", "w") as f:
+            f.write(saved[:len(saved) // 2])
+        assert sm_mod.SessionManager().session_info(name) == e
+        os.remove(index)
+        with open(index + ".tmp", "w") as f:
+            f.write(saved)
+        assert sm_mod.SessionManager().session_info(name) == e and os.path.exists(index)
+        print("Index save cut by a reset: entries kept (no rebuild)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Preallocated SD logs and the CMD25 stream fast path")
+    ap.add_argument("--log-kb", type=int, default=1024, help="Log size for the driver test")
+    ap.add_argument("--spi-mhz", type=float, default=10.0, help="SPI clock (bus time per byte)")
+    args = ap.parse_args()
+    driver_test(args)
+    logger_test(args)
+    print("SD PREALLOC TEST PASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Session Compression Transfer Test
+=================================
+Measures what on-device deflate (lib/session_compress.py) saves on a session
+download through MiniServer. CPython only (host simulation, sim/).
+
+  1. A synthetic session is logged (the real firmware on the host sim).
+  2. A second boot finds it closed: /download serves it raw, then the idle
+     logger (no fix yet) compresses it in the background.
+  3. A third boot serves the compressed copy (Content-Encoding: deflate).
+  4. A slow /download of a session the compressor is working on: the raw
+     file stays until the download is done, then it is compressed.
+  5. A build without compression support, a write that fails mid-file and
+     sessions listed to a sync client but not acked are left alone.
+
+Transfer times are bytes over the link at --link-kbps (ESP32 soft-AP TCP is
+typically 2-8 Mbit/s) plus MiniServer CPU time on the host.
+
+    python tests/session_compress.py
+    python tests/session_compress.py --laps 5 --link-kbps 2000
+"""
+
+import argparse
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import types
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim import fakes
+from sim.devices import synthetic_session
+from sim.host import Simulation, percentiles
+from lib.binlog import recover_length
+
+
+def download(root, name, session, track, lead_in_s):
+    """Boot the firmware on `root`, GET /download/<name> first thing, idle until lead-in ends."""
+    conn = fakes.SimConnection(("GET /download/%s HTTP/1.1\r\nHost: sim\r\n\r\n" % name).encode())
+    sim = Simulation(session, track=track, root=root, lead_in_s=lead_in_s, max_s=lead_in_s,
+                     trace_alloc=False, http_every_s=0)
+    sim.hw.connections.append(conn)
+    report = sim.run()
+    raw = bytes(conn.response)
+    head, body = raw.split(b"\r\n\r\n", 1)
+    headers = head.decode().split("\r\n")
+    assert headers[0].startswith("HTTP/1.1 200"), headers[0]
+    encoding = [h.split(":", 1)[1].strip() for h in headers if h.lower().startswith("content-encoding:")]
+    return body, encoding[0] if encoding else None, max(sim.poll_us), report, sim
+
+
+def response_body(conn):
+    head, body = bytes(conn.response).split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200"), head
+    return body, b"Content-Encoding: deflate" in head
+
+
+def closed_session(sim, sm):
+    """A closed CSV session in the index: (name, data, host path)."""
+    path = sm.get_log_file()
+    data = b"".join(b"%d,11.12799,77.18605,42.5,4.1,12\n" % i for i in range(1500))
+    with sim.vfs.open(path, "wb") as f:
+        f.write(data)
+    sm.close_log(len(data), zlib.crc32(data))
+    return os.path.basename(path), data, sim.vfs.host_path(path)
+
+
+class FailingDeflateIO:
+    """DeflateIO that runs out of memory on its `fail_at`th write (0: a decompress-only build)."""
+    fail_at = 0
+
+    def __init__(self, stream, format=0, wbits=0):
+        self.stream = stream
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        if self.writes >= FailingDeflateIO.fail_at:
+            raise MemoryError("memory allocation failed") if FailingDeflateIO.fail_at else AttributeError("write")
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def compressor_guards():
+    """No compressor in the build, a failing write, and sessions a sync client was shown."""
+    sim = Simulation(synthetic_session(laps=1)[0], trace_alloc=False)
+    with sim.installed():
+        sm_mod = importlib.import_module("lib.session_manager")
+        sc_mod = importlib.import_module("lib.session_compress")
+        sm = sm_mod.SessionManager()
+        name, data, raw = closed_session(sim, sm)
+        real = sc_mod.deflate
+        try:
+            sc_mod.deflate = types.SimpleNamespace(DeflateIO=FailingDeflateIO, ZLIB=real.ZLIB)
+            FailingDeflateIO.fail_at = 0
+            comp = sc_mod.SessionCompressor(sm)
+            assert not comp.available and not comp.step()
+
+            FailingDeflateIO.fail_at = 3 # Passes the trial write, fails on the file
+            comp = sc_mod.SessionCompressor(sm)
+            assert comp.available
+            while comp.step():
+                pass
+            assert comp.stats()["active"] is None and comp._src is None
+            assert not os.path.exists(raw + ".z.part") and os.path.exists(raw)
+            assert not comp.step() # Not retried every tick
+        finally:
+            sc_mod.deflate = real
+
+        comp = sc_mod.SessionCompressor(sm)
+        sm.listed.add(name) # In a /list manifest, not acked yet
+        assert not comp.step() and os.path.exists(raw)
+        sm.listed.discard(name)
+        comp = sc_mod.SessionCompressor(sm)
+        while comp.step():
+            pass
+        assert os.path.exists(raw + ".z") and not os.path.exists(raw)
+    print("Compressor: off without compress support, failed write cleaned up, listed sessions left raw")
+
+
+def download_during_compress():
+    """A client reading slowly (paused) holds the raw file while the compressor finishes it."""
+    sim = Simulation(synthetic_session(laps=1)[0], trace_alloc=False)
+    with sim.installed():
+        sm_mod = importlib.import_module("lib.session_manager")
+        sc_mod = importlib.import_module("lib.session_compress")
+        ms = importlib.import_module("lib.miniserver")
+        sm = sm_mod.SessionManager()
+        name, data, raw = closed_session(sim, sm)
+
+        comp = sc_mod.SessionCompressor(sm)
+        server = ms.MiniServer(sm)
+        loop = fakes.SimServerLoop(server)
+        try:
+            assert comp.step() and comp.stats()["active"] == name
+            conn = fakes.SimConnection(("GET /download/%s HTTP/1.1\r\nConnection: close\r\n\r\n" % name).encode())
+            conn.paused = True # Phone stops reading after the first buffer
+            loop.connect(conn)
+            loop.step()
+            assert loop.busy() and name in sm.transferring, sm.transferring
+            while comp.stats()["active"]:
+                comp.step()
+            assert os.path.exists(raw) and not os.path.exists(raw + ".z"), "Compressor replaced a file being read"
+
+            conn.paused = False
+            loop.step()
+            body, deflated = response_body(conn)
+            assert body == data and not deflated and not sm.transferring
+            while comp.step():
+                pass
+            assert os.path.exists(raw + ".z") and not os.path.exists(raw), "Not compressed after the download"
+
+            conn = fakes.SimConnection(("GET /download/%s HTTP/1.1\r\nConnection: close\r\n\r\n" % name).encode())
+            loop.connect(conn)
+            loop.step()
+            body, deflated = response_body(conn)
+            assert deflated and zlib.decompress(body) == data
+        finally:
+            loop.close()
+    print("Download during compression: raw file kept until the client finished, then compressed (%d -> %d B)" % (
+        len(data), len(body)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="On-device session compression: transfer savings")
+    ap.add_argument("--laps", type=int, default=3)
+    ap.add_argument("--link-kbps", type=float, default=4000.0, help="WiFi TCP throughput (kbit/s)")
+    args = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="rs_compress_")
+    try:
+        session, track = synthetic_session(laps=args.laps)
+        Simulation(session, track=track, root=root, trace_alloc=False).run()
+        learning = os.path.join(root, "data", "learning")
+        logs = [f for f in os.listdir(learning) if f.endswith(".rsl") and os.path.getsize(os.path.join(learning, f))]
+        assert logs, os.listdir(learning)
+        name = logs[0]
+
+        # Second boot: raw download, then ~40 KB/s of background compression
+        idle, _ = synthetic_session(laps=1)
+        # The run stopped mid-block: the boot recovers the log up to its last whole block
+        size, _ = recover_length(os.path.join(learning, name))
+        assert 0 <= os.path.getsize(os.path.join(learning, name)) - size < 4096
+        lead_in = 10.0 + size / 30000.0 # Boot takes a few virtual seconds
+        body_raw, enc_raw, cpu_raw, report, sim = download(root, name, idle, track, lead_in)
+        steps = sim.task_us["compress"]
+        assert enc_raw is None and len(body_raw) == size, (enc_raw, len(body_raw), size)
+        assert os.path.exists(os.path.join(learning, name + ".z")), os.listdir(learning)
+        assert not os.path.exists(os.path.join(learning, name)), os.listdir(learning)
+
+        # Third boot: compressed copy
+        body_z, enc_z, cpu_z, _, _ = download(root, name, idle, track, 10.0)
+        assert enc_z == "deflate", enc_z
+        assert zlib.decompress(body_z) == body_raw, "Inflated download differs from the raw log"
+
+        link_bps = args.link_kbps * 1000 / 8
+        t_raw = len(body_raw) / link_bps + cpu_raw / 1e6
+        t_z = len(body_z) / link_bps + cpu_z / 1e6
+        busy = [us for us in steps if us > 50] # Runs that compressed a buffer
+        print("Session %s: %d B raw, %d B deflate (%.1f%% of raw)" % (
+            name, len(body_raw), len(body_z), 100.0 * len(body_z) / len(body_raw)))
+        print("Transfer @ %.0f kbit/s: raw %.2f s (server CPU %d us), deflate %.2f s (server CPU %d us), saved %.0f%%" % (
+            args.link_kbps, t_raw, cpu_raw, t_z, cpu_z, 100.0 * (1 - t_z / t_raw)))
+        print("Background compression: %d steps of 4 KB, CPU per step %s" % (len(busy), percentiles(busy)))
+        download_during_compress()
+        compressor_guards()
+        print("SESSION COMPRESS TEST PASSED")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
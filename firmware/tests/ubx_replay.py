@@ -0,0 +1,135 @@
+"""
+UBX NAV-PVT Parser Replay Test
+===============================
+Feeds a byte stream through drivers/ubx.py and prints the decoded fixes.
+Also checks that a solution without a valid time (UBX or NMEA) does not move
+lib/gps_clock.py backwards. Runs on CPython (no hardware needed) or on the
+device.
+
+    python tests/ubx_replay.py                  # synthetic stream self-check
+    python tests/ubx_replay.py capture.ubx      # replay a recorded UART capture
+
+A capture can be recorded on the device with:
+    uart.read() chunks appended to a file while the module runs in UBX mode.
+"""
+
+import sys
+import struct
+
+try:
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+except (ImportError, AttributeError):
+    pass # MicroPython: run from the firmware root
+
+from drivers.ubx import UBXParser, frame, NAV_PVT_FMT, NAV_PVT_LEN
+from drivers.nmea import NMEAParser
+from lib.gps_clock import GPSClock
+
+
+def make_pvt(itow, lat, lon, speed_kmh, heading, fix_type=3, num_sv=12, hour=10, minute=30, sec=5, valid=0x07):
+    """Build a NAV-PVT frame (values in natural units)."""
+    fields = (itow, 2026, 2, 7, hour, minute, sec, valid, 50, 0,
+              fix_type, 0x01, 0, num_sv,
+              int(lon * 1e7), int(lat * 1e7), 150000, 140000,
+              1200, 2000, 0, 0, 0,
+              int(speed_kmh / 0.0036), int(heading * 1e5), 300, 50000)
+    payload = struct.pack(NAV_PVT_FMT, *fields)
+    payload += bytes(NAV_PVT_LEN - len(payload))
+    return frame(0x01, 0x07, payload)
+
+
+def synthetic_stream(epochs=50):
+    out = bytearray()
+    for i in range(epochs):
+        out += make_pvt(1000 * i, 11.1279 + i * 1e-5, 77.1860, 80.0 + i, 45.0)
+        if i % 10 == 3:
+            out += b"$GNGGA,103005.00,,,,,0,00,99.99,,,,,,*7A\r\n" # Stray NMEA
+        if i % 10 == 7:
+            out += frame(0x05, 0x01, b"\x06\x08") # ACK-ACK
+    # Corrupt one frame's checksum
+    bad = bytearray(make_pvt(999999, 0.0, 0.0, 0.0, 0.0))
+    bad[-1] ^= 0xFF
+    return bytes(out) + bytes(bad)
+
+
+def replay(data, chunk_sizes=(1, 7, 64, 300)):
+    parser = UBXParser()
+    pos = 0
+    k = 0
+    fixes = 0
+    while pos < len(data):
+        n = chunk_sizes[k % len(chunk_sizes)]
+        fixes += parser.feed(data[pos:pos + n])
+        pos += n
+        k += 1
+    return parser, fixes
+
+
+def nmea_rmc(hhmmss, date):
+    body = "GNRMC,%s.00,A,1107.67400,N,07711.16300,E,43.2,45.0,%s,,,A" % (hhmmss, date)
+    cs = 0
+    for c in body:
+        cs ^= ord(c)
+    return ("$%s*%02X\r\n" % (body, cs)).encode()
+
+
+def clock_test():
+    """
+    Solutions 1 s apart (rx_us as read), then one without a valid time: the
+    drivers clear 'utc' and main.py skips the clock. GPSClock itself ignores
+    a repeated UTC with a later rx_us (it would step the clock back by the gap).
+    """
+    for name in ("UBX", "NMEA"):
+        if name == "UBX":
+            parser = UBXParser()
+            frames = [make_pvt(1000 * i, 11.1279, 77.1860, 80.0, 45.0, sec=5 + i) for i in range(5)]
+            frames.append(make_pvt(5000, 11.1279, 77.1860, 80.0, 45.0, sec=10, valid=0x00))
+        else:
+            parser = NMEAParser()
+            frames = [nmea_rmc("1030%02d" % (5 + i), "070226") for i in range(5)]
+            frames.append(nmea_rmc("103010", "")) # No date yet
+        clock = GPSClock()
+        t0 = 1000000
+        for i, data in enumerate(frames):
+            rx_us = t0 + i * 1000000
+            assert parser.feed(data, rx_us) == 1
+            fix = parser.fix
+            if fix['utc']: # main.py task_gps
+                clock.on_fix(fix['utc'], fix['rx_us'])
+        assert fix['utc'] is None and fix['rx_us'] == rx_us, fix
+        before = clock.now_ms(rx_us)
+        clock.on_fix((2026, 2, 7, 10, 30, 9, 0), rx_us) # Stale UTC of the previous solution
+        after = clock.now_ms(rx_us)
+        assert clock.fixes == 5 and after >= before, (clock.fixes, before, after)
+        print("%s: invalid time clears utc; stale UTC ignored (clock %d ms at the invalid solution)" % (name, after))
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            data = f.read()
+        parser, fixes = replay(data)
+        print("Replayed %d bytes: %d NAV-PVT, %d bad checksum, %d ACK, %d NAK" % (
+            len(data), fixes, parser.bad_checksum, parser.acks, parser.naks))
+        print("Last fix:", parser.fix)
+        return
+
+    parser, fixes = replay(synthetic_stream())
+    fix = parser.fix
+    print("Synthetic: %d NAV-PVT, %d bad checksum, %d ACK" % (fixes, parser.bad_checksum, parser.acks))
+    print("Last fix:", fix)
+    assert fixes == 50, fixes
+    assert parser.bad_checksum == 1
+    assert parser.acks == 5
+    assert fix['valid'] and fix['satellites'] == 12 and fix['itow'] == 49000
+    assert abs(fix['lat'] - (11.1279 + 49e-5)) < 1e-6
+    assert abs(fix['speed_kmh'] - 129.0) < 0.01
+    assert abs(fix['heading'] - 45.0) < 1e-3
+    assert fix['timestamp'] == "103005.00"
+    clock_test()
+    print("UBX REPLAY TEST PASSED")
+
+
+if __name__ == "__main__":
+    main()
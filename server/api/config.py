@@ -12,11 +12,14 @@ TRACKS_DIR = DATA_DIR / "tracks"
 SESSIONS_DIR = DATA_DIR / "sessions"
 METADATA_DIR = DATA_DIR / "metadata"
 REGISTRY_FILE = METADATA_DIR / "registry.json"
+CACHE_DIR = DATA_DIR / "cache"
+DEVICE_SYNC_DIR = CACHE_DIR / "device_sync"  # Raw copies of device logs + per-file sync state
+UPLOAD_DIR = CACHE_DIR / "uploads"  # Partial chunked uploads from devices
 SECTOR_COUNT = 3
 
 
 
 
 # Ensure directories exist
-for d in [LEARNING_DIR, TRACKS_DIR, SESSIONS_DIR, METADATA_DIR]:
+for d in [LEARNING_DIR, TRACKS_DIR, SESSIONS_DIR, METADATA_DIR, CACHE_DIR, DEVICE_SYNC_DIR, UPLOAD_DIR]:
     d.mkdir(parents=True, exist_ok=True)
@@ -143,12 +143,13 @@ if CORE_PATH not in sys.path:
     sys.path.insert(0, CORE_PATH)
 
 import requests  # Required for device scanning and checking
+import urllib3
 
 MIN_ESP_VERSION = "0.0.0"
 
 from update_manager import UpdateManager
 FIRMWARE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../firmware'))
-update_mgr = UpdateManager(FIRMWARE_DIR)
+update_mgr = UpdateManager(FIRMWARE_DIR, build_dir=config.CACHE_DIR / "ota_build")
 
 def get_local_firmware_version():
     try:
@@ -1334,18 +1335,77 @@ def update_track(track_id):
             
         updates = request.json
         # Only allow specific fields to be updated
-        allowed_fields = ['pit_center_lat', 'pit_center_lon', 'pit_radius_m', 'track_name']
+        allowed_fields = ['pit_center_lat', 'pit_center_lon', 'pit_radius_m', 'track_name', 'start_line', 'sectors']
+        # Fields that change lap/sector timing of every session on the track
+        timing_fields = ['start_line', 'sectors']
+        timing_changed = False
         for field in allowed_fields:
             if field in updates:
+                if field in timing_fields and track_data.get(field) != updates[field]:
+                    timing_changed = True
                 track_data[field] = updates[field]
                 
         with open(track_file, 'w') as f:
             json.dump(track_data, f)
+        
+        response = {"success": True, "track": track_data}
+        if timing_changed:
+            response["retime"] = run_track_retime(track_id)
+        # Map shows name / start line / sectors: pre-render the new version in the background
+        render_track_map(track_dir)
             
-        return jsonify({"success": True, "track": track_data})
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def run_track_retime(track_id):
+    """
+    Re-time every session of a track (laps, sectors, tbl.json) and refresh
+    the leaderboard columns in the DB. Returns the retimer summary.
+    """
+    script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../core/retime_track.py'))
+    result = subprocess.run([
+        'python3', script_path, str(track_id)
+    ], capture_output=True, text=True, timeout=600)
+    
+    lines = result.stdout.strip().splitlines()
+    try:
+        summary = json.loads(lines[-1]) if lines else {}
+    except json.JSONDecodeError:
+        summary = {}
+    if result.returncode != 0 or not summary:
+        return {"error": summary.get("error") or result.stderr[-200:] or "Re-timing failed"}
+    
+    # Leaderboards read SessionMeta, so keep it in sync with the re-timed artifacts
+    for session_id, stats in summary.get("sessions", {}).items():
+        sm = SessionMeta.query.filter_by(session_id=session_id).first()
+        if sm:
+            sm.best_lap_time = stats.get("best_lap_time")
+            sm.total_laps = stats.get("total_laps")
+    db.session.commit()
+    
+    return {
+        "sessions": len(summary.get("sessions", {})),
+        "failed": summary.get("failed", []),
+        "theoretical_best": summary.get("tbl_total_best_time")
+    }
+
+@app.route('/api/tracks/<int:track_id>/retime', methods=['POST'])
+@jwt_required()
+def retime_track(track_id):
+    """Re-time all sessions of a track after its start line or sectors changed"""
+    user_id = get_jwt_identity()
+    if not get_track_folder(track_id, user_id=user_id):
+        return jsonify({"error": "Track not found"}), 404
+    
+    try:
+        retime = run_track_retime(track_id)
+        if "error" in retime:
+            return jsonify(retime), 500
+        return jsonify({"success": True, **retime})
+    except subprocess.TimeoutExpired:
+        return jsonify({"error": "Re-timing timeout"}), 500
+
 @app.route('/api/tracks/<int:track_id>/map')
 @jwt_required()
 def get_track_map(track_id):
@@ -1355,12 +1415,48 @@ def get_track_map(track_id):
     if not folder:
         return jsonify({"error": "Track not found"}), 404
     
-    map_file = config.TRACKS_DIR / folder / "track_map.png"
-    if not map_file.exists():
-        return jsonify({"error": "Map not found"}), 404
+    track_dir = config.TRACKS_DIR / folder
+    map_file = render_track_map(track_dir, wait=True)
+    if not map_file:
+        # Legacy tracks without geometry.json keep their pre-rendered image
+        map_file = track_dir / "track_map.png"
+        if not map_file.exists():
+            return jsonify({"error": "Map not found"}), 404
     
     return send_file(map_file, mimetype='image/png')
 
+# Track maps are rendered off the request/analysis path on a single worker
+# (matplotlib is imported there on first use) and cached by content hash.
+from concurrent.futures import ThreadPoolExecutor
+map_render_pool = ThreadPoolExecutor(max_workers=1)
+map_render_jobs = {}  # cached map path -> Future
+
+def render_track_map(track_dir, wait=False, timeout=60):
+    """
+    Returns the cached map path for a track, scheduling a render if it is stale.
+    With wait=False the render runs in the background and None is returned.
+    """
+    from src.analysis.core.track_visualizer import TrackVisualizer
+    
+    map_path = TrackVisualizer.cached_map_path(str(track_dir))
+    if not map_path:
+        return None
+    if os.path.exists(map_path):
+        return map_path
+    
+    job = map_render_jobs.get(map_path)
+    if job is None or job.done():
+        job = map_render_pool.submit(TrackVisualizer.render_cached, str(track_dir))
+        map_render_jobs[map_path] = job
+        job.add_done_callback(lambda _: map_render_jobs.pop(map_path, None))
+    if not wait:
+        return None
+    try:
+        return job.result(timeout=timeout)
+    except Exception as e:
+        print(f"[API] Map render failed for {track_dir}: {e}")
+        return None
+
 @app.route('/api/sessions')
 @jwt_required()
 def get_sessions():
@@ -1638,6 +1734,29 @@ def get_public_sessions():
     return jsonify(sessions)
 
 
+def convert_binary_log(raw, filename):
+    """
+    Decodes a binary device log (.rsl) into <name>.csv in the learning folder.
+    Returns the CSV path, or None if the data is not a valid log.
+    """
+    from src.analysis.ingestion.binary_loader import BinaryLogLoader
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    csv_path = config.LEARNING_DIR / f"{stem}.csv"
+    tmp_path = config.LEARNING_DIR / f".{stem}.rsl.part"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(raw)
+        rows = BinaryLogLoader().to_csv(str(tmp_path), str(csv_path))
+        print(f"[Upload] Decoded {filename}: {rows} samples -> {csv_path.name}")
+        return csv_path
+    except (ValueError, OSError) as e:
+        print(f"[Upload] Failed to decode {filename}: {e}")
+        return None
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """Receiver for ESP32 raw CSV uploads"""
@@ -1650,32 +1769,116 @@ def upload_file():
             return jsonify({"error": "filename and content required"}), 400
             
         safe_name = os.path.basename(filename)
-        # Enforce .csv extension for safety
-        if not safe_name.lower().endswith('.csv'):
-             safe_name += '.csv'
-             
-        save_path = config.LEARNING_DIR / safe_name
+        if data.get('encoding') == 'base64':
+            import base64
+            try:
+                raw = base64.b64decode(content)
+            except Exception:
+                return jsonify({"error": "invalid base64 content"}), 400
+            # Sessions compressed on the device arrive as zlib streams
+            if data.get('content_encoding') == 'deflate':
+                import zlib
+                try:
+                    raw = zlib.decompress(raw)
+                except zlib.error:
+                    return jsonify({"error": "invalid deflate content"}), 400
+                if not safe_name.lower().endswith('.rsl'):
+                    content = raw.decode('utf-8', 'replace') # Compressed CSV
+                    raw = None
+        else:
+            raw = None
         
-        # Determine write mode (append if chunked? No, typical upload is one shot for now)
-        # ESP32 sends whole file string.
+        return store_upload(safe_name, raw, content)
         
-        with open(save_path, 'w') as f:
-            f.write(content)
-            
-        # AUTO-TRIGGER Analysis for seamless experience
+    except Exception as e:
+        print(f"Upload Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/upload/stream/<filename>', methods=['PUT'])
+def upload_stream(filename):
+    """
+    Chunked upload from the device (firmware/lib/uploader.py). Each request
+    carries the next part of the stored file: X-Upload-Offset is where it
+    starts, X-Upload-Total the stored size. Chunks are appended to a part
+    file in UPLOAD_DIR; an offset past what is held gets a 409 with the
+    offset to resume from. The last chunk completes the upload.
+    """
+    safe_name = os.path.basename(filename)
+    try:
+        offset = int(request.headers.get('X-Upload-Offset', '0'))
+        total = int(request.headers['X-Upload-Total'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "X-Upload-Offset and X-Upload-Total required"}), 400
+
+    part = config.UPLOAD_DIR / f"{safe_name}.part"
+    have = part.stat().st_size if part.exists() else 0
+    if offset > have or offset < 0:
+        return jsonify({"error": "offset not held", "offset": have}), 409
+
+    chunk = request.get_data()
+    if offset + len(chunk) > total:
+        return jsonify({"error": "chunk past total size", "offset": offset}), 400
+    # A chunk resent after a lost answer overwrites the same bytes
+    with open(part, 'r+b' if have else 'wb') as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(chunk)
+    have = offset + len(chunk)
+    if have < total:
+        return jsonify({"offset": have})
+
+    raw = part.read_bytes()
+    part.unlink()
+    if request.headers.get('X-Content-Encoding') == 'deflate':
+        import zlib
+        try:
+            raw = zlib.decompress(raw)
+        except zlib.error:
+            return jsonify({"error": "invalid deflate content"}), 400
+    print(f"[Upload] Received {safe_name} in chunks ({total} B)")
+    content = None
+    if not safe_name.lower().endswith('.rsl'):
+        content = raw.decode('utf-8', 'replace')
+        raw = None
+    return store_upload(safe_name, raw, content, complete=True)
+
+
+def store_upload(safe_name, raw, content, **extra):
+    """Save an uploaded session (raw .rsl bytes or CSV text) and start its analysis"""
+    # Binary device logs (.rsl) are stored as CSV
+    if raw is not None:
+        save_path = convert_binary_log(raw, safe_name)
+        if save_path is None:
+            return jsonify({"error": "invalid binary log"}), 400
+        safe_name = save_path.name
         try:
             script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../core/run_analysis.py'))
-            # Run in background to not block the ESP32 handshake
             subprocess.Popen(['python3', script_path, str(save_path)])
             print(f"[Upload] Auto-triggered analysis for {safe_name}")
         except Exception as ae:
             print(f"[Upload] Failed to auto-trigger analysis: {ae}")
-            
-        return jsonify({"success": True, "filename": safe_name, "auto_analysis": True})
+        return jsonify({"success": True, "filename": safe_name, "auto_analysis": True, **extra})
+
+    # Enforce .csv extension for safety
+    if not safe_name.lower().endswith('.csv'):
+         safe_name += '.csv'
+         
+    save_path = config.LEARNING_DIR / safe_name
+    
+    with open(save_path, 'w') as f:
+        f.write(content)
         
-    except Exception as e:
-        print(f"Upload Error: {e}")
-        return jsonify({"error": str(e)}), 500
+    # AUTO-TRIGGER Analysis for seamless experience
+    try:
+        script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../core/run_analysis.py'))
+        # Run in background to not block the ESP32 handshake
+        subprocess.Popen(['python3', script_path, str(save_path)])
+        print(f"[Upload] Auto-triggered analysis for {safe_name}")
+    except Exception as ae:
+        print(f"[Upload] Failed to auto-trigger analysis: {ae}")
+        
+    return jsonify({"success": True, "filename": safe_name, "auto_analysis": True, **extra})
 
 
 def register_new_sessions(user_id):
@@ -1790,56 +1993,319 @@ def process_session():
             "message": str(e)
         }), 500
 
+def iter_device_bundle(resp):
+    """
+    Parses a streamed /bundle response from the device (format in
+    firmware/lib/miniserver.py). Yields (header, data, crc_ok) per file,
+    with sessions compressed on the device already inflated.
+    """
+    import zlib
+    chunks = resp.iter_content(chunk_size=65536)
+    buf = bytearray()
+
+    def fill(n):
+        # Grow buf to at least n bytes; False when the stream ends first
+        while len(buf) < n:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return False
+            buf.extend(chunk)
+        return True
+
+    while True:
+        while b"\n" not in buf:
+            if not fill(len(buf) + 1):
+                if buf:
+                    raise ValueError("Bundle truncated in a file header")
+                return
+        line_end = buf.index(b"\n")
+        head = json.loads(bytes(buf[:line_end]))
+        del buf[:line_end + 1]
+        size = head['size']
+        if not fill(size + 9):
+            raise ValueError(f"Bundle truncated in {head['name']}")
+        data = bytes(buf[:size])
+        crc_ok = int(bytes(buf[size:size + 8]), 16) == zlib.crc32(data) & 0xFFFFFFFF
+        del buf[:size + 9]
+        if crc_ok and head.get('encoding') == 'deflate':
+            data = zlib.decompress(data)
+        yield head, data, crc_ok
+
+
+def download_device_file(http, device_ip, fname, offset=0, expected=None, attempts=3):
+    """
+    Fetches a session file from the device from `offset` on (Range), resuming
+    after a dropped connection until `expected` stored bytes are in when that
+    is known. Returns (bytes as stored on the device, Content-Encoding) or
+    (None, None). Older firmware ignores Range: a 200 reply restarts at 0 and
+    the bytes before `offset` are dropped once the whole file is in.
+    """
+    data = bytearray()
+    start = offset
+    encoding = None
+    for attempt in range(attempts):
+        pos = start + len(data)
+        headers = {"Range": f"bytes={pos}-"} if pos else {}
+        try:
+            with http.get(f"http://{device_ip}/download/{fname}", headers=headers, stream=True, timeout=10) as r:
+                if r.status_code == 200:
+                    data = bytearray() # Whole file
+                    start = 0
+                elif r.status_code != 206:
+                    print(f"[Sync] {fname}: device returned {r.status_code}")
+                    return None, None
+                encoding = r.headers.get('Content-Encoding')
+                # Stored bytes as sent (ranges and the manifest CRC count compressed bytes)
+                for chunk in r.raw.stream(65536, decode_content=False):
+                    data.extend(chunk)
+            if expected is None or start + len(data) >= expected:
+                break
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            # r.raw.stream() raises urllib3 errors (ProtocolError, ReadTimeoutError) on a cut body
+            print(f"[Sync] {fname}: {e} after {len(data)} B, resuming")
+    else:
+        return None, None
+    if start != offset:
+        # Asked for a tail, got the whole file (firmware without Range): keep the tail
+        if len(data) < offset:
+            return None, None
+        del data[:offset]
+    return bytes(data), encoding
+
+
+def load_device_sync_state():
+    """Per device file: bytes held locally {name: {"size", "crc32", ("z_size", "z_crc32")}}."""
+    path = config.DEVICE_SYNC_DIR / "state.json"
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_device_sync_state(state):
+    path = config.DEVICE_SYNC_DIR / "state.json"
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def device_copy_path(fname):
+    """Local copy of a device log: CSV logs are the learning copy itself, .rsl logs are kept raw for decoding."""
+    safe = os.path.basename(fname)
+    if safe.lower().endswith('.rsl'):
+        return config.DEVICE_SYNC_DIR / safe
+    return config.LEARNING_DIR / safe
+
+
 @app.route('/api/sync/device', methods=['POST'])
 def sync_device():
-    """Pull CSV files from ESP32 Device"""
+    """
+    Pull session files from ESP32 Device (append-aware).
+    With the /list manifest (size, crc32, closed per file) only new bytes
+    are fetched: the server remembers what it holds of each file and asks
+    for the tail with Range. A file is deleted on the device only after
+    /sync/ack, where the device checks the CRC of what the server holds.
+    """
     import requests
+    import zlib
     data = request.get_json() or {}
     device_ip = data.get('ip', '192.168.4.1') # Default to AP IP
+    http = requests.Session() # Keep-alive: one connection for the whole sync
     
-    # 1. Get List
+    # 1. Get List (+ manifest from newer firmware; the device computes CRCs
+    # it has not cached yet, so allow time)
     try:
         print(f"Syncing from {device_ip}...")
-        resp = requests.get(f"http://{device_ip}/list", timeout=10)
+        resp = http.get(f"http://{device_ip}/list", timeout=30)
         if resp.status_code != 200:
             return jsonify({"error": f"Device Error: {resp.status_code}"}), 400
-            
-        files = resp.json().get('files', [])
+        
+        listing = resp.json()
+        files = listing.get('files', [])
+        manifest = {e['name']: e for e in listing.get('sessions', [])}
     except Exception as e:
         return jsonify({"error": f"Failed to connect to device: {e}"}), 500
 
+    if not manifest:
+        return sync_device_legacy(http, device_ip, files)
+
+    state = load_device_sync_state()
     synced = []
     failed = []
+    deleted = []
+    transferred = 0
+    
+    def ingest(fname, raw, append):
+        """Update the local copy (appending a tail) and the learning CSV."""
+        path = device_copy_path(fname)
+        with open(path, 'ab' if append else 'wb') as f:
+            f.write(raw)
+        if fname.lower().endswith('.rsl'):
+            # Binary device log: (re)decode the whole copy to CSV
+            with open(path, 'rb') as f:
+                if convert_binary_log(f.read(), fname) is None:
+                    return False
+        return True
+    
+    def store_whole(fname, raw, entry):
+        """A whole file as stored on the device (inflated if it was compressed there)."""
+        rec = {}
+        if entry.get('encoding') == 'deflate':
+            rec = {"z_size": len(raw), "z_crc32": zlib.crc32(raw) & 0xFFFFFFFF}
+            raw = zlib.decompress(raw)
+        rec.update(size=len(raw), crc32=zlib.crc32(raw) & 0xFFFFFFFF)
+        if not ingest(fname, raw, append=False):
+            return False
+        state[fname] = rec
+        return True
+    
+    def fetch_tail(fname, have, crc, entry):
+        """Stored bytes from `have` on, checked against the manifest. Returns (tail, crc of the whole) or (None, None)."""
+        tail, _ = download_device_file(http, device_ip, fname, offset=have, expected=entry['size'])
+        if tail is None:
+            return None, None
+        crc = zlib.crc32(tail, crc) & 0xFFFFFFFF
+        total = have + len(tail)
+        if total < entry['size'] or (total == entry['size'] and crc != entry['crc32']):
+            return None, None # (Longer: the file grew after /list, nothing to check against)
+        return tail, crc
+    
+    # 2a. Files new to the server and closed on the device: one streamed /bundle
+    fresh = [f for f in files if f in manifest and f not in state
+             and manifest[f].get('closed', True) and manifest[f].get('size')]
+    if fresh:
+        try:
+            with http.get(f"http://{device_ip}/bundle", params={"files": ",".join(fresh)},
+                          stream=True, timeout=10) as r:
+                if r.status_code == 200:
+                    for head, raw, crc_ok in iter_device_bundle(r):
+                        fname = head['name']
+                        entry = manifest.get(fname)
+                        if not entry or not crc_ok or head['size'] != entry['size']:
+                            print(f"[Sync] {fname}: bad bundle entry, retrying alone")
+                            continue
+                        rec = {}
+                        if head.get('encoding') == 'deflate':
+                            rec = {"z_size": entry['size'], "z_crc32": entry['crc32']}
+                        rec.update(size=len(raw), crc32=zlib.crc32(raw) & 0xFFFFFFFF)
+                        if ingest(fname, raw, append=False):
+                            state[fname] = rec
+                            synced.append(fname)
+                            transferred += head['size']
+                            print(f"[Sync] {fname}: {head['size']} B (bundle)")
+        except Exception as e:
+            print(f"[Sync] Bundle interrupted ({e}), falling back to single downloads")
     
-    # 2. Download Each
+    # 2b. Everything else: only what the server does not hold yet
     for fname in files:
+        entry = manifest.get(fname)
+        if entry is None:
+            continue
+        rec = state.get(fname)
         try:
-            print(f"Downloading {fname}...")
-            r = requests.get(f"http://{device_ip}/download/{fname}", stream=True, timeout=10)
-            if r.status_code == 200:
-                save_path = config.LEARNING_DIR / fname
-                with open(save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=1024):
-                        if chunk: f.write(chunk)
-                        
-                synced.append(fname)
-                
-                # 3. Delete from Device (Move from ESP to Pi)
-                try:
-                    time.sleep(0.2) # Small breather for ESP32
-                    del_resp = requests.get(f"http://{device_ip}/delete/{fname}", timeout=5)
-                    if del_resp.status_code == 200:
-                        print(f"[Sync] Successfully deleted {fname} from ESP32")
-                    else:
-                        print(f"[Sync] Failed to delete {fname} from ESP32: {del_resp.status_code}")
-                except Exception as de:
-                    print(f"[Sync] Error deleting {fname} from ESP32: {de}")
+            if entry.get('encoding') == 'deflate':
+                # Compressed on the device (closed): whole file, unless held already
+                if not rec or rec.get('z_crc32') != entry['crc32']:
+                    raw, _ = download_device_file(http, device_ip, fname, expected=entry['size'])
+                    if raw is None or (zlib.crc32(raw) & 0xFFFFFFFF) != entry['crc32']:
+                        print(f"[Sync] {fname}: download failed or CRC mismatch")
+                        failed.append(fname)
+                        continue
+                    if not store_whole(fname, raw, entry):
+                        failed.append(fname)
+                        continue
+                    synced.append(fname)
+                    transferred += len(raw)
             else:
-                failed.append(fname)
+                have = rec['size'] if rec and rec['size'] <= entry['size'] else 0
+                if not (rec and have == entry['size'] and rec['crc32'] == entry['crc32']):
+                    tail, crc = fetch_tail(fname, have, rec['crc32'] if have else 0, entry)
+                    if tail is None and have:
+                        # Our copy is not a prefix of the device file: start over
+                        print(f"[Sync] {fname}: local copy diverged, fetching it whole")
+                        have = 0
+                        tail, crc = fetch_tail(fname, 0, 0, entry)
+                    if tail is None or not ingest(fname, tail, append=have > 0):
+                        failed.append(fname)
+                        continue
+                    state[fname] = {"size": have + len(tail), "crc32": crc}
+                    synced.append(fname)
+                    transferred += len(tail)
+                    print(f"[Sync] {fname}: +{len(tail)} B at {have}")
+                elif not entry.get('closed', True) and entry.get('synced') == have:
+                    continue # Open file, nothing new, device already knows what we hold
         except Exception as e:
             print(f"Error downloading {fname}: {e}")
             failed.append(fname)
+            continue
+        finally:
+            save_device_sync_state(state)
+        
+        # 3. Ack: the device checks our checksum, then deletes a closed file
+        # (or remembers how much of an open one we hold)
+        rec = state[fname]
+        ack = {"file": fname, "size": rec.get('z_size', rec['size']), "crc32": rec.get('z_crc32', rec['crc32'])}
+        try:
+            ack_resp = http.post(f"http://{device_ip}/sync/ack", json=ack, timeout=30)
+            if ack_resp.status_code == 200 and ack_resp.json().get('deleted'):
+                deleted.append(fname)
+                state.pop(fname, None)
+                if fname.lower().endswith('.rsl'):
+                    device_copy_path(fname).unlink(missing_ok=True) # Decoded CSV stays in learning
+                print(f"[Sync] {fname}: confirmed, deleted on device")
+            elif ack_resp.status_code == 409:
+                print(f"[Sync] {fname}: device checksum differs, refetching next sync")
+                state.pop(fname, None)
+        except Exception as ae:
+            print(f"[Sync] Ack failed for {fname}: {ae}")
+    save_device_sync_state(state)
+            
+    return jsonify({
+        "success": True,
+        "synced": synced,
+        "failed": failed,
+        "deleted": deleted,
+        "bytes": transferred,
+        "device_ip": device_ip
+    })
+
+
+def sync_device_legacy(http, device_ip, files):
+    """Firmware without a /list manifest: whole files, deleted right after download."""
+    synced = []
+    failed = []
+    for fname in files:
+        try:
+            print(f"Downloading {fname}...")
+            raw, encoding = download_device_file(http, device_ip, fname)
+            if raw is None:
+                failed.append(fname)
+                continue
+            if fname.lower().endswith('.rsl'):
+                # Binary device log: decode straight to CSV
+                if convert_binary_log(raw, fname) is None:
+                    failed.append(fname)
+                    continue
+            else:
+                with open(config.LEARNING_DIR / os.path.basename(fname), 'wb') as f:
+                    f.write(raw)
+            synced.append(fname)
             
+            # Delete from Device (Move from ESP to Pi)
+            try:
+                time.sleep(0.2) # Small breather for ESP32
+                del_resp = http.get(f"http://{device_ip}/delete/{fname}", timeout=5)
+                if del_resp.status_code == 200:
+                    print(f"[Sync] Successfully deleted {fname} from ESP32")
+                else:
+                    print(f"[Sync] Failed to delete {fname} from ESP32: {del_resp.status_code}")
+            except Exception as de:
+                print(f"[Sync] Error deleting {fname} from ESP32: {de}")
+        except Exception as e:
+            print(f"Error downloading {fname}: {e}")
+            failed.append(fname)
     return jsonify({
         "success": True,
         "synced": synced,
@@ -2132,6 +2598,19 @@ def device_version_check():
         
     local_v = get_local_firmware_version()
     
+    # Differential OTA firmware: compare per-file hashes, not just the version string
+    try:
+        diff = update_mgr.check(ip)
+        if diff is not None:
+            diff.update({
+                "server_version": local_v,
+                "update_available": bool(diff["changed_files"] or diff["delete_files"]),
+                "is_compatible": is_compatible(diff["device_version"])
+            })
+            return jsonify(diff)
+    except (requests.RequestException, ValueError, RuntimeError) as e:
+        print(f"[OTA] Manifest check failed for {ip}: {e}")
+    
     try:
         r = requests.get(f"http://{ip}/status", timeout=5)
         if r.status_code == 200:
@@ -2155,7 +2634,7 @@ def device_update_ota():
         return jsonify({"error": "No IP provided"}), 400
         
     print(f"[OTA] Starting update for {ip}...")
-    result = update_mgr.push_update(ip)
+    result = update_mgr.push_update(ip, version=get_local_firmware_version())
     print(f"[OTA] Result: {result}")
     
     return jsonify(result)
@@ -2258,17 +2737,182 @@ def internal_error(e):
 @app.route('/api/tracks/<int:track_id>/geometry')
 @jwt_required()
 def get_track_geometry(track_id):
-    """Serve the geometry.json file for a track."""
+    """
+    Serve track geometry at one simplification level.
+    ?level=N picks a Douglas-Peucker level (0 = most detailed, higher = coarser, for
+    thumbnails / zoomed-out maps). Legacy geometry.json without levels is served as-is.
+    """
     user_id = get_jwt_identity()
     folder_name = get_track_folder(track_id, user_id=user_id)
     if not folder_name:
          return jsonify({"error": "Track not found"}), 404
          
     geo_path = OUTPUT_DIR / "tracks" / folder_name / "geometry.json"
-    if geo_path.exists():
-        return send_file(geo_path)
+    if not geo_path.exists():
+        return jsonify({"error": "Geometry not found. Please regenerate track."}), 404
+    
+    with open(geo_path, 'r') as f:
+        geometry = json.load(f)
+    
+    levels = geometry.get("levels")
+    if not levels:
+        return jsonify(geometry)
+    
+    level = min(max(request.args.get('level', 0, type=int), 0), len(levels) - 1)
+    return jsonify({
+        "coordinates": levels[level]["coordinates"],
+        "sector_indices": levels[level]["sector_indices"],
+        "level": level,
+        "tolerance_m": levels[level]["tolerance_m"],
+        "level_count": len(levels)
+    })
+
+def load_reference_lap(track_id, user_id, folder_name):
+    """
+    Reference lap for the device's live lap delta: the user's best lap on this
+    track, resampled by distance into compact int arrays. Cached in the track
+    folder until a faster session becomes the best.
+    Returns (ref, error).
+    """
+    from src.analysis.processing.track_geometry import GeometryBuilder
     
-    return jsonify({"error": "Geometry not found. Please regenerate track."}), 404
+    best = SessionMeta.query.filter(
+        SessionMeta.user_id == user_id,
+        SessionMeta.track_id == track_id,
+        SessionMeta.best_lap_time > 0
+    ).order_by(SessionMeta.best_lap_time).first()
+    if not best:
+        return None, "No timed laps on this track"
+    
+    cache_path = OUTPUT_DIR / "tracks" / folder_name / "reference_lap.json"
+    if cache_path.exists():
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get("session_id") == best.session_id:
+            return cached, None
+    
+    s_path = config.SESSIONS_DIR / f"{best.session_id}.json"
+    t_path = config.SESSIONS_DIR / f"{best.session_id}_telemetry.json"
+    if not s_path.exists() or not t_path.exists():
+        return None, "Best session data not found"
+    
+    with open(s_path, 'r') as f:
+        s_data = json.load(f)
+    laps = [l for l in s_data.get('laps', []) if l.get('lap_time') and l.get('valid', True)]
+    if not laps:
+        return None, "No valid laps in best session"
+    lap = min(laps, key=lambda l: l['lap_time'])
+    
+    with open(t_path, 'r') as f:
+        telemetry = json.load(f)
+    start = lap.get('start_time', 0.0)
+    end = start + lap['lap_time'] + 0.001  # Times are rounded to ms
+    idx = [i for i, t in enumerate(telemetry.get('time', [])) if start - 0.001 <= t <= end]
+    
+    ref = GeometryBuilder.reference_lap([telemetry['time'][i] for i in idx],
+                                        [telemetry['lat'][i] for i in idx],
+                                        [telemetry['lon'][i] for i in idx])
+    if not ref:
+        return None, "Best lap too short for a reference"
+    
+    ref = {**ref, "session_id": best.session_id, "lap_number": lap.get('lap_number')}
+    try:
+        with open(cache_path, 'w') as f:
+            json.dump(ref, f)
+    except IOError as e:
+        print(f"[API] Reference lap cache write failed: {e}")
+    return ref, None
+
+def build_device_track(track_id, user_id):
+    """
+    /track/set payload for the device track library, with an ETag over its
+    content (the device skips tracks whose ETag it already stores).
+    Returns None if the track has no track.json.
+    """
+    import hashlib
+    
+    folder_name = get_track_folder(track_id, user_id=user_id)
+    if not folder_name:
+        return None
+    track_dir = config.TRACKS_DIR / folder_name
+    track_file = track_dir / "track.json"
+    if not track_file.exists():
+        return None
+    with open(track_file, 'r') as f:
+        track_data = json.load(f)
+    
+    # TBL: sector index (string) -> best time
+    tbl = {}
+    tbl_file = track_dir / "tbl.json"
+    if tbl_file.exists():
+        with open(tbl_file, 'r') as f:
+            tbl_data = json.load(f)
+        for idx, s in enumerate(tbl_data.get('sectors', [])):
+            if isinstance(s, dict):
+                if s.get('best_time') is not None:
+                    tbl[str(s.get('sector_index', idx))] = s['best_time']
+            elif s is not None:
+                tbl[str(idx)] = s
+    
+    payload = {
+        "id": str(track_id),
+        "name": track_data.get('track_name'),
+        "start_line": {
+            "lat": track_data['start_line']['lat'],
+            "lon": track_data['start_line']['lon'],
+            "radius_m": 20
+        },
+        "sectors": [{"idx": idx, "end_lat": s.get('end_lat'), "end_lon": s.get('end_lon')}
+                    for idx, s in enumerate(track_data.get('sectors', []))],
+        "tbl": tbl
+    }
+    if track_data.get('pit_center_lat') is not None:
+        payload["pit_center_lat"] = track_data['pit_center_lat']
+        payload["pit_center_lon"] = track_data['pit_center_lon']
+        payload["pit_radius_m"] = track_data.get('pit_radius_m') or 50
+    
+    ref, _ = load_reference_lap(track_id, user_id, folder_name)
+    if ref:
+        payload["ref"] = {k: v for k, v in ref.items() if k not in ("session_id", "lap_number")}
+    
+    payload["etag"] = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+    return payload
+
+@app.route('/api/tracks/<int:track_id>/reference')
+@jwt_required()
+def get_track_reference(track_id):
+    """Reference lap for the device's live lap delta (see load_reference_lap)"""
+    user_id = get_jwt_identity()
+    folder_name = get_track_folder(track_id, user_id=user_id)
+    if not folder_name:
+        return jsonify({"error": "Track not found"}), 404
+    
+    ref, error = load_reference_lap(track_id, user_id, folder_name)
+    if error:
+        return jsonify({"error": error}), 404
+    return jsonify(ref)
+
+@app.route('/api/tracks/<int:track_id>/device')
+@jwt_required()
+def get_device_track(track_id):
+    """One track formatted for the device's /track/set"""
+    payload = build_device_track(track_id, get_jwt_identity())
+    if not payload:
+        return jsonify({"error": "Track not found"}), 404
+    return jsonify(payload)
+
+@app.route('/api/tracks/device')
+@jwt_required()
+def get_device_library():
+    """All of the user's tracks formatted for the device track library"""
+    user_id = get_jwt_identity()
+    tracks = []
+    for t in TrackMeta.query.filter_by(user_id=user_id).all():
+        payload = build_device_track(t.track_id, user_id)
+        if payload:
+            tracks.append(payload)
+    return jsonify({"tracks": tracks})
+
 @app.route('/api/sessions/<session_id>', methods=['DELETE'])
 @jwt_required()
 def delete_session_endpoint(session_id):
@@ -2393,6 +3037,9 @@ def rename_learning_file():
             return jsonify({"error": "A file with that name already exists"}), 400
             
         os.rename(src, dst)
+        # Keep the high-rate IMU sidecar (.imu) with its CSV
+        if src.with_suffix('.imu').exists():
+            os.rename(src.with_suffix('.imu'), dst.with_suffix('.imu'))
         return jsonify({"success": True, "new_name": new_name})
         
     except Exception as e:
@@ -1,15 +1,35 @@
 import os
+import sys
+import time
+import shutil
+import hashlib
+import subprocess
 import requests
 import json
 from pathlib import Path
 
+# .mpy cross-compiler: `pip install mpy-cross` (version matching the device's
+# MicroPython) or an mpy-cross binary on PATH / in $MPY_CROSS. Without one the
+# firmware is sent as source, as before.
+try:
+    import mpy_cross
+except ImportError:
+    mpy_cross = None
+
+SOURCE_ONLY = ("main.py", "boot.py")  # Run by name on the device: never compiled
+
+
 class UpdateManager:
-    def __init__(self, firmware_dir):
+    def __init__(self, firmware_dir, build_dir=None):
         """
         :param firmware_dir: Path to firmware/esp32 directory containing main.py, boot.py, lib/
+        :param build_dir: Where compiled .mpy files are cached (differential OTA)
         """
         self.firmware_dir = Path(firmware_dir)
         
+        self.build_dir = Path(build_dir) if build_dir else self.firmware_dir / ".ota_build"
+        self.mpy_cross = os.environ.get("MPY_CROSS") or shutil.which("mpy-cross")
+
     def get_file_list(self):
         """List all core files that should be synced to ESP32."""
         files = []
@@ -42,8 +62,190 @@ class UpdateManager:
                 
         return files
 
-    def push_update(self, device_ip, progress_callback=None):
-        """Push all firmware files to device via WiFi."""
+    # ------------------------------------------------------------------
+    # Differential OTA (firmware/lib/ota.py)
+    # ------------------------------------------------------------------
+
+    def can_compile(self):
+        return bool(self.mpy_cross or mpy_cross)
+
+    def compile_file(self, src, remote_path):
+        """Cross-compile one module to .mpy in the build dir (cached by mtime). Returns its path."""
+        out = self.build_dir / (remote_path[:-3] + ".mpy")
+        if out.exists() and out.stat().st_mtime >= src.stat().st_mtime:
+            return out
+        out.parent.mkdir(parents=True, exist_ok=True)
+        # -s: source name in tracebacks as on the device
+        args = ["-s", remote_path, "-o", str(out), str(src)]
+        if self.mpy_cross:
+            proc = subprocess.run([self.mpy_cross] + args, capture_output=True, text=True)
+        else:
+            proc = subprocess.run([sys.executable, "-m", "mpy_cross"] + args, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"mpy-cross failed for {remote_path}: {proc.stderr.strip()}")
+        return out
+
+    def build(self):
+        """
+        Files to install: {remote_path: {"local_path", "sha256", "size"}}.
+        Modules become .mpy when a cross-compiler is available.
+        """
+        compile_mpy = self.can_compile()
+        if not compile_mpy:
+            print("[OTA] mpy-cross not found: sending modules as source")
+        out = {}
+        for f_info in self.get_file_list():
+            local_path = f_info['local_path']
+            remote_path = f_info['remote_path']
+            if compile_mpy and remote_path not in SOURCE_ONLY:
+                local_path = self.compile_file(local_path, remote_path)
+                remote_path = remote_path[:-3] + ".mpy"
+            data = local_path.read_bytes()
+            out[remote_path] = {
+                "local_path": local_path,
+                "sha256": hashlib.sha256(data).hexdigest(),
+                "size": len(data)
+            }
+        return out
+
+    def get_device_manifest(self, device_ip, http=None):
+        """Installed files and hashes ({"version", "files", "state"}), or None for firmware without OTA manifests."""
+        r = (http or requests).get(f"http://{device_ip}/ota/manifest", timeout=15)
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.json()
+
+    @staticmethod
+    def plan(build, device_files):
+        """
+        Files to send (hash differs or missing) and device files to delete:
+        the other form (.py / .mpy) of a module being installed, which would
+        otherwise shadow it (MicroPython imports x.py before x.mpy). Anything
+        else on the device (libraries installed with mip) is left alone.
+        """
+        changed = sorted(p for p, info in build.items() if device_files.get(p) != info['sha256'])
+        stems = {p.rsplit('.', 1)[0] for p in build}
+        delete = sorted(p for p in device_files if p not in build and p.rsplit('.', 1)[0] in stems)
+        return changed, delete
+
+    def check(self, device_ip, http=None):
+        """Compare the device's manifest with the current build (for /api/device/version-check)."""
+        manifest = self.get_device_manifest(device_ip, http)
+        if manifest is None:
+            return None
+        build = self.build()
+        changed, delete = self.plan(build, manifest.get('files', {}))
+        return {
+            "device_version": manifest.get('version', '0.0.0'),
+            "changed_files": changed,
+            "delete_files": delete,
+            "update_bytes": sum(build[p]['size'] for p in changed),
+            "full_bytes": sum(info['size'] for info in build.values()),
+            "pending": manifest.get('state')
+        }
+
+    def device_status(self, device_ip, http=None, timeout=5):
+        try:
+            r = (http or requests).get(f"http://{device_ip}/status", timeout=timeout)
+            if r.status_code == 200:
+                return r.json()
+        except requests.RequestException:
+            pass
+        return None
+
+    def wait_for_device(self, device_ip, timeout_s=60):
+        """Poll /status until the rebooted device answers again."""
+        time.sleep(3) # Still shutting down
+        deadline = time.time() + timeout_s
+        while time.time() < deadline:
+            status = self.device_status(device_ip, timeout=3)
+            if status:
+                return status
+            time.sleep(2)
+        return None
+
+    def push_update(self, device_ip, progress_callback=None, version=None):
+        """
+        Send only the files whose hash differs from the device's manifest,
+        commit them (atomic swap on the device, rollback if the new firmware
+        does not come up) and reboot. Devices without /ota/manifest get the
+        full source upload.
+        """
+        http = requests.Session()
+        try:
+            manifest = self.get_device_manifest(device_ip, http)
+        except (requests.RequestException, ValueError) as e:
+            return {"success": False, "total": 0, "success_count": 0, "failed": [f"manifest: {e}"]}
+        if manifest is None:
+            return self.push_update_legacy(device_ip, progress_callback)
+
+        before = self.device_status(device_ip, http)
+        build = self.build()
+        changed, delete = self.plan(build, manifest.get('files', {}))
+        result = {
+            "success": True,
+            "differential": True,
+            "total": len(changed),
+            "success_count": 0,
+            "deleted": delete,
+            "failed": [],
+            "bytes_sent": 0,
+            "full_bytes": sum(info['size'] for info in build.values())
+        }
+        if not changed and not delete:
+            result["up_to_date"] = True
+            return result
+
+        for i, remote_path in enumerate(changed):
+            info = build[remote_path]
+            if progress_callback:
+                progress_callback(i, len(changed), f"Uploading {remote_path}...")
+            try:
+                # Query written out: the device does not URL-decode ("lib/x.mpy")
+                resp = http.post(f"http://{device_ip}/ota/file?path={remote_path}&sha256={info['sha256']}",
+                                 data=info['local_path'].read_bytes(),
+                                 headers={"Content-Type": "application/octet-stream"}, timeout=20)
+                if resp.status_code == 200:
+                    result["success_count"] += 1
+                    result["bytes_sent"] += info['size']
+                else:
+                    result["failed"].append(f"{remote_path}: {resp.status_code}")
+            except requests.RequestException as e:
+                result["failed"].append(f"{remote_path}: {str(e)}")
+
+        if result["failed"]:
+            # Nothing is swapped in: staged files are replaced by the next attempt
+            result["success"] = False
+            return result
+
+        try:
+            resp = http.post(f"http://{device_ip}/ota/commit",
+                             json={"version": version, "files": changed, "delete": delete}, timeout=30)
+            if resp.status_code != 200:
+                result["success"] = False
+                result["failed"].append(f"commit: {resp.status_code} {resp.text}")
+                return result
+        except requests.RequestException as e:
+            result["success"] = False
+            result["failed"].append(f"commit: {str(e)}")
+            return result
+
+        try:
+            http.post(f"http://{device_ip}/reboot", timeout=2)
+        except requests.RequestException:
+            pass # Expected timeout during reboot
+
+        # Boot cost before/after (import time of .py vs .mpy, free heap)
+        after = self.wait_for_device(device_ip)
+        result["boot_before"] = (before or {}).get("boot")
+        result["boot_after"] = (after or {}).get("boot")
+        if after is None:
+            result["warning"] = "Device did not come back; it rolls back after repeated failed boots"
+        return result
+
+    def push_update_legacy(self, device_ip, progress_callback=None):
+        """Push all firmware files to device via WiFi (firmware without /ota/manifest)."""
         files = self.get_file_list()
         total = len(files)
         success_count = 0
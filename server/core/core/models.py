@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Optional
 import bisect
 
@@ -30,6 +30,30 @@ class Sample:
     imu: IMUSample
     env: EnvSample
 
+@dataclass
+class IMUStream:
+    """
+    High-rate IMU samples logged independently of the GPS-rate Samples
+    (drained from the sensor FIFO). Raw units, as in IMUSample.
+    """
+    timestamps: List[float] = field(default_factory=list)
+    accel_x: List[float] = field(default_factory=list)
+    accel_y: List[float] = field(default_factory=list)
+    accel_z: List[float] = field(default_factory=list)
+    gyro_x: List[float] = field(default_factory=list)
+    gyro_y: List[float] = field(default_factory=list)
+    gyro_z: List[float] = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def sample_rate(self) -> float:
+        if len(self.timestamps) < 2:
+            return 0.0
+        span = self.timestamps[-1] - self.timestamps[0]
+        return (len(self.timestamps) - 1) / span if span > 0 else 0.0
+
 class Session:
     """
     A container for a continuous sequence of Samples.
@@ -37,6 +61,7 @@ class Session:
     def __init__(self, description: str = "", samples: List[Sample] = None):
         self.description = description
         self.samples: List[Sample] = samples if samples else []
+        self.imu_stream: Optional[IMUStream] = None # High-rate IMU, if logged
 
     def add_sample(self, sample: Sample):
         self.samples.append(sample)
@@ -86,5 +111,7 @@ class Lap(Session):
             samples=session.samples[start_index:end_index]
         )
         self.lap_number = number
+        self.start_index = start_index # Index range in the parent session
+        self.end_index = end_index
         self.sector_times = {} # {'s1': 23.4, 's2': 45.1}
 
@@ -22,9 +22,11 @@ class SessionExporter:
                 pass # Might not have permissions if running locally vs Pi
 
     def export(self, session: Session, track_info: Dict, tbl_data: Optional[Dict], 
-               best_real_lap_ref: Optional[float] = None, source_file: Optional[str] = None) -> str:
+               best_real_lap_ref: Optional[float] = None, source_file: Optional[str] = None,
+               session_name: Optional[str] = None, source_hash: Optional[str] = None) -> str:
         """
         Builds the JSON and saves it. Returns the file path.
+        If session_name is given, that session is overwritten instead of allocating a new name.
         """
         
         # 1. Meta
@@ -45,6 +47,7 @@ class SessionExporter:
                 "session_id": sess_id,
                 "session_name": session.description,
                 "source_file": source_file,  # Track which CSV produced this session
+                "source_hash": source_hash,  # Content hash of that CSV (de-duplication)
                 "start_time": st_iso,
                 "end_time": et_iso,
                 "duration_sec": round(dur, 2),
@@ -119,7 +122,10 @@ class SessionExporter:
         registry = RegistryManager()
         folder_name = registry.get_folder_name(track_id) or f"track_{track_id}"
         
-        filename = self._generate_session_filename(st_ts, folder_name)
+        if session_name:
+            filename = f"{session_name}.json"
+        else:
+            filename = self._generate_session_filename(st_ts, folder_name)
         
         # Update session_id and session_name to match filename (without .json)
         session_name = filename.replace(".json", "")
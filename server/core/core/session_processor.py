@@ -4,6 +4,7 @@ import datetime
 from typing import Optional
 
 from src.analysis.ingestion.csv_loader import CSVLoader
+from src.analysis.ingestion.binary_loader import BinaryLogLoader
 from src.analysis.core.track_manager import TrackManager
 from src.analysis.core.track_generator import TrackGenerator
 from src.analysis.core.tbl_manager import TBLManager
@@ -13,6 +14,8 @@ from src.analysis.processing.stats import StatsEngine
 from src.analysis.core.registry_manager import RegistryManager
 from src.analysis.core.imu_calibrator import IMUCalibrator
 from src.analysis.processing.metrics_engine import SensorMetricsEngine
+from src.analysis.core.stage_cache import StageCache
+from src.analysis.core.models import Lap
 import src.config as config
 from src.core.log_manager import get_logger
 
@@ -21,15 +24,24 @@ class SessionProcessor:
     Orchestrator for the Post-Session Workflow.
     INPUT: Session/CSV
     OUTPUT: Updated Artifacts (Tracks, TBL, Session JSON)
+
+    Stage outputs (parsed columns, track ID, laps, IMU, metrics, sectors) are
+    cached by CSV content hash + stage parameters, so reprocessing only re-runs
+    the stages whose inputs changed.
     """
 
-    def __init__(self, output_dir=None):
+    # Bump to invalidate cached IMU/metrics results after algorithm changes
+    IMU_STAGE_VERSION = "advanced_imu_v1"
+
+    def __init__(self, output_dir=None, cache_dir=None):
         self.log = get_logger("analysis")
         self.loader = CSVLoader()
+        self.binary_loader = BinaryLogLoader()
         self.tm = TrackManager()
         self.gen = TrackGenerator()
         self.tbl_mgr = TBLManager()
         self.exporter = SessionExporter(output_dir=output_dir)
+        self.cache = StageCache(cache_dir=cache_dir)
 
     def process_session(self, file_path: str, force_track_id: str = None) -> bool:
         """
@@ -39,9 +51,18 @@ class SessionProcessor:
         self.log.info(f"Starting processing for: {filename}", data={"file": file_path})
         
         try:
-            # 1. Load Session
+            # 1. Load Session (cached as columns by content hash)
             try:
-                session = self.loader.load(file_path)
+                csv_hash = self.cache.hash_file(file_path)
+                parse_key = StageCache.parse_key(file_path)
+                cols = self.cache.get(csv_hash, "parse", parse_key)
+                if cols is not None:
+                    session = StageCache.columns_to_session(cols, description=filename)
+                    self.log.info("Parse stage: cache hit", data={"hash": csv_hash[:12]})
+                else:
+                    loader = self.binary_loader if BinaryLogLoader.is_binary_log(file_path) else self.loader
+                    session = loader.load(file_path)
+                    self.cache.put(csv_hash, "parse", parse_key, StageCache.session_to_columns(session))
                 if not session.samples:
                     self.log.warning("Session empty. Skipping.", data={"file": filename})
                     return False
@@ -51,15 +72,26 @@ class SessionProcessor:
 
             # 2. Identify or Generate Track
             track_info = None
-            
-            if force_track_id:
-                # Manual override or Known ID
-                track_info = next((t for t in self.tm.tracks if t["id"] == force_track_id), None)
-                if not track_info:
-                    self.log.warning(f"Forced track '{force_track_id}' not found.")
-            else:
-                # Auto-ID
-                track_info = self.tm.identify_track(session)
+            track_key = self.cache.make_key(
+                force_track_id,
+                sorted((str(t.get("id")), t.get("start_line")) for t in self.tm.tracks)
+            )
+            cached_track_id = self.cache.get(csv_hash, "track", track_key)
+            if cached_track_id is not None:
+                track_info = next((t for t in self.tm.tracks if t.get("id") == cached_track_id), None)
+
+            if not track_info:
+                if force_track_id:
+                    # Manual override or Known ID
+                    track_info = next((t for t in self.tm.tracks if t["id"] == force_track_id), None)
+                    if not track_info:
+                        self.log.warning(f"Forced track '{force_track_id}' not found.")
+                else:
+                    # Auto-ID
+                    track_info = self.tm.identify_track(session)
+
+                if track_info:
+                    self.cache.put(csv_hash, "track", track_key, track_info.get("id"))
             
             # 3. Handle Unknown Track (Auto-Gen)
             if not track_info:
@@ -85,10 +117,17 @@ class SessionProcessor:
             # 4. Lap Detection & Stats
             # Use DB Start Line
             sl = track_info["start_line"]
-            start_line = StartLine(sl["lat"], sl["lon"], sl.get("radius_m", 20.0))
+            laps_key = StageCache.laps_key(sl)
+            lap_ranges = self.cache.get(csv_hash, "laps", laps_key)
             
-            detector = LapDetector(start_line)
-            laps = detector.detect(session)
+            if lap_ranges is not None:
+                laps = [Lap(session, start, end, number=num) for start, end, num in lap_ranges]
+            else:
+                start_line = StartLine(sl["lat"], sl["lon"], sl.get("radius_m", 20.0))
+                detector = LapDetector(start_line)
+                laps = detector.detect(session)
+                self.cache.put(csv_hash, "laps", laps_key,
+                               [[l.start_index, l.end_index, l.lap_number] for l in laps])
             session.laps = laps # Attach to session for exporters
             
             self.log.info(f"Laps Detected: {len(laps)}")
@@ -99,24 +138,43 @@ class SessionProcessor:
             # Extract Raw Signals
             # Note: Values might be missing/None, mapped to 0.0 in CSVLoader but ensure lists are standard
             timestamps = [s.timestamp for s in session.samples]
-            ax_raw = [s.imu.accel_x for s in session.samples]
-            ay_raw = [s.imu.accel_y for s in session.samples]
-            az_raw = [s.imu.accel_z for s in session.samples]
-            
-            gx_raw = [(s.imu.gyro_x if s.imu.gyro_x else 0.0) for s in session.samples]
-            gy_raw = [(s.imu.gyro_y if s.imu.gyro_y else 0.0) for s in session.samples]
-            gz_raw = [(s.imu.gyro_z if s.imu.gyro_z else 0.0) for s in session.samples]
+            stream = session.imu_stream
+            if stream is not None and len(stream) > len(session.samples):
+                # High-rate IMU stream: processed at its own rate, results on GPS timestamps
+                imu_timestamps = stream.timestamps
+                ax_raw, ay_raw, az_raw = stream.accel_x, stream.accel_y, stream.accel_z
+                gx_raw, gy_raw, gz_raw = stream.gyro_x, stream.gyro_y, stream.gyro_z
+                self.log.info(f"Using high-rate IMU stream ({stream.sample_rate:.0f} Hz)")
+            else:
+                imu_timestamps = None
+                ax_raw = [s.imu.accel_x for s in session.samples]
+                ay_raw = [s.imu.accel_y for s in session.samples]
+                az_raw = [s.imu.accel_z for s in session.samples]
+                
+                gx_raw = [(s.imu.gyro_x if s.imu.gyro_x else 0.0) for s in session.samples]
+                gy_raw = [(s.imu.gyro_y if s.imu.gyro_y else 0.0) for s in session.samples]
+                gz_raw = [(s.imu.gyro_z if s.imu.gyro_z else 0.0) for s in session.samples]
             
             lats = [s.gps.lat for s in session.samples]
             lons = [s.gps.lon for s in session.samples]
             speeds = [s.gps.speed for s in session.samples]
 
-            self.log.info("Running Advanced IMU Processing Pipeline...")
+            if imu_timestamps is not None:
+                imu_key = self.cache.make_key(self.IMU_STAGE_VERSION, parse_key)
+            else:
+                imu_key = self.cache.make_key(self.IMU_STAGE_VERSION)
             
             try:
-                imu_proc = AdvancedIMUProcessor()
-                imu_results = imu_proc.process(timestamps, ax_raw, ay_raw, az_raw, gx_raw, gy_raw, gz_raw, 
-                                             speeds=speeds, lats=lats, lons=lons)
+                imu_results = self.cache.get(csv_hash, "imu", imu_key)
+                if imu_results is None:
+                    self.log.info("Running Advanced IMU Processing Pipeline...")
+                    imu_proc = AdvancedIMUProcessor()
+                    imu_results = imu_proc.process(timestamps, ax_raw, ay_raw, az_raw, gx_raw, gy_raw, gz_raw, 
+                                                 speeds=speeds, lats=lats, lons=lons,
+                                                 imu_timestamps=imu_timestamps)
+                    self.cache.put(csv_hash, "imu", imu_key, imu_results)
+                else:
+                    self.log.info("IMU stage: cache hit")
                 
                 # Map results to session signals
                 # Results: lean_angle, pitch_angle, ax_cg, ay_cg, etc.
@@ -142,8 +200,12 @@ class SessionProcessor:
                 
                 # 4.6 Sensor Metrics (Recalculate on clean signals)
                 # Ensure metrics engine handles new clean signals
-                met_engine = SensorMetricsEngine()
-                metrics = met_engine.compute(session)
+                metrics_key = self.cache.make_key(imu_key, laps_key)
+                metrics = self.cache.get(csv_hash, "metrics", metrics_key)
+                if metrics is None:
+                    met_engine = SensorMetricsEngine()
+                    metrics = met_engine.compute(session)
+                    self.cache.put(csv_hash, "metrics", metrics_key, metrics)
                 session.sensor_metrics = metrics
                 
             except Exception as e:
@@ -152,7 +214,14 @@ class SessionProcessor:
                 session.calibration = {"calibrated": False, "reason": str(e)}
 
             # 5. Sector Calculation
-            StatsEngine.calculate_sectors(laps, track_info)
+            sectors_key = StageCache.sectors_key(laps_key, track_info.get("sectors", []))
+            sector_times = self.cache.get(csv_hash, "sectors", sectors_key)
+            if sector_times is not None and len(sector_times) == len(laps):
+                for lap, times in zip(laps, sector_times):
+                    lap.sector_times = times
+            else:
+                StatsEngine.calculate_sectors(laps, track_info)
+                self.cache.put(csv_hash, "sectors", sectors_key, [l.sector_times for l in laps])
             
             # 6. Update Persistent Records (Track JSON & TBL)
             self.log.debug("Track JSON is frozen. Skipping record update.")
@@ -168,9 +237,20 @@ class SessionProcessor:
             # Get Reference BRL
             brl_ref = track_info.get("records", {}).get("best_real_lap", {}).get("time")
             
-            json_path = self.exporter.export(session, track_info, tbl_data, best_real_lap_ref=brl_ref, source_file=filename)
+            # Re-import of identical content: overwrite the existing session instead of duplicating it
+            existing_name = None
+            prior = self.cache.lookup_session(csv_hash)
+            if prior and os.path.exists(os.path.join(self.exporter.output_dir, f"{prior['session_name']}.json")):
+                existing_name = prior["session_name"]
+                self.log.info(f"Duplicate CSV content detected. Updating {existing_name}.")
+            
+            json_path = self.exporter.export(session, track_info, tbl_data, best_real_lap_ref=brl_ref,
+                                             source_file=filename, session_name=existing_name,
+                                             source_hash=csv_hash)
             if json_path:
                 self.log.info(f"Session Export Complete: {json_path}")
+                session_name = os.path.basename(json_path).replace(".json", "")
+                self.cache.record_session(csv_hash, session_name, filename, track_info.get("track_id"))
                 
             return True
 
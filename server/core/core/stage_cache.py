@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import src.config as config
+from src.analysis.core.models import Session, Sample, GPSSample, IMUSample, EnvSample, IMUStream
+from src.analysis.ingestion.csv_loader import CSVLoader
+
+# Bump when the layout of any cached stage output changes
+CACHE_VERSION = 1
+
+# Columnar layout of the 'parse' stage (one list per column)
+COLUMNS = ["timestamp", "lat", "lon", "speed", "sats",
+           "ax", "ay", "az", "gx", "gy", "gz", "temp", "pressure"]
+
+# Fields of the optional high-rate IMU stream, stored under cols["imu_stream"]
+IMU_STREAM_FIELDS = ["timestamps", "accel_x", "accel_y", "accel_z", "gyro_x", "gyro_y", "gyro_z"]
+
+class StageCache:
+    """
+    Content-addressed cache for SessionProcessor stage outputs.
+
+    Entries are stored per CSV content hash as <cache_dir>/<csv_hash>/<stage>.json
+    together with the key (hash of the stage parameters) they were computed with.
+    A stage is only reused when its key matches, so editing sectors invalidates
+    sector splitting but keeps parsing, laps and IMU results.
+
+    Also keeps index.json (csv_hash -> exported session) so re-importing the same
+    CSV overwrites its existing session instead of creating a duplicate.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = str(cache_dir if cache_dir else config.CACHE_DIR)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+    @staticmethod
+    def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+        """SHA-256 of the raw file content."""
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def make_key(*params: Any) -> str:
+        """Stable short hash of JSON-serialisable stage parameters."""
+        blob = json.dumps([CACHE_VERSION, *params], sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def parse_key(csv_path: str) -> str:
+        """Key of the 'parse' stage: covers the high-rate IMU sidecar when present."""
+        sidecar = CSVLoader.imu_sidecar_path(csv_path)
+        if os.path.exists(sidecar):
+            return StageCache.make_key("parse", StageCache.hash_file(sidecar))
+        return StageCache.make_key("parse")
+
+    @staticmethod
+    def laps_key(start_line: Dict) -> str:
+        """Key of the 'laps' stage: depends only on the start line."""
+        return StageCache.make_key(start_line.get("lat"), start_line.get("lon"), start_line.get("radius_m", 20.0))
+
+    @staticmethod
+    def sectors_key(laps_key: str, sectors: List[Dict]) -> str:
+        """Key of the 'sectors' stage: lap boundaries + sector definition."""
+        return StageCache.make_key(laps_key, sectors)
+
+    # ------------------------------------------------------------------
+    # Stage entries
+    # ------------------------------------------------------------------
+    def _entry_path(self, csv_hash: str, stage: str) -> str:
+        return os.path.join(self.cache_dir, csv_hash, f"{stage}.json")
+
+    def get(self, csv_hash: str, stage: str, key: str) -> Optional[Any]:
+        """Returns the cached stage output, or None on miss / stale key."""
+        path = self._entry_path(csv_hash, stage)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return None
+        if entry.get("key") != key:
+            return None
+        return entry.get("data")
+
+    def put(self, csv_hash: str, stage: str, key: str, data: Any):
+        path = self._entry_path(csv_hash, stage)
+        self._write_json(path, {"key": key, "data": data})
+
+    def invalidate(self, csv_hash: str):
+        """Drop every cached stage for one CSV."""
+        entry_dir = os.path.join(self.cache_dir, csv_hash)
+        if not os.path.isdir(entry_dir):
+            return
+        for name in os.listdir(entry_dir):
+            try:
+                os.remove(os.path.join(entry_dir, name))
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # Session de-duplication index
+    # ------------------------------------------------------------------
+    def _load_index(self) -> Dict:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {}
+
+    def lookup_session(self, csv_hash: str) -> Optional[Dict]:
+        """Session previously exported from this CSV content, if any."""
+        return self._load_index().get(csv_hash)
+
+    def record_session(self, csv_hash: str, session_name: str, source_file: str, track_id=None):
+        index = self._load_index()
+        index[csv_hash] = {
+            "session_name": session_name,
+            "source_file": source_file,
+            "track_id": track_id
+        }
+        self._write_json(self.index_path, index)
+
+    def all_sessions(self) -> Dict[str, Dict]:
+        """Every indexed session (csv_hash -> entry)."""
+        return self._load_index()
+
+    def sessions_for_track(self, track_id) -> Dict[str, Dict]:
+        """All indexed sessions (csv_hash -> entry) belonging to a track."""
+        return {h: e for h, e in self._load_index().items() if e.get("track_id") == track_id}
+
+    # ------------------------------------------------------------------
+    # Columnar (de)serialisation of parsed sessions
+    # ------------------------------------------------------------------
+    @staticmethod
+    def session_to_columns(session: Session) -> Dict[str, List]:
+        cols = {name: [] for name in COLUMNS}
+        for s in session.samples:
+            cols["timestamp"].append(s.timestamp)
+            cols["lat"].append(s.gps.lat)
+            cols["lon"].append(s.gps.lon)
+            cols["speed"].append(s.gps.speed)
+            cols["sats"].append(s.gps.sats)
+            cols["ax"].append(s.imu.accel_x)
+            cols["ay"].append(s.imu.accel_y)
+            cols["az"].append(s.imu.accel_z)
+            cols["gx"].append(s.imu.gyro_x)
+            cols["gy"].append(s.imu.gyro_y)
+            cols["gz"].append(s.imu.gyro_z)
+            cols["temp"].append(s.env.temp)
+            cols["pressure"].append(s.env.pressure)
+        stream = getattr(session, "imu_stream", None)
+        if stream is not None:
+            cols["imu_stream"] = {name: getattr(stream, name) for name in IMU_STREAM_FIELDS}
+        return cols
+
+    @staticmethod
+    def columns_to_session(cols: Dict[str, List], description: str = "") -> Session:
+        session = Session(description=description)
+        for row in zip(*(cols[name] for name in COLUMNS)):
+            ts, lat, lon, speed, sats, ax, ay, az, gx, gy, gz, temp, pressure = row
+            session.add_sample(Sample(
+                ts,
+                GPSSample(lat, lon, speed, sats),
+                IMUSample(ax, ay, az, gx, gy, gz),
+                EnvSample(temp, pressure)
+            ))
+        if cols.get("imu_stream"):
+            session.imu_stream = IMUStream(**{name: cols["imu_stream"][name] for name in IMU_STREAM_FIELDS})
+        return session
+
+    def _write_json(self, path: str, data: Any):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except (IOError, OSError) as e:
+            print(f"[StageCache] Failed to write {path}: {e}")
@@ -1,7 +1,7 @@
 import json
 import os
 import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import src.config as config
 from src.analysis.core.models import Session
 
@@ -58,6 +58,47 @@ class TBLManager:
         except IOError as e:
              print(f"[TBLManager] Error saving {path}: {e}")
 
+    def rebuild(self, track_info: Dict, session_sector_times: Dict[str, List[Dict]]) -> Dict:
+        """
+        Recompute the TBL from scratch (e.g. after the start line or sectors changed).
+        session_sector_times: {session_name: [lap.sector_times, ...]}
+        Unlike update_from_session, stale bests are dropped rather than kept.
+        """
+        track_id = track_info["track_id"]
+        tbl_data = self._create_default_tbl(track_id)
+        tbl_data["track_name"] = track_info.get("track_name", "Unknown")
+        tbl_data["sector_count"] = len(track_info.get("sectors", []))
+
+        bests = {}  # {sector_index: (time, session_name)}
+        for session_name, laps in session_sector_times.items():
+            for sector_times in laps:
+                for sec_id, time_val in sector_times.items():
+                    if time_val is None: continue
+                    idx = self._sector_index(sec_id)
+                    if idx < 0: continue
+                    if idx not in bests or time_val < bests[idx][0]:
+                        bests[idx] = (time_val, session_name)
+
+        if bests:
+            tbl_data["sectors"] = [
+                {"sector_index": idx, "best_time": t, "session_id": name}
+                for idx, (t, name) in sorted(bests.items())
+            ]
+            tbl_data["total_best_time"] = sum(t for t, _ in bests.values())
+            tbl_data["last_updated_session_id"] = "retime"
+            tbl_data["last_updated_time"] = datetime.datetime.utcnow().isoformat() + "Z"
+
+        self.save_tbl(track_id, tbl_data)
+        return tbl_data
+
+    @staticmethod
+    def _sector_index(sid) -> int:
+        """Normalize sector ID to index (e.g. "S1" -> 0)."""
+        if isinstance(sid, int): return sid
+        if isinstance(sid, str) and sid.startswith("S") and sid[1:].isdigit():
+            return int(sid[1:]) - 1
+        return -1
+
     def update_from_session(self, session: Session, track_info: Dict) -> bool:
         """
         Updates TBL with best sectors from the provided session.
@@ -1,11 +1,11 @@
 import os
 import json
-import matplotlib.pyplot as plt
 from typing import Dict, Optional, List
 import src.config as config
 from src.analysis.core.models import Session, Lap
 from src.analysis.processing.laps import LapDetector, StartLine
 from src.analysis.processing.geo import haversine_distance
+from src.analysis.processing.track_geometry import GeometryBuilder
 
 class TrackGenerator:
     """
@@ -96,45 +96,13 @@ class TrackGenerator:
         ref_lap_idx = valid_laps.index(ref_lap)
         print(f"[TrackGenerator] Selected Reference Lap {ref_lap.lap_number} (Time: {ref_lap.duration:.2f}s, Dist: {lap_distances[ref_lap_idx]:.3f}km)")
 
-        # 4. Process Geometry (Smooth & Close Loop)
-        # We extract samples from ref_lap
-        raw_lats = [s.gps.lat for s in ref_lap.samples]
-        raw_lons = [s.gps.lon for s in ref_lap.samples]
-        
-        # Smooth Geometry (Moving Average, window=5)
-        # Use a simple helper or inline
-        def smooth_coords(coords, window=5):
-            if len(coords) < window: return coords
-            smoothed = []
-            for i in range(len(coords)):
-                start = max(0, i - window // 2)
-                end = min(len(coords), i + window // 2 + 1)
-                chunk = coords[start:end]
-                smoothed.append(sum(chunk) / len(chunk))
-            return smoothed
-            
-        final_lats = smooth_coords(raw_lats)
-        final_lons = smooth_coords(raw_lons)
-        
-        # Explicitly Close the Loop
-        # Force the last point to match the first point exactly
-        if final_lats:
-             final_lats[-1] = final_lats[0]
-             final_lons[-1] = final_lons[0]
-
-        # 5. Overwrite Ref Lap Samples? 
-        # Ideally we want to prevent recalculating sectors on raw data if we smoothed geometry.
-        # But 'sectors' are calculated based on indices of ref_lap.
-        # We should create a "Synthetic Lap" for geometry definition?
-        # For simplicity, we keep sectors based on raw ref_lap (which is time-accurate)
-        # BUT we update the 'Track Geometry' source to be this smoothed list?
-        # The current system plots from 'ref_lap.samples'.
-        # We need to save this smoothed geometry into track.json or pass it to visualizer.
-        # Track JSON usually only stores sectors.
-        # Wait, track.json doesn't performantly store 1000 points of geometry?
-        # Usually it doesn't. But we need it for the map.
-        
-        # Let's update the Start Line to be exactly Point 0 of smoothed geometry
+        # 4. Process Geometry (Consensus of all clean laps, closed loop)
+        # Each clean lap is resampled by distance and the per-point median taken,
+        # which rejects single-lap GPS glitches better than smoothing one lap.
+        final_lats, final_lons = GeometryBuilder.consensus_line(clean_laps)
+        print(f"[TrackGenerator] Consensus geometry from {len(clean_laps)} laps ({len(final_lats)} points)")
+
+        # Update the Start Line to be exactly Point 0 of the consensus geometry
         if final_lats:
             start_lat = final_lats[0]
             start_lon = final_lons[0]
@@ -172,9 +140,12 @@ class TrackGenerator:
                 
             # A2. Save geometry.json (New in Phase 7.2)
             geo_json_path = os.path.join(track_dir, "geometry.json")
+            # Douglas-Peucker levels; level 0 doubles as the default payload
+            levels = GeometryBuilder.build_levels(final_lats, final_lons, sector_indices)
             geometry_data = {
-                "coordinates": list(zip(final_lats, final_lons)),
-                "sector_indices": sector_indices
+                "coordinates": levels[0]["coordinates"],
+                "sector_indices": levels[0]["sector_indices"],
+                "levels": levels
             }
             with open(geo_json_path, 'w') as f:
                 json.dump(geometry_data, f)
@@ -190,12 +161,9 @@ class TrackGenerator:
             with open(tbl_json_path, 'w') as f:
                 json.dump(default_tbl, f, indent=4)
                 
-            # C. Generate Map using SMOOTHED data
-            from src.analysis.core.track_visualizer import TrackVisualizer
-            map_path = os.path.join(track_dir, "track_map.png")
-            
-            TrackVisualizer.generate_track_map(final_lats, final_lons, track_data, map_path)
-            
+            # C. Map image is not rendered here: TrackVisualizer.render_cached builds it
+            #    lazily (keyed by geometry + sectors hash) on first request.
+
             # D. Register track in registry.json for UI
             self.registry.register_track(track_id, track_name, folder_name)
             
@@ -211,80 +179,79 @@ class TrackGenerator:
         Scans for the 'First Valid Loop Closure' within the racing circuit.
         Criteria:
         1. Point A (early) and Point B (later) are spatially close (< radius).
-        2. Heading at A matches Heading at B (within 45 deg).
+        2. Heading at A matches Heading at B (within 60 deg).
         3. Skips initial samples to avoid pit exit/entry roads.
+
+        Uses a KD-tree over locally projected coordinates so the whole session
+        is scanned in O(n log n) instead of the old capped O(n^2) pair walk.
         """
         samples = session.samples
         if not samples:
             print("[TrackGenerator] Error: No samples.")
             return 0.0, 0.0
-            
-        step = 1 # High precision scan
+
+        import numpy as np
+        from scipy.spatial import cKDTree
+
         buffer_frames = 600 # ~60s - ensure we're finding full lap closures
         skip_initial = 300 # Skip first 30s to avoid pit exit/entry areas
-        
-        limit = min(len(samples), 5000) 
+        min_speed_kmh = 30.0 # Force start line to be on track (not in pits)
+        max_heading_diff = 60.0 # Allow some cornering variation, but must be roughly same direction
+        chunk = 4096 # Candidates queried per batch (stop at the first batch with a closure)
 
         print("[TrackGenerator] Scanning for First Loop Closure (Skipping pit areas)...")
-        
-        import math
-        def get_heading(idx):
-             # Simple heading using next point
-             if idx >= len(samples) - 1: return 0.0
-             s1 = samples[idx]
-             s2 = samples[idx+1]
-             # simple bearing calculation
-             y = math.sin(math.radians(s2.gps.lon - s1.gps.lon)) * math.cos(math.radians(s2.gps.lat))
-             x = math.cos(math.radians(s1.gps.lat)) * math.sin(math.radians(s2.gps.lat)) - \
-                 math.sin(math.radians(s1.gps.lat)) * math.cos(math.radians(s2.gps.lat)) * math.cos(math.radians(s2.gps.lon - s1.gps.lon))
-             return math.degrees(math.atan2(y, x)) % 360.0
 
-        min_speed_kmh = 30.0 # Force start line to be on track (not in pits)
-        min_speed_warning_printed = False
+        lats = np.array([s.gps.lat for s in samples])
+        lons = np.array([s.gps.lon for s in samples])
+        speeds = np.array([s.gps.speed for s in samples])
+        headings = self._headings(lats, lons)
+        xy, _ = GeometryBuilder.project_local(lats, lons)
+        tree = cKDTree(xy)
+
+        candidates = np.nonzero(speeds >= min_speed_kmh)[0]
+        candidates = candidates[(candidates >= skip_initial) & (candidates + buffer_frames < len(samples))]
+
+        for c0 in range(0, len(candidates), chunk):
+            batch = candidates[c0:c0 + chunk]
+            neighbours = tree.query_ball_point(xy[batch], r=radius_m)
+
+            # Flatten (candidate, neighbour) pairs and apply the time/heading filters vectorised
+            lens = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=len(batch))
+            if not lens.sum(): continue
+            owner = np.repeat(batch, lens)
+            near = np.concatenate([n for n in neighbours if n]).astype(np.int64)
+
+            heading_diff = np.abs(headings[near] - headings[owner])
+            heading_diff = np.minimum(heading_diff, 360.0 - heading_diff)
+            valid = (near >= owner + buffer_frames) & (heading_diff < max_heading_diff)
+            if not valid.any(): continue
+
+            # Earliest candidate wins; snap to its earliest matching later pass
+            i = int(owner[np.argmax(valid)])
+            j = int(near[valid & (owner == i)].min())
+            candidate, s = samples[i], samples[j]
+            diff = abs(headings[i] - headings[j])
+            diff = min(diff, 360.0 - diff)
+            print(f"[TrackGenerator] Valid Loop Closure at Index {i} (Time {candidate.timestamp:.1f}).")
+            print(f"  > Speed: {candidate.gps.speed:.1f} km/h (Threshold: {min_speed_kmh})")
+            print(f"  > Heading Match: A={headings[i]:.0f}, B={headings[j]:.0f} (Diff={diff:.0f})")
+            print(f"  > Snapping Start Line to Racing Line (2nd Pass, Index {j}).")
+            print(f"  > Start Line set to: {s.gps.lat:.6f}, {s.gps.lon:.6f}")
+            return s.gps.lat, s.gps.lon
 
-        for i in range(skip_initial, limit, step):
-            candidate = samples[i]
-            
-            # Speed Filter: Ignore points where we are too slow (Pits)
-            if candidate.gps.speed < min_speed_kmh:
-                if not min_speed_warning_printed:
-                    # Debug log once per session to avoid spam
-                    # print(f"[TrackGenerator] Skipping candidate at index {i} (Speed {candidate.gps.speed:.1f} < {min_speed_kmh})")
-                    min_speed_warning_printed = True
-                continue
-
-            c_lat, c_lon = candidate.gps.lat, candidate.gps.lon
-            
-            search_start = i + buffer_frames
-            if search_start >= len(samples): break
-            
-            c_heading = get_heading(i)
-            
-            for j in range(search_start, len(samples), 5):
-                s = samples[j]
-                
-                # Fast Euclidian
-                if abs(s.gps.lat - c_lat) > 0.002: continue 
-                
-                d = haversine_distance(c_lat, c_lon, s.gps.lat, s.gps.lon) * 1000.0
-                
-                if d < radius_m:
-                    # Spatially close. Check Heading.
-                    s_heading = get_heading(j)
-                    heading_diff = abs(c_heading - s_heading)
-                    if heading_diff > 180: heading_diff = 360 - heading_diff
-                    
-                    if heading_diff < 60: # Allow some cornering variation, but must be roughly same direction
-                        print(f"[TrackGenerator] Valid Loop Closure at Index {i} (Time {candidate.timestamp:.1f}).")
-                        print(f"  > Speed: {candidate.gps.speed:.1f} km/h (Threshold: {min_speed_kmh})")
-                        print(f"  > Heading Match: A={c_heading:.0f}, B={s_heading:.0f} (Diff={heading_diff:.0f})")
-                        print(f"  > Snapping Start Line to Racing Line (2nd Pass, Index {j}).")
-                        print(f"  > Start Line set to: {s.gps.lat:.6f}, {s.gps.lon:.6f}")
-                        return s.gps.lat, s.gps.lon
-                    
         print("[TrackGenerator] No valid closed loop found. Defaulting to Start.")
         return samples[0].gps.lat, samples[0].gps.lon
 
+    @staticmethod
+    def _headings(lats, lons):
+        """Bearing (deg) from each sample to the next; last sample gets 0."""
+        import numpy as np
+        la1, la2 = np.radians(lats[:-1]), np.radians(lats[1:])
+        dlon = np.radians(lons[1:] - lons[:-1])
+        y = np.sin(dlon) * np.cos(la2)
+        x = np.cos(la1) * np.sin(la2) - np.sin(la1) * np.cos(la2) * np.cos(dlon)
+        return np.append(np.degrees(np.arctan2(y, x)) % 360.0, 0.0)
+
     def _calculate_sectors_from_coords(self, lats: List[float], lons: List[float], start_lat: float, start_lon: float) -> List[Dict]:
         """
         Calculates sectors based on equidistant splits of the coordinate geometry.
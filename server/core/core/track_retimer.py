@@ -0,0 +1,222 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from src.analysis.ingestion.csv_loader import CSVLoader
+from src.analysis.core.track_manager import TrackManager
+from src.analysis.core.tbl_manager import TBLManager
+from src.analysis.core.session_exporter import SessionExporter
+from src.analysis.core.stage_cache import StageCache
+from src.analysis.core.models import Lap
+from src.analysis.processing.laps import LapDetector, StartLine
+from src.analysis.processing.stats import StatsEngine
+import src.config as config
+from src.core.log_manager import get_logger
+
+
+def _retime_session(job: Dict) -> Dict:
+    """
+    Worker: recompute laps + sectors for one session from its cached columns.
+    Runs in a separate process, so it only takes/returns plain dicts. Any
+    failure comes back as {"session_name", "error"}: an exception would
+    abort pool.map and with it the whole re-time.
+    """
+    try:
+        return _retime(job)
+    except Exception as e:
+        return {"session_name": job["session_name"], "error": f"{type(e).__name__}: {e}"}
+
+
+def _retime(job: Dict) -> Dict:
+    csv_hash = job["csv_hash"]
+    track_info = job["track_info"]
+    cache = StageCache(cache_dir=job["cache_dir"])
+    result = {"session_name": job["session_name"], "csv_hash": csv_hash}
+
+    # 1. Parsed columns (fall back to the source CSV on a cold cache)
+    csv_path = os.path.join(job["learning_dir"], job["source_file"] or "")
+    parse_key = StageCache.parse_key(csv_path)
+    cols = cache.get(csv_hash, "parse", parse_key)
+    if cols is not None:
+        session = StageCache.columns_to_session(cols, description=job["source_file"])
+    else:
+        if not job["source_file"] or not os.path.exists(csv_path):
+            result["error"] = "No cached columns and source CSV missing"
+            return result
+        session = CSVLoader().load(csv_path)
+        cache.put(csv_hash, "parse", parse_key, StageCache.session_to_columns(session))
+
+    # 2. Laps
+    sl = track_info["start_line"]
+    laps_key = StageCache.laps_key(sl)
+    lap_ranges = cache.get(csv_hash, "laps", laps_key)
+    if lap_ranges is not None:
+        laps = [Lap(session, start, end, number=num) for start, end, num in lap_ranges]
+    else:
+        detector = LapDetector(StartLine(sl["lat"], sl["lon"], sl.get("radius_m", 20.0)))
+        laps = detector.detect(session)
+        cache.put(csv_hash, "laps", laps_key, [[l.start_index, l.end_index, l.lap_number] for l in laps])
+    session.laps = laps
+
+    # 3. Sectors
+    sectors_key = StageCache.sectors_key(laps_key, track_info.get("sectors", []))
+    sector_times = cache.get(csv_hash, "sectors", sectors_key)
+    if sector_times is not None and len(sector_times) == len(laps):
+        for lap, times in zip(laps, sector_times):
+            lap.sector_times = times
+    else:
+        StatsEngine.calculate_sectors(laps, track_info)
+        cache.put(csv_hash, "sectors", sectors_key, [l.sector_times for l in laps])
+
+    # 4. Artifact sections (references depend on the rebuilt TBL, filled in later)
+    exporter = SessionExporter(output_dir=job["sessions_dir"])
+    result.update({
+        "laps": exporter._build_laps_list(session, track_info),
+        "sectors": exporter._build_sector_stats(session, track_info),
+        "best_lap_time": exporter._find_best_lap_time(session),
+        "sector_times": [l.sector_times for l in laps]
+    })
+    return result
+
+
+class TrackRetimer:
+    """
+    Bulk re-timing of every session on one track after its start line or
+    sectors changed.
+
+    Uses the StageCache columns instead of re-parsing CSVs, recomputes laps and
+    sectors in parallel worker processes, rebuilds tbl.json from scratch and
+    rewrites only the lap/sector sections of each session JSON.
+    """
+
+    def __init__(self, sessions_dir: str = None, cache_dir: str = None, max_workers: Optional[int] = None):
+        self.log = get_logger("analysis")
+        self.sessions_dir = str(sessions_dir if sessions_dir else config.SESSIONS_DIR)
+        self.cache = StageCache(cache_dir=cache_dir)
+        self.tbl_mgr = TBLManager()
+        self.max_workers = max_workers
+
+    def retime_track(self, track_id, track_info: Dict = None) -> Dict:
+        """
+        Re-time all sessions of a track.
+        Returns {"track_id", "sessions": {name: {best_lap_time, total_laps}}, "failed": [...], "tbl_total_best_time"}
+        """
+        if track_info is None:
+            track_info = next((t for t in TrackManager().tracks
+                               if t.get("track_id", t.get("id")) == track_id), None)
+        if not track_info or not track_info.get("start_line"):
+            self.log.error(f"Track {track_id} not found or has no start line.")
+            return {"track_id": track_id, "sessions": {}, "failed": [], "error": "Track not found"}
+
+        jobs = [{
+            "csv_hash": csv_hash,
+            "session_name": entry["session_name"],
+            "source_file": entry.get("source_file"),
+            "track_info": track_info,
+            "cache_dir": self.cache.cache_dir,
+            "sessions_dir": self.sessions_dir,
+            "learning_dir": str(config.LEARNING_DIR)
+        } for csv_hash, entry in self._collect_sessions(track_id).items()]
+        self.log.info(f"Re-timing {len(jobs)} sessions for track {track_id}")
+
+        if len(jobs) > 1 and self.max_workers != 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(_retime_session, jobs))
+        else:
+            results = [_retime_session(job) for job in jobs]
+
+        failed = [r for r in results if "error" in r]
+        results = [r for r in results if "error" not in r]
+        for r in failed:
+            self.log.warning(f"Re-time skipped {r['session_name']}: {r['error']}")
+
+        # TBL from scratch, then patch session artifacts against it
+        tbl_data = self.tbl_mgr.rebuild(track_info, {r["session_name"]: r["sector_times"] for r in results})
+        brl_ref = track_info.get("records", {}).get("best_real_lap", {}).get("time")
+
+        summary = {}
+        for r in results:
+            if self._patch_session_json(r, track_info, tbl_data, brl_ref):
+                summary[r["session_name"]] = {
+                    "best_lap_time": r["best_lap_time"],
+                    "total_laps": len(r["laps"])
+                }
+
+        return {
+            "track_id": track_id,
+            "sessions": summary,
+            "failed": [r["session_name"] for r in failed],
+            "tbl_total_best_time": tbl_data.get("total_best_time")
+        }
+
+    def _collect_sessions(self, track_id) -> Dict[str, Dict]:
+        """
+        Sessions on this track, keyed by CSV hash. Session JSONs exported before
+        the stage cache existed are backfilled into the index from meta.source_file.
+        """
+        sessions = {h: e for h, e in self.cache.sessions_for_track(track_id).items()
+                    if os.path.exists(self._session_path(e["session_name"]))}
+        known = {e["session_name"] for e in self.cache.all_sessions().values()}
+
+        if not os.path.isdir(self.sessions_dir):
+            return sessions
+        for filename in os.listdir(self.sessions_dir):
+            if not filename.endswith(".json") or filename.endswith("_telemetry.json"):
+                continue
+            name = filename[:-len(".json")]
+            if name in known:
+                continue
+            try:
+                with open(self._session_path(name), 'r') as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                continue
+            if data.get("track", {}).get("track_id") != track_id:
+                continue
+            source_file = data.get("meta", {}).get("source_file")
+            csv_path = os.path.join(str(config.LEARNING_DIR), source_file or "")
+            csv_hash = data.get("meta", {}).get("source_hash")
+            if not csv_hash and source_file and os.path.exists(csv_path):
+                csv_hash = StageCache.hash_file(csv_path)
+            if not csv_hash:
+                self.log.warning(f"Cannot re-time {name}: source CSV unknown")
+                continue
+            self.cache.record_session(csv_hash, name, source_file, track_id)
+            sessions[csv_hash] = {"session_name": name, "source_file": source_file, "track_id": track_id}
+        return sessions
+
+    def _session_path(self, session_name: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_name}.json")
+
+    def _patch_session_json(self, result: Dict, track_info: Dict, tbl_data: Dict, brl_ref) -> bool:
+        """Rewrite only the lap/sector dependent sections of a session artifact."""
+        path = self._session_path(result["session_name"])
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"[TrackRetimer] Failed to read {path}: {e}")
+            return False
+
+        exporter = SessionExporter(output_dir=self.sessions_dir)
+        best = result["best_lap_time"]
+        total_best = tbl_data.get("total_best_time")
+
+        data["laps"] = result["laps"]
+        data["sectors"] = result["sectors"]
+        data["references"] = exporter._build_references(track_info, tbl_data, brl_ref)
+        data.setdefault("track", {})["sector_count"] = len(track_info.get("sectors", []))
+        aggregates = data.setdefault("aggregates", {})
+        aggregates["best_lap_time"] = best
+        aggregates["gap_to_theoretical_best"] = round(best - total_best, 3) if (best and total_best) else None
+
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, path)
+            return True
+        except (IOError, OSError) as e:
+            print(f"[TrackRetimer] Failed to write {path}: {e}")
+            return False
@@ -1,61 +1,140 @@
-import matplotlib.pyplot as plt
+import hashlib
+import json
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 from src.analysis.processing.geo import haversine_distance
 
 class TrackVisualizer:
+    """
+    Renders static track maps.
+
+    Maps are cached next to the track as track_map_<hash>.png, where the hash
+    covers the geometry and the start line / sectors. They are rendered lazily
+    (first request) instead of during track generation, and only re-rendered
+    when that content changes. matplotlib is imported on first render only.
+    """
+
+    MAP_PREFIX = "track_map_"
+
     @staticmethod
     def generate_track_map(lats: List[float], lons: List[float], track_data: Dict, output_path: str):
         """
         Generates a static map of the track with annotations.
         """
         try:
-            plt.figure(figsize=(12, 10))
-            
+            # Object-oriented API (no pyplot global state): safe to call from a worker thread
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+            fig = Figure(figsize=(12, 10))
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot(111)
+            lats, lons = list(lats), list(lons)
+
             # Close the loop for visualization if not closed
             if lats and lons:
                 if haversine_distance(lats[0], lons[0], lats[-1], lons[-1]) * 1000 > 5:
                     lats.append(lats[0])
                     lons.append(lons[0])
-            
+
             # Plot Main Track Path
-            plt.plot(lons, lats, 'k-', linewidth=2, label='Track Geometry', alpha=0.7)
-            
+            ax.plot(lons, lats, 'k-', linewidth=2, label='Track Geometry', alpha=0.7)
+
             # Annotate Start/Finish
             sl = track_data.get("start_line", {})
             if sl:
-                plt.plot(sl['lon'], sl['lat'], 'g*', markersize=18, label='Start/Finish', zorder=10)
-            
+                ax.plot(sl['lon'], sl['lat'], 'g*', markersize=18, label='Start/Finish', zorder=10)
+
             # Annotate Sectors
             sectors = track_data.get("sectors", [])
             colors = ['r', 'b', 'm', 'c', 'y']
-            
-            num_sectors = len(sectors)
+
             for i, sec in enumerate(sectors):
                 # Sector End Point
                 s_lat = sec.get("end_lat")
                 s_lon = sec.get("end_lon")
                 s_id = sec.get("id", f"S{i+1}")
-                
-                
+
                 if s_lat and s_lon:
                     # Alternating colors
                     c = colors[i % len(colors)]
-                    plt.plot(s_lon, s_lat, marker='|', color=c, markersize=14, markeredgewidth=3)
-                    plt.text(s_lon, s_lat, f" {s_id}", fontsize=12, fontweight='bold', color=c)
-            
-            plt.title(f"Track Map: {track_data.get('name', 'Unknown')}", fontsize=14)
-            plt.xlabel("Longitude")
-            plt.ylabel("Latitude")
-            plt.legend()
-            plt.grid(True, linestyle='--', alpha=0.5)
-            plt.axis('equal')
-            
-            plt.savefig(output_path, dpi=150, bbox_inches='tight')
-            plt.close()
+                    ax.plot(s_lon, s_lat, marker='|', color=c, markersize=14, markeredgewidth=3)
+                    ax.text(s_lon, s_lat, f" {s_id}", fontsize=12, fontweight='bold', color=c)
+
+            ax.set_title(f"Track Map: {track_data.get('name', track_data.get('track_name', 'Unknown'))}", fontsize=14)
+            ax.set_xlabel("Longitude")
+            ax.set_ylabel("Latitude")
+            ax.legend()
+            ax.grid(True, linestyle='--', alpha=0.5)
+            ax.axis('equal')
+
+            fig.savefig(output_path, dpi=150, bbox_inches='tight')
             print(f"[TrackVisualizer] Saved map to {output_path}")
             return True
-            
+
         except Exception as e:
             print(f"[TrackVisualizer] Visualization failed: {e}")
             return False
+
+    @staticmethod
+    def map_hash(coordinates: List, track_data: Dict) -> str:
+        """Content hash of everything drawn on the map."""
+        drawn = {
+            "coordinates": coordinates,
+            "start_line": track_data.get("start_line"),
+            "sectors": track_data.get("sectors", []),
+            "name": track_data.get("name", track_data.get("track_name"))
+        }
+        blob = json.dumps(drawn, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _load_track(track_dir: str):
+        """Returns (track_data, coordinates) or (None, None) if geometry is missing."""
+        try:
+            with open(os.path.join(track_dir, "track.json"), 'r') as f:
+                track_data = json.load(f)
+            with open(os.path.join(track_dir, "geometry.json"), 'r') as f:
+                coordinates = json.load(f).get("coordinates", [])
+        except (IOError, json.JSONDecodeError):
+            return None, None
+        return track_data, coordinates
+
+    @staticmethod
+    def cached_map_path(track_dir: str) -> Optional[str]:
+        """Path the current map is (or will be) cached at; None without geometry."""
+        track_data, coordinates = TrackVisualizer._load_track(track_dir)
+        if track_data is None or not coordinates:
+            return None
+        key = TrackVisualizer.map_hash(coordinates, track_data)
+        return os.path.join(track_dir, f"{TrackVisualizer.MAP_PREFIX}{key}.png")
+
+    @staticmethod
+    def render_cached(track_dir: str) -> Optional[str]:
+        """
+        Returns the path of an up-to-date map, rendering it if needed.
+        Stale maps for the same track are removed after a successful render.
+        """
+        track_data, coordinates = TrackVisualizer._load_track(track_dir)
+        if track_data is None or not coordinates:
+            return None
+        key = TrackVisualizer.map_hash(coordinates, track_data)
+        name = f"{TrackVisualizer.MAP_PREFIX}{key}.png"
+        path = os.path.join(track_dir, name)
+        if os.path.exists(path):
+            return path
+
+        lats = [c[0] for c in coordinates]
+        lons = [c[1] for c in coordinates]
+        tmp_path = path + ".tmp.png"
+        if not TrackVisualizer.generate_track_map(lats, lons, track_data, tmp_path):
+            return None
+        os.replace(tmp_path, path)
+
+        for old in os.listdir(track_dir):
+            if old.startswith(TrackVisualizer.MAP_PREFIX) and old.endswith(".png") and old != name:
+                try:
+                    os.remove(os.path.join(track_dir, old))
+                except OSError:
+                    pass
+        return path
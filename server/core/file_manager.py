@@ -6,6 +6,7 @@ from datetime import datetime
 
 METADATA_FILE = ".metadata.json"
 ARCHIVE_DIR_NAME = "archive"
+IMU_SIDECAR_EXT = ".imu" # High-rate IMU stream stored next to a CSV (see CSVLoader)
 
 class FileManager:
     def __init__(self, base_dir):
@@ -19,6 +20,17 @@ class FileManager:
         self.log = logging.getLogger("file_mgr")
         self._ensure_dir()
 
+    @staticmethod
+    def _sidecar(path):
+        return Path(path).with_suffix(IMU_SIDECAR_EXT)
+
+    def _move(self, src, dst):
+        """Move a CSV together with its IMU sidecar, if any."""
+        import shutil
+        shutil.move(str(src), str(dst))
+        if self._sidecar(src).exists():
+            shutil.move(str(self._sidecar(src)), str(self._sidecar(dst)))
+
     def _ensure_dir(self):
         self.base_dir.mkdir(parents=True, exist_ok=True)
         self.archive_dir.mkdir(parents=True, exist_ok=True)
@@ -113,7 +125,7 @@ class FileManager:
                 continue
                 
             try:
-                shutil.move(str(src), str(dst))
+                self._move(src, dst)
                 moved.append(fname)
             except Exception as e:
                 failed.append({"filename": fname, "reason": str(e)})
@@ -139,7 +151,7 @@ class FileManager:
                 continue
                 
             try:
-                shutil.move(str(src), str(dst))
+                self._move(src, dst)
                 moved.append(fname)
             except Exception as e:
                 failed.append({"filename": fname, "reason": str(e)})
@@ -165,6 +177,8 @@ class FileManager:
             if path.exists():
                 try:
                     os.remove(path)
+                    if self._sidecar(path).exists():
+                        os.remove(self._sidecar(path))
                     deleted.append(fname)
                     # Cleanup metadata
                     if fname in meta:
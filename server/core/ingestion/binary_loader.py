@@ -0,0 +1,169 @@
+import os
+import struct
+import zlib
+from typing import Iterator, Tuple
+from src.analysis.core.models import Session, Sample, GPSSample, IMUSample, EnvSample, IMUStream
+from src.analysis.ingestion.csv_loader import CSVLoader
+
+class BinaryLogLoader:
+    """
+    Decoder for the device's packed binary session log (.rsl).
+    Format is defined by the writer in firmware/lib/binlog.py:
+
+        file header  "<4sBBHII"  magic, version, record size, records/block, start epoch, flags
+        block header "<HHI"      magic, record count, CRC32 of the payload
+        GPS block    magic 0xB10C, records "<IiiHhhhhhhHBB"
+                     t_ms, lat*1e7, lon*1e7, speed*100, acc xyz, gyro xyz, vbat mV, sats, flags
+        IMU block    magic 0xB1A1 (v2), "<IH" first frame t_ms + frame period (us),
+                     then raw FIFO frames "<hhhhhh" (acc xyz, gyro xyz)
+
+    Blocks failing their CRC are skipped and decoding resumes at the next block
+    magic, so a torn write (power loss) costs at most one block.
+    """
+
+    EXTENSION = ".rsl"
+    FILE_MAGIC = b"RSL1"
+    SUPPORTED_VERSIONS = (1, 2)
+    FILE_HDR_FMT = "<4sBBHII"
+    BLOCK_MAGIC = 0xB10C
+    IMU_BLOCK_MAGIC = 0xB1A1
+    BLOCK_HDR_FMT = "<HHI"
+    REC_FMT = "<IiiHhhhhhhHBB"
+    IMU_HDR_FMT = "<IH"
+    IMU_FRAME_FMT = "<hhhhhh"
+    IMU_DUMMY_ACC = 0x7F01 # FIFO slot without new data
+
+    CSV_HEADER = "time,lat,lon,alt,speed,acc_x,acc_y,acc_z,gyro_x,gyro_y,gyro_z,vbat"
+
+    def __init__(self):
+        self.bad_blocks = 0
+
+    @staticmethod
+    def is_binary_log(path: str) -> bool:
+        return path.lower().endswith(BinaryLogLoader.EXTENSION)
+
+    def iter_blocks(self, data: bytes) -> Iterator[Tuple[int, int, bytes, int]]:
+        """Yields (block_magic, start_epoch, payload, count) for every valid block."""
+        hdr_size = struct.calcsize(self.FILE_HDR_FMT)
+        if len(data) < hdr_size:
+            raise ValueError("File too short for RSL header")
+        magic, version, rec_size, _, start_epoch, _ = struct.unpack_from(self.FILE_HDR_FMT, data, 0)
+        if magic != self.FILE_MAGIC:
+            raise ValueError(f"Not an RSL log (magic {magic!r})")
+        if version not in self.SUPPORTED_VERSIONS or rec_size != struct.calcsize(self.REC_FMT):
+            raise ValueError(f"Unsupported RSL v{version} record size {rec_size}")
+
+        blk_size = struct.calcsize(self.BLOCK_HDR_FMT)
+        imu_hdr_size = struct.calcsize(self.IMU_HDR_FMT)
+        imu_frame_size = struct.calcsize(self.IMU_FRAME_FMT)
+        markers = [struct.pack("<H", self.BLOCK_MAGIC), struct.pack("<H", self.IMU_BLOCK_MAGIC)]
+        pos = hdr_size
+        self.bad_blocks = 0
+
+        while pos + blk_size <= len(data):
+            bmagic, count, crc = struct.unpack_from(self.BLOCK_HDR_FMT, data, pos)
+            if bmagic == self.BLOCK_MAGIC:
+                size = count * rec_size
+            elif bmagic == self.IMU_BLOCK_MAGIC:
+                size = imu_hdr_size + count * imu_frame_size
+            else:
+                size = -1
+            end = pos + blk_size + size
+            valid = size > 0 and count > 0 and end <= len(data)
+            if valid:
+                payload = data[pos + blk_size:end]
+                valid = (zlib.crc32(payload) & 0xFFFFFFFF) == crc
+
+            if not valid:
+                # Resync on the next block magic (a truncated final block just runs out)
+                self.bad_blocks += 1
+                found = [p for p in (data.find(m, pos + 1) for m in markers) if p >= 0]
+                if not found:
+                    break
+                pos = min(found)
+                continue
+
+            yield bmagic, start_epoch, payload, count
+            pos = end
+
+    def iter_records(self, data: bytes) -> Iterator[Tuple[float, tuple]]:
+        """Yields (timestamp_s, record_tuple) for every GPS-rate record."""
+        rec = struct.Struct(self.REC_FMT)
+        for bmagic, start_epoch, payload, _ in self.iter_blocks(data):
+            if bmagic != self.BLOCK_MAGIC:
+                continue
+            for fields in rec.iter_unpack(payload):
+                yield start_epoch + fields[0] / 1000.0, fields
+
+    def iter_imu_frames(self, data: bytes) -> Iterator[Tuple[float, tuple]]:
+        """Yields (timestamp_s, (ax, ay, az, gx, gy, gz)) for every high-rate IMU frame."""
+        imu_hdr_size = struct.calcsize(self.IMU_HDR_FMT)
+        frame = struct.Struct(self.IMU_FRAME_FMT)
+        for bmagic, start_epoch, payload, _ in self.iter_blocks(data):
+            if bmagic != self.IMU_BLOCK_MAGIC:
+                continue
+            t_ms, period_us = struct.unpack_from(self.IMU_HDR_FMT, payload, 0)
+            t0 = start_epoch + t_ms / 1000.0
+            for i, f in enumerate(frame.iter_unpack(payload[imu_hdr_size:])):
+                if (f[0] & 0xFFFF) == self.IMU_DUMMY_ACC:
+                    continue
+                yield t0 + i * period_us / 1e6, f
+
+    def load_imu_stream(self, data: bytes) -> IMUStream:
+        frames = sorted(self.iter_imu_frames(data), key=lambda x: x[0])
+        stream = IMUStream()
+        for ts, f in frames:
+            stream.timestamps.append(ts)
+            stream.accel_x.append(f[0])
+            stream.accel_y.append(f[1])
+            stream.accel_z.append(f[2])
+            stream.gyro_x.append(f[3])
+            stream.gyro_y.append(f[4])
+            stream.gyro_z.append(f[5])
+        return stream
+
+    def load(self, file_source: str, source_name: str = "Unknown") -> Session:
+        """Load a .rsl file into a Session (same units as CSVLoader output)."""
+        with open(file_source, 'rb') as f:
+            data = f.read()
+        session = Session(description=os.path.basename(file_source))
+
+        for ts, r in self.iter_records(data):
+            gps = GPSSample(lat=r[1] / 1e7, lon=r[2] / 1e7, speed=r[3] / 100.0, sats=r[11])
+            imu = IMUSample(accel_x=r[4], accel_y=r[5], accel_z=r[6],
+                            gyro_x=r[7], gyro_y=r[8], gyro_z=r[9])
+            session.add_sample(Sample(ts, gps, imu, EnvSample(0.0, 0.0)))
+
+        stream = self.load_imu_stream(data)
+        if len(stream):
+            session.imu_stream = stream
+
+        if self.bad_blocks:
+            print(f"[BinaryLogLoader] Skipped {self.bad_blocks} corrupt block(s) in {file_source}")
+        return session
+
+    def to_csv(self, src_path: str, dst_path: str) -> int:
+        """
+        Converts a .rsl log to the device's legacy CSV layout, so the CSV-based
+        tooling (learning folder, previews, uploads) keeps working. A high-rate
+        IMU stream, if logged, is written next to it as a .imu sidecar CSV.
+        Returns the number of rows written.
+        """
+        with open(src_path, 'rb') as f:
+            data = f.read()
+        rows = 0
+        tmp_path = dst_path + ".tmp"
+        with open(tmp_path, 'w') as out:
+            out.write(self.CSV_HEADER + "\n")
+            for ts, r in self.iter_records(data):
+                out.write(f"{ts:.3f},{r[1] / 1e7:.7f},{r[2] / 1e7:.7f},0.0,{r[3] / 100.0:.2f},"
+                          f"{r[4]},{r[5]},{r[6]},{r[7]},{r[8]},{r[9]},{r[10] / 1000.0:.2f}\n")
+                rows += 1
+
+        stream = self.load_imu_stream(data)
+        if len(stream):
+            CSVLoader.write_imu_sidecar(dst_path, stream)
+        os.replace(tmp_path, dst_path)
+        if self.bad_blocks:
+            print(f"[BinaryLogLoader] Skipped {self.bad_blocks} corrupt block(s) in {src_path}")
+        return rows
@@ -1,14 +1,59 @@
 import os
 import csv
 import io
-from typing import TextIO, Union
-from src.analysis.core.models import Session, Sample, GPSSample, IMUSample, EnvSample
+from typing import Optional, TextIO, Union
+from src.analysis.core.models import Session, Sample, GPSSample, IMUSample, EnvSample, IMUStream
 
 class CSVLoader:
     """
     Decoupled CSV Ingestion for Motorcycle Telemetry.
     Reads standard CSV format and produces a Session object.
+
+    A high-rate IMU stream (logged from the sensor FIFO) travels next to the
+    CSV as <name>.imu, a CSV of time,acc_x..gyro_z; it is attached to the
+    Session as session.imu_stream when present.
     """
+
+    IMU_SIDECAR_EXT = ".imu"
+    IMU_SIDECAR_HEADER = "time,acc_x,acc_y,acc_z,gyro_x,gyro_y,gyro_z"
+
+    @staticmethod
+    def imu_sidecar_path(csv_path: str) -> str:
+        return os.path.splitext(csv_path)[0] + CSVLoader.IMU_SIDECAR_EXT
+
+    @staticmethod
+    def write_imu_sidecar(csv_path: str, stream: IMUStream):
+        path = CSVLoader.imu_sidecar_path(csv_path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(CSVLoader.IMU_SIDECAR_HEADER + "\n")
+            for row in zip(stream.timestamps, stream.accel_x, stream.accel_y, stream.accel_z,
+                           stream.gyro_x, stream.gyro_y, stream.gyro_z):
+                f.write(f"{row[0]:.4f},{row[1]},{row[2]},{row[3]},{row[4]},{row[5]},{row[6]}\n")
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load_imu_sidecar(csv_path: str) -> Optional[IMUStream]:
+        """Reads the .imu sidecar of a CSV, or None if there is none."""
+        path = CSVLoader.imu_sidecar_path(csv_path)
+        if not os.path.exists(path):
+            return None
+        stream = IMUStream()
+        cols = (stream.timestamps, stream.accel_x, stream.accel_y, stream.accel_z,
+                stream.gyro_x, stream.gyro_y, stream.gyro_z)
+        with open(path, 'r') as f:
+            next(f, None)
+            for line in f:
+                parts = line.split(',')
+                if len(parts) < 7:
+                    continue
+                try:
+                    values = [float(p) for p in parts[:7]]
+                except ValueError:
+                    continue
+                for col, v in zip(cols, values):
+                    col.append(v)
+        return stream if len(stream) else None
     
     def load(self, file_source: Union[str, TextIO], source_name: str = "Unknown") -> Session:
         """
@@ -65,6 +110,9 @@ class CSVLoader:
                 except ValueError as e:
                     # Skip malformed rows
                     continue
+
+            if should_close:
+                session.imu_stream = self.load_imu_sidecar(file_source)
                     
             return session
             
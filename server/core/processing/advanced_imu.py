@@ -1,6 +1,6 @@
 import numpy as np
 import math
-from scipy.signal import butter, filtfilt, medfilt
+from scipy.signal import butter, filtfilt, lfilter, medfilt
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Optional
 
@@ -29,7 +29,8 @@ class AdvancedIMUProcessor:
     def process(self, timestamps: List[float], 
                 ax_raw: List[float], ay_raw: List[float], az_raw: List[float],
                 gx_raw: List[float], gy_raw: List[float], gz_raw: List[float],
-                speeds: List[float] = None, lats: List[float] = None, lons: List[float] = None) -> Dict:
+                speeds: List[float] = None, lats: List[float] = None, lons: List[float] = None,
+                imu_timestamps: List[float] = None) -> Dict:
         """
         Two-Phase IMU Processing Pipeline.
         Phase 1: Detect straights from GPS, calibrate biases.
@@ -41,6 +42,10 @@ class AdvancedIMUProcessor:
             gx_raw, gy_raw, gz_raw: Raw gyroscope readings
             speeds: GPS speeds in km/h (required for calibration)
             lats, lons: GPS coordinates in degrees (required for straight detection)
+            imu_timestamps: Timestamps of the IMU readings when they come from a
+                separate (higher-rate) stream than the GPS samples. IMU signals are
+                then filtered/integrated at their own rate and resampled onto
+                `timestamps`; outputs are always one value per GPS sample.
         
         Returns:
             Dict with lean_angle, pitch_angle, yaw_angle, ax_cg, ay_cg, az_cg, confidence
@@ -48,7 +53,7 @@ class AdvancedIMUProcessor:
         # Validate required GPS data
         if speeds is None or lats is None or lons is None:
             print("[IMU] WARNING: Missing GPS data. Returning uncalibrated fallback.")
-            return self._fallback_process(timestamps, ax_raw, ay_raw, az_raw, gx_raw)
+            return self._fallback_process(timestamps, ax_raw, ay_raw, az_raw, gx_raw, imu_timestamps)
         
         # 0. Convert to Numpy
         t = np.array(timestamps)
@@ -60,6 +65,19 @@ class AdvancedIMUProcessor:
         dt_avg = np.mean(dt_list) if len(dt_list)>0 else 0.1
         if dt_avg <= 0: dt_avg = 0.1
         fs = 1.0 / dt_avg
+
+        # IMU timeline (same as GPS unless a separate high-rate stream is given)
+        mixed_rate = imu_timestamps is not None
+        t_imu = np.array(imu_timestamps) if mixed_rate else t
+        dt_imu = np.mean(np.diff(t_imu)) if len(t_imu) > 1 else dt_avg
+        if dt_imu <= 0: dt_imu = dt_avg
+        fs_imu = 1.0 / dt_imu
+
+        def _to_imu(gps_series):
+            return np.interp(t_imu, t, gps_series) if mixed_rate else gps_series
+
+        def _to_gps(imu_series):
+            return np.interp(t, t_imu, imu_series) if mixed_rate else imu_series
         
         # GPS Yaw Rate
         y = np.sin(np.diff(lon_rad, prepend=lon_rad[0])) * np.cos(lat_rad)
@@ -78,6 +96,14 @@ class AdvancedIMUProcessor:
             normal = cutoff / nyq
             b, a = butter(2, normal, btype='low', analog=False)
             return filtfilt(b, a, data)
+
+        def _lpf_imu(data, cutoff):
+            if not mixed_rate:
+                return _lpf(data, cutoff)
+            nyq = 0.5 * fs_imu
+            if cutoff >= nyq: cutoff = nyq * 0.9
+            b, a = butter(2, cutoff / nyq, btype='low', analog=False)
+            return filtfilt(b, a, data)
             
         gps_yaw_rate = _lpf(gps_yaw_rate, 1.0)
         
@@ -118,12 +144,13 @@ class AdvancedIMUProcessor:
         bias_gx = 0.0
         bias_ax = 0.0
         
-        if np.sum(straight_mask) > 10:
-            bias_ay = np.mean(ay[straight_mask])
+        straight_mask_imu = _to_imu(straight_mask.astype(float)) > 0.5 if mixed_rate else straight_mask
+        if np.sum(straight_mask) > 10 and np.sum(straight_mask_imu) > 10:
+            bias_ay = np.mean(ay[straight_mask_imu])
             
             # Ax Bias from GPS acceleration
-            gps_accel = np.gradient(v) * fs
-            bias_ax = np.mean(ax[straight_mask] - gps_accel[straight_mask])
+            gps_accel = _to_imu(np.gradient(v) * fs)
+            bias_ax = np.mean(ax[straight_mask_imu] - gps_accel[straight_mask_imu])
             print(f"[IMU] Calibrated Biases: Ay={bias_ay:.2f} Ax={bias_ax:.2f}")
         else:
             print("[IMU] No suitable straights for calibration. Using GPS-only mode.")
@@ -133,8 +160,8 @@ class AdvancedIMUProcessor:
         ay -= bias_ay
         
         # Heavy Filter accelerometer
-        ax = _lpf(ax, 0.5)
-        ay = _lpf(ay, 0.5)
+        ax = _lpf_imu(ax, 0.5)
+        ay = _lpf_imu(ay, 0.5)
         
         # ===== LEAN ANGLE: Hybrid GPS + IMU with Auto-Calibration =====
         # Step 1: Calculate GPS physics lean (ground truth reference)
@@ -160,19 +187,32 @@ class AdvancedIMUProcessor:
         # Step 2: Auto-detect roll axis - handles TILTED IMU with multi-axis regression
         # If IMU is tilted, roll shows up as combination of axes: roll = a*Gx + b*Gy + c*Gz
         gy = np.array(gy_raw) * scale_g
-        gy = _lpf(gy, 2.0)
-        gx = _lpf(gx, 2.0)
-        gz = _lpf(gz, 2.0)
+        gy = _lpf_imu(gy, 2.0)
+        gx = _lpf_imu(gx, 2.0)
+        gz = _lpf_imu(gz, 2.0)
         
         def integrate_gyro(gyro_rate, decay=0.98):
-            """Integrate gyro to lean with drift compensation."""
-            lean = 0.0
-            leans = []
-            for rate in gyro_rate:
-                lean = lean * decay + rate * dt_avg
-                lean = max(-60, min(60, lean))
-                leans.append(lean)
-            return np.array(leans)
+            """
+            Integrate gyro to lean with drift compensation, on the GPS timeline.
+            decay is per GPS-rate step; it is rescaled so the drift time constant
+            is the same at the IMU rate.
+            """
+            decay = decay ** (dt_imu / dt_avg)
+            # Linear leaky integrator; the clamped loop below is only needed
+            # when the lean actually saturates
+            leans = lfilter([dt_imu], [1.0, -decay], gyro_rate)
+            if len(leans) and np.max(np.abs(leans)) > 60:
+                lean = 0.0
+                leans = np.empty(len(gyro_rate))
+                for i, rate in enumerate(gyro_rate):
+                    lean = lean * decay + rate * dt_imu
+                    lean = max(-60, min(60, lean))
+                    leans[i] = lean
+            return leans
+
+        def imu_lean_on_gps(gyro_rate):
+            """Integrated + filtered lean candidate, resampled onto GPS timestamps."""
+            return _to_gps(_lpf_imu(integrate_gyro(gyro_rate), 1.0))
         
         # Only use turn segments for calibration
         turn_mask = np.abs(gps_lean) > 5
@@ -193,8 +233,7 @@ class AdvancedIMUProcessor:
             ]
             
             for axis_name, gyro_data, coeffs in single_axes:
-                imu_lean = integrate_gyro(gyro_data)
-                imu_lean_f = _lpf(imu_lean, 1.0)
+                imu_lean_f = imu_lean_on_gps(gyro_data)
                 
                 try:
                     corr, _ = pearsonr(gps_lean[turn_mask], imu_lean_f[turn_mask])
@@ -222,8 +261,7 @@ class AdvancedIMUProcessor:
                     a, b, c = a/norm, b/norm, c/norm
                     
                     combined = a * gx + b * gy + c * gz
-                    imu_lean = integrate_gyro(combined)
-                    imu_lean_f = _lpf(imu_lean, 1.0)
+                    imu_lean_f = imu_lean_on_gps(combined)
                     
                     try:
                         corr, _ = pearsonr(gps_lean[turn_mask], imu_lean_f[turn_mask])
@@ -247,8 +285,7 @@ class AdvancedIMUProcessor:
                             if norm > 0.01:
                                 a, b, c = a/norm, b/norm, c/norm
                                 combined = a * gx + b * gy + c * gz
-                                imu_lean = integrate_gyro(combined)
-                                best_imu_lean = _lpf(imu_lean, 1.0)
+                                best_imu_lean = imu_lean_on_gps(combined)
                                 best_coeffs = [a, b, c]
                                 best_corr = best_opt_corr
                     except:
@@ -342,12 +379,13 @@ class AdvancedIMUProcessor:
             "confidence": 1.0 
         }
 
-    def _fallback_process(self, timestamps, ax_raw, ay_raw, az_raw, gx_raw):
+    def _fallback_process(self, timestamps, ax_raw, ay_raw, az_raw, gx_raw, imu_timestamps=None):
         """
         Fallback processing when GPS data is unavailable.
         Uses simple scaling and filtering without calibration.
         """
         n = len(timestamps)
+        sample_times = imu_timestamps if imu_timestamps is not None else timestamps
         
         # Basic scaling
         scale_a = 1/16384.0 if np.mean(np.abs(az_raw)) > 1000 else 1.0
@@ -359,7 +397,7 @@ class AdvancedIMUProcessor:
         gx = np.array(gx_raw) * scale_g
         
         # Simple low-pass filter
-        dt_list = np.diff(timestamps)
+        dt_list = np.diff(sample_times)
         dt_avg = np.mean(dt_list) if len(dt_list) > 0 else 0.1
         fs = 1.0 / dt_avg if dt_avg > 0 else 10.0
         
@@ -372,6 +410,12 @@ class AdvancedIMUProcessor:
         
         ax = _lpf(ax, 0.5)
         ay = _lpf(ay, 0.5)
+
+        if imu_timestamps is not None:
+            # High-rate stream: report on the GPS sample timestamps
+            ax = np.interp(timestamps, imu_timestamps, ax)
+            ay = np.interp(timestamps, imu_timestamps, ay)
+            az = np.interp(timestamps, imu_timestamps, az)
         
         # No lean angle without GPS (return zeros)
         return {
@@ -0,0 +1,188 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from src.analysis.core.models import Lap
+
+EARTH_RADIUS_M = 6371000.0
+
+class GeometryBuilder:
+    """
+    Vectorised track-geometry helpers:
+    - Local tangent-plane projection (equirectangular, metres)
+    - Consensus centre-line from several laps (distance-resampled median)
+    - Douglas-Peucker simplification into multi-resolution levels
+    - Compact distance-indexed reference lap for the device's live lap delta
+    """
+
+    # Simplification tolerances (m) per level: 0 = detail, last = overview thumbnail
+    LEVEL_TOLERANCES_M = [0.5, 2.0, 5.0, 15.0]
+
+    # Reference lap pushed to the device (firmware lib/lap_delta.py)
+    REFERENCE_VERSION = 1
+    REFERENCE_STEP_M = 5.0
+
+    @staticmethod
+    def project_local(lats, lons, origin: Optional[Tuple[float, float]] = None):
+        """
+        Projects lat/lon (deg) to x/y metres around origin (defaults to centroid).
+        Returns (xy [N,2], origin).
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        if origin is None:
+            origin = (float(lats.mean()), float(lons.mean()))
+        lat0, lon0 = np.radians(origin[0]), np.radians(origin[1])
+        x = (np.radians(lons) - lon0) * np.cos(lat0) * EARTH_RADIUS_M
+        y = (np.radians(lats) - lat0) * EARTH_RADIUS_M
+        return np.column_stack((x, y)), origin
+
+    @staticmethod
+    def unproject_local(xy, origin: Tuple[float, float]):
+        """Inverse of project_local. Returns (lats, lons) arrays."""
+        xy = np.asarray(xy, dtype=float)
+        lat0, lon0 = np.radians(origin[0]), np.radians(origin[1])
+        lats = np.degrees(xy[:, 1] / EARTH_RADIUS_M + lat0)
+        lons = np.degrees(xy[:, 0] / (np.cos(lat0) * EARTH_RADIUS_M) + lon0)
+        return lats, lons
+
+    @staticmethod
+    def consensus_line(laps: List[Lap], spacing_m: float = 2.0) -> Tuple[List[float], List[float]]:
+        """
+        Resamples every lap to the same number of points (equal fractions of its
+        own length) and takes the per-point median. All laps start at the start
+        line, so point k of each lap describes the same place on track.
+        Returns closed (lats, lons) lists.
+        """
+        laps = [l for l in laps if len(l.samples) >= 2]
+        if not laps:
+            return [], []
+
+        all_lats = np.concatenate([[s.gps.lat for s in l.samples] for l in laps])
+        all_lons = np.concatenate([[s.gps.lon for s in l.samples] for l in laps])
+        _, origin = GeometryBuilder.project_local(all_lats, all_lons)
+
+        projected = []
+        lengths = []
+        for lap in laps:
+            xy, _ = GeometryBuilder.project_local([s.gps.lat for s in lap.samples],
+                                                  [s.gps.lon for s in lap.samples], origin)
+            seg = np.hypot(*np.diff(xy, axis=0).T)
+            cum = np.concatenate(([0.0], np.cumsum(seg)))
+            projected.append((xy, cum))
+            lengths.append(cum[-1])
+
+        n_points = max(int(np.median(lengths) / spacing_m), 16)
+        fractions = np.linspace(0.0, 1.0, n_points)
+
+        resampled = np.empty((len(projected), n_points, 2))
+        for k, (xy, cum) in enumerate(projected):
+            target = fractions * cum[-1]
+            resampled[k, :, 0] = np.interp(target, cum, xy[:, 0])
+            resampled[k, :, 1] = np.interp(target, cum, xy[:, 1])
+
+        line = np.median(resampled, axis=0)
+        line[-1] = line[0] # Close the loop
+        lats, lons = GeometryBuilder.unproject_local(line, origin)
+        return lats.tolist(), lons.tolist()
+
+    @staticmethod
+    def douglas_peucker(xy, tolerance_m: float, keep: Sequence[int] = ()) -> np.ndarray:
+        """
+        Iterative Douglas-Peucker. Returns sorted indices of retained points.
+        Indices in `keep` (e.g. sector boundaries) are always retained.
+        """
+        xy = np.asarray(xy, dtype=float)
+        n = len(xy)
+        if n <= 2:
+            return np.arange(n)
+
+        retained = np.zeros(n, dtype=bool)
+        retained[[0, n - 1]] = True
+        anchors = sorted(set([0, n - 1] + [int(k) for k in keep if 0 <= k < n]))
+        retained[anchors] = True
+
+        stack = list(zip(anchors[:-1], anchors[1:]))
+        while stack:
+            a, b = stack.pop()
+            if b - a < 2:
+                continue
+            p, q = xy[a], xy[b]
+            pts = xy[a + 1:b]
+            d = q - p
+            norm = np.hypot(*d)
+            if norm == 0.0:
+                dist = np.hypot(*(pts - p).T)
+            else:
+                dist = np.abs(d[0] * (pts[:, 1] - p[1]) - d[1] * (pts[:, 0] - p[0])) / norm
+            k = int(np.argmax(dist))
+            if dist[k] > tolerance_m:
+                m = a + 1 + k
+                retained[m] = True
+                stack.append((a, m))
+                stack.append((m, b))
+
+        return np.nonzero(retained)[0]
+
+    @staticmethod
+    def reference_lap(times: Sequence[float], lats: Sequence[float], lons: Sequence[float],
+                      step_m: float = None) -> Optional[Dict]:
+        """
+        One lap (start line to start line) resampled every step_m metres for the
+        device's live lap delta: x/y in decimetres east/north of the first point,
+        t in ms from lap start, each delta-encoded. The last point closes the lap.
+        Returns None for laps too short to use.
+        """
+        step_m = step_m if step_m else GeometryBuilder.REFERENCE_STEP_M
+        if len(times) < 2:
+            return None
+        origin = (round(float(lats[0]), 7), round(float(lons[0]), 7))
+        xy, _ = GeometryBuilder.project_local(lats, lons, origin)
+        t = np.asarray(times, dtype=float) - float(times[0])
+        cum = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))))
+        if cum[-1] < 3 * step_m:
+            return None
+
+        target = np.arange(0.0, cum[-1], step_m)
+        if cum[-1] - target[-1] > 1e-6:
+            target = np.append(target, cum[-1])
+        # Stationary samples repeat a distance; interp needs it increasing
+        keep = np.concatenate(([True], np.diff(cum) > 0))
+        cum, xy, t = cum[keep], xy[keep], t[keep]
+
+        points = np.column_stack((np.interp(target, cum, xy[:, 0]) * 10,
+                                  np.interp(target, cum, xy[:, 1]) * 10,
+                                  np.interp(target, cum, t) * 1000))
+        ints = np.rint(points).astype(np.int64)
+        deltas = np.vstack((ints[:1], np.diff(ints, axis=0)))
+        return {
+            "v": GeometryBuilder.REFERENCE_VERSION,
+            "lat0": origin[0],
+            "lon0": origin[1],
+            "step_m": step_m,
+            "lap_ms": int(ints[-1, 2]),
+            "x": deltas[:, 0].tolist(),
+            "y": deltas[:, 1].tolist(),
+            "t": deltas[:, 2].tolist()
+        }
+
+    @staticmethod
+    def build_levels(lats: List[float], lons: List[float], sector_indices: List[int],
+                     tolerances: List[float] = None) -> List[Dict]:
+        """
+        Multi-resolution simplified polylines. Sector boundary points are kept in
+        every level and sector_indices are remapped to each level's point list.
+        """
+        tolerances = tolerances if tolerances else GeometryBuilder.LEVEL_TOLERANCES_M
+        if not lats:
+            return []
+        xy, _ = GeometryBuilder.project_local(lats, lons)
+
+        levels = []
+        for tol in tolerances:
+            idx = GeometryBuilder.douglas_peucker(xy, tol, keep=sector_indices)
+            position = {int(i): k for k, i in enumerate(idx)}
+            levels.append({
+                "tolerance_m": tol,
+                "coordinates": [[round(lats[i], 7), round(lons[i], 7)] for i in idx],
+                "sector_indices": [position[int(i)] for i in sector_indices]
+            })
+        return levels
@@ -0,0 +1,26 @@
+import argparse
+import json
+import sys
+import os
+
+# Add project root to sys.path to allow 'from src...' imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-time all sessions of a track after start line / sector edits")
+    parser.add_argument("track_id", type=int, help="Numeric track ID")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel worker processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    from src.analysis.core.track_retimer import TrackRetimer
+
+    result = TrackRetimer(max_workers=args.workers).retime_track(args.track_id)
+
+    # Last stdout line is the machine-readable summary (consumed by the API)
+    print(json.dumps(result))
+    if result.get("error"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
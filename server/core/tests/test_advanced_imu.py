@@ -0,0 +1,50 @@
+import unittest
+import math
+import numpy as np
+from src.analysis.processing.advanced_imu import AdvancedIMUProcessor
+
+LAT0, LON0 = 10.92650, 77.06200
+
+def circle_ride(duration_s=120.0, gps_hz=10, imu_hz=200, radius=80.0, speed=20.0):
+    """Constant-radius ride: GPS at gps_hz, a gyro roll rate signal at imu_hz."""
+    omega = speed / radius
+    t_gps = np.arange(0, duration_s, 1.0 / gps_hz)
+    lats = LAT0 + np.degrees(radius * np.sin(omega * t_gps) / 6371000.0)
+    lons = LON0 + np.degrees(radius * np.cos(omega * t_gps) / (6371000.0 * math.cos(math.radians(LAT0))))
+    speeds = np.full(len(t_gps), speed * 3.6)
+
+    t_imu = np.arange(0, duration_s, 1.0 / imu_hz)
+    gx = 10.0 * np.sin(2 * np.pi * 0.2 * t_imu) # deg/s roll oscillation
+    zeros = np.zeros(len(t_imu))
+    az = np.full(len(t_imu), 1.0)
+    return t_gps, lats, lons, speeds, t_imu, gx, zeros, az
+
+class TestAdvancedIMUMixedRate(unittest.TestCase):
+
+    def test_high_rate_stream_outputs_on_gps_timeline(self):
+        t_gps, lats, lons, speeds, t_imu, gx, zeros, az = circle_ride()
+        res = AdvancedIMUProcessor().process(t_gps.tolist(), zeros, zeros, az, gx, zeros, zeros,
+                                             speeds=speeds.tolist(), lats=lats.tolist(), lons=lons.tolist(),
+                                             imu_timestamps=t_imu.tolist())
+        for key in ("lean_angle", "ax_cg", "ay_cg", "braking_g"):
+            self.assertEqual(len(res[key]), len(t_gps))
+        # Steady circle: lean settles near atan(v^2 / (r g))
+        expected = math.degrees(math.atan(20.0 ** 2 / (80.0 * 9.81)))
+        self.assertAlmostEqual(abs(np.median(res["lean_angle"][200:-200])), expected, delta=3.0)
+
+    def test_same_rate_timestamps_match_single_stream(self):
+        t_gps, lats, lons, speeds, t_imu, gx, zeros, az = circle_ride(imu_hz=10)
+        args = (t_gps.tolist(), zeros, zeros, az, gx, zeros, zeros)
+        kwargs = dict(speeds=speeds.tolist(), lats=lats.tolist(), lons=lons.tolist())
+        single = AdvancedIMUProcessor().process(*args, **kwargs)
+        mixed = AdvancedIMUProcessor().process(*args, imu_timestamps=t_imu.tolist(), **kwargs)
+        np.testing.assert_allclose(single["lean_angle"], mixed["lean_angle"])
+
+    def test_fallback_resamples_to_gps(self):
+        t_gps, _, _, _, t_imu, gx, zeros, az = circle_ride(duration_s=20.0)
+        res = AdvancedIMUProcessor().process(t_gps.tolist(), zeros, zeros, az, gx, zeros, zeros,
+                                             imu_timestamps=t_imu.tolist())
+        self.assertEqual(len(res["az_cg"]), len(t_gps))
+
+if __name__ == '__main__':
+    unittest.main()
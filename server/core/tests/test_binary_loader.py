@@ -0,0 +1,112 @@
+import unittest
+import os
+import struct
+import zlib
+import tempfile
+import shutil
+from src.analysis.ingestion.binary_loader import BinaryLogLoader
+from src.analysis.ingestion.csv_loader import CSVLoader
+
+START_EPOCH = 1760000000
+
+def make_record(i):
+    # t_ms, lat, lon, speed, acc xyz, gyro xyz, vbat, sats, flags
+    return (i * 100, int((10.9265 + i * 1e-5) * 1e7), int(77.062 * 1e7), 4000 + i,
+            100, -200, 8192, 5, -5, 12, 4100, 9, 0)
+
+def make_imu_block(t_ms, frames, period_us=5000):
+    payload = struct.pack(BinaryLogLoader.IMU_HDR_FMT, t_ms, period_us)
+    payload += b"".join(struct.pack(BinaryLogLoader.IMU_FRAME_FMT, *f) for f in frames)
+    return struct.pack(BinaryLogLoader.BLOCK_HDR_FMT, BinaryLogLoader.IMU_BLOCK_MAGIC, len(frames),
+                       zlib.crc32(payload) & 0xFFFFFFFF) + payload
+
+def make_log(n, per_block=32, version=1):
+    out = bytearray(struct.pack(BinaryLogLoader.FILE_HDR_FMT, b"RSL1", version,
+                                struct.calcsize(BinaryLogLoader.REC_FMT), per_block, START_EPOCH, 0))
+    for start in range(0, n, per_block):
+        payload = b"".join(struct.pack(BinaryLogLoader.REC_FMT, *make_record(i))
+                           for i in range(start, min(start + per_block, n)))
+        count = len(payload) // struct.calcsize(BinaryLogLoader.REC_FMT)
+        out += struct.pack(BinaryLogLoader.BLOCK_HDR_FMT, BinaryLogLoader.BLOCK_MAGIC, count,
+                           zlib.crc32(payload) & 0xFFFFFFFF)
+        out += payload
+    return bytes(out)
+
+class TestBinaryLogLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_decode(self):
+        session = BinaryLogLoader().load(self._write("a.rsl", make_log(100)))
+        self.assertEqual(len(session.samples), 100)
+        s = session.samples[10]
+        self.assertAlmostEqual(s.timestamp, START_EPOCH + 1.0)
+        self.assertAlmostEqual(s.gps.lat, 10.9266, places=7)
+        self.assertAlmostEqual(s.gps.speed, 40.10)
+        self.assertEqual(s.gps.sats, 9)
+        self.assertEqual((s.imu.accel_x, s.imu.accel_z, s.imu.gyro_z), (100, 8192, 12))
+
+    def test_corrupt_and_truncated_blocks_skipped(self):
+        data = bytearray(make_log(96))
+        block = struct.calcsize(BinaryLogLoader.BLOCK_HDR_FMT) + 32 * struct.calcsize(BinaryLogLoader.REC_FMT)
+        hdr = struct.calcsize(BinaryLogLoader.FILE_HDR_FMT)
+        data[hdr + block + 20] ^= 0xFF     # Flip a byte inside block 2
+        data = data[:-10]                  # Torn final block
+        loader = BinaryLogLoader()
+        session = loader.load(self._write("b.rsl", bytes(data)))
+        self.assertEqual(len(session.samples), 32)
+        self.assertGreaterEqual(loader.bad_blocks, 2)
+
+    def test_bad_header(self):
+        with self.assertRaises(ValueError):
+            BinaryLogLoader().load(self._write("c.rsl", b"not a log at all"))
+
+    def test_csv_round_trip_and_size(self):
+        src = self._write("d.rsl", make_log(500))
+        dst = os.path.join(self.tmp, "d.csv")
+        self.assertEqual(BinaryLogLoader().to_csv(src, dst), 500)
+
+        binary = BinaryLogLoader().load(src)
+        text = CSVLoader().load(dst)
+        self.assertEqual(len(text.samples), 500)
+        for a, b in zip(binary.samples[::50], text.samples[::50]):
+            self.assertAlmostEqual(a.timestamp, b.timestamp, places=3)
+            self.assertAlmostEqual(a.gps.lat, b.gps.lat, places=7)
+            self.assertAlmostEqual(a.imu.gyro_x, b.imu.gyro_x)
+        self.assertLess(os.path.getsize(src), os.path.getsize(dst) / 2)
+
+    def test_imu_stream_and_sidecar(self):
+        data = make_log(64, version=2)
+        dummy = (0x7F01, 0, 0, 0, 0, 0)
+        data += make_imu_block(1000, [(i, -i, 8192, 10, 20, 30) for i in range(20)])
+        data += make_imu_block(1100, [(i, -i, 8192, 10, 20, 30) for i in range(20, 39)] + [dummy])
+        src = self._write("e.rsl", data)
+
+        session = BinaryLogLoader().load(src)
+        stream = session.imu_stream
+        self.assertEqual(len(session.samples), 64)
+        self.assertEqual(len(stream), 39)          # Dummy frame dropped
+        self.assertAlmostEqual(stream.timestamps[1], START_EPOCH + 1.005)
+        self.assertAlmostEqual(stream.sample_rate, 200.0, delta=1.0)
+        self.assertEqual(stream.accel_y[25], -25)
+
+        dst = os.path.join(self.tmp, "e.csv")
+        BinaryLogLoader().to_csv(src, dst)
+        text = CSVLoader().load(dst)
+        self.assertEqual(len(text.samples), 64)
+        self.assertEqual(text.imu_stream.accel_x, stream.accel_x)
+        for a, b in zip(text.imu_stream.timestamps, stream.timestamps):
+            self.assertAlmostEqual(a, b, places=4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import os
+import tempfile
+import shutil
+from src.analysis.core.stage_cache import StageCache
+from src.analysis.core.models import Session, Sample, GPSSample, IMUSample, EnvSample
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = StageCache(cache_dir=self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_hash_is_content_addressed(self):
+        """Same bytes under different names hash identically."""
+        a = os.path.join(self.tmp, "a.csv")
+        b = os.path.join(self.tmp, "b.csv")
+        for p in (a, b):
+            with open(p, 'w') as f:
+                f.write("time,lat,lon\n1.0,2.0,3.0\n")
+        self.assertEqual(StageCache.hash_file(a), StageCache.hash_file(b))
+
+    def test_stage_key_mismatch_is_miss(self):
+        """Changing stage parameters invalidates only that stage."""
+        laps_key = StageCache.make_key(10.0, 77.0, 20.0)
+        self.cache.put("abc", "laps", laps_key, [[0, 10, 1]])
+        self.cache.put("abc", "sectors", StageCache.make_key(laps_key, ["S1"]), [{"S1": 5.0}])
+
+        self.assertEqual(self.cache.get("abc", "laps", laps_key), [[0, 10, 1]])
+        self.assertIsNone(self.cache.get("abc", "sectors", StageCache.make_key(laps_key, ["S1", "S2"])))
+
+    def test_columns_round_trip(self):
+        session = Session(description="x.csv")
+        session.add_sample(Sample(1000.0, GPSSample(1.5, 2.5, 60.0, 9), IMUSample(0.1, 0.2, 0.9, 1, 2, 3), EnvSample(25.0, 0.0)))
+        session.add_sample(Sample(1000.1, GPSSample(1.6, 2.6, 61.0, 9), IMUSample(0.0, 0.1, 1.0, 4, 5, 6), EnvSample(25.0, 0.0)))
+
+        restored = StageCache.columns_to_session(StageCache.session_to_columns(session), "x.csv")
+        self.assertEqual(restored.samples, session.samples)
+
+    def test_session_index(self):
+        """Re-imports resolve to the previously exported session."""
+        self.assertIsNone(self.cache.lookup_session("abc"))
+        self.cache.record_session("abc", "jan21Session1", "sess_1.csv", track_id=3)
+
+        self.assertEqual(self.cache.lookup_session("abc")["session_name"], "jan21Session1")
+        self.assertIn("abc", self.cache.sessions_for_track(3))
+        self.assertEqual(self.cache.sessions_for_track(4), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import math
+import tempfile
+import shutil
+from src.analysis.core.track_generator import TrackGenerator
+from src.analysis.core.models import Session, Sample, GPSSample, IMUSample, EnvSample
+from src.analysis.processing.geo import haversine_distance
+
+R = 6371000.0
+LAT0, LON0 = 10.92650, 77.06200
+
+def to_latlon(x, y):
+    return (LAT0 + math.degrees(y / R),
+            LON0 + math.degrees(x / (R * math.cos(math.radians(LAT0)))))
+
+def make_session(out_lap_samples, laps=3, radius=200.0, speed_ms=30.0, hz=10):
+    """Long straight out-lap (heading north, well east of the circuit) followed by circle laps."""
+    session = Session(description="synthetic")
+    t = 1000.0
+    # Out-lap: drive 2 km east of the circuit, never crossing it
+    for k in range(out_lap_samples):
+        x = 2000.0 + radius
+        y = k * 0.5
+        lat, lon = to_latlon(x, y)
+        session.add_sample(Sample(t, GPSSample(lat, lon, 50.0, 9), IMUSample(0, 0, 1), EnvSample(0, 0)))
+        t += 1.0 / hz
+    per_lap = int(2 * math.pi * radius / speed_ms * hz)
+    for k in range(laps * per_lap):
+        ang = 2 * math.pi * k / per_lap
+        lat, lon = to_latlon(radius * math.cos(ang), radius * math.sin(ang))
+        session.add_sample(Sample(t, GPSSample(lat, lon, speed_ms * 3.6, 9), IMUSample(0, 0, 1), EnvSample(0, 0)))
+        t += 1.0 / hz
+    return session
+
+class TestLoopClosure(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.gen = TrackGenerator(output_dir=self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def assertOnCircuit(self, lat, lon, radius=200.0):
+        d = haversine_distance(LAT0, LON0, lat, lon) * 1000.0
+        self.assertAlmostEqual(d, radius, delta=5.0)
+
+    def test_closure_found(self):
+        session = make_session(out_lap_samples=400)
+        self.assertOnCircuit(*self.gen._detect_start_line_candidate(session, 20.0))
+
+    def test_closure_after_long_out_lap(self):
+        """Circuit starts beyond the old 5000-sample scan limit."""
+        session = make_session(out_lap_samples=8000)
+        lat, lon = self.gen._detect_start_line_candidate(session, 20.0)
+        self.assertNotEqual((lat, lon), (session.samples[0].gps.lat, session.samples[0].gps.lon))
+        self.assertOnCircuit(lat, lon)
+
+    def test_no_closure_defaults_to_start(self):
+        session = make_session(out_lap_samples=3000, laps=0)
+        lat, lon = self.gen._detect_start_line_candidate(session, 20.0)
+        self.assertEqual((lat, lon), (session.samples[0].gps.lat, session.samples[0].gps.lon))
+
+if __name__ == '__main__':
+    unittest.main()
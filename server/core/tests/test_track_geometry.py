@@ -0,0 +1,83 @@
+import unittest
+import math
+import random
+import numpy as np
+from src.analysis.processing.track_geometry import GeometryBuilder
+from src.analysis.core.models import Session, Sample, Lap, GPSSample, IMUSample, EnvSample
+
+LAT0, LON0 = 10.92650, 77.06200
+
+def circle_lap_session(laps, radius=150.0, per_lap=400, noise=1.5, seed=0):
+    random.seed(seed)
+    session = Session()
+    t = 0.0
+    for k in range(laps * per_lap + 1):
+        ang = 2 * math.pi * k / per_lap
+        x = radius * math.cos(ang) + random.gauss(0, noise)
+        y = radius * math.sin(ang) + random.gauss(0, noise)
+        lat = LAT0 + math.degrees(y / 6371000.0)
+        lon = LON0 + math.degrees(x / (6371000.0 * math.cos(math.radians(LAT0))))
+        session.add_sample(Sample(t, GPSSample(lat, lon, 90.0, 9), IMUSample(0, 0, 1), EnvSample(0, 0)))
+        t += 0.1
+    return session, [Lap(session, i * per_lap, (i + 1) * per_lap, number=i + 1) for i in range(laps)]
+
+class TestGeometryBuilder(unittest.TestCase):
+
+    def test_projection_round_trip(self):
+        lats, lons = [10.0, 10.001, 10.002], [77.0, 77.001, 76.999]
+        xy, origin = GeometryBuilder.project_local(lats, lons)
+        back_lats, back_lons = GeometryBuilder.unproject_local(xy, origin)
+        np.testing.assert_allclose(back_lats, lats, atol=1e-9)
+        np.testing.assert_allclose(back_lons, lons, atol=1e-9)
+
+    def test_consensus_beats_single_lap(self):
+        """Median of many noisy laps is closer to the true circle than any one lap."""
+        _, laps = circle_lap_session(laps=7)
+        lats, lons = GeometryBuilder.consensus_line(laps)
+        xy, _ = GeometryBuilder.project_local(lats, lons, origin=(LAT0, LON0))
+        radial_err = np.abs(np.hypot(xy[:, 0], xy[:, 1]) - 150.0)
+
+        single = [s for s in laps[0].samples]
+        sxy, _ = GeometryBuilder.project_local([s.gps.lat for s in single], [s.gps.lon for s in single], origin=(LAT0, LON0))
+        single_err = np.abs(np.hypot(sxy[:, 0], sxy[:, 1]) - 150.0)
+
+        self.assertLess(radial_err.mean(), single_err.mean())
+        self.assertEqual((lats[0], lons[0]), (lats[-1], lons[-1]))
+
+    def test_douglas_peucker_keeps_forced_points(self):
+        xy = np.column_stack((np.arange(100.0), np.zeros(100)))  # Straight line
+        idx = GeometryBuilder.douglas_peucker(xy, 0.5, keep=[42])
+        self.assertEqual(idx.tolist(), [0, 42, 99])
+
+    def test_levels_get_coarser(self):
+        _, laps = circle_lap_session(laps=3, noise=0.0)
+        lats, lons = GeometryBuilder.consensus_line(laps)
+        sector_indices = [len(lats) // 3, 2 * len(lats) // 3, 0]
+        levels = GeometryBuilder.build_levels(lats, lons, sector_indices)
+
+        sizes = [len(l["coordinates"]) for l in levels]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertLess(sizes[0], len(lats))
+        for level in levels:
+            for orig, mapped in zip(sector_indices, level["sector_indices"]):
+                self.assertEqual(level["coordinates"][mapped], [round(lats[orig], 7), round(lons[orig], 7)])
+
+    def test_reference_lap_is_distance_indexed(self):
+        session, _ = circle_lap_session(laps=1, noise=0.0)
+        samples = session.samples  # Start line to start line
+        ref = GeometryBuilder.reference_lap([s.timestamp for s in samples],
+                                            [s.gps.lat for s in samples],
+                                            [s.gps.lon for s in samples], step_m=5.0)
+        x, y, t = (np.cumsum(ref[k]) for k in ("x", "y", "t"))
+        self.assertEqual((x[0], y[0], t[0]), (0, 0, 0))
+        self.assertEqual(ref["lap_ms"], 40000)  # 400 samples at 10 Hz
+        self.assertEqual(t[-1], ref["lap_ms"])
+        # Every step is 5 m (50 dm) except the closing one; the lap ends where it began
+        steps = np.hypot(np.diff(x), np.diff(y))
+        np.testing.assert_allclose(steps[:-1], 50.0, atol=1.5)
+        self.assertLessEqual(steps[-1], 51.5)
+        self.assertLess(math.hypot(x[-1], y[-1]), 2)
+        self.assertEqual(len(x), math.ceil(2 * math.pi * 150 / 5) + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import json
+import tempfile
+import shutil
+from src.analysis.core.tbl_manager import TBLManager
+from unittest import mock
+from src.analysis.core.track_retimer import TrackRetimer, _retime_session
+
+TRACK_ID = 9999  # Not in the registry -> folder "track_9999"
+
+class TestTrackRetimer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp, f"track_{TRACK_ID}"))
+        self.track_info = {
+            "track_id": TRACK_ID,
+            "track_name": "test",
+            "start_line": {"lat": 10.0, "lon": 77.0, "radius_m": 20.0},
+            "sectors": [{"id": "S1"}, {"id": "S2"}]
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_tbl_rebuild_drops_stale_bests(self):
+        """Rebuild starts from scratch instead of keeping old (faster) sectors."""
+        mgr = TBLManager(tracks_dir=self.tmp)
+        mgr.save_tbl(TRACK_ID, {"track_id": TRACK_ID, "sectors": [{"sector_index": 0, "best_time": 1.0}],
+                                "total_best_time": 1.0})
+
+        tbl = mgr.rebuild(self.track_info, {
+            "a": [{"S1": 20.0, "S2": 31.0}, {"S1": 19.5, "S2": None}],
+            "b": [{"S1": 21.0, "S2": 30.0}]
+        })
+
+        self.assertEqual([s["best_time"] for s in tbl["sectors"]], [19.5, 30.0])
+        self.assertEqual([s["session_id"] for s in tbl["sectors"]], ["a", "b"])
+        self.assertAlmostEqual(tbl["total_best_time"], 49.5)
+        self.assertEqual(mgr.load_tbl(TRACK_ID)["total_best_time"], tbl["total_best_time"])
+
+    def test_patch_rewrites_only_timing_sections(self):
+        sessions_dir = os.path.join(self.tmp, "sessions")
+        retimer = TrackRetimer(sessions_dir=sessions_dir, cache_dir=os.path.join(self.tmp, "cache"))
+        os.makedirs(sessions_dir)
+        path = os.path.join(sessions_dir, "jan21Session1.json")
+        with open(path, 'w') as f:
+            json.dump({"meta": {"session_name": "jan21Session1"}, "analysis": {"signals": {"lean_angle": [1, 2]}},
+                       "laps": [], "aggregates": {"best_lap_time": 60.0, "consistency_score": 90}}, f)
+
+        result = {"session_name": "jan21Session1", "laps": [{"lap_number": 1, "lap_time": 50.0}],
+                  "sectors": [], "best_lap_time": 50.0}
+        tbl = {"sectors": [{"sector_index": 0, "best_time": 20.0}, {"sector_index": 1, "best_time": 29.0}],
+               "total_best_time": 49.0}
+        self.assertTrue(retimer._patch_session_json(result, self.track_info, tbl, None))
+
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data["laps"], result["laps"])
+        self.assertEqual(data["aggregates"], {"best_lap_time": 50.0, "gap_to_theoretical_best": 1.0,
+                                              "consistency_score": 90})
+        self.assertEqual(data["references"]["sector_times"], [20.0, 29.0])
+        self.assertEqual(data["analysis"], {"signals": {"lean_angle": [1, 2]}})
+
+    def test_worker_error_is_reported(self):
+        """An exception in one session's worker becomes its "error", not an aborted re-time."""
+        learning = os.path.join(self.tmp, "learning")
+        os.makedirs(learning)
+        with open(os.path.join(learning, "broken.csv"), 'w') as f:
+            f.write("time,lat\n")
+        job = {"csv_hash": "h1", "session_name": "broken", "source_file": "broken.csv",
+               "track_info": self.track_info, "cache_dir": os.path.join(self.tmp, "cache"),
+               "sessions_dir": os.path.join(self.tmp, "sessions"), "learning_dir": learning}
+        with mock.patch("src.analysis.core.track_retimer.CSVLoader") as loader:
+            loader.return_value.load.side_effect = ValueError("bad row")
+            result = _retime_session(job)
+        self.assertEqual(result, {"session_name": "broken", "error": "ValueError: bad row"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import os
+import json
+import tempfile
+import shutil
+from src.analysis.core.track_visualizer import TrackVisualizer
+
+class TestTrackMapCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.track = {
+            "track_id": 1, "track_name": "test",
+            "start_line": {"lat": 10.0, "lon": 77.0, "radius_m": 20.0},
+            "sectors": [{"id": "S1", "end_lat": 10.001, "end_lon": 77.001, "radius_m": 10.0}]
+        }
+        self._write("track.json", self.track)
+        self._write("geometry.json", {"coordinates": [[10.0, 77.0], [10.001, 77.001], [10.0, 77.002]],
+                                      "sector_indices": [1]})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.tmp, name), 'w') as f:
+            json.dump(data, f)
+
+    def _maps(self):
+        return sorted(f for f in os.listdir(self.tmp) if f.startswith(TrackVisualizer.MAP_PREFIX))
+
+    def test_no_geometry_no_map(self):
+        os.remove(os.path.join(self.tmp, "geometry.json"))
+        self.assertIsNone(TrackVisualizer.cached_map_path(self.tmp))
+        self.assertIsNone(TrackVisualizer.render_cached(self.tmp))
+
+    def test_render_once_then_reuse(self):
+        path = TrackVisualizer.render_cached(self.tmp)
+        self.assertEqual(path, TrackVisualizer.cached_map_path(self.tmp))
+        mtime = os.path.getmtime(path)
+
+        self.assertEqual(TrackVisualizer.render_cached(self.tmp), path)
+        self.assertEqual(os.path.getmtime(path), mtime)
+
+    def test_sector_edit_rerenders_and_drops_stale(self):
+        first = TrackVisualizer.render_cached(self.tmp)
+        self.track["sectors"][0]["end_lat"] = 10.0005
+        self._write("track.json", self.track)
+
+        second = TrackVisualizer.render_cached(self.tmp)
+        self.assertNotEqual(first, second)
+        self.assertEqual(self._maps(), [os.path.basename(second)])
+
+if __name__ == '__main__':
+    unittest.main()
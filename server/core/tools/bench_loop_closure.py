@@ -0,0 +1,72 @@
+"""
+Loop-Closure Detection Benchmark
+================================
+
+Times TrackGenerator._detect_start_line_candidate on synthetic sessions
+(long out-lap + circuit laps) of increasing size, up to 100k samples.
+
+Usage:
+    python tools/bench_loop_closure.py [--sizes 10000 50000 100000]
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+
+from src.analysis.core.track_generator import TrackGenerator
+from src.analysis.core.models import Session, Sample, GPSSample, IMUSample, EnvSample
+
+R = 6371000.0
+LAT0, LON0 = 10.92650, 77.06200
+
+
+def make_session(n_samples, out_lap_fraction=0.2, radius=300.0, speed_ms=30.0, hz=10):
+    """Straight out-lap for the first part of the session, then circuit laps with mild noise."""
+    import random
+    random.seed(0)
+    session = Session(description="bench")
+    n_out = int(n_samples * out_lap_fraction)
+    per_lap = int(2 * math.pi * radius / speed_ms * hz)
+    t = 0.0
+    for k in range(n_samples):
+        if k < n_out:
+            x, y, v = 2000.0, k * (50.0 / 3.6) / hz, 50.0
+        else:
+            ang = 2 * math.pi * (k - n_out) / per_lap
+            x = radius * math.cos(ang) + random.gauss(0, 1.0)
+            y = radius * math.sin(ang) + random.gauss(0, 1.0)
+            v = speed_ms * 3.6
+        lat = LAT0 + math.degrees(y / R)
+        lon = LON0 + math.degrees(x / (R * math.cos(math.radians(LAT0))))
+        session.add_sample(Sample(t, GPSSample(lat, lon, v, 9), IMUSample(0, 0, 1), EnvSample(0, 0)))
+        t += 1.0 / hz
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loop-closure detection")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--radius", type=float, default=20.0, help="Start line radius (m)")
+    args = parser.parse_args()
+
+    gen = TrackGenerator(output_dir=tempfile.mkdtemp())
+    import scipy.spatial  # Warm import so the first size isn't charged for it
+
+    print(f"{'samples':>10} {'closure (s)':>12} {'no closure (s)':>15} {'us/sample':>10}")
+    for n in args.sizes:
+        timings = []
+        # Typical session, then worst case (no circuit: every candidate is scanned)
+        for fraction in (0.2, 1.0):
+            session = make_session(n, out_lap_fraction=fraction)
+            t0 = time.perf_counter()
+            gen._detect_start_line_candidate(session, args.radius)
+            timings.append(time.perf_counter() - t0)
+        print(f"{n:>10} {timings[0]:>12.3f} {timings[1]:>15.3f} {timings[1] / n * 1e6:>10.2f}")
+
+if __name__ == "__main__":
+    main()
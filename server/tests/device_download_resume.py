@@ -0,0 +1,95 @@
+"""
+Device download resume test: a local HTTP server stands in for the ESP32
+/download/<file> endpoint. The first response promises the whole file but
+the connection is cut part-way; download_device_file() must resume with
+Range from the bytes it already has. Firmware without Range support answers
+a tail request with the whole file: the tail is still returned.
+
+    python server/tests/device_download_resume.py
+"""
+import os
+import socket
+import sys
+import threading
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../api')))
+os.chdir(os.path.join(os.path.dirname(__file__), '../api'))
+
+from main import download_device_file
+
+FILE = bytes((i * 7) & 0xFF for i in range(1000))
+CUT = 100
+
+
+class CuttingDevice:
+    """Serves FILE; the first request gets CUT bytes of a full-length reply, then the socket is closed."""
+
+    def __init__(self, ranges=True):
+        self.honour_range = ranges
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(4)
+        self.port = self.sock.getsockname()[1]
+        self.ranges = []
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            head = b''
+            while b'\r\n\r\n' not in head:
+                data = conn.recv(1024)
+                if not data:
+                    break
+                head += data
+            start = 0
+            for line in head.decode().split('\r\n'):
+                if line.lower().startswith('range: bytes='):
+                    start = int(line.split('=')[1].split('-')[0])
+            self.ranges.append(start)
+            if not self.honour_range:
+                start = 0
+            body = FILE[start:]
+            status = '206 Partial Content' if start else '200 OK'
+            conn.sendall(f"HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode())
+            if len(self.ranges) == 1:
+                conn.sendall(body[:CUT]) # Promised len(body), connection drops
+            else:
+                conn.sendall(body)
+            conn.close()
+
+
+def main():
+    dev = CuttingDevice()
+    data, encoding = download_device_file(requests.Session(), f"127.0.0.1:{dev.port}", "sess_1.rsl",
+                                          expected=len(FILE))
+    assert data == FILE, None if data is None else len(data)
+    assert dev.ranges == [0, CUT], dev.ranges
+    print(f"Cut after {CUT} B of {len(FILE)}: resumed with Range from {dev.ranges[1]}")
+
+    # Tail fetch (append-aware sync) cut mid-body: resumes from offset + received
+    dev = CuttingDevice()
+    offset = 400
+    data, _ = download_device_file(requests.Session(), f"127.0.0.1:{dev.port}", "sess_1.rsl",
+                                   offset=offset, expected=len(FILE))
+    assert data == FILE[offset:], None if data is None else len(data)
+    assert dev.ranges == [offset, offset + CUT], dev.ranges
+    print(f"Tail from {offset} cut after {CUT} B: resumed with Range from {dev.ranges[1]}")
+
+    # Firmware that ignores Range: whole file, cut, then whole file again
+    dev = CuttingDevice(ranges=False)
+    data, _ = download_device_file(requests.Session(), f"127.0.0.1:{dev.port}", "sess_1.rsl",
+                                   offset=offset, expected=len(FILE))
+    assert data == FILE[offset:], None if data is None else len(data)
+    print(f"No Range support: tail of {len(data)} B taken from the whole file")
+    print("DEVICE DOWNLOAD RESUME TEST PASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -214,6 +214,7 @@ let tracks = [];
 let sessions = [];
 let activeTrackId = null;  // Track identified by ESP32 status
 let lastSyncedTrackId = null; // Track we last pushed to ESP32
+let librarySyncedIP = null; // Device whose track library we last synced
 
 // ============================================================================
 // INITIALIZATION
@@ -673,6 +674,12 @@ async function pollStatus() {
                 const trackNameEl = document.getElementById('activeTrackName');
                 const identDot = document.getElementById('trackIdentifiedDot');
 
+                // Track library: once per device connection, push new/changed tracks
+                if (librarySyncedIP !== deviceIP) {
+                    librarySyncedIP = deviceIP;
+                    syncTrackLibrary(deviceIP);
+                }
+
                 if (espRes.active_track) {
                     trackBadge.style.display = 'flex';
                     activeTrackId = espRes.active_track;
@@ -707,40 +714,40 @@ async function pollStatus() {
 }
 
 /**
- * Ensures the full track metadata from Pi is pushed to the ESP32
+ * Track ETags stored in the ESP32's track library ({} on firmware without one)
  */
-async function ensureTrackSynced(trackId, deviceIP) {
+async function getDeviceTrackLibrary(deviceIP) {
+    try {
+        const resp = await fetch(`http://${deviceIP}/track/library`);
+        if (!resp.ok) return {};
+        const data = await resp.json();
+        return data.tracks || {};
+    } catch (err) {
+        return {};
+    }
+}
+
+/**
+ * Ensures the full track metadata from Pi is pushed to the ESP32.
+ * Skipped when the device already stores this version (same ETag), unless
+ * force is set (the device then just makes it the current track).
+ */
+async function ensureTrackSynced(trackId, deviceIP, force = false) {
     if (!deviceIP) return;
 
     try {
         console.log(`[Sync] Auto-syncing track ${trackId} to device...`);
-        const trackData = await apiCall(`/api/tracks/${trackId}`);
-
-        // Format for ESP32
-        const payload = {
-            id: trackData.track_id.toString(),
-            name: trackData.track_name,
-            pit_center_lat: trackData.pit_center_lat,
-            pit_center_lon: trackData.pit_center_lon,
-            pit_radius_m: trackData.pit_radius_m || 50,
-            start_line: {
-                lat: trackData.start_line.lat,
-                lon: trackData.start_line.lon,
-                radius_m: 20
-            },
-            sectors: trackData.sectors.map((s, idx) => ({
-                idx: idx,
-                end_lat: s.end_lat,
-                end_lon: s.end_lon
-            })),
-            tbl: {}
-        };
-
-        // Format TBL: Convert from list to dict with string keys
-        if (trackData.tbl && trackData.tbl.sectors) {
-            trackData.tbl.sectors.forEach((time, idx) => {
-                payload.tbl[idx.toString()] = time;
-            });
+        // Formatted for ESP32 server-side: sectors, TBL, pit geofence, reference lap, etag
+        const payload = await apiCall(`/api/tracks/${trackId}/device`);
+        if (!payload) return;
+
+        if (!force) {
+            const library = await getDeviceTrackLibrary(deviceIP);
+            if (library[payload.id] && library[payload.id].etag === payload.etag) {
+                console.log(`[Sync] Track ${trackId} already up to date on device`);
+                lastSyncedTrackId = trackId;
+                return;
+            }
         }
 
         const resp = await fetch(`http://${deviceIP}/track/set`, {
@@ -757,6 +764,36 @@ async function ensureTrackSynced(trackId, deviceIP) {
     }
 }
 
+/**
+ * Pushes every track the device doesn't have (or has an older version of) into
+ * its track library, so it can identify any of them from GPS on its own.
+ */
+async function syncTrackLibrary(deviceIP) {
+    if (!deviceIP) return 0;
+
+    try {
+        const data = await apiCall('/api/tracks/device');
+        if (!data) return 0;
+        const library = await getDeviceTrackLibrary(deviceIP);
+        const changed = data.tracks.filter(t => !library[t.id] || library[t.id].etag !== t.etag);
+
+        // One track per request keeps the device's request buffer small
+        for (const track of changed) {
+            await fetch(`http://${deviceIP}/track/set`, {
+                method: 'POST',
+                body: JSON.stringify({ tracks: [track] })
+            });
+        }
+        if (changed.length) {
+            console.log(`[Sync] Track library: ${changed.length} of ${data.tracks.length} tracks pushed`);
+        }
+        return changed.length;
+    } catch (err) {
+        console.error('[Sync] Track library sync failed:', err);
+        return 0;
+    }
+}
+
 // ============================================================================
 // SOCIAL & COMMUNITY FEATURES
 // ============================================================================
@@ -1707,7 +1744,7 @@ async function pushTrackToESP(trackId) {
 
     try {
         showToast('Pushing track data...', 'info');
-        await ensureTrackSynced(trackId, deviceIP);
+        await ensureTrackSynced(trackId, deviceIP, true);
         showToast('Track set as active', 'success');
 
         // Refresh tracks view to show active state
@@ -1772,7 +1809,8 @@ async function viewTrack(trackId) {
 
         let mapDisplay = '';
         try {
-            const geometry = await apiCall(`/api/tracks/${trackId}/geometry`);
+            // Level 1 (~2 m tolerance) is plenty for a 600px map
+            const geometry = await apiCall(`/api/tracks/${trackId}/geometry?level=1`);
             mapDisplay = generateTrackMapSVG(geometry, null, null, { title: '' });
         } catch (e) {
             mapDisplay = `<img src="${API_BASE}/api/tracks/${trackId}/map" 
@@ -2471,7 +2509,7 @@ async function loadTrackdayMap(trackId, trackName) {
     if (!mapContainer) return;
 
     try {
-        const geometry = await apiCall(`/api/tracks/${trackId}/geometry`);
+        const geometry = await apiCall(`/api/tracks/${trackId}/geometry?level=2`);
         mapContainer.innerHTML = generateTrackMapSVG(geometry, null, null, { title: '' });
     } catch (e) {
         // Fallback to static image